@@ -1,4 +1,4 @@
-from .deepseek import DeepSeekProvider, AIProvider
+from .deepseek import DeepSeekProvider, AIProvider, AIErrorResponse
 from .siliconflow import SiliconFlowProvider
 from .local import LocalAIProvider
 from .openai_compatible import OpenAICompatibleProvider
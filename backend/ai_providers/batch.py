@@ -0,0 +1,189 @@
+"""
+OpenAI兼容接口的离线批量调用
+
+请求文件为 JSONL，每行 {"custom_id", "method", "url", "body"}，与 OpenAI Batch API 的输入格式一致；
+结果同样是 JSONL，每行 {"custom_id", "response": {"status_code", "body"}, "error"}。
+
+提供者有批量接口（/files + /batches）时由 NativeBatchClient 上传请求文件、提交批次、查询状态和下载结果；
+没有时由 LocalBatchDriver 在本地按并发上限逐条调用聊天接口，输出相同格式的结果行。
+"""
+import asyncio
+import json
+from typing import Dict, Any, Iterable, Callable, Optional
+import httpx
+from logger import get_logger
+from .deepseek import AIProvider
+
+CHAT_COMPLETIONS_PATH = "/chat/completions"
+BATCH_ENDPOINT = "/v1/chat/completions"
+# 批次不再变化的状态
+TERMINAL_BATCH_STATUSES = ("completed", "failed", "expired", "cancelled")
+# 本地逐条调用遇到这些状态码时退避重试
+RETRY_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+
+logger = get_logger("ai_provider_batch")
+
+
+class BatchAPIUnsupported(Exception):
+    """提供者没有批量接口（/files 或 /batches 返回 404、405 或 501）"""
+
+
+def api_base(provider: AIProvider) -> str:
+    """由聊天接口地址推出API根地址（如 https://host/v1/chat/completions -> https://host/v1）"""
+    url = getattr(provider, "api_url", None)
+    if not url:
+        raise ValueError(f"AI提供者 {provider.provider_name} 不是OpenAI兼容的HTTP接口，不支持离线批量")
+    url = url.rstrip("/")
+    if url.endswith(CHAT_COMPLETIONS_PATH):
+        url = url[:-len(CHAT_COMPLETIONS_PATH)]
+    return url
+
+
+def build_request_line(provider: AIProvider, custom_id: str, description: str, question_type: str) -> Dict[str, Any]:
+    """一行批量请求，请求体与在线分析时提供者发送的完全相同"""
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": provider.build_chat_request(description, question_type)
+    }
+
+
+def parse_result_line(line: Dict[str, Any]) -> Dict[str, Any]:
+    """解析一行批量结果，返回 {custom_id, content, usage, model, error}"""
+    response = line.get("response") or {}
+    body = response.get("body") or {}
+    error = line.get("error")
+    content = None
+    if not error:
+        status_code = response.get("status_code", 200)
+        if status_code != 200:
+            error = body.get("error") or {"message": f"HTTP {status_code}"}
+        else:
+            try:
+                content = body["choices"][0]["message"]["content"]
+            except (KeyError, IndexError, TypeError):
+                error = {"message": "结果中缺少 choices"}
+    if isinstance(error, dict):
+        error = error.get("message") or json.dumps(error, ensure_ascii=False)
+    return {
+        "custom_id": line.get("custom_id"),
+        "content": content,
+        "usage": body.get("usage"),
+        "model": body.get("model"),
+        "error": error
+    }
+
+
+def _auth_headers(provider: AIProvider) -> Dict[str, str]:
+    # 上传文件使用 multipart，Content-Type 由 httpx 设置
+    return {key: value for key, value in provider.build_headers().items() if key.lower() != "content-type"}
+
+
+class NativeBatchClient:
+    """OpenAI Batch API 客户端：/files 上传请求文件和下载结果，/batches 提交、查询和取消批次"""
+
+    def __init__(self, provider: AIProvider, transport: Optional[httpx.AsyncBaseTransport] = None,
+                 timeout: float = 120.0):
+        self.provider = provider
+        self.base_url = api_base(provider)
+        self.transport = transport
+        self.timeout = timeout
+
+    def _client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(base_url=self.base_url, headers=_auth_headers(self.provider),
+                                 timeout=self.timeout, transport=self.transport)
+
+    @staticmethod
+    def _check(response: httpx.Response, detect_unsupported: bool = False) -> Dict[str, Any]:
+        if detect_unsupported and response.status_code in (404, 405, 501):
+            raise BatchAPIUnsupported(f"{response.request.url} 返回 {response.status_code}")
+        if response.status_code >= 400:
+            raise RuntimeError(f"批量接口调用失败: {response.status_code} - {response.text[:500]}")
+        return response.json()
+
+    async def submit(self, content: bytes, metadata: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """上传请求文件并创建批次，返回批次对象"""
+        async with self._client() as client:
+            uploaded = self._check(await client.post(
+                "/files", data={"purpose": "batch"},
+                files={"file": ("requests.jsonl", content, "application/jsonl")}
+            ), detect_unsupported=True)
+            batch = self._check(await client.post("/batches", json={
+                "input_file_id": uploaded["id"],
+                "endpoint": BATCH_ENDPOINT,
+                "completion_window": "24h",
+                "metadata": metadata or {}
+            }), detect_unsupported=True)
+        logger.info(f"{self.provider.provider_name} 批次已提交: {batch['id']}")
+        return batch
+
+    async def retrieve(self, batch_id: str) -> Dict[str, Any]:
+        async with self._client() as client:
+            return self._check(await client.get(f"/batches/{batch_id}"))
+
+    async def cancel(self, batch_id: str) -> Dict[str, Any]:
+        async with self._client() as client:
+            return self._check(await client.post(f"/batches/{batch_id}/cancel"))
+
+    async def download(self, file_id: str) -> str:
+        async with self._client() as client:
+            response = await client.get(f"/files/{file_id}/content")
+            if response.status_code >= 400:
+                raise RuntimeError(f"下载批量结果失败: {response.status_code} - {response.text[:500]}")
+            return response.text
+
+
+class LocalBatchDriver:
+    """提供者没有批量接口时在本地逐条调用聊天接口，结果行与批量接口的输出文件格式一致"""
+
+    def __init__(self, provider: AIProvider, concurrency: int = 4, max_retries: int = 3,
+                 transport: Optional[httpx.AsyncBaseTransport] = None, timeout: float = 120.0):
+        self.provider = provider
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.transport = transport
+        self.timeout = timeout
+
+    async def run(self, lines: Iterable[Dict[str, Any]], on_result: Callable[[Dict[str, Any]], Any]):
+        """
+        调用所有请求行，每完成一行立即调用 on_result(结果行)
+
+        lines 可以是惰性读取的迭代器，各并发槽位从中依次取出下一行。
+        """
+        pending = iter(lines)
+        async with httpx.AsyncClient(headers=self.provider.build_headers(), timeout=self.timeout,
+                                     transport=self.transport) as client:
+            async def worker():
+                for line in pending:
+                    on_result(await self._call(client, line))
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+    async def _call(self, client: httpx.AsyncClient, line: Dict[str, Any]) -> Dict[str, Any]:
+        custom_id = line["custom_id"]
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await client.post(self.provider.api_url, json=line["body"])
+            except httpx.HTTPError as e:
+                if attempt < self.max_retries:
+                    await asyncio.sleep(2 ** attempt)
+                    continue
+                return {"id": f"local-{custom_id}", "custom_id": custom_id, "response": None,
+                        "error": {"message": f"{type(e).__name__}: {e}"}}
+            self.provider.request_count += 1
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                await asyncio.sleep(self._retry_delay(response, attempt))
+                continue
+            try:
+                body = response.json()
+            except ValueError:
+                body = {"error": {"message": response.text[:500]}}
+            return {"id": f"local-{custom_id}", "custom_id": custom_id,
+                    "response": {"status_code": response.status_code, "body": body}, "error": None}
+
+    @staticmethod
+    def _retry_delay(response: httpx.Response, attempt: int) -> float:
+        try:
+            return min(float(response.headers.get("retry-after", "")), 60.0)
+        except ValueError:
+            return float(2 ** attempt)
@@ -3,9 +3,23 @@ import time
 import httpx
 from typing import Dict, Any
 from logger import get_logger, log_ai_request, log_error
+from token_meter import token_meter
 from abc import ABC, abstractmethod
 
+# OpenAI兼容聊天接口使用的系统提示词
+SYSTEM_PROMPT = "你是一个专业的CTF专家，具有丰富的网络安全知识和实战经验。请提供详细、专业且实用的分析。"
+
+
+class AIErrorResponse(str):
+    """提供者调用失败时返回的提示文本
+
+    提供者不抛出异常，而是返回可直接展示给用户的提示；用这个 str 子类标记失败，调用方按类型判断
+    （不写入缓存和历史、批量分析换下一个提供者），不依赖提示文本的内容。
+    """
+
 class AIProvider(ABC):
+    provider_name = "unknown"
+
     def __init__(self):
         self.logger = get_logger(f"ai_provider_{self.__class__.__name__}")
         self.request_count = 0
@@ -24,11 +38,42 @@ class AIProvider(ABC):
         return {
             "request_count": self.request_count,
             "total_response_time": self.total_response_time,
-            "average_response_time": avg_response_time
+            "average_response_time": avg_response_time,
+            "token_usage": token_meter.get_provider_stats(self.provider_name)
         }
 
+    def build_chat_request(self, description: str, question_type: str) -> Dict[str, Any]:
+        """构建OpenAI兼容聊天接口的请求体（在线分析和离线批量共用）"""
+        prompt = self.get_prompt_template(question_type).format(description=description)
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.7,
+            "max_tokens": 4000,
+            "stream": False
+        }
+
+    def build_headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def _record_usage(self, model: str, prompt: str, completion: str, usage: Dict[str, Any] = None,
+                      question_type: str = None, token_counter=None) -> Dict[str, Any]:
+        """记录token用量，响应中缺少usage块时使用本地估算"""
+        return token_meter.record(
+            self.provider_name, model, prompt, completion,
+            usage=usage, question_type=question_type, token_counter=token_counter
+        )
+
 class DeepSeekProvider(AIProvider):
     """DeepSeek AI提供者"""
+    provider_name = "deepseek"
+
     def __init__(self):
         super().__init__()
         self.api_key = os.getenv("DEEPSEEK_API_KEY")
@@ -53,23 +98,8 @@ class DeepSeekProvider(AIProvider):
     async def analyze_challenge(self, description: str, question_type: str) -> str:
         try:
             start_time = time.time()
-            template = self.get_prompt_template(question_type)
-            prompt = template.format(description=description)
-            request_data = {
-                "model": self.model,
-                "messages": [
-                    {"role": "system", "content": "你是一个专业的CTF专家，具有丰富的网络安全知识和实战经验。请提供详细、专业且实用的分析。"},
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.7,
-                "max_tokens": 4000,
-                "stream": False
-            }
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            log_ai_request("deepseek", request_data)
+            request_data = self.build_chat_request(description, question_type)
+            headers = self.build_headers()
             async with httpx.AsyncClient(timeout=60.0) as client:
                 response = await client.post(
                     self.api_url,
@@ -79,16 +109,24 @@ class DeepSeekProvider(AIProvider):
                 response_time = time.time() - start_time
                 self.request_count += 1
                 self.total_response_time += response_time
+                log_ai_request("deepseek", request_data, response_time)
                 if response.status_code == 200:
                     result = response.json()
                     ai_response = result["choices"][0]["message"]["content"]
+                    self._record_usage(
+                        self.model,
+                        "\n".join(m["content"] for m in request_data["messages"]),
+                        ai_response,
+                        usage=result.get("usage"),
+                        question_type=question_type
+                    )
                     self.logger.info(f"DeepSeek分析完成，响应时间: {response_time:.2f}s")
                     return ai_response
                 else:
                     error_msg = f"DeepSeek API调用失败: {response.status_code} - {response.text}"
                     log_error("deepseek_api_error", error_msg)
-                    return f"AI分析暂时不可用，请稍后重试。错误信息: {error_msg}"
+                    return AIErrorResponse(f"AI分析暂时不可用，请稍后重试。错误信息: {error_msg}")
         except Exception as e:
             error_msg = f"DeepSeek API服务异常: {str(e)}"
             log_error("deepseek_service_error", error_msg, exc_info=True)
-            return f"AI分析遇到问题，请检查网络连接或稍后重试。错误信息: {error_msg}" 
\ No newline at end of file
+            return AIErrorResponse(f"AI分析遇到问题，请检查网络连接或稍后重试。错误信息: {error_msg}") 
\ No newline at end of file
@@ -1,6 +1,7 @@
 import os
+import time
 from logger import get_logger
-from .deepseek import AIProvider
+from .deepseek import AIProvider, AIErrorResponse
 
 try:
     import torch
@@ -14,7 +15,10 @@ except ImportError:
 
 class LocalAIProvider(AIProvider):
     """本地AI模型提供者"""
+    provider_name = "local"
+
     def __init__(self):
+        super().__init__()
         if not TRANSFORMERS_AVAILABLE:
             raise ValueError("本地模型支持需要安装 transformers 和 torch。请运行: pip install torch transformers")
         self.model_path = os.getenv("LOCAL_MODEL_PATH")
@@ -51,6 +55,7 @@ class LocalAIProvider(AIProvider):
         return templates.get(question_type, templates["unknown"])
     async def analyze_challenge(self, description: str, question_type: str) -> str:
         try:
+            start_time = time.time()
             template = self.get_prompt_template(question_type)
             prompt = template.format(description=description)
             inputs = self.tokenizer(
@@ -75,10 +80,20 @@ class LocalAIProvider(AIProvider):
             generated_tokens = outputs[0][input_length:]
             response = self.tokenizer.decode(generated_tokens, skip_special_tokens=True)
             response = response.strip()
+            self.request_count += 1
+            self.total_response_time += time.time() - start_time
+            # 本地模型直接使用tokenizer的真实计数
+            self._record_usage(
+                os.path.basename(self.model_path.rstrip("/")),
+                prompt,
+                response,
+                usage={"prompt_tokens": input_length, "completion_tokens": len(generated_tokens)},
+                question_type=question_type
+            )
             if not response:
-                response = "抱歉，本地模型未能生成有效分析结果，请检查模型配置或尝试其他AI提供者。"
+                response = AIErrorResponse("抱歉，本地模型未能生成有效分析结果，请检查模型配置或尝试其他AI提供者。")
             return response
         except Exception as e:
             error_msg = f"本地AI模型分析异常: {str(e)}"
             print(error_msg)
-            return f"本地模型分析遇到问题，请检查模型配置或稍后重试。错误信息: {error_msg}" 
\ No newline at end of file
+            return AIErrorResponse(f"本地模型分析遇到问题，请检查模型配置或稍后重试。错误信息: {error_msg}") 
\ No newline at end of file
@@ -0,0 +1,165 @@
+"""
+OpenAI兼容接口的本地模拟服务
+
+实现 /v1/chat/completions、/v1/files 和 /v1/batches 的最小子集，返回带模型名和题目摘录的模拟分析结果，
+用于在没有真实提供者时调试在线分析、离线批量以及没有批量接口时的本地回退。
+
+用法（在 backend 目录下运行）:
+    python -m ai_providers.mock_server --port 8001 [--no-batch] [--latency 0.2] [--fail-rate 0.1]
+然后设置 AI_SERVICE=openai_compatible、OPENAI_COMPATIBLE_API_URL=http://127.0.0.1:8001/v1/chat/completions。
+
+也可以不启动服务，直接把 httpx.ASGITransport(app=create_app()) 传给批量客户端。
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import Dict, Any, Tuple
+from fastapi import FastAPI, HTTPException, Request, UploadFile, File, Form, Body
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+
+def create_app(batch_api: bool = True, latency: float = 0.0, fail_rate: float = 0.0,
+               batch_delay: float = 0.0, seed: int = 0) -> FastAPI:
+    """
+    创建模拟服务
+
+    Args:
+        batch_api: 是否提供 /files 和 /batches（为 False 时这些接口返回404）
+        latency: 每次聊天调用的延迟(秒)
+        fail_rate: 聊天调用返回500的比例
+        batch_delay: 批次开始处理前的排队时间(秒)
+        seed: 失败抽样的随机种子
+    """
+    app = FastAPI(title="Mock OpenAI-compatible API")
+    rng = random.Random(seed)
+    files: Dict[str, Dict[str, Any]] = {}
+    batches: Dict[str, Dict[str, Any]] = {}
+
+    def complete(body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        if fail_rate and rng.random() < fail_rate:
+            return 500, {"error": {"message": "mock server error", "type": "server_error"}}
+        messages = body.get("messages") or []
+        prompt = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        model = body.get("model", "mock-model")
+        content = f"[mock:{model}] 模拟分析结果\n\n题目摘录: {prompt[:200]}"
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4 + 1
+        return 200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4 + 1,
+                      "total_tokens": prompt_tokens + len(content) // 4 + 1}
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        if latency:
+            await asyncio.sleep(latency)
+        status_code, payload = complete(body)
+        return JSONResponse(payload, status_code=status_code)
+
+    if not batch_api:
+        return app
+
+    def store_file(content: bytes, purpose: str, filename: str) -> Dict[str, Any]:
+        file_id = f"file-{uuid.uuid4().hex[:12]}"
+        files[file_id] = {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                          "filename": filename, "purpose": purpose, "content": content}
+        return {key: value for key, value in files[file_id].items() if key != "content"}
+
+    async def process(batch: Dict[str, Any]):
+        if batch_delay:
+            await asyncio.sleep(batch_delay)
+        if batch["status"] == "validating":
+            batch["status"] = "in_progress"
+            batch["in_progress_at"] = int(time.time())
+        outputs, errors = [], []
+        lines = [line for line in files[batch["input_file_id"]]["content"].decode("utf-8").splitlines() if line.strip()]
+        batch["request_counts"]["total"] = len(lines)
+        for raw in lines:
+            if batch["status"] == "cancelling":
+                break
+            line = json.loads(raw)
+            if latency:
+                await asyncio.sleep(latency)
+            status_code, payload = complete(line["body"])
+            result = {"id": f"batch_req_{uuid.uuid4().hex[:12]}", "custom_id": line["custom_id"],
+                      "response": {"status_code": status_code, "request_id": uuid.uuid4().hex, "body": payload},
+                      "error": None}
+            (outputs if status_code == 200 else errors).append(json.dumps(result, ensure_ascii=False))
+            batch["request_counts"]["completed" if status_code == 200 else "failed"] += 1
+        if outputs:
+            batch["output_file_id"] = store_file("\n".join(outputs).encode("utf-8") + b"\n", "batch_output", "output.jsonl")["id"]
+        if errors:
+            batch["error_file_id"] = store_file("\n".join(errors).encode("utf-8") + b"\n", "batch_output", "errors.jsonl")["id"]
+        batch["status"] = "cancelled" if batch["status"] == "cancelling" else "completed"
+        batch[f"{batch['status']}_at"] = int(time.time())
+
+    @app.post("/v1/files")
+    async def upload_file(file: UploadFile = File(...), purpose: str = Form(...)):
+        return store_file(await file.read(), purpose, file.filename or "upload.jsonl")
+
+    @app.get("/v1/files/{file_id}/content")
+    async def file_content(file_id: str):
+        if file_id not in files:
+            raise HTTPException(status_code=404, detail="file not found")
+        return PlainTextResponse(files[file_id]["content"].decode("utf-8"))
+
+    @app.post("/v1/batches")
+    async def create_batch(payload: Dict[str, Any] = Body(...)):
+        if payload.get("input_file_id") not in files:
+            raise HTTPException(status_code=400, detail="input_file_id not found")
+        batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+        batch = batches[batch_id] = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": payload.get("endpoint"),
+            "input_file_id": payload["input_file_id"],
+            "completion_window": payload.get("completion_window", "24h"),
+            "status": "validating",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": int(time.time()),
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            "metadata": payload.get("metadata") or {}
+        }
+        batch["_task"] = asyncio.create_task(process(batch))
+        return {key: value for key, value in batch.items() if not key.startswith("_")}
+
+    @app.get("/v1/batches/{batch_id}")
+    async def retrieve_batch(batch_id: str):
+        if batch_id not in batches:
+            raise HTTPException(status_code=404, detail="batch not found")
+        return {key: value for key, value in batches[batch_id].items() if not key.startswith("_")}
+
+    @app.post("/v1/batches/{batch_id}/cancel")
+    async def cancel_batch(batch_id: str):
+        batch = batches.get(batch_id)
+        if batch is None:
+            raise HTTPException(status_code=404, detail="batch not found")
+        if batch["status"] in ("validating", "in_progress"):
+            batch["status"] = "cancelling"
+        return {key: value for key, value in batch.items() if not key.startswith("_")}
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI兼容接口的本地模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--no-batch", action="store_true", help="不提供批量接口，用于测试本地回退")
+    parser.add_argument("--latency", type=float, default=0.0, help="每次调用的延迟(秒)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="调用失败的比例")
+    parser.add_argument("--batch-delay", type=float, default=0.0, help="批次排队时间(秒)")
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run(create_app(not args.no_batch, args.latency, args.fail_rate, args.batch_delay),
+                host=args.host, port=args.port)
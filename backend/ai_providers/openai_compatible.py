@@ -1,50 +1,58 @@
 import os
+import time
 import httpx
+from typing import Dict
 from logger import get_logger
-from .deepseek import DeepSeekProvider, AIProvider
+from .deepseek import DeepSeekProvider, AIProvider, AIErrorResponse
 
 class OpenAICompatibleProvider(AIProvider):
     """OpenAI兼容API提供者（支持本地部署的OpenAI兼容服务）"""
+    provider_name = "openai_compatible"
+
     def __init__(self):
+        super().__init__()
         self.api_key = os.getenv("OPENAI_COMPATIBLE_API_KEY", "sk-no-key-required")
         self.api_url = os.getenv("OPENAI_COMPATIBLE_API_URL")
         self.model = os.getenv("OPENAI_COMPATIBLE_MODEL", "gpt-3.5-turbo")
         if not self.api_url:
             raise ValueError("OPENAI_COMPATIBLE_API_URL环境变量未设置")
+    def build_headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key != "sk-no-key-required":
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
     def get_prompt_template(self, question_type: str) -> str:
         deepseek_provider = DeepSeekProvider.__new__(DeepSeekProvider)
         return deepseek_provider.get_prompt_template(question_type)
     async def analyze_challenge(self, description: str, question_type: str) -> str:
         try:
-            template = self.get_prompt_template(question_type)
-            prompt = template.format(description=description)
-            request_data = {
-                "model": self.model,
-                "messages": [
-                    {"role": "system", "content": "你是一个专业的CTF专家，具有丰富的网络安全知识和实战经验。请提供详细、专业且实用的分析。"},
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.7,
-                "max_tokens": 4000,
-                "stream": False
-            }
-            headers = {"Content-Type": "application/json"}
-            if self.api_key != "sk-no-key-required":
-                headers["Authorization"] = f"Bearer {self.api_key}"
+            start_time = time.time()
+            request_data = self.build_chat_request(description, question_type)
+            headers = self.build_headers()
             async with httpx.AsyncClient(timeout=60.0) as client:
                 response = await client.post(
                     self.api_url,
                     headers=headers,
                     json=request_data
                 )
+                self.request_count += 1
+                self.total_response_time += time.time() - start_time
                 if response.status_code == 200:
                     result = response.json()
-                    return result["choices"][0]["message"]["content"]
+                    ai_response = result["choices"][0]["message"]["content"]
+                    self._record_usage(
+                        self.model,
+                        "\n".join(m["content"] for m in request_data["messages"]),
+                        ai_response,
+                        usage=result.get("usage"),
+                        question_type=question_type
+                    )
+                    return ai_response
                 else:
                     error_msg = f"OpenAI兼容API调用失败: {response.status_code} - {response.text}"
                     print(error_msg)
-                    return f"AI分析暂时不可用，请稍后重试。错误信息: {error_msg}"
+                    return AIErrorResponse(f"AI分析暂时不可用，请稍后重试。错误信息: {error_msg}")
         except Exception as e:
             error_msg = f"OpenAI兼容API服务异常: {str(e)}"
             print(error_msg)
-            return f"AI分析遇到问题，请检查网络连接或稍后重试。错误信息: {error_msg}" 
\ No newline at end of file
+            return AIErrorResponse(f"AI分析遇到问题，请检查网络连接或稍后重试。错误信息: {error_msg}") 
\ No newline at end of file
@@ -1,11 +1,16 @@
 import os
+import time
 import httpx
+from typing import Dict, Any
 from logger import get_logger
-from .deepseek import DeepSeekProvider, AIProvider
+from .deepseek import DeepSeekProvider, AIProvider, AIErrorResponse
 
 class SiliconFlowProvider(AIProvider):
     """硅基流动 AI提供者"""
+    provider_name = "siliconflow"
+
     def __init__(self):
+        super().__init__()
         self.api_key = os.getenv("SILICONFLOW_API_KEY")
         self.api_url = os.getenv("SILICONFLOW_API_URL", "https://api.siliconflow.cn/v1/chat/completions")
         self.model = os.getenv("SILICONFLOW_MODEL", "Qwen/QwQ-32B")
@@ -16,42 +21,45 @@ class SiliconFlowProvider(AIProvider):
         deepseek_provider = DeepSeekProvider.__new__(DeepSeekProvider)
         return deepseek_provider.get_prompt_template(question_type)
 
+    def build_chat_request(self, description: str, question_type: str) -> Dict[str, Any]:
+        request_data = super().build_chat_request(description, question_type)
+        request_data.update({
+            "top_p": 0.7,
+            "top_k": 50,
+            "frequency_penalty": 0.5,
+            "n": 1,
+            "response_format": {"type": "text"}
+        })
+        return request_data
+
     async def analyze_challenge(self, description: str, question_type: str) -> str:
         try:
-            template = self.get_prompt_template(question_type)
-            prompt = template.format(description=description)
-            request_data = {
-                "model": self.model,
-                "messages": [
-                    {"role": "system", "content": "你是一个专业的CTF专家，具有丰富的网络安全知识和实战经验。请提供详细、专业且实用的分析。"},
-                    {"role": "user", "content": prompt}
-                ],
-                "stream": False,
-                "max_tokens": 4000,
-                "temperature": 0.7,
-                "top_p": 0.7,
-                "top_k": 50,
-                "frequency_penalty": 0.5,
-                "n": 1,
-                "response_format": {"type": "text"}
-            }
+            start_time = time.time()
+            request_data = self.build_chat_request(description, question_type)
             async with httpx.AsyncClient(timeout=60.0) as client:
                 response = await client.post(
                     self.api_url,
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json"
-                    },
+                    headers=self.build_headers(),
                     json=request_data
                 )
+                self.request_count += 1
+                self.total_response_time += time.time() - start_time
                 if response.status_code == 200:
                     result = response.json()
-                    return result["choices"][0]["message"]["content"]
+                    ai_response = result["choices"][0]["message"]["content"]
+                    self._record_usage(
+                        self.model,
+                        "\n".join(m["content"] for m in request_data["messages"]),
+                        ai_response,
+                        usage=result.get("usage"),
+                        question_type=question_type
+                    )
+                    return ai_response
                 else:
                     error_msg = f"硅基流动API调用失败: {response.status_code} - {response.text}"
                     print(error_msg)
-                    return f"AI分析暂时不可用，请稍后重试。错误信息: {error_msg}"
+                    return AIErrorResponse(f"AI分析暂时不可用，请稍后重试。错误信息: {error_msg}")
         except Exception as e:
             error_msg = f"硅基流动AI服务异常: {str(e)}"
             print(error_msg)
-            return f"AI分析遇到问题，请检查网络连接或稍后重试。错误信息: {error_msg}" 
\ No newline at end of file
+            return AIErrorResponse(f"AI分析遇到问题，请检查网络连接或稍后重试。错误信息: {error_msg}") 
\ No newline at end of file
@@ -1,17 +1,32 @@
 import os
 import hashlib
 import json
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Optional
 from dotenv import load_dotenv
-from ai_providers import AIProviderFactory, AIProvider
+from ai_providers import AIProviderFactory, AIProvider, AIErrorResponse
 from config import config
 from logger import get_logger
 from data_service import data_service
 from conversation_service import conversation_service
+from token_meter import token_meter
+from prompt_builder import prompt_assembler
+from context_provider import context_provider
+from stats_service import stats_service
 import re
 
 load_dotenv()
 
+# 提供者调用失败时返回的提示文本开头，用于识别从缓存、历史等处读回的已失去 AIErrorResponse 类型的文本
+ERROR_RESPONSE_PREFIXES = (
+    "AI分析暂时不可用", "AI分析遇到问题", "本地模型分析遇到问题", "抱歉，本地模型未能生成有效分析结果"
+)
+
+
+def is_error_response(response: Optional[str]) -> bool:
+    """判断分析结果是否为调用失败的提示（提供者返回的 AIErrorResponse 或以失败提示开头的文本）"""
+    return not response or isinstance(response, AIErrorResponse) or response.startswith(ERROR_RESPONSE_PREFIXES)
+
+
 class AIService:
     """AI服务管理类"""
     
@@ -32,86 +47,20 @@ class AIService:
         return hashlib.md5(content.encode('utf-8')).hexdigest()
 
     def _collect_context(self, description: str, question_type: str, user_id: str = None) -> Dict[str, Any]:
-        """收集上下文信息"""
-        context = {
-            "user_preferences": {},
-            "history_summary": "",
-            "similar_challenges": [],
-            "tool_usage": [],
-            "success_patterns": []
-        }
-        
+        """收集上下文信息（来自内存中增量维护的聚合数据）"""
         try:
-            # 1. 获取用户偏好设置
-            user_config = data_service.get_user_config()
-            context["user_preferences"] = {
-                "ai_provider": user_config.get("ai_provider", "deepseek"),
-                "language": user_config.get("ai_settings", {}).get("language", "zh"),
-                "analysis_style": user_config.get("analysis_settings", {}).get("style", "detailed")
-            }
-            
-            # 2. 获取历史分析记录摘要
-            history = data_service.get_analysis_history(limit=10)
-            if history:
-                # 提取相似题目的分析结果
-                similar_history = [h for h in history if h.get("analysis_data", {}).get("type") == question_type]
-                if similar_history:
-                    context["history_summary"] = self._summarize_history(similar_history[:3])
-                    context["similar_challenges"] = similar_history[:3]
-            
-            # 3. 获取工具使用历史
-            tools = data_service.get_tools()
-            if tools:
-                # 根据题目类型推荐相关工具
-                relevant_tools = [tool for tool in tools if tool.get("category") == question_type]
-                context["tool_usage"] = relevant_tools[:5]
-            
-            # 4. 获取成功解题模式
-            auto_solves = data_service.get_auto_solves(limit=10)
-            if auto_solves:
-                successful_solves = [solve for solve in auto_solves if solve.get("status") == "completed"]
-                context["success_patterns"] = self._extract_success_patterns(successful_solves)
-            
+            context = context_provider.get_context(question_type, user_id, description)
             self.logger.info(f"收集到上下文信息: {len(context)} 个维度")
-            
+            return context
         except Exception as e:
             self.logger.warning(f"收集上下文信息失败: {e}")
-        
-        return context
-    
-    def _summarize_history(self, history: List[Dict[str, Any]]) -> str:
-        """总结历史分析记录"""
-        if not history:
-            return ""
-        
-        summary_parts = []
-        for record in history:
-            analysis_data = record.get("analysis_data", {})
-            summary_parts.append(f"题目类型: {analysis_data.get('type', 'unknown')}")
-            if analysis_data.get('ai_response'):
-                # 提取AI响应的关键信息
-                response = analysis_data['ai_response']
-                if '## 分析思路' in response:
-                    summary_parts.append("包含详细分析思路")
-                if '## 解题步骤' in response:
-                    summary_parts.append("包含具体解题步骤")
-                if 'flag{' in response.lower():
-                    summary_parts.append("包含flag信息")
-        
-        return " | ".join(summary_parts[:5])  # 限制长度
-    
-    def _extract_success_patterns(self, successful_solves: List[Dict[str, Any]]) -> List[str]:
-        """提取成功解题模式"""
-        patterns = []
-        for solve in successful_solves:
-            method = solve.get("solve_method", "")
-            if method:
-                patterns.append(f"成功使用 {method} 方法解题")
-            
-            if solve.get("flag"):
-                patterns.append("成功获取flag")
-        
-        return patterns[:3]  # 限制数量
+            return {
+                "user_preferences": {},
+                "history_summary": "",
+                "similar_challenges": [],
+                "tool_usage": [],
+                "success_patterns": []
+            }
     
     def _build_context_prompt(self, description: str, question_type: str, context: Dict[str, Any]) -> str:
         """构建包含上下文的提示词"""
@@ -148,69 +97,90 @@ class AIService:
         
         return enhanced_prompt
 
-    async def analyze_challenge(self, description: str, question_type: str, user_id: str = None, use_context: bool = True, conversation_id: str = None) -> str:
+    def cache_key(self, description: str, question_type: str, file_context: str = None) -> str:
+        """当前提供者对该题目分析结果的缓存键"""
+        return self._generate_cache_key(description + (file_context or ""), question_type, self.provider_type)
+
+    def build_prompt(self, description: str, question_type: str, user_id: str = None, use_context: bool = True,
+                     conversation_id: str = None, file_context: str = None) -> str:
+        """按优先级收集上下文和对话历史，在token预算内组装最终提示词"""
+        # 收集上下文信息
+        context = self._collect_context(description, question_type, user_id) if use_context else {}
+
+        # 获取对话历史（由提示词组装器按预算裁剪）
+        history_msgs = []
+        if conversation_id:
+            history_msgs = conversation_service.get_conversation_history(conversation_id)
+            # 调用方已将当前问题写入对话，避免在历史中重复
+            if history_msgs and history_msgs[-1].get("role") == "user" and description.startswith(history_msgs[-1].get("content", "")):
+                history_msgs = history_msgs[:-1]
+
+        # 构建上下文信息（按优先级排序）
+        context_info = []
+        if context.get("user_preferences"):
+            prefs = context["user_preferences"]
+            context_info.append(f"用户偏好: 使用{prefs.get('language', '中文')}分析，风格{prefs.get('analysis_style', '详细')}")
+        if context.get("tool_usage"):
+            tools = [tool.get("name", "") for tool in context["tool_usage"]]
+            context_info.append(f"推荐工具: {', '.join(tools)}")
+        if context.get("success_patterns"):
+            patterns = context["success_patterns"]
+            context_info.append(f"成功模式: {'; '.join(patterns)}")
+        for similar in context.get("similar_challenges", []):
+            # 只有检索索引返回的结果带有题解要点
+            if similar.get("digest"):
+                solved = "（已成功解题）" if similar.get("solved") else ""
+                context_info.append(f"相似题解[{similar.get('type')}]{solved}: {similar['digest']}")
+        if context.get("history_summary"):
+            context_info.append(f"历史分析摘要: {context['history_summary']}")
+
+        # 按token预算组装最终 prompt
+        base_prompt = self.provider.get_prompt_template(question_type)
+        final_prompt, _ = prompt_assembler.assemble(
+            description,
+            question_type,
+            base_prompt,
+            context_info=context_info,
+            history_msgs=history_msgs,
+            conversation_id=conversation_id,
+            file_context=file_context
+        )
+        return final_prompt
+
+    async def analyze_challenge(self, description: str, question_type: str, user_id: str = None, use_context: bool = True,
+                                conversation_id: str = None, file_context: str = None) -> str:
         """
         分析CTF题目（支持上下文增强和多轮对话）
+
+        file_context 为上传文件的预分析摘要，放在提示词的当前问题部分
         """
         try:
-            # 收集上下文信息
-            context = self._collect_context(description, question_type, user_id) if use_context else {}
-
-            # 获取对话历史
-            history_msgs = []
-            if conversation_id:
-                history_msgs = conversation_service.get_conversation_history(conversation_id, limit=6)
-
-            # 构建对话历史文本
-            history_text = ""
-            if history_msgs:
-                history_text = "## 对话历史\n" + "\n".join([
-                    f"{'用户' if m['role']=='user' else 'AI助手'}: {m['content']}" for m in history_msgs
-                ]) + "\n"
-
-            # 构建上下文信息
-            context_info = []
-            if context.get("user_preferences"):
-                prefs = context["user_preferences"]
-                context_info.append(f"用户偏好: 使用{prefs.get('language', '中文')}分析，风格{prefs.get('analysis_style', '详细')}")
-            if context.get("history_summary"):
-                context_info.append(f"历史分析摘要: {context['history_summary']}")
-            if context.get("tool_usage"):
-                tools = [tool.get("name", "") for tool in context["tool_usage"]]
-                context_info.append(f"推荐工具: {', '.join(tools)}")
-            if context.get("success_patterns"):
-                patterns = context["success_patterns"]
-                context_info.append(f"成功模式: {'; '.join(patterns)}")
-            context_section = "\n\n## 上下文信息\n" + "\n".join(f"- {info}" for info in context_info) if context_info else ""
-
-            # 构建最终 prompt
-            base_prompt = self.provider.get_prompt_template(question_type)
-            prompt_body = f"{description}{context_section}"
-            enhanced_prompt = base_prompt.replace("{description}", prompt_body)
-            final_prompt = f"{history_text}\n## 当前问题\n题目类型: {question_type}\n题目描述: {enhanced_prompt}\n请基于对话历史和上下文信息，提供连贯且深入的分析。"
+            final_prompt = self.build_prompt(description, question_type, user_id, use_context,
+                                             conversation_id, file_context)
 
             # 检查缓存
-            cache_key = self._generate_cache_key(description, question_type, self.provider_type)
+            cache_key = self.cache_key(description, question_type, file_context)
             cached_response = data_service.get_cache(cache_key)
             if cached_response:
                 self.logger.info(f"使用上下文缓存响应，题目类型: {question_type}")
                 return cached_response
 
-            # 调用AI分析
-            response = await self.provider.analyze_challenge(final_prompt, question_type)
-            data_service.save_cache(cache_key, response, ttl=config.CACHE_TTL)
-
-            # 追加消息到对话
-            if conversation_id:
-                conversation_service.add_message(conversation_id, "user", description, {"question_type": question_type})
-                conversation_service.add_message(conversation_id, "assistant", response, {})
+            # 调用AI分析（绑定用户和题目类型用于token计量），失败的提示不写入缓存
+            with token_meter.scope(user_id=user_id, question_type=question_type):
+                response = await self.provider.analyze_challenge(final_prompt, question_type)
+            if not is_error_response(response):
+                data_service.save_cache(cache_key, response, ttl=config.CACHE_TTL)
 
             return response
         except Exception as e:
             error_msg = f"AI服务异常: {str(e)}"
             self.logger.error(error_msg, exc_info=True)
-            return f"AI分析遇到问题，请检查配置或稍后重试。错误信息: {error_msg}"
+            return AIErrorResponse(f"AI分析遇到问题，请检查配置或稍后重试。错误信息: {error_msg}")
     
+    def get_cached_response(self, description: str, question_type: str, file_context: str = None) -> Optional[str]:
+        """查询当前提供者对该题目的缓存结果（与 analyze_challenge 使用相同的缓存键），不调用AI"""
+        return data_service.get_cache(self.cache_key(description, question_type, file_context))
+
     async def generate_solve_code(self, description: str, question_type: str) -> str:
         """
         生成解题代码
@@ -253,7 +223,8 @@ class AIService:
             prompt = template.format(description=description)
             
             # 调用AI生成代码
-            response = await self.provider.analyze_challenge(prompt, question_type)
+            with token_meter.scope(question_type=question_type):
+                response = await self.provider.analyze_challenge(prompt, question_type)
             
             # 提取代码部分
             code = self._extract_code_from_response(response)
@@ -340,12 +311,23 @@ class AIService:
         """
         provider_stats = self.provider.get_performance_stats()
         # 文件缓存不统计命中率，仅返回缓存文件数
-        cache_files = len(list(data_service.cache_dir.glob("cache_*.json")))
+        cache_files = stats_service.get_cache_file_count()
         return {
             "provider": self.provider_type,
             "provider_stats": provider_stats,
             "cache_files": cache_files
         }
+
+    def get_token_metrics(self) -> Dict[str, Any]:
+        """
+        获取token用量与费用统计
+
+        Returns:
+            按提供者、模型、用户和题目类型聚合的用量字典
+        """
+        metrics = token_meter.get_stats()
+        metrics["current_provider"] = self.provider_type
+        return metrics
     
     def switch_provider(self, provider_type: str) -> bool:
         """
@@ -0,0 +1,9 @@
+"""上传文件的本地预分析（在调用AI之前提取文件特征并生成提示词摘要）"""
+from .pcap import summarize_pcap, format_pcap_summary, is_capture
+from .binary import triage_binary, format_binary_summary, is_binary, BINARY_MIME_TYPES
+from .image_stego import scan_image, format_stego_summary, image_format
+from .archive import extract_archive, format_archive_manifest, archive_type
+from .strings import scan_strings, format_strings_summary
+from .filetype import detect_file, detect_bytes
+from .common import cached_report
+from .pipeline import analysis_pipeline, analyzer_registry, AnalyzerSpec, merge_context
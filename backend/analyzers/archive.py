@@ -0,0 +1,471 @@
+"""
+压缩包递归解包
+
+支持 zip、tar、gzip、bzip2、xz，安装 py7zr 时支持 7z。解出的文件按块流式写入本次解包的临时目录（按内容哈希命名，
+不使用压缩包中的路径写文件，解包和预分析结束后删除），嵌套的压缩包继续递归解包，其他文件按文件头分发给对应的预分析
+（二进制、图片、流量包），预分析在线程池中与解包并行执行，最后生成用于提示词的文件清单。
+
+防压缩炸弹：限制嵌套深度、解出的总字节数、文件数量和压缩比。大小按实际解压的字节数统计，
+不信任压缩包头中声明的大小。
+"""
+import bz2
+import gzip
+import lzma
+import os
+import queue
+import tarfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, Future
+from pathlib import Path
+from typing import Dict, Any, List, Optional, BinaryIO, Iterator
+from config import config
+from logger import get_logger
+from upload_store import upload_store, UploadTooLargeError
+from .common import cached_report, iter_flags
+from .binary import triage_binary, format_binary_summary, is_binary
+from .image_stego import scan_image, format_stego_summary, image_format
+from .pcap import summarize_pcap, format_pcap_summary, is_capture
+from .filetype import detect_file
+
+try:
+    import py7zr
+    from py7zr.io import Py7zIO, WriterFactory
+    PY7ZR_AVAILABLE = True
+except ImportError:
+    py7zr = None
+    Py7zIO = WriterFactory = object
+    PY7ZR_AVAILABLE = False
+
+logger = get_logger("analyzers.archive")
+
+SINGLE_STREAM_OPENERS = {"gzip": gzip.open, "bzip2": bz2.open, "xz": lzma.open}
+SINGLE_STREAM_SUFFIXES = {"gzip": (".gz", ".tgz"), "bzip2": (".bz2", ".tbz2"), "xz": (".xz", ".txz")}
+# 压缩比检查的余量，避免很小的高压缩比文件（如全零的小文件）被误判
+RATIO_SLACK = 1024 * 1024
+# 嵌套文件预分析摘要的最大长度
+MEMBER_SUMMARY_CHARS = 800
+
+# 嵌套文件预分析线程池
+_executor = ThreadPoolExecutor(max_workers=config.ARCHIVE_WORKERS, thread_name_prefix="archive")
+
+
+class ArchiveLimitError(Exception):
+    """解包超过防压缩炸弹限制，fatal 为 False 时只跳过当前文件"""
+
+    def __init__(self, reason: str, fatal: bool = True):
+        super().__init__(reason)
+        self.fatal = fatal
+
+
+def archive_type(head: bytes) -> Optional[str]:
+    """根据文件头判断压缩包类型（tar 需要至少 262 字节的文件头）"""
+    if head[:4] in (b"PK\x03\x04", b"PK\x05\x06"):
+        return "zip"
+    if head[:3] == b"\x1f\x8b\x08":
+        return "gzip"
+    if head[:3] == b"BZh" and head[4:10] == b"1AY&SY":
+        return "bzip2"
+    if head[:6] == b"\xfd7zXZ\x00":
+        return "xz"
+    if head[:6] == b"7z\xbc\xaf\x27\x1c":
+        return "7z"
+    if head[257:262] == b"ustar":
+        return "tar"
+    return None
+
+
+class ByteQuota:
+    """字节配额，超出时抛出 ArchiveLimitError"""
+
+    def __init__(self, limit: float, reason: str, fatal: bool = True):
+        self.limit = limit
+        self.used = 0
+        self.reason = reason
+        self.fatal = fatal
+
+    def consume(self, size: int):
+        self.used += size
+        if self.used > self.limit:
+            raise ArchiveLimitError(self.reason, self.fatal)
+
+
+class LimitedReader:
+    """包装解压流，每次读取都按顺序计入所有配额，bytes_read 为实际解压出的字节数"""
+
+    def __init__(self, stream: BinaryIO, quotas: List[ByteQuota]):
+        self.stream = stream
+        self.quotas = quotas
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.stream.read(size if size and size > 0 else config.UPLOAD_CHUNK_SIZE)
+        self.bytes_read += len(chunk)
+        for quota in self.quotas:
+            quota.consume(len(chunk))
+        return chunk
+
+
+class _SevenZipWriter(Py7zIO):
+    """py7zr 的输出对象：把一个文件的解压数据逐块放进管道"""
+
+    def __init__(self, pipe: "_SevenZipPipe"):
+        self.pipe = pipe
+        self.written = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        # py7zr 每次写入的块可能很大（上百MB），按上传块大小复制成小块放入管道，
+        # 写入返回后 py7zr 即可释放整块，管道中只保留几个小块
+        view = memoryview(data)
+        for start in range(0, len(view), config.UPLOAD_CHUNK_SIZE):
+            self.pipe.put(("data", bytes(view[start:start + config.UPLOAD_CHUNK_SIZE])))
+        self.written += len(view)
+        return len(view)
+
+    def read(self, size: Optional[int] = None) -> bytes:
+        return b""
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return 0
+
+    def flush(self):
+        pass
+
+    def size(self) -> int:
+        return self.written
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.pipe.put(("end", None))
+
+
+class _SevenZipPipe(WriterFactory):
+    """
+    在后台线程中用 py7zr 解压 7z，按文件把解压数据交给解包线程
+
+    py7zr 只能把解压数据写入它创建的输出对象，不能按文件读取。这里的输出对象把每次写入放进有界队列，
+    解包线程通过 members() 逐个取出文件的数据流，与 zip、tar 一样经过 LimitedReader 计入配额，
+    内存中最多保留几个块。解包线程停止读取时调用 close()，后台线程在下一次写入时中止解压。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.queue: "queue.Queue[tuple]" = queue.Queue(maxsize=4)
+        self.aborted = threading.Event()
+        self.thread = threading.Thread(target=self._extract, name="archive-7z", daemon=True)
+        self.writer: Optional[_SevenZipWriter] = None
+
+    def create(self, filename: str) -> _SevenZipWriter:
+        # 较早版本的 py7zr 不在文件解压完成时调用 close()，由下一个文件开始时补上结束标记
+        self._close_writer()
+        self.put(("start", filename))
+        self.writer = _SevenZipWriter(self)
+        return self.writer
+
+    def _close_writer(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def put(self, item: tuple):
+        while not self.aborted.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise ArchiveLimitError("解包已中止")
+
+    def _extract(self):
+        try:
+            # 传入文件对象时 py7zr 在当前线程中依次解压各个文件
+            with open(self.path, "rb") as f, py7zr.SevenZipFile(f, mode="r") as archive:
+                archive.extractall(factory=self)
+            self._close_writer()
+            self.put(("done", None))
+        except Exception as e:
+            if not self.aborted.is_set():
+                self.put(("error", e))
+
+    def members(self) -> Iterator[tuple]:
+        """依次返回 (文件名, 数据流)，取下一个文件前会读完上一个文件的剩余数据"""
+        self.thread.start()
+        stream = None
+        while True:
+            if stream is not None:
+                stream.drain()
+            kind, value = self.queue.get()
+            if kind == "start":
+                stream = _SevenZipStream(self.queue)
+                yield value, stream
+            elif kind == "done":
+                return
+            elif kind == "error":
+                raise ValueError(str(value) or type(value).__name__)
+
+    def close(self):
+        self.aborted.set()
+        while self.thread.is_alive():
+            try:
+                self.queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.thread.join()
+
+
+class _SevenZipStream:
+    """7z 中一个文件的解压数据流（从管道读取，读到文件结束时返回空字节）"""
+
+    def __init__(self, pipe_queue: "queue.Queue[tuple]"):
+        self.queue = pipe_queue
+        self.buffer = b""
+        self.finished = False
+
+    def read(self, size: int = -1) -> bytes:
+        while not self.buffer and not self.finished:
+            kind, value = self.queue.get()
+            if kind == "data":
+                self.buffer = value
+            else:
+                self.finished = True
+        if size is None or size < 0:
+            size = len(self.buffer)
+        chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
+
+    def drain(self):
+        while self.read(config.UPLOAD_CHUNK_SIZE):
+            pass
+
+
+def _text_summary(path: str) -> Dict[str, Any]:
+    with upload_store.open_mmap(path) as buf:
+        if buf is None:
+            return {}
+        head = bytes(buf[:300])
+        flags = sorted({value for value, _ in iter_flags(buf)})[:10]
+    printable = sum(32 <= b < 127 or b in (9, 10, 13) for b in head) / max(len(head), 1)
+    summary: Dict[str, Any] = {}
+    if flags:
+        summary["flags"] = flags
+    if printable > 0.9:
+        summary["preview"] = head.decode("utf-8", errors="replace")[:200]
+    return summary
+
+
+def analyze_member(path: str, sha256: str, head: bytes) -> Dict[str, Any]:
+    """按文件头把解出的文件分发给对应的预分析，返回 {"analyzer", "summary"} 或文本预览/flag"""
+    if is_binary(head):
+        report = cached_report("binary", sha256, lambda: triage_binary(path))
+        return {"analyzer": "binary", "summary": format_binary_summary(report, MEMBER_SUMMARY_CHARS)}
+    if image_format(head):
+        report = cached_report("stego", sha256, lambda: scan_image(path))
+        return {"analyzer": "image_stego", "summary": format_stego_summary(report, MEMBER_SUMMARY_CHARS)}
+    if is_capture(head):
+        report = cached_report("pcap", sha256, lambda: summarize_pcap(path, time_budget=config.PCAP_TIME_BUDGET))
+        return {"analyzer": "pcap", "summary": format_pcap_summary(report, MEMBER_SUMMARY_CHARS)}
+    return _text_summary(path)
+
+
+class ArchiveExtractor:
+    """递归解包一个上传的压缩包（每次解包创建一个实例）"""
+
+    def __init__(self, max_depth: Optional[int] = None, max_total_size: Optional[int] = None,
+                 max_ratio: Optional[float] = None, max_members: Optional[int] = None):
+        self.max_depth = max_depth or config.ARCHIVE_MAX_DEPTH
+        self.max_ratio = max_ratio or config.ARCHIVE_MAX_RATIO
+        self.max_members = max_members or config.ARCHIVE_MAX_MEMBERS
+        self.total = ByteQuota(max_total_size or config.ARCHIVE_MAX_TOTAL_SIZE, "解出的总大小超过限制")
+        # 因超过单个文件的限制而跳过的文件已解压的字节数（不计入总大小）
+        self.skipped_size = 0
+        self.members: List[Dict[str, Any]] = []
+        self.warnings: List[str] = []
+        self.stopped: Optional[str] = None
+        self._pending: List[tuple] = []
+        self._scratch: Optional[Path] = None
+
+    def extract(self, path: str, name: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        kind = archive_type(upload_store.read_head(path, 512))
+        if kind is None and any(item["type"] == "zip" for item in detect_file(path)["embedded"]):
+            # 附加在其他文件后面的 zip（zipfile 从结尾的目录记录定位，前面的数据不影响读取）
+            kind = "zip"
+        if kind is None:
+            raise ValueError("不是支持的压缩包格式")
+        # 解出的文件只在解包和预分析期间使用（结果按内容哈希缓存），结束后随临时目录删除
+        with upload_store.scratch() as self._scratch:
+            try:
+                self._walk(path, name, kind, 1)
+            finally:
+                for member, future in self._pending:
+                    try:
+                        member.update(future.result())
+                    except Exception as e:
+                        member["error"] = f"预分析失败: {e}"
+        elapsed = time.perf_counter() - started
+        return {
+            "format": kind,
+            "members": self.members,
+            "member_count": len(self.members),
+            "total_size": self.total.used,
+            "skipped_size": self.skipped_size,
+            "max_depth": max((m["depth"] for m in self.members), default=0),
+            "warnings": self.warnings[:50],
+            "stopped": self.stopped,
+            "elapsed_ms": round(elapsed * 1000, 1)
+        }
+
+    # 各格式的遍历
+    def _walk(self, path: str, display: str, kind: str, depth: int):
+        try:
+            if kind == "zip":
+                self._walk_zip(path, display, depth)
+            elif kind == "tar":
+                self._walk_tar(path, display, depth)
+            elif kind in SINGLE_STREAM_OPENERS:
+                self._walk_single(path, display, kind, depth)
+            elif kind == "7z":
+                self._walk_7z(path, display, depth)
+        except ArchiveLimitError as e:
+            self.stopped = self.stopped or str(e)
+        except (zipfile.BadZipFile, tarfile.TarError, OSError, EOFError, lzma.LZMAError, ValueError) as e:
+            self.warnings.append(f"{display}: 解包失败 ({e})")
+
+    def _walk_zip(self, path: str, display: str, depth: int):
+        with zipfile.ZipFile(path) as archive:
+            if archive.comment:
+                self.warnings.append(f"{display}: 压缩包注释 {archive.comment[:200].decode('utf-8', errors='replace')!r}")
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                member_display = f"{display}!/{info.filename}"
+                extra = {"compressed_size": info.compress_size}
+                if info.comment:
+                    extra["comment"] = info.comment[:200].decode("utf-8", errors="replace")
+                if info.flag_bits & 0x1:
+                    # 加密文件（也可能是只设置了加密标志位的伪加密）
+                    self._record(member_display, depth, size=info.file_size, encrypted=True, **extra)
+                    continue
+                ratio = ByteQuota(max(info.compress_size, 1) * self.max_ratio + RATIO_SLACK, "压缩比超过限制", fatal=False)
+                with archive.open(info) as stream:
+                    self._store(stream, member_display, depth, [ratio], extra)
+
+    def _walk_tar(self, path: str, display: str, depth: int):
+        with open(path, "rb") as f, tarfile.open(fileobj=f, mode="r|") as archive:
+            for info in archive:
+                if not info.isfile():
+                    continue
+                stream = archive.extractfile(info)
+                if stream is not None:
+                    self._store(stream, f"{display}!/{info.name}", depth, [], {})
+
+    def _walk_single(self, path: str, display: str, kind: str, depth: int):
+        input_size = os.path.getsize(path)
+        ratio = ByteQuota(input_size * self.max_ratio + RATIO_SLACK, "压缩比超过限制")
+        name = display.rsplit("/", 1)[-1]
+        for suffix in SINGLE_STREAM_SUFFIXES[kind]:
+            if name.lower().endswith(suffix):
+                name = name[:-len(suffix)] + (".tar" if suffix.startswith(".t") else "")
+                break
+        else:
+            name += ".out"
+        with SINGLE_STREAM_OPENERS[kind](path, "rb") as stream:
+            self._store(stream, f"{display}!/{name}", depth, [ratio], {})
+
+    def _walk_7z(self, path: str, display: str, depth: int):
+        if not PY7ZR_AVAILABLE:
+            self.warnings.append(f"{display}: 未安装 py7zr，无法解包 7z")
+            return
+        with py7zr.SevenZipFile(path, mode="r") as archive:
+            if archive.needs_password():
+                self.warnings.append(f"{display}: 7z 压缩包已加密")
+                return
+        # 固实压缩的 7z 没有单个文件的压缩大小，按整个压缩包检查压缩比
+        ratio = ByteQuota(os.path.getsize(path) * self.max_ratio + RATIO_SLACK, "压缩比超过限制")
+        pipe = _SevenZipPipe(path)
+        try:
+            for name, stream in pipe.members():
+                self._store(stream, f"{display}!/{name}", depth, [ratio], {})
+        finally:
+            pipe.close()
+
+    # 单个文件
+    def _record(self, display: str, depth: int, **fields) -> Dict[str, Any]:
+        if len(self.members) >= self.max_members:
+            raise ArchiveLimitError("文件数量超过限制")
+        member = {"path": display, "depth": depth, **fields}
+        self.members.append(member)
+        return member
+
+    def _store(self, stream: BinaryIO, display: str, depth: int, quotas: List[ByteQuota], extra: Dict[str, Any]):
+        member = self._record(display, depth, **extra)
+        # 先检查单个文件的限制，超过时跳过该文件，已读出的字节退回总配额
+        reader = LimitedReader(stream, quotas + [self.total])
+        total_before = self.total.used
+        try:
+            stored = upload_store.save_stream(reader, max_size=int(self.total.limit), directory=self._scratch)
+        except (ArchiveLimitError, UploadTooLargeError) as e:
+            member["skipped"] = str(e)
+            if getattr(e, "fatal", False):
+                raise
+            self.total.used = total_before
+            self.skipped_size += reader.bytes_read
+            return
+        head = upload_store.read_head(stored["path"], 512)
+        member.update({"size": stored["size"], "sha256": stored["sha256"], "mime": detect_file(stored["path"], display)["mime"]})
+        kind = archive_type(head)
+        if kind:
+            member["archive"] = kind
+            if depth < self.max_depth:
+                self._walk(stored["path"], display, kind, depth + 1)
+            else:
+                member["skipped"] = "达到最大嵌套深度"
+        elif stored["size"]:
+            future: Future = _executor.submit(analyze_member, stored["path"], stored["sha256"], head)
+            self._pending.append((member, future))
+
+
+def extract_archive(path: str, name: str, **limits) -> Dict[str, Any]:
+    """
+    递归解包压缩包并生成文件清单
+
+    Args:
+        path: 压缩包路径
+        name: 显示用的文件名
+        limits: ArchiveExtractor 的限制参数（max_depth、max_total_size、max_ratio、max_members）
+    """
+    report = ArchiveExtractor(**limits).extract(path, name)
+    logger.info(f"解包完成: {name}, {report['member_count']} 个文件, {report['total_size']} 字节, 耗时 {report['elapsed_ms']}ms")
+    return report
+
+
+def format_archive_manifest(report: Dict[str, Any], max_chars: int = 6000) -> str:
+    """将文件清单格式化为提示词中的文本块"""
+    lines = [f"[压缩包解包] 格式: {report['format']}, 文件数: {report['member_count']}, "
+             f"解出 {report['total_size']} 字节, 最大嵌套深度 {report['max_depth']}"]
+    if report.get("skipped_size"):
+        lines.append(f"超过单个文件限制而跳过的数据: {report['skipped_size']} 字节")
+    if report.get("stopped"):
+        lines.append(f"解包已中止: {report['stopped']}")
+    for warning in report.get("warnings", [])[:10]:
+        lines.append(f"注意: {warning}")
+    summaries = []
+    for member in report["members"]:
+        line = f"- {member['path']}"
+        details = [f"{member['size']} 字节" if "size" in member else None, member.get("mime"),
+                   "已加密" if member.get("encrypted") else None, member.get("skipped"), member.get("error")]
+        line += " (" + ", ".join(d for d in details if d) + ")"
+        if member.get("comment"):
+            line += f" 注释: {member['comment']!r}"
+        if member.get("flags"):
+            line += " 疑似flag: " + ", ".join(member["flags"])
+        if member.get("preview"):
+            line += f" 内容: {member['preview'][:120]!r}"
+        lines.append(line)
+        if member.get("summary"):
+            summaries.append(member["summary"])
+    # 嵌套文件的预分析摘要放在清单之后，超出长度时优先保留清单
+    text = "\n".join(lines + summaries)
+    return text if len(text) <= max_chars else text[:max_chars] + "\n..."
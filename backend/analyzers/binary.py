@@ -0,0 +1,334 @@
+"""
+ELF/PE 二进制文件预分析
+
+内存映射文件后解析文件头、保护机制（NX、PIE、Canary、RELRO 等）、节区、导入函数和符号，
+提取字符串并计算每个节区的熵，生成紧凑的特征报告，相当于在提示词中附上 checksec 和 readelf 的结果。
+"""
+import mmap
+import re
+import struct
+import time
+from typing import Dict, Any, List, Optional
+from logger import get_logger
+from .common import shannon_entropy, extract_strings, iter_flags
+
+logger = get_logger("analyzers.binary")
+
+ELF_MACHINES = {
+    3: "x86", 8: "mips", 20: "powerpc", 21: "powerpc64", 40: "arm", 62: "x86-64", 183: "aarch64", 243: "riscv"
+}
+BINARY_MIME_TYPES = {
+    "application/x-executable", "application/x-sharedlib", "application/x-pie-executable",
+    "application/x-elf", "application/x-dosexec", "application/vnd.microsoft.portable-executable"
+}
+PE_MACHINES = {0x14C: "x86", 0x8664: "x86-64", 0x1C0: "arm", 0xAA64: "aarch64"}
+
+# pwn 题中常见的危险函数
+DANGEROUS_FUNCTIONS = {
+    "gets", "strcpy", "strcat", "sprintf", "vsprintf", "scanf", "__isoc99_scanf", "printf", "system",
+    "execve", "execl", "popen", "read", "memcpy", "mprotect", "mmap", "alloca", "free", "malloc"
+}
+INTERESTING_SYMBOL = re.compile(r"(?i)win|flag|shell|backdoor|secret|vuln|main$|get_flag|print_flag|magic")
+INTERESTING_STRING = re.compile(r"(?i)flag|ctf\{|/bin/(?:ba)?sh|%[0-9$]*[nsxp]|password|secret|key|https?://")
+
+# 熵的计算最多读取每个节区的前 16MB
+ENTROPY_SAMPLE = 16 * 1024 * 1024
+
+
+def is_binary(head: bytes) -> bool:
+    return head[:4] == b"\x7fELF" or head[:2] == b"MZ"
+
+
+def _cstring(buf, offset: int, limit: int = 256) -> str:
+    if offset < 0 or offset >= len(buf):
+        return ""
+    end = buf.find(b"\x00", offset, min(offset + limit, len(buf)))
+    return bytes(buf[offset:end if end >= 0 else min(offset + limit, len(buf))]).decode("latin-1")
+
+
+# ELF
+def _parse_elf(buf) -> Dict[str, Any]:
+    bits = 64 if buf[4] == 2 else 32
+    endian = "<" if buf[5] == 1 else ">"
+    header = struct.unpack_from(endian + ("HHIQQQIHHHHHH" if bits == 64 else "HHIIIIIHHHHHH"), buf, 16)
+    e_type, machine, _, entry, phoff, shoff, _, _, phentsize, phnum, shentsize, shnum, shstrndx = header
+    report: Dict[str, Any] = {
+        "format": "ELF",
+        "bits": bits,
+        "endian": "little" if endian == "<" else "big",
+        "arch": ELF_MACHINES.get(machine, f"machine:{machine}"),
+        "type": {1: "REL", 2: "EXEC", 3: "DYN", 4: "CORE"}.get(e_type, str(e_type)),
+        "entry": hex(entry)
+    }
+
+    # 程序头
+    segments = []
+    for i in range(min(phnum, 512)):
+        offset = phoff + i * phentsize
+        if offset + phentsize > len(buf):
+            break
+        if bits == 64:
+            p_type, p_flags = struct.unpack_from(endian + "II", buf, offset)
+        else:
+            p_type = struct.unpack_from(endian + "I", buf, offset)[0]
+            p_flags = struct.unpack_from(endian + "I", buf, offset + 24)[0]
+        segments.append((p_type, p_flags))
+    segment_types = {p_type for p_type, _ in segments}
+    gnu_stack = next((flags for p_type, flags in segments if p_type == 0x6474E551), None)
+
+    # 节区
+    section_format = endian + ("IIQQQQIIQQ" if bits == 64 else "IIIIIIIIII")
+    raw_sections = []
+    for i in range(min(shnum, 4096)):
+        offset = shoff + i * shentsize
+        if shoff == 0 or offset + shentsize > len(buf):
+            break
+        raw_sections.append(struct.unpack_from(section_format, buf, offset))
+    names_offset = raw_sections[shstrndx][4] if shstrndx < len(raw_sections) else None
+
+    sections = []
+    by_type: Dict[int, List[tuple]] = {}
+    for index, (name, sh_type, flags, addr, offset, size, link, _, _, entsize) in enumerate(raw_sections):
+        section_name = _cstring(buf, names_offset + name) if names_offset is not None else ""
+        by_type.setdefault(sh_type, []).append((index, section_name, offset, size, link, entsize))
+        if sh_type == 0 or not section_name:
+            continue
+        has_data = sh_type != 8 and offset + size <= len(buf)  # SHT_NOBITS 不占文件空间
+        sections.append({
+            "name": section_name,
+            "addr": hex(addr),
+            "size": size,
+            "flags": ("W" if flags & 1 else "") + ("A" if flags & 2 else "") + ("X" if flags & 4 else ""),
+            "entropy": shannon_entropy(buf[offset:offset + min(size, ENTROPY_SAMPLE)]) if has_data and size else None
+        })
+    report["sections"] = sections
+
+    # 符号表（.symtab 为 SHT_SYMTAB，.dynsym 为 SHT_DYNSYM）
+    def read_symbols(sh_type: int):
+        symbols = []
+        for _, _, offset, size, link, entsize in by_type.get(sh_type, []):
+            if link >= len(raw_sections):
+                continue
+            strtab = raw_sections[link][4]
+            entsize = entsize or (24 if bits == 64 else 16)
+            for position in range(offset, min(offset + size, len(buf)) - entsize + 1, entsize):
+                if bits == 64:
+                    st_name, st_info, _, st_shndx, st_value = struct.unpack_from(endian + "IBBHQ", buf, position)
+                else:
+                    st_name, st_value, _, st_info, _, st_shndx = struct.unpack_from(endian + "IIIBBH", buf, position)
+                if st_name:
+                    symbols.append((_cstring(buf, strtab + st_name).split("@")[0], st_info & 0xF, st_shndx, st_value))
+        return symbols
+
+    symtab = read_symbols(2)
+    dynsym = read_symbols(11)
+    all_names = {name for name, _, _, _ in symtab + dynsym}
+    imports = sorted({name for name, _, shndx, _ in dynsym if shndx == 0 and name})
+    functions = [(name, value) for name, sym_type, shndx, value in symtab + dynsym if sym_type == 2 and shndx != 0]
+
+    # 动态段
+    needed, bind_now, pie_flag, runpath = [], False, False, None
+    for _, _, offset, size, link, _ in by_type.get(6, []):
+        strtab = raw_sections[link][4] if link < len(raw_sections) else 0
+        entry_format = endian + ("qQ" if bits == 64 else "iI")
+        entry_size = struct.calcsize(entry_format)
+        for position in range(offset, min(offset + size, len(buf)) - entry_size + 1, entry_size):
+            tag, value = struct.unpack_from(entry_format, buf, position)
+            if tag == 0:
+                break
+            if tag == 1:
+                needed.append(_cstring(buf, strtab + value))
+            elif tag == 24 or (tag == 30 and value & 0x8) or (tag == 0x6FFFFFFB and value & 0x1):
+                bind_now = True
+            if tag == 0x6FFFFFFB and value & 0x08000000:
+                pie_flag = True
+            if tag in (15, 29):
+                runpath = _cstring(buf, strtab + value)
+
+    if 0x6474E552 in segment_types:
+        relro = "full" if bind_now else "partial"
+    else:
+        relro = "none"
+    if e_type == 3:
+        pie = "enabled" if (3 in segment_types or pie_flag) else "dso"
+    else:
+        pie = "disabled"
+    report["protections"] = {
+        "nx": gnu_stack is not None and not gnu_stack & 0x1,
+        "pie": pie,
+        "canary": bool(all_names & {"__stack_chk_fail", "__stack_chk_guard", "__intel_security_cookie"}),
+        "relro": relro,
+        "fortify": sorted(name for name in all_names if name.startswith("__") and name.endswith("_chk")
+                          and name != "__stack_chk_fail")[:10],
+        "stripped": not by_type.get(2),
+        "static": 3 not in segment_types and 2 not in segment_types,
+        "rpath": runpath
+    }
+    report["libraries"] = needed
+    report["imports"] = imports[:200]
+    report["dangerous_imports"] = sorted(DANGEROUS_FUNCTIONS & (set(imports) | {n for n, _ in functions}))
+    report["interesting_symbols"] = sorted({f"{name}@{hex(value)}" for name, value in functions
+                                            if INTERESTING_SYMBOL.search(name)})[:50]
+    report["symbol_count"] = len(symtab) + len(dynsym)
+    return report
+
+
+# PE
+def _parse_pe(buf) -> Optional[Dict[str, Any]]:
+    pe_offset = struct.unpack_from("<I", buf, 0x3C)[0]
+    if pe_offset + 24 > len(buf) or buf[pe_offset:pe_offset + 4] != b"PE\x00\x00":
+        return None
+    machine, section_count, timestamp, _, _, optional_size, characteristics = struct.unpack_from("<HHIIIHH", buf, pe_offset + 4)
+    optional = pe_offset + 24
+    magic = struct.unpack_from("<H", buf, optional)[0]
+    pe32_plus = magic == 0x20B
+    entry_rva = struct.unpack_from("<I", buf, optional + 16)[0]
+    image_base = struct.unpack_from("<Q" if pe32_plus else "<I", buf, optional + (24 if pe32_plus else 28))[0]
+    subsystem, dll_characteristics = struct.unpack_from("<HH", buf, optional + 68)
+    directories_offset = optional + (112 if pe32_plus else 96)
+    directory_count = struct.unpack_from("<I", buf, directories_offset - 4)[0]
+    directories = [struct.unpack_from("<II", buf, directories_offset + i * 8)
+                   for i in range(min(directory_count, 16)) if directories_offset + i * 8 + 8 <= len(buf)]
+
+    sections = []
+    raw_sections = []
+    table = optional + optional_size
+    for i in range(min(section_count, 96)):
+        offset = table + i * 40
+        if offset + 40 > len(buf):
+            break
+        name = bytes(buf[offset:offset + 8]).rstrip(b"\x00").decode("latin-1")
+        virtual_size, virtual_address, raw_size, raw_pointer = struct.unpack_from("<IIII", buf, offset + 8)
+        flags = struct.unpack_from("<I", buf, offset + 36)[0]
+        raw_sections.append((virtual_address, max(virtual_size, raw_size), raw_pointer))
+        data_end = min(raw_pointer + raw_size, len(buf))
+        sections.append({
+            "name": name,
+            "addr": hex(image_base + virtual_address),
+            "size": raw_size,
+            "flags": ("R" if flags & 0x40000000 else "") + ("W" if flags & 0x80000000 else "") + ("X" if flags & 0x20000000 else ""),
+            "entropy": shannon_entropy(buf[raw_pointer:min(data_end, raw_pointer + ENTROPY_SAMPLE)]) if raw_size else None
+        })
+
+    def rva_to_offset(rva: int) -> Optional[int]:
+        for virtual_address, size, raw_pointer in raw_sections:
+            if virtual_address <= rva < virtual_address + size:
+                return rva - virtual_address + raw_pointer
+        return None
+
+    imports: List[str] = []
+    libraries: List[str] = []
+    if len(directories) > 1 and directories[1][0]:
+        descriptor = rva_to_offset(directories[1][0])
+        thunk_size = 8 if pe32_plus else 4
+        ordinal_flag = 1 << (63 if pe32_plus else 31)
+        while descriptor is not None and descriptor + 20 <= len(buf) and len(libraries) < 256:
+            original_thunk, _, _, name_rva, first_thunk = struct.unpack_from("<IIIII", buf, descriptor)
+            if not name_rva:
+                break
+            name_offset = rva_to_offset(name_rva)
+            library = _cstring(buf, name_offset) if name_offset is not None else "?"
+            libraries.append(library)
+            thunk = rva_to_offset(original_thunk or first_thunk)
+            while thunk is not None and thunk + thunk_size <= len(buf) and len(imports) < 2000:
+                value = struct.unpack_from("<Q" if pe32_plus else "<I", buf, thunk)[0]
+                if not value:
+                    break
+                if value & ordinal_flag:
+                    imports.append(f"{library}!#{value & 0xFFFF}")
+                else:
+                    hint_offset = rva_to_offset(value & 0x7FFFFFFF)
+                    if hint_offset is not None:
+                        imports.append(f"{library}!{_cstring(buf, hint_offset + 2)}")
+                thunk += thunk_size
+            descriptor += 20
+
+    import_names = {name.split("!", 1)[1] for name in imports}
+    return {
+        "format": "PE",
+        "bits": 64 if pe32_plus else 32,
+        "endian": "little",
+        "arch": PE_MACHINES.get(machine, f"machine:{hex(machine)}"),
+        "type": "DLL" if characteristics & 0x2000 else "EXE",
+        "subsystem": {2: "gui", 3: "console"}.get(subsystem, str(subsystem)),
+        "entry": hex(image_base + entry_rva),
+        "timestamp": timestamp,
+        "sections": sections,
+        "protections": {
+            "nx": bool(dll_characteristics & 0x0100),
+            "aslr": bool(dll_characteristics & 0x0040),
+            "high_entropy_va": bool(dll_characteristics & 0x0020),
+            "cfg": bool(dll_characteristics & 0x4000),
+            "seh": not dll_characteristics & 0x0400,
+            # 存在加载配置目录时通常启用了 /GS 安全Cookie
+            "canary": len(directories) > 10 and bool(directories[10][0]),
+            "dotnet": len(directories) > 14 and bool(directories[14][0])
+        },
+        "libraries": libraries,
+        "imports": imports[:200],
+        "dangerous_imports": sorted(DANGEROUS_FUNCTIONS & import_names),
+        "interesting_symbols": sorted(name for name in import_names if INTERESTING_SYMBOL.search(name))[:50]
+    }
+
+
+def triage_binary(path: str, min_string_length: int = 6, max_strings: int = 80) -> Dict[str, Any]:
+    """
+    生成二进制文件特征报告
+
+    Args:
+        path: 文件路径
+        min_string_length: 提取字符串的最小长度
+        max_strings: 报告中保留的字符串数量（可疑字符串优先）
+    """
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        size = f.seek(0, 2)
+        if size < 64:
+            raise ValueError("文件过小，不是有效的二进制文件")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            report = None
+            try:
+                if buf[:4] == b"\x7fELF":
+                    report = _parse_elf(buf)
+                elif buf[:2] == b"MZ":
+                    report = _parse_pe(buf)
+            except (struct.error, IndexError) as e:
+                logger.warning(f"解析二进制文件头失败 {path}: {e}")
+            report = report or {"format": "unknown"}
+            report["file_size"] = size
+            report["entropy"] = shannon_entropy(buf[:ENTROPY_SAMPLE])
+            report["strings"] = extract_strings(buf, min_string_length, max_strings,
+                                                interesting=lambda s: bool(INTERESTING_STRING.search(s)))
+            report["flags"] = sorted({value for value, _ in iter_flags(buf)})[:20]
+    report["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return report
+
+
+def format_binary_summary(report: Dict[str, Any], max_chars: int = 4000) -> str:
+    """将特征报告格式化为提示词中的文本块"""
+    if report.get("format") == "unknown":
+        lines = ["[二进制分析] 未识别的文件格式"]
+    else:
+        lines = [f"[二进制分析] {report['format']} {report['bits']}位 {report['arch']} {report['type']}, 入口 {report['entry']}"]
+        protections = report.get("protections", {})
+        lines.append("保护机制: " + ", ".join(f"{k}={v}" for k, v in protections.items() if v not in (None, [], "")))
+        if report.get("libraries"):
+            lines.append("依赖库: " + ", ".join(report["libraries"][:10]))
+        if report.get("dangerous_imports"):
+            lines.append("危险函数: " + ", ".join(report["dangerous_imports"]))
+        if report.get("interesting_symbols"):
+            lines.append("可疑符号: " + ", ".join(report["interesting_symbols"][:20]))
+        if report.get("imports"):
+            lines.append(f"导入函数({len(report['imports'])}): " + ", ".join(report["imports"][:40]))
+        if report.get("sections"):
+            lines.append("节区: " + ", ".join(
+                f"{s['name']}({s['flags']},{s['size']},H={s['entropy']})" for s in report["sections"][:20]))
+    if report.get("flags"):
+        lines.append("疑似flag: " + ", ".join(report["flags"]))
+    strings = report.get("strings", {})
+    if strings.get("strings"):
+        lines.append(f"字符串 (ascii={strings['counts'].get('ascii', 0)}, utf-16le={strings['counts'].get('utf-16le', 0)}, "
+                     f"utf-8={strings['counts'].get('utf-8', 0)}):")
+        lines += [f"  {item['value'][:120]!r}" for item in strings["strings"][:30]]
+    text = "\n".join(lines)
+    return text if len(text) <= max_chars else text[:max_chars] + "\n..."
@@ -0,0 +1,181 @@
+"""预分析共用的工具函数：flag匹配、熵计算、字符串提取和按内容哈希缓存分析结果"""
+import base64
+import math
+import re
+from collections import Counter
+from typing import Dict, Any, Iterator, List, Tuple, Callable, Optional
+from config import config
+from data_service import data_service
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+FLAG_PATTERN = re.compile(rb"(?i)(?:flag|ctf|key)[A-Za-z0-9_]{0,12}\{[^{}\r\n]{1,200}\}")
+# 先定位花括号并检查前缀，再匹配括号内容；直接用 FLAG_PATTERN 扫描要慢一个数量级
+OPEN_BRACE_PATTERN = re.compile(rb"\{")
+BRACES_PATTERN = re.compile(rb"\{[^{}\r\n]{1,200}\}")
+WORD_BYTES = frozenset(b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_")
+FLAG_PREFIX_PATTERN = re.compile(rb"(?i)(?:flag|ctf|key)[A-Za-z0-9_]{0,12}$")
+# "flag{" / "FLAG{" 的base64编码前缀
+BASE64_FLAG_PATTERN = re.compile(rb"(?:ZmxhZ3|RkxBR3)[A-Za-z0-9+/]{2,400}={0,2}")
+
+# 嵌入文件的魔数：(魔数, 类型, 校验函数)，校验函数接收魔数所在位置之后的若干字节
+EMBEDDED_SIGNATURES = [
+    (b"PK\x03\x04", "zip", None),
+    (b"Rar!\x1a\x07", "rar", None),
+    (b"7z\xbc\xaf\x27\x1c", "7z", None),
+    (b"\x1f\x8b\x08", "gzip", lambda tail: tail[3] < 0x20 and tail[8] in (0, 2, 4) and (tail[9] <= 13 or tail[9] == 255)),
+    (b"BZh", "bzip2", lambda tail: tail[3:4].isdigit() and tail[4:10] == b"1AY&SY"),
+    (b"\xfd7zXZ\x00", "xz", None),
+    (b"%PDF-", "pdf", None),
+    (b"\x89PNG\r\n\x1a\n", "png", None),
+    (b"\xff\xd8\xff", "jpeg", lambda tail: tail[3:4] in (b"\xe0", b"\xe1", b"\xdb", b"\xee", b"\xc0")),
+    (b"GIF8", "gif", lambda tail: tail[4:6] in (b"7a", b"9a")),
+    (b"\x7fELF", "elf", lambda tail: tail[4:5] in (b"\x01", b"\x02")),
+    (b"ustar", "tar", None),
+    (b"RIFF", "riff", lambda tail: tail[8:12] in (b"WAVE", b"AVI ", b"WEBP"))
+]
+
+# 分析结果格式变化时递增，使旧的缓存结果失效
+ANALYZER_CACHE_VERSION = 1
+
+
+def iter_flags(data) -> Iterator[Tuple[str, bool]]:
+    """查找符合flag格式的字符串，返回 (flag, 是否由base64解码得到)"""
+    for brace in OPEN_BRACE_PATTERN.finditer(data):
+        start = brace.start()
+        # 大多数候选（压缩或随机数据中的花括号）在检查前一个字节时就被排除
+        if not start or data[start - 1] not in WORD_BYTES:
+            continue
+        prefix = FLAG_PREFIX_PATTERN.search(data, max(start - 16, 0), start)
+        if not prefix:
+            continue
+        match = BRACES_PATTERN.match(data, start)
+        if match:
+            yield bytes(data[prefix.start():match.end()]).decode("latin-1"), False
+    for marker in (b"ZmxhZ3", b"RkxBR3"):
+        position = data.find(marker)
+        while position >= 0:
+            match = BASE64_FLAG_PATTERN.match(data, position)
+            position = data.find(marker, position + 1)
+            if match:
+                yield from _decode_base64_flags(match.group())
+
+
+def _decode_base64_flags(raw: bytes) -> Iterator[Tuple[str, bool]]:
+    try:
+        decoded = base64.b64decode(raw[:len(raw) - len(raw) % 4] or raw)
+    except Exception:
+        return
+    for flag_match in FLAG_PATTERN.finditer(decoded):
+        yield flag_match.group().decode("latin-1"), True
+
+
+def scan_signatures(data, start: int = 0, end: int = None, limit: int = 20) -> List[Dict[str, Any]]:
+    """在 data[start:end] 中查找嵌入文件的魔数，返回按偏移排序的 {"offset", "type"}"""
+    end = len(data) if end is None else end
+    found = []
+    for magic, kind, check in EMBEDDED_SIGNATURES:
+        position = data.find(magic, start, end)
+        hits = 0
+        while position >= 0 and hits < limit:
+            if kind == "tar":
+                # ustar 标记位于tar头的第257字节
+                if position >= 257:
+                    found.append({"offset": position - 257, "type": kind})
+                    hits += 1
+            elif check is None or check(bytes(data[position:position + 16])):
+                found.append({"offset": position, "type": kind})
+                hits += 1
+            position = data.find(magic, position + 1, end)
+    return sorted(found, key=lambda item: item["offset"])[:limit]
+
+
+def byte_histogram(data) -> List[int]:
+    if NUMPY_AVAILABLE:
+        return np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256).tolist()
+    counts = Counter(bytes(data))
+    return [counts.get(value, 0) for value in range(256)]
+
+
+def shannon_entropy(data) -> float:
+    """字节香农熵（0-8）"""
+    length = len(data)
+    if not length:
+        return 0.0
+    entropy = 0.0
+    for count in byte_histogram(data):
+        if count:
+            p = count / length
+            entropy -= p * math.log2(p)
+    return round(entropy, 3)
+
+
+def extract_strings(data, min_length: int = 6, limit: int = 200,
+                    interesting: Callable[[str], bool] = None) -> Dict[str, Any]:
+    """
+    提取可打印字符串（ASCII、UTF-16LE 和包含多字节字符的 UTF-8）
+
+    Returns:
+        {"counts": 各编码的字符串数量, "strings": [{"value", "encoding", "offset"}]}
+        interesting 为真的字符串排在前面，总数不超过 limit
+    """
+    patterns = [
+        ("ascii", re.compile(rb"[\x20-\x7e\t]{%d,}" % min_length)),
+        ("utf-16le", re.compile(rb"(?:[\x20-\x7e]\x00){%d,}" % min_length)),
+        ("utf-8", re.compile(rb"(?:[\x20-\x7e]|[\xc2-\xf4][\x80-\xbf]{1,3}){%d,}" % min_length))
+    ]
+    counts = {}
+    picked: List[Dict[str, Any]] = []
+    others: List[Dict[str, Any]] = []
+    for encoding, pattern in patterns:
+        count = 0
+        for match in pattern.finditer(data):
+            raw = match.group()
+            if encoding == "utf-8":
+                # 纯ASCII的字符串已在上面统计
+                if raw.isascii():
+                    continue
+                try:
+                    value = raw.decode("utf-8")
+                except UnicodeDecodeError:
+                    continue
+            elif encoding == "utf-16le":
+                value = raw.decode("utf-16le")
+            else:
+                value = raw.decode("ascii")
+            count += 1
+            item = {"value": value[:200], "encoding": encoding, "offset": match.start()}
+            if interesting and interesting(value):
+                if len(picked) < limit:
+                    picked.append(item)
+            elif len(others) < limit:
+                others.append(item)
+        counts[encoding] = count
+    return {"counts": counts, "strings": (picked + others)[:limit]}
+
+
+def _cache_key(kind: str, sha256: str) -> str:
+    return f"analysis_{kind}_v{ANALYZER_CACHE_VERSION}_{sha256}"
+
+
+def get_cached_report(kind: str, sha256: str) -> Optional[Dict[str, Any]]:
+    return data_service.get_cache(_cache_key(kind, sha256))
+
+
+def save_cached_report(kind: str, sha256: str, report: Dict[str, Any]):
+    data_service.save_cache(_cache_key(kind, sha256), report, ttl=config.ANALYZER_CACHE_TTL)
+
+
+def cached_report(kind: str, sha256: str, build: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    """按文件内容哈希缓存分析结果（保存在数据缓存目录，重复上传的文件不再重新分析）"""
+    report = get_cached_report(kind, sha256)
+    if report is not None:
+        return dict(report, cached=True)
+    report = build()
+    save_cached_report(kind, sha256, report)
+    return dict(report, cached=False)
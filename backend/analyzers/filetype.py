@@ -0,0 +1,392 @@
+"""
+文件类型识别
+
+只读取文件开头和结尾各几KB。先查编译后的文件头签名表（按偏移和长度分组，每组一次字典查找），
+未命中时回退到每个线程复用的 libmagic 句柄，最后结合扩展名给出类型和置信度。
+文件头非零偏移处和文件结尾的签名用于发现拼接/多格式文件（如图片后附加 zip）。
+"""
+import mimetypes
+import os
+import struct
+import threading
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple, Callable
+from logger import get_logger
+from .common import scan_signatures
+from .strings import looks_like_text
+
+try:
+    import magic
+    MAGIC_AVAILABLE = True
+except ImportError:
+    magic = None
+    MAGIC_AVAILABLE = False
+
+logger = get_logger("analyzers.filetype")
+
+HEAD_SIZE = 4096
+TAIL_SIZE = 4096
+# 文件头中查找嵌入签名的范围（PDF 等格式允许签名出现在前 1KB 内）
+EMBEDDED_HEAD_SCAN = 1024
+
+# 置信度
+SIGNATURE_CONFIDENCE = 0.9
+LIBMAGIC_CONFIDENCE = 0.7
+GENERIC_CONFIDENCE = 0.4
+EXTENSION_CONFIDENCE = 0.4
+DECLARED_CONFIDENCE = 0.2
+# 扩展名与内容一致时增加、矛盾时减少的置信度
+EXTENSION_AGREEMENT = 0.1
+EXTENSION_CONFLICT = 0.1
+
+GENERIC_MIME_TYPES = {"application/octet-stream", "text/plain", "application/x-empty", "inode/x-empty"}
+
+
+# 签名的附加检查：返回 None 表示不匹配，返回 (MIME, 类型名) 表示细化后的类型
+def _check_pe(head: bytes) -> Optional[Tuple[str, str]]:
+    if len(head) < 64:
+        return None
+    offset = struct.unpack_from("<I", head, 0x3C)[0]
+    if offset + 4 <= len(head) and head[offset:offset + 4] != b"PE\x00\x00":
+        return None
+    return "application/vnd.microsoft.portable-executable", "pe"
+
+
+def _check_riff(head: bytes) -> Optional[Tuple[str, str]]:
+    return {b"WAVE": ("audio/x-wav", "wav"), b"AVI ": ("video/x-msvideo", "avi"),
+            b"WEBP": ("image/webp", "webp")}.get(head[8:12])
+
+
+def _check_zip(head: bytes) -> Optional[Tuple[str, str]]:
+    # 基于 zip 的格式通过第一个文件的文件名区分（在文件头范围内能看到时）
+    if head[30:38] == b"mimetype" and b"application/epub+zip" in head[38:80]:
+        return "application/epub+zip", "epub"
+    if b"AndroidManifest.xml" in head or b"classes.dex" in head:
+        return "application/vnd.android.package-archive", "apk"
+    if b"META-INF/" in head:
+        return "application/java-archive", "jar"
+    for marker, result in ((b"word/", ("application/vnd.openxmlformats-officedocument.wordprocessingml.document", "docx")),
+                           (b"xl/", ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx")),
+                           (b"ppt/", ("application/vnd.openxmlformats-officedocument.presentationml.presentation", "pptx"))):
+        if marker in head:
+            return result
+    return "application/zip", "zip"
+
+
+def _check_bmp(head: bytes) -> Optional[Tuple[str, str]]:
+    if len(head) < 18 or struct.unpack_from("<I", head, 14)[0] not in (12, 40, 52, 56, 64, 108, 124):
+        return None
+    return "image/bmp", "bmp"
+
+
+def _check_gzip(head: bytes) -> Optional[Tuple[str, str]]:
+    return ("application/gzip", "gzip") if len(head) >= 10 and head[3] < 0x20 else None
+
+
+def _check_bzip2(head: bytes) -> Optional[Tuple[str, str]]:
+    return ("application/x-bzip2", "bzip2") if head[3:4].isdigit() else None
+
+
+def _check_ftyp(head: bytes) -> Optional[Tuple[str, str]]:
+    brand = head[8:12]
+    if brand in (b"heic", b"heix", b"mif1"):
+        return "image/heic", "heic"
+    if brand == b"qt  ":
+        return "video/quicktime", "mov"
+    return "video/mp4", "mp4"
+
+
+# (偏移, 魔数, MIME, 类型名, 附加检查)
+SIGNATURES: List[Tuple[int, bytes, str, str, Optional[Callable[[bytes], Optional[Tuple[str, str]]]]]] = [
+    (0, b"\x7fELF", "application/x-executable", "elf", None),
+    (0, b"MZ", "application/x-dosexec", "pe", _check_pe),
+    (0, b"\xcf\xfa\xed\xfe", "application/x-mach-binary", "macho", None),
+    (0, b"\xce\xfa\xed\xfe", "application/x-mach-binary", "macho", None),
+    (0, b"\xca\xfe\xba\xbe", "application/java-vm", "class", None),
+    (0, b"dex\n", "application/vnd.android.dex", "dex", None),
+    (0, b"\x00asm", "application/wasm", "wasm", None),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png", "png", None),
+    (0, b"\xff\xd8\xff", "image/jpeg", "jpeg", None),
+    (0, b"GIF87a", "image/gif", "gif", None),
+    (0, b"GIF89a", "image/gif", "gif", None),
+    (0, b"BM", "image/bmp", "bmp", _check_bmp),
+    (0, b"II*\x00", "image/tiff", "tiff", None),
+    (0, b"MM\x00*", "image/tiff", "tiff", None),
+    (0, b"RIFF", "application/x-riff", "riff", _check_riff),
+    (4, b"ftyp", "video/mp4", "mp4", _check_ftyp),
+    (0, b"ID3", "audio/mpeg", "mp3", None),
+    (0, b"fLaC", "audio/flac", "flac", None),
+    (0, b"OggS", "audio/ogg", "ogg", None),
+    (0, b"PK\x03\x04", "application/zip", "zip", _check_zip),
+    (0, b"PK\x05\x06", "application/zip", "zip", None),
+    (0, b"Rar!\x1a\x07", "application/vnd.rar", "rar", None),
+    (0, b"7z\xbc\xaf\x27\x1c", "application/x-7z-compressed", "7z", None),
+    (0, b"\x1f\x8b\x08", "application/gzip", "gzip", _check_gzip),
+    (0, b"BZh", "application/x-bzip2", "bzip2", _check_bzip2),
+    (0, b"\xfd7zXZ\x00", "application/x-xz", "xz", None),
+    (0, b"(\xb5/\xfd", "application/zstd", "zstd", None),
+    (257, b"ustar", "application/x-tar", "tar", None),
+    (0, b"%PDF-", "application/pdf", "pdf", None),
+    (0, b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "application/x-ole-storage", "ole", None),
+    (0, b"SQLite format 3\x00", "application/vnd.sqlite3", "sqlite", None),
+    (0, b"\xd4\xc3\xb2\xa1", "application/vnd.tcpdump.pcap", "pcap", None),
+    (0, b"\xa1\xb2\xc3\xd4", "application/vnd.tcpdump.pcap", "pcap", None),
+    (0, b"\x4d\x3c\xb2\xa1", "application/vnd.tcpdump.pcap", "pcap", None),
+    (0, b"\xa1\xb2\x3c\x4d", "application/vnd.tcpdump.pcap", "pcap", None),
+    (0, b"\x0a\x0d\x0d\x0a", "application/x-pcapng", "pcapng", None),
+    (0, b"-----BEGIN ", "application/x-pem-file", "pem", None),
+    (0, b"<?php", "application/x-httpd-php", "php", None),
+]
+
+
+def _compile(signatures) -> List[Tuple[int, int, Dict[bytes, list]]]:
+    """按 (偏移, 长度) 分组为字典，较长的魔数优先检查"""
+    groups: Dict[Tuple[int, int], Dict[bytes, list]] = {}
+    for entry in signatures:
+        offset, signature = entry[0], entry[1]
+        groups.setdefault((offset, len(signature)), {}).setdefault(signature, []).append(entry)
+    return [(offset, length, table) for (offset, length), table
+            in sorted(groups.items(), key=lambda item: -item[0][1])]
+
+
+_SIGNATURE_TABLE = _compile(SIGNATURES)
+
+# 扩展名对应的 (MIME, 类型名)，没有列出的扩展名由 mimetypes 推断
+EXTENSION_TYPES = {
+    ".elf": ("application/x-executable", "elf"), ".so": ("application/x-sharedlib", "elf"),
+    ".o": ("application/x-object", "elf"), ".ko": ("application/x-object", "elf"),
+    ".exe": ("application/vnd.microsoft.portable-executable", "pe"),
+    ".dll": ("application/vnd.microsoft.portable-executable", "pe"),
+    ".sys": ("application/vnd.microsoft.portable-executable", "pe"),
+    ".pcap": ("application/vnd.tcpdump.pcap", "pcap"), ".cap": ("application/vnd.tcpdump.pcap", "pcap"),
+    ".pcapng": ("application/x-pcapng", "pcapng"),
+    ".7z": ("application/x-7z-compressed", "7z"), ".rar": ("application/vnd.rar", "rar"),
+    ".gz": ("application/gzip", "gzip"), ".tgz": ("application/gzip", "gzip"),
+    ".bz2": ("application/x-bzip2", "bzip2"), ".xz": ("application/x-xz", "xz"),
+    ".zst": ("application/zstd", "zstd"), ".tar": ("application/x-tar", "tar"),
+    ".apk": ("application/vnd.android.package-archive", "apk"), ".jar": ("application/java-archive", "jar"),
+    ".dex": ("application/vnd.android.dex", "dex"), ".class": ("application/java-vm", "class"),
+    ".wasm": ("application/wasm", "wasm"), ".pyc": ("application/x-python-code", "pyc"),
+    ".pem": ("application/x-pem-file", "pem"), ".key": ("application/x-pem-file", "pem"),
+    ".db": ("application/vnd.sqlite3", "sqlite"), ".sqlite": ("application/vnd.sqlite3", "sqlite"),
+    ".php": ("application/x-httpd-php", "php"), ".py": ("text/x-python", "python"),
+    ".sh": ("text/x-shellscript", "script"), ".js": ("text/javascript", "js"),
+    ".html": ("text/html", "html"), ".htm": ("text/html", "html"), ".jpg": ("image/jpeg", "jpeg"),
+    ".jpeg": ("image/jpeg", "jpeg"), ".mp3": ("audio/mpeg", "mp3"), ".wav": ("audio/x-wav", "wav"),
+    ".vmem": ("application/octet-stream", "memdump"), ".raw": ("application/octet-stream", "memdump"),
+}
+
+# libmagic 输出的 MIME 与类型名的对应（签名表中的 MIME 自动加入）
+MIME_LABELS = {
+    "application/x-sharedlib": "elf", "application/x-pie-executable": "elf", "application/x-object": "elf",
+    "application/x-coredump": "elf", "application/x-elf": "elf",
+    "application/vnd.microsoft.portable-executable": "pe", "application/x-msdownload": "pe",
+    "text/html": "html", "text/x-php": "php", "text/javascript": "js", "application/javascript": "js",
+    "text/x-python": "python", "text/x-script.python": "python", "text/x-shellscript": "script",
+    "text/x-c": "c", "text/plain": "text", "audio/x-wav": "wav", "audio/wav": "wav",
+    "application/x-gzip": "gzip", "application/x-rar": "rar", "application/x-bzip2": "bzip2",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "xlsx",
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation": "pptx",
+    "application/vnd.oasis.opendocument.text": "odt", "application/epub+zip": "epub",
+    "application/java-archive": "jar", "application/vnd.android.package-archive": "apk",
+    "application/json": "json", "text/csv": "csv", "text/xml": "xml", "application/xml": "xml",
+    "text/markdown": "markdown",
+}
+for _entry in SIGNATURES:
+    MIME_LABELS.setdefault(_entry[2], _entry[3])
+LABEL_MIMES = {}
+for _entry in SIGNATURES:
+    LABEL_MIMES.setdefault(_entry[3], _entry[2])
+
+# 以其他格式为容器的类型（扩展名更具体时采用扩展名的类型）
+CONTAINER_LABELS = {
+    "apk": "zip", "jar": "zip", "docx": "zip", "xlsx": "zip", "pptx": "zip", "epub": "zip", "odt": "zip",
+    "python": "text", "script": "text", "js": "text", "html": "text", "php": "text", "c": "text", "pem": "text",
+    "csv": "text", "json": "text", "xml": "text", "markdown": "text",
+}
+# 压缩包格式（嵌套在其他文件中时可以按偏移解包）
+ARCHIVE_LABELS = {"zip", "rar", "7z", "gzip", "bzip2", "xz", "tar"}
+
+# 图片/文档正常结束的标记，结尾之后还有数据说明附加了内容
+END_MARKERS = {
+    "png": (b"IEND\xaeB`\x82",),
+    "jpeg": (b"\xff\xd9",),
+    "gif": (b"\x00;",),
+    "pdf": (b"%%EOF",),
+}
+
+# 每个线程复用一个 libmagic 句柄（句柄内部有锁，共享时多线程会互相等待）
+_local = threading.local()
+
+
+def _magic_handle():
+    handle = getattr(_local, "handle", None)
+    if handle is None:
+        handle = False
+        if MAGIC_AVAILABLE:
+            try:
+                handle = magic.Magic(mime=True)
+            except Exception as e:
+                logger.warning(f"libmagic 初始化失败: {e}")
+        _local.handle = handle
+    return handle or None
+
+
+def _from_libmagic(head: bytes) -> Optional[str]:
+    handle = _magic_handle()
+    if handle is None or not head:
+        return None
+    try:
+        return handle.from_buffer(head)
+    except Exception:
+        return None
+
+
+def _label(mime: Optional[str]) -> Optional[str]:
+    if not mime:
+        return None
+    return MIME_LABELS.get(mime) or mime.split("/")[-1].replace("x-", "")
+
+
+def extension_hint(file_name: Optional[str]) -> Optional[Tuple[str, str]]:
+    """根据文件扩展名推断 (MIME, 类型名)"""
+    if not file_name:
+        return None
+    return _extension_type(os.path.splitext(os.path.basename(file_name).lower())[1])
+
+
+@lru_cache(maxsize=1024)
+def _extension_type(ext: str) -> Optional[Tuple[str, str]]:
+    if not ext:
+        return None
+    if ext in EXTENSION_TYPES:
+        return EXTENSION_TYPES[ext]
+    mime, encoding = mimetypes.guess_type("file" + ext, strict=False)
+    if encoding:
+        mime = {"gzip": "application/gzip", "bzip2": "application/x-bzip2", "xz": "application/x-xz"}.get(encoding, mime)
+    return (mime, _label(mime)) if mime else None
+
+
+def _compatible(detected: str, hinted: str) -> bool:
+    return detected == hinted or CONTAINER_LABELS.get(hinted) == detected
+
+
+def match_signature(head: bytes) -> Optional[Tuple[str, str]]:
+    """在签名表中查找文件头对应的 (MIME, 类型名)"""
+    for offset, length, table in _SIGNATURE_TABLE:
+        entries = table.get(head[offset:offset + length])
+        if not entries:
+            continue
+        for _, _, mime, label, check in entries:
+            if check is None:
+                return mime, label
+            refined = check(head)
+            if refined:
+                return refined
+    return None
+
+
+def _embedded_zip(tail: bytes, tail_offset: int) -> Optional[int]:
+    """根据结尾的 zip 目录结束记录计算 zip 数据的起始偏移（zip 前面有其他数据时大于 0）"""
+    position = tail.rfind(b"PK\x05\x06")
+    if position < 0 or position + 22 > len(tail):
+        return None
+    cd_size, cd_offset, comment_length = struct.unpack_from("<IIH", tail, position + 12)
+    if position + 22 + comment_length != len(tail):
+        return None
+    start = tail_offset + position - cd_size - cd_offset
+    return start if start >= 0 else None
+
+
+def _find_embedded(head: bytes, tail: bytes, size: int, primary: Optional[str]) -> List[Dict[str, Any]]:
+    """查找文件头非零偏移处和文件结尾中其他格式的签名"""
+    tail_offset = size - len(tail)
+    found: Dict[Tuple[int, str], Dict[str, Any]] = {}
+    hits = [(item["offset"], item["type"]) for item in scan_signatures(head, 1, min(len(head), EMBEDDED_HEAD_SCAN), 10)]
+    if tail_offset > len(head):
+        hits += [(tail_offset + item["offset"], item["type"]) for item in scan_signatures(tail, 0, len(tail), 10)]
+    if "zip" not in (primary, CONTAINER_LABELS.get(primary)) and tail:
+        start = _embedded_zip(tail, tail_offset)
+        if start is not None:
+            hits.append((start, "zip"))
+    for offset, kind in hits:
+        if kind in (primary, CONTAINER_LABELS.get(primary), "riff") or offset <= 0:
+            continue
+        # 同一个 zip 的本地文件头会出现多次，只保留最前面的
+        if kind == "zip" and any(key[1] == "zip" for key in found):
+            continue
+        found[(offset, kind)] = {"offset": offset, "type": kind, "mime": LABEL_MIMES.get(kind)}
+    return sorted(found.values(), key=lambda item: item["offset"])
+
+
+def detect_bytes(head: bytes, tail: bytes = b"", size: Optional[int] = None,
+                 file_name: Optional[str] = None, declared: Optional[str] = None) -> Dict[str, Any]:
+    """
+    根据文件开头和结尾的字节识别文件类型
+
+    Args:
+        head: 文件开头的字节
+        tail: 文件结尾的字节（文件不长于 head 时可以为空）
+        size: 文件大小，默认为 head 的长度
+        file_name: 文件名（提供扩展名提示）
+        declared: 客户端声明的 MIME 类型（只在无法从内容判断时使用）
+
+    Returns:
+        {"mime", "label", "confidence", "source", "extension", "extension_mismatch", "embedded", "trailing_data"}
+    """
+    size = len(head) if size is None else size
+    if not tail and size <= len(head):
+        tail = head
+    hint = extension_hint(file_name)
+    result: Dict[str, Any] = {"mime": None, "label": None, "confidence": 0.0, "source": None,
+                              "extension": hint[1] if hint else None, "extension_mismatch": False,
+                              "embedded": [], "trailing_data": False}
+
+    signature = match_signature(head)
+    if signature:
+        result.update(mime=signature[0], label=signature[1], confidence=SIGNATURE_CONFIDENCE, source="signature")
+    elif head:
+        mime, source = _from_libmagic(head), "libmagic"
+        if mime is None and looks_like_text(head[:512]):
+            mime, source = "text/plain", "text"
+        if mime:
+            result.update(mime=mime, label=_label(mime), source=source,
+                          confidence=GENERIC_CONFIDENCE if mime in GENERIC_MIME_TYPES else LIBMAGIC_CONFIDENCE)
+
+    if hint:
+        if result["mime"] is None or result["mime"] == "application/octet-stream":
+            result.update(mime=hint[0], label=hint[1], confidence=EXTENSION_CONFIDENCE, source="extension")
+        elif hint[0] == "application/octet-stream":
+            pass
+        elif _compatible(result["label"], hint[1]):
+            if result["label"] != hint[1]:
+                # 内容只能确定容器格式时采用扩展名给出的具体类型
+                result.update(mime=hint[0], label=hint[1])
+            result["confidence"] = min(1.0, result["confidence"] + EXTENSION_AGREEMENT)
+        else:
+            result["extension_mismatch"] = True
+            result["confidence"] = max(0.0, result["confidence"] - EXTENSION_CONFLICT)
+    if result["mime"] is None and declared and declared != "application/octet-stream":
+        result.update(mime=declared, label=_label(declared), confidence=DECLARED_CONFIDENCE, source="declared")
+
+    if size and head:
+        result["embedded"] = _find_embedded(head, tail, size, result["label"])
+        markers = END_MARKERS.get(result["label"])
+        if markers and tail:
+            result["trailing_data"] = not tail.rstrip(b"\r\n\x00 ").endswith(markers)
+    result["confidence"] = round(result["confidence"], 2)
+    return result
+
+
+def detect_file(path: str, file_name: Optional[str] = None, declared: Optional[str] = None,
+                head_size: int = HEAD_SIZE, tail_size: int = TAIL_SIZE) -> Dict[str, Any]:
+    """读取文件开头和结尾各几KB识别文件类型（参数和返回值见 detect_bytes）"""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        head = f.read(head_size)
+        tail = b""
+        if size > len(head):
+            f.seek(max(len(head), size - tail_size))
+            tail = f.read()
+    return detect_bytes(head, tail, size, file_name, declared)
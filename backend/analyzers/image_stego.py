@@ -0,0 +1,422 @@
+"""
+图片隐写预扫描
+
+结构检查直接在内存映射的文件上进行：PNG 数据块（CRC 校验、文本块）、JPEG 段（EXIF、注释）、
+GIF 扩展块，以及结束标记之后的附加数据和嵌入文件的魔数。
+像素检查使用 NumPy 向量化计算：逐通道的 LSB 平面统计、卡方检验（按图片前缀比例给出，
+可估计顺序嵌入的长度）以及按常见顺序提取 LSB 数据并检查是否为文本、flag 或文件。
+像素解码依赖 Pillow，未安装 Pillow 或 NumPy 时只进行结构检查。
+"""
+import math
+import mmap
+import struct
+import time
+import zlib
+from typing import Dict, Any, Optional
+from config import config
+from logger import get_logger
+from .common import iter_flags, scan_signatures, shannon_entropy, EMBEDDED_SIGNATURES
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    Image = None
+    PIL_AVAILABLE = False
+
+logger = get_logger("analyzers.image_stego")
+
+IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "png"), (b"\xff\xd8\xff", "jpeg"), (b"GIF87a", "gif"), (b"GIF89a", "gif"), (b"BM", "bmp")
+]
+EXIF_TAGS = {
+    0x010E: "ImageDescription", 0x010F: "Make", 0x0110: "Model", 0x0131: "Software", 0x0132: "DateTime",
+    0x013B: "Artist", 0x8298: "Copyright", 0x9286: "UserComment", 0x9003: "DateTimeOriginal",
+    0x9C9B: "XPTitle", 0x9C9C: "XPComment", 0x9C9D: "XPAuthor", 0x9C9E: "XPKeywords", 0x9C9F: "XPSubject"
+}
+EXIF_POINTERS = {0x8769: "ExifIFD", 0x8825: "GPSInfo"}
+
+# 卡方检验按图片前缀比例计算，用于估计顺序嵌入的数据长度
+CHI_SQUARE_FRACTIONS = (0.001, 0.01, 0.1, 0.5, 1.0)
+# 计算 LSB 相邻相同比例时采样的像素数
+RUN_SAMPLE = 1_000_000
+CHANNEL_NAMES = {"L": ["L"], "P": ["index"], "RGB": ["R", "G", "B"], "RGBA": ["R", "G", "B", "A"], "LA": ["L", "A"]}
+# 每种顺序提取的 LSB 数据字节数
+PAYLOAD_BYTES = 4096
+
+
+def image_format(head: bytes) -> Optional[str]:
+    for magic, kind in IMAGE_SIGNATURES:
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+def _text(raw: bytes, limit: int = 300) -> str:
+    return raw.decode("utf-8", errors="replace").strip("\x00 ")[:limit]
+
+
+# 结构检查
+def _parse_exif(data: bytes) -> Dict[str, Any]:
+    """解析 TIFF 格式的 EXIF 数据，只保留文本类标签"""
+    if data[:2] not in (b"II", b"MM"):
+        return {}
+    endian = "<" if data[:2] == b"II" else ">"
+    tags: Dict[str, Any] = {}
+    pending = [struct.unpack_from(endian + "I", data, 4)[0]]
+    visited = set()
+    while pending and len(visited) < 8:
+        offset = pending.pop()
+        if offset in visited or offset + 2 > len(data):
+            continue
+        visited.add(offset)
+        count = struct.unpack_from(endian + "H", data, offset)[0]
+        for i in range(min(count, 256)):
+            entry = offset + 2 + i * 12
+            if entry + 12 > len(data):
+                break
+            tag, value_type, value_count = struct.unpack_from(endian + "HHI", data, entry)
+            if tag in EXIF_POINTERS:
+                tags[EXIF_POINTERS[tag]] = True
+                pending.append(struct.unpack_from(endian + "I", data, entry + 8)[0])
+                continue
+            if tag not in EXIF_TAGS or value_type not in (1, 2, 7):
+                continue
+            value_offset = entry + 8 if value_count <= 4 else struct.unpack_from(endian + "I", data, entry + 8)[0]
+            raw = data[value_offset:value_offset + min(value_count, 2048)]
+            name = EXIF_TAGS[tag]
+            if name.startswith("XP"):
+                value = raw.decode("utf-16le", errors="replace").strip("\x00 ")
+            elif name == "UserComment":
+                value = _text(raw[8:])
+            else:
+                value = _text(raw)
+            if value:
+                tags[name] = value[:300]
+    return tags
+
+
+def _scan_png(buf, report: Dict[str, Any]):
+    chunks: Dict[str, int] = {}
+    offset = 8
+    pixel_start = end = None
+    while offset + 12 <= len(buf):
+        length, chunk_type = struct.unpack_from(">I4s", buf, offset)
+        name = chunk_type.decode("latin-1")
+        data_end = offset + 8 + length
+        if data_end + 4 > len(buf):
+            report["warnings"].append(f"数据块 {name} 被截断（偏移 {offset}）")
+            break
+        chunks[name] = chunks.get(name, 0) + 1
+        if name == "IDAT" and pixel_start is None:
+            pixel_start = offset
+        if name != "IDAT":
+            data = bytes(buf[offset + 8:data_end])
+            crc = struct.unpack_from(">I", buf, data_end)[0]
+            if zlib.crc32(chunk_type + data) != crc:
+                report["warnings"].append(f"数据块 {name} CRC校验失败" + ("（宽高可能被修改）" if name == "IHDR" else ""))
+            if name == "IHDR":
+                report["width"], report["height"], report["bit_depth"], report["color_type"] = struct.unpack_from(">IIBB", data)
+            elif name in ("tEXt", "zTXt", "iTXt"):
+                key, _, value = data.partition(b"\x00")
+                try:
+                    if name == "zTXt":
+                        value = zlib.decompress(value[1:])
+                    elif name == "iTXt":
+                        compressed = value[:1] == b"\x01"
+                        value = value[2:].split(b"\x00", 2)[-1]
+                        value = zlib.decompress(value) if compressed else value
+                except zlib.error:
+                    value = b"<decompress failed>"
+                report["metadata"][key.decode("latin-1")] = _text(value)
+            elif name == "eXIf":
+                report["metadata"].update(_parse_exif(data))
+            elif name not in ("PLTE", "IEND", "tRNS", "gAMA", "cHRM", "sRGB", "iCCP", "pHYs", "bKGD", "tIME", "sBIT"):
+                report["metadata"][f"chunk:{name}"] = f"{length} 字节"
+        if name == "IEND":
+            end = data_end + 4
+            break
+        offset = data_end + 4
+    report["structure"] = {"chunks": chunks}
+    return pixel_start, end
+
+
+def _scan_jpeg(buf, report: Dict[str, Any]):
+    offset = 2
+    segments: Dict[str, int] = {}
+    while offset + 4 <= len(buf):
+        if buf[offset] != 0xFF:
+            report["warnings"].append(f"段标记错误（偏移 {offset}）")
+            return offset, None
+        marker = buf[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        length = struct.unpack_from(">H", buf, offset + 2)[0]
+        data = bytes(buf[offset + 4:offset + 2 + length])
+        name = f"APP{marker - 0xE0}" if 0xE0 <= marker <= 0xEF else {0xFE: "COM", 0xDA: "SOS", 0xDB: "DQT", 0xC4: "DHT"}.get(marker, hex(marker))
+        segments[name] = segments.get(name, 0) + 1
+        if marker == 0xE1 and data.startswith(b"Exif\x00\x00"):
+            report["metadata"].update(_parse_exif(data[6:]))
+        elif marker == 0xE1 and data.startswith(b"http://ns.adobe.com/xap"):
+            report["metadata"]["XMP"] = _text(data.split(b"\x00", 1)[-1], 500)
+        elif marker == 0xFE:
+            report["metadata"]["Comment"] = _text(data)
+        elif marker in (0xC0, 0xC1, 0xC2):
+            report["height"], report["width"] = struct.unpack_from(">HH", data, 1)
+        if marker == 0xDA:
+            # 熵编码数据中 0xFF 之后总是 0x00 或 RST 标记，第一个 FFD9 即为图片结束
+            eoi = buf.find(b"\xff\xd9", offset + 2 + length)
+            report["structure"] = {"segments": segments}
+            return offset, eoi + 2 if eoi >= 0 else None
+        offset += 2 + length
+    report["structure"] = {"segments": segments}
+    return offset, None
+
+
+def _scan_gif(buf, report: Dict[str, Any]):
+    report["width"], report["height"], packed = struct.unpack_from("<HHB", buf, 6)
+    offset = 13 + (3 * 2 ** ((packed & 7) + 1) if packed & 0x80 else 0)
+    frames = 0
+    pixel_start = None
+
+    def skip_blocks(position: int) -> int:
+        while position < len(buf) and buf[position]:
+            position += buf[position] + 1
+        return position + 1
+
+    while offset < len(buf):
+        block = buf[offset]
+        if block == 0x3B:
+            report["structure"] = {"frames": frames}
+            return pixel_start, offset + 1
+        if block == 0x21:
+            label = buf[offset + 1]
+            if label == 0xFE:
+                end = skip_blocks(offset + 2)
+                comment, position = b"", offset + 2
+                while position < end - 1:
+                    comment += bytes(buf[position + 1:position + 1 + buf[position]])
+                    position += buf[position] + 1
+                report["metadata"]["Comment"] = _text(comment)
+                offset = end
+            else:
+                offset = skip_blocks(offset + 2)
+        elif block == 0x2C:
+            frames += 1
+            pixel_start = offset if pixel_start is None else pixel_start
+            packed = buf[offset + 9]
+            offset += 10 + (3 * 2 ** ((packed & 7) + 1) if packed & 0x80 else 0)
+            offset = skip_blocks(offset + 1)
+        else:
+            report["warnings"].append(f"未知的GIF块 {hex(block)}（偏移 {offset}）")
+            break
+    report["structure"] = {"frames": frames}
+    return pixel_start, None
+
+
+def _scan_bmp(buf, report: Dict[str, Any]):
+    size, _, pixel_start = struct.unpack_from("<IIi", buf, 2)
+    report["width"], report["height"] = struct.unpack_from("<ii", buf, 18)
+    return pixel_start, size if 0 < size <= len(buf) else None
+
+
+# 像素检查
+def _chi_square_p(histogram) -> float:
+    """
+    Westfeld-Pfitzmann 卡方检验：LSB 嵌入使 (2k, 2k+1) 取值对的频数趋于相等。
+    返回值接近1说明频数对几乎相等（存在嵌入的可能性大），接近0说明是自然图片。
+    """
+    even = histogram[0::2].astype(np.float64)
+    odd = histogram[1::2].astype(np.float64)
+    expected = (even + odd) / 2
+    mask = expected > 4
+    degrees = int(mask.sum()) - 1
+    if degrees < 1:
+        return 0.0
+    chi2 = float((((even - expected) ** 2)[mask] / expected[mask]).sum())
+    # Wilson-Hilferty 近似计算卡方分布的生存函数
+    k = degrees
+    z = ((chi2 / k) ** (1 / 3) - (1 - 2 / (9 * k))) / math.sqrt(2 / (9 * k))
+    return round(0.5 * math.erfc(z / math.sqrt(2)), 4)
+
+
+def _payload_info(payload: bytes) -> Optional[Dict[str, Any]]:
+    """判断提取的 LSB 数据是否有意义（可打印文本、flag 或已知文件头）"""
+    flags = [value for value, _ in iter_flags(payload)]
+    magic = next((kind for signature, kind, check in EMBEDDED_SIGNATURES
+                  if payload.startswith(signature) and (check is None or check(payload[:16]))), None)
+    head = payload[:256]
+    printable = sum(32 <= b < 127 or b in (9, 10, 13) for b in head) / max(len(head), 1)
+    if not flags and not magic and printable < 0.9:
+        return None
+    info: Dict[str, Any] = {"printable_ratio": round(printable, 2), "preview": _text(head.split(b"\x00")[0], 120)}
+    if flags:
+        info["flags"] = flags[:5]
+    if magic:
+        info["file_type"] = magic
+    return info
+
+
+def _pixel_analysis(path: str, max_pixels: int) -> Dict[str, Any]:
+    with Image.open(path) as image:
+        width, height = image.size
+        if width * height > max_pixels:
+            return {"skipped": f"像素数 {width * height} 超过限制 {max_pixels}"}
+        image.load()
+        mode = image.mode
+        if mode not in CHANNEL_NAMES:
+            image = image.convert("RGBA" if "A" in mode else "RGB")
+            mode = image.mode
+        pixels = np.asarray(image)
+    if pixels.ndim == 2:
+        pixels = pixels[:, :, None]
+    flat = pixels.reshape(-1, pixels.shape[2])
+    total = flat.shape[0]
+    result: Dict[str, Any] = {"mode": mode, "channels": {}}
+
+    bounds = [max(int(total * fraction), 1) for fraction in CHI_SQUARE_FRACTIONS]
+    for index, name in enumerate(CHANNEL_NAMES[mode]):
+        channel = flat[:, index]
+        # 按前缀区间分段统计直方图再累加，每个像素只统计一次
+        histogram = np.zeros(256, dtype=np.int64)
+        chi_square = {}
+        previous = 0
+        for fraction, bound in zip(CHI_SQUARE_FRACTIONS, bounds):
+            histogram += np.bincount(channel[previous:bound], minlength=256)
+            previous = bound
+            chi_square[f"{fraction * 100:g}%"] = _chi_square_p(histogram)
+        stats: Dict[str, Any] = {"lsb_ones": round(float(histogram[1::2].sum() / total), 4)}
+        used = np.flatnonzero(histogram)
+        if len(used) == 1:
+            stats["constant"] = int(used[0])
+        else:
+            stats["chi_square"] = chi_square
+            # LSB 平面中相邻像素相同的比例（自然图片约为0.5，明显偏离说明平面中有图案）
+            sample = channel[:RUN_SAMPLE] & 1
+            stats["lsb_run_similarity"] = round(float((sample[1:] == sample[:-1]).mean()), 4)
+        result["channels"][name] = stats
+
+    # 按常见顺序提取 LSB 数据：通道交错（行优先）以及单独的每个通道，位序分别按高位在前和低位在前
+    bits_needed = PAYLOAD_BYTES * 8
+    orders = {"interleaved": (flat[:bits_needed // flat.shape[1] + 1] & 1).reshape(-1)[:bits_needed]}
+    if flat.shape[1] > 1:
+        for index, name in enumerate(CHANNEL_NAMES[mode]):
+            orders[name] = flat[:bits_needed, index] & 1
+    payloads = {}
+    for order, bits in orders.items():
+        for bit_order in ("big", "little"):
+            payload = np.packbits(bits, bitorder=bit_order).tobytes()
+            info = _payload_info(payload)
+            if info:
+                payloads[f"{order}/{'msb' if bit_order == 'big' else 'lsb'}"] = info
+    result["lsb_payloads"] = payloads
+    return result
+
+
+def scan_image(path: str, max_pixels: Optional[int] = None) -> Dict[str, Any]:
+    """
+    图片隐写预扫描
+
+    Args:
+        path: 文件路径
+        max_pixels: 像素检查的最大像素数，超过时只进行结构检查
+    """
+    started = time.perf_counter()
+    max_pixels = max_pixels or config.STEGO_MAX_PIXELS
+    report: Dict[str, Any] = {"metadata": {}, "warnings": []}
+    with open(path, "rb") as f:
+        size = f.seek(0, 2)
+        if size == 0:
+            raise ValueError("空文件")
+        f.seek(0)
+        kind = image_format(f.read(8))
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            report["format"] = kind or "unknown"
+            report["file_size"] = size
+            pixel_start = end = None
+            try:
+                if kind:
+                    pixel_start, end = {"png": _scan_png, "jpeg": _scan_jpeg, "gif": _scan_gif, "bmp": _scan_bmp}[kind](buf, report)
+            except (struct.error, IndexError) as e:
+                report["warnings"].append(f"结构解析失败: {e}")
+            if end is not None and end < size:
+                trailing = bytes(buf[end:end + 4096])
+                report["trailing_data"] = {
+                    "offset": end,
+                    "size": size - end,
+                    "entropy": shannon_entropy(buf[end:end + 1024 * 1024]),
+                    "preview": _text(trailing[:120].split(b"\x00")[0], 120)
+                }
+            # 文件头之后出现的其他文件魔数（附加或拼接的压缩包、图片等）和flag。
+            # 压缩的像素数据中的匹配没有意义，结构完整时只检查像素数据之前的元数据和结束标记之后的数据
+            if pixel_start is not None and end is not None:
+                regions = [(0, pixel_start), (end, size)]
+            else:
+                regions = [(0, size)]
+            embedded, flags = [], set()
+            for region_start, region_end in regions:
+                embedded += scan_signatures(buf, max(region_start, 1), region_end)
+                segment = buf if (region_start, region_end) == (0, size) else buf[region_start:region_end]
+                flags.update(value for value, _ in iter_flags(segment))
+            report["embedded_files"] = embedded
+            report["flags"] = sorted(flags)[:20]
+    report["metadata_flags"] = sorted({value for text in report["metadata"].values() if isinstance(text, str)
+                                       for value, _ in iter_flags(text.encode("utf-8", errors="ignore"))})
+    if kind and NUMPY_AVAILABLE and PIL_AVAILABLE:
+        try:
+            report["pixels"] = _pixel_analysis(path, max_pixels)
+        except Exception as e:
+            report["warnings"].append(f"像素解码失败: {e}")
+    elif kind:
+        report["pixels"] = {"skipped": "未安装 Pillow/NumPy，只进行结构检查"}
+    report["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return report
+
+
+def format_stego_summary(report: Dict[str, Any], max_chars: int = 3000) -> str:
+    """将隐写扫描结果格式化为提示词中的文本块"""
+    size = f", {report['width']}x{report['height']}" if "width" in report else ""
+    lines = [f"[图片隐写扫描] {report['format']}{size}, {report['file_size']} 字节"]
+    if report.get("structure"):
+        lines.append("结构: " + ", ".join(f"{k}={v}" for k, v in report["structure"].items()))
+    for warning in report.get("warnings", [])[:5]:
+        lines.append(f"警告: {warning}")
+    if report.get("metadata"):
+        lines.append("元数据: " + "; ".join(f"{k}={v!r}"[:200] for k, v in list(report["metadata"].items())[:15]))
+    if report.get("trailing_data"):
+        trailing = report["trailing_data"]
+        lines.append(f"结束标记后附加数据: 偏移 {trailing['offset']}, {trailing['size']} 字节, 熵 {trailing['entropy']}, 预览 {trailing['preview']!r}")
+    if report.get("embedded_files"):
+        lines.append("嵌入文件: " + ", ".join(f"{item['type']}@{item['offset']}" for item in report["embedded_files"][:10]))
+    flags = sorted(set(report.get("flags", [])) | set(report.get("metadata_flags", [])))
+    if flags:
+        lines.append("疑似flag: " + ", ".join(flags))
+    pixels = report.get("pixels") or {}
+    if pixels.get("skipped"):
+        lines.append(f"像素检查跳过: {pixels['skipped']}")
+    elif pixels:
+        lines.append(f"像素模式: {pixels['mode']}")
+        for name, stats in pixels["channels"].items():
+            if "constant" in stats:
+                lines.append(f"  通道{name}: 常量 {stats['constant']}")
+                continue
+            chi = ", ".join(f"{k}:{v}" for k, v in stats["chi_square"].items())
+            lines.append(f"  通道{name}: LSB=1比例 {stats['lsb_ones']}, 相邻相同 {stats['lsb_run_similarity']}, 卡方p值(前缀) {chi}")
+        for order, info in pixels.get("lsb_payloads", {}).items():
+            details = ", ".join(f"{k}={v!r}" for k, v in info.items())
+            lines.append(f"  LSB数据 {order}: {details}"[:300])
+        if not pixels.get("lsb_payloads"):
+            lines.append("  常见顺序的LSB数据中未发现文本或文件头")
+    text = "\n".join(lines)
+    return text if len(text) <= max_chars else text[:max_chars] + "\n..."
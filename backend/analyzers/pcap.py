@@ -0,0 +1,497 @@
+"""
+PCAP/PCAPNG 流量包预分析
+
+内存映射抓包文件并单次遍历所有数据包，生成用于提示词的紧凑摘要：
+协议分布、流量最大的会话、HTTP请求、DNS查询、重组后的TCP流预览以及符合flag格式的字符串。
+会话数、TCP流数量和每条流保存的字节数都有上限，内存占用与抓包文件大小无关。
+"""
+import mmap
+import socket
+import struct
+import time
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+from logger import get_logger
+from .common import iter_flags
+
+logger = get_logger("analyzers.pcap")
+
+# 处理过的映射区域每隔这么多字节释放一次，常驻内存不随文件大小增长
+RELEASE_INTERVAL = 32 * 1024 * 1024
+
+HTTP_METHODS = (b"GET ", b"POST ", b"PUT ", b"DELETE ", b"HEAD ", b"OPTIONS ", b"PATCH ", b"CONNECT ")
+WELL_KNOWN_PORTS = {
+    20: "ftp-data", 21: "ftp", 22: "ssh", 23: "telnet", 25: "smtp", 53: "dns", 67: "dhcp", 68: "dhcp",
+    69: "tftp", 80: "http", 110: "pop3", 123: "ntp", 143: "imap", 161: "snmp", 443: "tls", 445: "smb",
+    1883: "mqtt", 3306: "mysql", 3389: "rdp", 5060: "sip", 6379: "redis", 8000: "http", 8080: "http"
+}
+DNS_TYPES = {1: "A", 2: "NS", 5: "CNAME", 15: "MX", 16: "TXT", 28: "AAAA", 33: "SRV", 255: "ANY"}
+
+PCAP_MAGICS = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e6), b"\xa1\xb2\xc3\xd4": (">", 1e6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e9), b"\xa1\xb2\x3c\x4d": (">", 1e9)
+}
+PCAPNG_SHB = b"\x0a\x0d\x0d\x0a"
+
+
+def is_capture(head: bytes) -> bool:
+    """根据文件头判断是否为 pcap/pcapng 文件"""
+    return head[:4] in PCAP_MAGICS or head[:4] == PCAPNG_SHB
+
+
+def _address(raw: bytes) -> str:
+    return socket.inet_ntop(socket.AF_INET if len(raw) == 4 else socket.AF_INET6, raw)
+
+
+def _preview(data: bytes, length: int = 300) -> str:
+    """可打印字符原样保留，其他字节替换为 ."""
+    return "".join(chr(b) if 32 <= b < 127 or b in (9, 10, 13) else "." for b in data[:length])
+
+
+class _Stream:
+    __slots__ = ("segments", "stored", "total")
+
+    def __init__(self):
+        self.segments: Dict[int, bytes] = {}
+        self.stored = 0
+        self.total = 0
+
+    def add(self, seq: int, payload: bytes, limit: int):
+        self.total += len(payload)
+        if seq in self.segments or self.stored >= limit:
+            return
+        payload = payload[:limit - self.stored]
+        self.segments[seq] = payload
+        self.stored += len(payload)
+
+    def reassemble(self) -> bytes:
+        """按序号拼接分段，丢弃重传的重叠部分"""
+        if not self.segments:
+            return b""
+        ordered = sorted(self.segments.items())
+        parts = []
+        expected = ordered[0][0]
+        for seq, payload in ordered:
+            end = seq + len(payload)
+            if end <= expected:
+                continue
+            parts.append(payload[max(expected - seq, 0):])
+            expected = end
+        return b"".join(parts)
+
+
+class PcapSummarizer:
+    """单次遍历流量包的摘要统计"""
+
+    def __init__(self, max_conversations: int = 50000, max_streams: int = 256,
+                 max_stream_bytes: int = 65536, max_http_requests: int = 100,
+                 max_dns_names: int = 5000, max_flags: int = 50):
+        self.max_conversations = max_conversations
+        self.max_streams = max_streams
+        self.max_stream_bytes = max_stream_bytes
+        self.max_http_requests = max_http_requests
+        self.max_dns_names = max_dns_names
+        self.max_flags = max_flags
+
+        self.packets = 0
+        self.captured_bytes = 0
+        self.first_ts: Optional[float] = None
+        self.last_ts: Optional[float] = None
+        self.link_types: Counter = Counter()
+        self.protocols: Counter = Counter()
+        self.conversations: Dict[Tuple, List[int]] = {}
+        self.dropped_conversations = 0
+        self.http_requests: List[Dict[str, Any]] = []
+        self.http_request_count = 0
+        self.http_status: Counter = Counter()
+        self.dns_queries: Counter = Counter()
+        self.streams: Dict[Tuple, _Stream] = {}
+        self.dropped_streams = 0
+        self.flags: Dict[str, str] = {}
+
+    # 链路层与网络层
+    def packet(self, ts: float, link_type: int, buf, offset: int, length: int):
+        self.packets += 1
+        self.captured_bytes += length
+        if self.first_ts is None:
+            self.first_ts = ts
+        self.last_ts = ts
+        end = offset + length
+
+        if link_type == 1:  # Ethernet
+            if length < 14:
+                return
+            ether_type = struct.unpack_from(">H", buf, offset + 12)[0]
+            l3 = offset + 14
+            while ether_type in (0x8100, 0x88A8) and l3 + 4 <= end:
+                ether_type = struct.unpack_from(">H", buf, l3 + 2)[0]
+                l3 += 4
+        elif link_type == 113:  # Linux cooked capture
+            if length < 16:
+                return
+            ether_type = struct.unpack_from(">H", buf, offset + 14)[0]
+            l3 = offset + 16
+        elif link_type == 276:  # Linux cooked capture v2
+            if length < 20:
+                return
+            ether_type = struct.unpack_from(">H", buf, offset)[0]
+            l3 = offset + 20
+        elif link_type == 0:  # BSD loopback
+            if length < 4:
+                return
+            family = struct.unpack_from("<I", buf, offset)[0]
+            if family > 0xFFFF:
+                family = struct.unpack_from(">I", buf, offset)[0]
+            ether_type = 0x0800 if family == 2 else 0x86DD if family in (24, 28, 30) else None
+            l3 = offset + 4
+        elif link_type in (12, 14, 101, 228, 229):  # 原始IP
+            if length < 1:
+                return
+            ether_type = 0x0800 if buf[offset] >> 4 == 4 else 0x86DD
+            l3 = offset
+        else:
+            self.protocols[f"link:{link_type}"] += 1
+            return
+
+        if ether_type == 0x0800:
+            self._ipv4(buf, l3, end)
+        elif ether_type == 0x86DD:
+            self._ipv6(buf, l3, end)
+        elif ether_type == 0x0806:
+            self.protocols["arp"] += 1
+        else:
+            self.protocols["other-l3"] += 1
+
+    def _ipv4(self, buf, l3: int, end: int):
+        if l3 + 20 > end:
+            return
+        self.protocols["ipv4"] += 1
+        ihl = (buf[l3] & 0x0F) * 4
+        total_length, fragment = struct.unpack_from(">H2xH", buf, l3 + 2)
+        if total_length >= ihl:
+            end = min(end, l3 + total_length)
+        if fragment & 0x1FFF:
+            self.protocols["ipv4-fragment"] += 1
+            return
+        self._transport(buf, buf[l3 + 9], buf[l3 + 12:l3 + 16], buf[l3 + 16:l3 + 20], l3 + ihl, end)
+
+    def _ipv6(self, buf, l3: int, end: int):
+        if l3 + 40 > end:
+            return
+        self.protocols["ipv6"] += 1
+        payload_length = struct.unpack_from(">H", buf, l3 + 4)[0]
+        if payload_length:
+            end = min(end, l3 + 40 + payload_length)
+        next_header = buf[l3 + 6]
+        l4 = l3 + 40
+        # 跳过扩展头
+        for _ in range(8):
+            if next_header in (0, 43, 60) and l4 + 2 <= end:
+                next_header, l4 = buf[l4], l4 + (buf[l4 + 1] + 1) * 8
+            elif next_header == 44 and l4 + 8 <= end:
+                if struct.unpack_from(">H", buf, l4 + 2)[0] & 0xFFF8:
+                    self.protocols["ipv6-fragment"] += 1
+                    return
+                next_header, l4 = buf[l4], l4 + 8
+            else:
+                break
+        self._transport(buf, next_header, buf[l3 + 8:l3 + 24], buf[l3 + 24:l3 + 40], l4, end)
+
+    # 传输层
+    def _count_conversation(self, protocol: str, src: bytes, sport: int, dst: bytes, dport: int, size: int):
+        a, b = (src, sport), (dst, dport)
+        key = (protocol,) + ((a, b) if a <= b else (b, a))
+        stats = self.conversations.get(key)
+        if stats is None:
+            if len(self.conversations) >= self.max_conversations:
+                self.dropped_conversations += 1
+                return
+            stats = self.conversations[key] = [0, 0]
+        stats[0] += 1
+        stats[1] += size
+
+    def _transport(self, buf, protocol: int, src: bytes, dst: bytes, l4: int, end: int):
+        if protocol == 6 and l4 + 20 <= end:
+            self.protocols["tcp"] += 1
+            sport, dport, seq = struct.unpack_from(">HHI", buf, l4)
+            data_offset = (buf[l4 + 12] >> 4) * 4
+            self._count_conversation("tcp", src, sport, dst, dport, end - l4)
+            if l4 + data_offset < end:
+                payload = buf[l4 + data_offset:end]
+                self._application("tcp", sport, dport, payload)
+                self._tcp_payload(src, sport, dst, dport, seq, payload)
+        elif protocol == 17 and l4 + 8 <= end:
+            self.protocols["udp"] += 1
+            sport, dport = struct.unpack_from(">HH", buf, l4)
+            self._count_conversation("udp", src, sport, dst, dport, end - l4)
+            if l4 + 8 < end:
+                payload = buf[l4 + 8:end]
+                self._application("udp", sport, dport, payload)
+                if 53 in (sport, dport) or 5353 in (sport, dport):
+                    self._dns(payload)
+        elif protocol in (1, 58):
+            self.protocols["icmp" if protocol == 1 else "icmpv6"] += 1
+            self._count_conversation("icmp", src, 0, dst, 0, end - l4)
+            if l4 + 8 < end:
+                self._scan_flags(buf[l4 + 8:end])
+        else:
+            self.protocols[f"ip-proto:{protocol}"] += 1
+
+    def _application(self, transport: str, sport: int, dport: int, payload: bytes):
+        if payload.startswith(HTTP_METHODS):
+            self.protocols["http"] += 1
+            self._http_request(payload)
+        elif payload.startswith(b"HTTP/1."):
+            self.protocols["http"] += 1
+            self.http_status[payload[9:12].decode("ascii", "replace")] += 1
+        elif transport == "tcp" and len(payload) > 5 and payload[0] in (0x16, 0x17) and payload[1] == 3:
+            self.protocols["tls"] += 1
+        else:
+            service = WELL_KNOWN_PORTS.get(min(sport, dport)) or WELL_KNOWN_PORTS.get(max(sport, dport))
+            if service:
+                self.protocols[service] += 1
+        self._scan_flags(payload)
+
+    def _http_request(self, payload: bytes):
+        self.http_request_count += 1
+        if len(self.http_requests) >= self.max_http_requests:
+            return
+        head = payload[:2048]
+        request_line = head.split(b"\r\n", 1)[0].decode("latin-1")
+        parts = request_line.split(" ")
+        host = ""
+        host_position = head.lower().find(b"\r\nhost:")
+        if host_position >= 0:
+            host_end = head.find(b"\r\n", host_position + 2)
+            host = head[host_position + 7:host_end if host_end >= 0 else None].strip().decode("latin-1")
+        request = {"method": parts[0], "host": host, "uri": parts[1][:300] if len(parts) > 1 else ""}
+        body_position = payload.find(b"\r\n\r\n")
+        if request["method"] in ("POST", "PUT", "PATCH") and 0 <= body_position < len(payload) - 4:
+            request["body"] = _preview(payload[body_position + 4:], 200)
+        self.http_requests.append(request)
+
+    def _dns(self, payload: bytes):
+        if len(payload) < 17:
+            return
+        flags, question_count = struct.unpack_from(">HH", payload, 2)
+        if flags & 0x8000 or not question_count:
+            return
+        self.protocols["dns-query"] += 1
+        labels = []
+        position = 12
+        while position < len(payload):
+            length = payload[position]
+            if length == 0 or length & 0xC0:
+                break
+            labels.append(payload[position + 1:position + 1 + length].decode("latin-1"))
+            position += 1 + length
+        if position + 3 > len(payload):
+            return
+        query_type = struct.unpack_from(">H", payload, position + 1)[0]
+        key = (".".join(labels), DNS_TYPES.get(query_type, str(query_type)))
+        if key in self.dns_queries or len(self.dns_queries) < self.max_dns_names:
+            self.dns_queries[key] += 1
+
+    def _tcp_payload(self, src: bytes, sport: int, dst: bytes, dport: int, seq: int, payload: bytes):
+        key = (src, sport, dst, dport)
+        stream = self.streams.get(key)
+        if stream is None:
+            if len(self.streams) >= self.max_streams:
+                self.dropped_streams += 1
+                return
+            stream = self.streams[key] = _Stream()
+        stream.add(seq, payload, self.max_stream_bytes)
+
+    def _scan_flags(self, data: bytes, source: str = "packet"):
+        if len(self.flags) >= self.max_flags:
+            return
+        for value, from_base64 in iter_flags(data):
+            self.flags.setdefault(value, f"{source}(base64)" if from_base64 else source)
+
+    # 结果
+    def report(self) -> Dict[str, Any]:
+        top_conversations = sorted(self.conversations.items(), key=lambda item: item[1][1], reverse=True)[:10]
+        candidates = []
+        for (src, sport, dst, dport), stream in self.streams.items():
+            data = stream.reassemble()
+            # 跨分段的flag只能在重组后的数据中找到
+            self._scan_flags(data, "tcp-stream")
+            sample = data[:4096]
+            printable = sum(32 <= b < 127 or b in (9, 10, 13) for b in sample) / len(sample) if sample else 0
+            candidates.append((printable >= 0.8, stream.total, src, sport, dst, dport, data))
+        # 优先展示明文流（TLS等加密流的预览对分析没有帮助），其次按字节数
+        candidates.sort(key=lambda item: (item[0], item[1]), reverse=True)
+        stream_results = [{
+            "src": f"{_address(src)}:{sport}",
+            "dst": f"{_address(dst)}:{dport}",
+            "bytes": total,
+            "plaintext": plaintext,
+            "preview": _preview(data)
+        } for plaintext, total, src, sport, dst, dport, data in candidates[:5]]
+        return {
+            "packets": self.packets,
+            "captured_bytes": self.captured_bytes,
+            "start_time": self.first_ts,
+            "duration": round(self.last_ts - self.first_ts, 3) if self.first_ts is not None else 0,
+            "link_types": dict(self.link_types),
+            "protocols": dict(self.protocols.most_common()),
+            "top_conversations": [
+                {"protocol": key[0], "a": f"{_address(key[1][0])}:{key[1][1]}",
+                 "b": f"{_address(key[2][0])}:{key[2][1]}", "packets": stats[0], "bytes": stats[1]}
+                for key, stats in top_conversations
+            ],
+            "conversation_count": len(self.conversations),
+            "dropped_conversations": self.dropped_conversations,
+            "http_request_count": self.http_request_count,
+            "http_requests": self.http_requests[:20],
+            "http_status": dict(self.http_status),
+            "dns_queries": [{"name": name, "type": query_type, "count": count}
+                            for (name, query_type), count in self.dns_queries.most_common(20)],
+            "tcp_streams": stream_results,
+            "tcp_stream_count": len(self.streams) + self.dropped_streams,
+            "flags": [{"value": value, "source": source} for value, source in self.flags.items()]
+        }
+
+
+def _iter_pcap(buf, size: int):
+    endian, resolution = PCAP_MAGICS[bytes(buf[:4])]
+    link_type = struct.unpack_from(endian + "I", buf, 20)[0] & 0x0FFFFFFF
+    record = struct.Struct(endian + "IIII")
+    offset = 24
+    while offset + 16 <= size:
+        seconds, fraction, captured, _ = record.unpack_from(buf, offset)
+        offset += 16
+        captured = min(captured, size - offset)
+        yield seconds + fraction / resolution, link_type, offset, captured
+        offset += captured
+
+
+def _iter_pcapng(buf, size: int):
+    endian = "<"
+    interfaces: List[Tuple[int, float]] = []
+    offset = 0
+    while offset + 12 <= size:
+        block_type = struct.unpack_from(endian + "I", buf, offset)[0]
+        if block_type == 0x0A0D0D0A:
+            # 每个节头块重新确定字节序，接口编号重新开始
+            endian = "<" if buf[offset + 8:offset + 12] == b"\x4d\x3c\x2b\x1a" else ">"
+            interfaces = []
+        block_length = struct.unpack_from(endian + "I", buf, offset + 4)[0]
+        if block_length < 12 or offset + block_length > size:
+            break
+        body = offset + 8
+        if block_type == 0x00000001:  # 接口描述块
+            link_type = struct.unpack_from(endian + "H", buf, body)[0]
+            resolution = 1e6
+            option = body + 8
+            while option + 4 <= offset + block_length - 4:
+                code, length = struct.unpack_from(endian + "HH", buf, option)
+                if code == 0:
+                    break
+                if code == 9 and length >= 1:
+                    value = buf[option + 4]
+                    resolution = float(2 ** (value & 0x7F)) if value & 0x80 else float(10 ** value)
+                option += 4 + ((length + 3) & ~3)
+            interfaces.append((link_type, resolution))
+        elif block_type in (0x00000006, 0x00000002):  # 增强数据包块 / 旧版数据包块
+            if block_type == 6:
+                interface_id, high, low, captured = struct.unpack_from(endian + "IIII", buf, body)
+            else:
+                interface_id, _, high, low, captured = struct.unpack_from(endian + "HHIII", buf, body)
+            if interface_id < len(interfaces):
+                link_type, resolution = interfaces[interface_id]
+                captured = min(captured, block_length - 32)
+                yield ((high << 32) | low) / resolution, link_type, body + 20, captured
+        elif block_type == 0x00000003 and interfaces:  # 简单数据包块
+            link_type, _ = interfaces[0]
+            yield 0.0, link_type, body + 4, block_length - 16
+        offset += block_length
+
+
+def summarize_pcap(path: str, time_budget: Optional[float] = None, **limits) -> Dict[str, Any]:
+    """
+    生成抓包文件摘要
+
+    Args:
+        path: 抓包文件路径（pcap 或 pcapng）
+        time_budget: 最长处理时间（秒），超时后返回已处理部分的摘要并标记 truncated
+        limits: PcapSummarizer 的容量上限参数
+
+    Returns:
+        摘要字典，包含处理耗时和吞吐量
+    """
+    started = time.perf_counter()
+    summarizer = PcapSummarizer(**limits)
+    truncated = False
+    with open(path, "rb") as f:
+        size = f.seek(0, 2)
+        if size < 24:
+            raise ValueError("文件过小，不是有效的抓包文件")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            if hasattr(buf, "madvise"):
+                buf.madvise(mmap.MADV_SEQUENTIAL)
+            released = 0
+            head = buf[:4]
+            if head in PCAP_MAGICS:
+                capture_format, packets = "pcap", _iter_pcap(buf, size)
+            elif head == PCAPNG_SHB:
+                capture_format, packets = "pcapng", _iter_pcapng(buf, size)
+            else:
+                raise ValueError("不是 pcap/pcapng 格式的文件")
+            for index, (ts, link_type, offset, length) in enumerate(packets):
+                summarizer.link_types[link_type] += 1
+                try:
+                    summarizer.packet(ts, link_type, buf, offset, length)
+                except (struct.error, IndexError, ValueError):
+                    summarizer.protocols["malformed"] += 1
+                if (index & 0x3FF) == 0:
+                    if time_budget and time.perf_counter() - started > time_budget:
+                        truncated = True
+                        break
+                    if offset - released >= RELEASE_INTERVAL and hasattr(mmap, "MADV_DONTNEED"):
+                        release_end = offset - offset % mmap.PAGESIZE
+                        buf.madvise(mmap.MADV_DONTNEED, released, release_end - released)
+                        released = release_end
+            report = summarizer.report()
+
+    elapsed = time.perf_counter() - started
+    report.update({
+        "format": capture_format,
+        "file_size": size,
+        "truncated": truncated,
+        "elapsed_ms": round(elapsed * 1000, 1),
+        "throughput_mb_s": round(size / 1048576 / elapsed, 1) if elapsed > 0 else None,
+        "packets_per_s": round(summarizer.packets / elapsed) if elapsed > 0 else None
+    })
+    logger.info(f"流量包摘要完成: {summarizer.packets} 个数据包, {size} 字节, "
+                f"耗时 {report['elapsed_ms']}ms ({report['throughput_mb_s']} MB/s)")
+    return report
+
+
+def format_pcap_summary(report: Dict[str, Any], max_chars: int = 4000) -> str:
+    """将摘要格式化为提示词中的文本块"""
+    lines = [f"[流量包摘要] 格式: {report['format']}, 数据包: {report['packets']}, "
+             f"时长: {report['duration']}s" + (", 仅分析了部分数据" if report.get("truncated") else "")]
+    if report["protocols"]:
+        lines.append("协议分布: " + ", ".join(f"{k}={v}" for k, v in list(report["protocols"].items())[:15]))
+    if report["flags"]:
+        lines.append("疑似flag: " + ", ".join(f"{f['value']} ({f['source']})" for f in report["flags"][:10]))
+    if report["top_conversations"]:
+        lines.append("主要会话:")
+        lines += [f"  {c['protocol']} {c['a']} <-> {c['b']} 包数={c['packets']} 字节={c['bytes']}"
+                  for c in report["top_conversations"][:5]]
+    if report["http_requests"]:
+        lines.append(f"HTTP请求 (共 {report['http_request_count']} 个):")
+        for request in report["http_requests"][:10]:
+            line = f"  {request['method']} {request['host']}{request['uri']}"
+            if request.get("body"):
+                line += f" body={request['body'][:100]}"
+            lines.append(line)
+    if report["dns_queries"]:
+        lines.append("DNS查询: " + ", ".join(f"{q['name']}({q['type']})x{q['count']}" for q in report["dns_queries"][:10]))
+    if report["tcp_streams"]:
+        lines.append("TCP流预览:")
+        lines += [f"  {s['src']} -> {s['dst']} ({s['bytes']} 字节): {s['preview'][:200]!r}"
+                  for s in report["tcp_streams"][:3]]
+    text = "\n".join(lines)
+    return text if len(text) <= max_chars else text[:max_chars] + "\n..."
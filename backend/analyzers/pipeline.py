@@ -0,0 +1,331 @@
+"""
+上传文件预分析流水线
+
+各预分析在注册表中声明处理的 MIME 类型、扩展名、文件头匹配函数和开销等级。一次请求中所有匹配的
+预分析并发执行：开销低的在线程池中执行，开销高的在进程池中执行（不占用事件循环进程的GIL）。
+结果按 (预分析名称, 文件内容哈希) 缓存。请求只等待时间预算内完成的预分析，超时的预分析在后台
+继续执行并写入缓存，之后相同文件的请求可以直接使用。各预分析的摘要合并为长度受限的上下文文本块，
+每个阶段的状态和耗时随结果返回，并累计在 stats 中。
+"""
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, Optional, Callable, Tuple, Set, Sequence
+from config import config
+from logger import get_logger
+from upload_store import upload_store
+from .common import get_cached_report, save_cached_report
+from .binary import triage_binary, format_binary_summary, is_binary, BINARY_MIME_TYPES
+from .image_stego import scan_image, format_stego_summary, image_format
+from .pcap import summarize_pcap, format_pcap_summary, is_capture
+from .archive import extract_archive, format_archive_manifest, archive_type
+from .strings import scan_strings, format_strings_summary
+from .filetype import detect_file
+
+logger = get_logger("analyzers.pipeline")
+
+COST_CLASSES = ("light", "heavy")
+
+
+class AnalyzerSpec:
+    """
+    预分析注册信息
+
+    run(path, file_name, **kwargs) 返回可JSON序列化的报告，format(report, max_chars) 生成提示词摘要。
+    mime_types 中以 / 结尾的项按前缀匹配。fallback 为真的预分析只在没有其他预分析匹配时执行。
+    budget_kwarg 为支持时间预算的预分析接收 time_budget（秒）的参数名。该预算属于预分析本身，
+    与请求的等待时间无关：请求超时后预分析在后台按自己的预算完成，缓存的是完整结果。
+    """
+
+    def __init__(self, name: str, run: Callable[..., Dict[str, Any]], format: Callable[..., str],
+                 mime_types: Tuple[str, ...] = (), extensions: Tuple[str, ...] = (),
+                 match: Optional[Callable[[bytes], bool]] = None, cost: str = "heavy",
+                 priority: int = 50, fallback: bool = False, budget_kwarg: Optional[str] = None,
+                 time_budget: Optional[float] = None):
+        if cost not in COST_CLASSES:
+            raise ValueError(f"未知的开销等级: {cost}")
+        self.name = name
+        self.run = run
+        self.format = format
+        self.mime_types = tuple(mime_types)
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.match = match
+        self.cost = cost
+        self.priority = priority
+        self.fallback = fallback
+        self.budget_kwarg = budget_kwarg
+        self.time_budget = time_budget
+
+    def matches(self, mime: Optional[str], file_name: Optional[str], head: bytes) -> bool:
+        if mime and any(mime == item or (item.endswith("/") and mime.startswith(item)) for item in self.mime_types):
+            return True
+        if file_name and self.extensions and file_name.lower().endswith(self.extensions):
+            return True
+        return bool(self.match and self.match(head))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "mime_types": list(self.mime_types),
+            "extensions": list(self.extensions),
+            "cost": self.cost,
+            "priority": self.priority,
+            "fallback": self.fallback
+        }
+
+
+class AnalyzerRegistry:
+    """预分析注册表"""
+
+    def __init__(self):
+        self._specs: Dict[str, AnalyzerSpec] = {}
+
+    def register(self, spec: AnalyzerSpec):
+        self._specs[spec.name] = spec
+
+    def get(self, name: str) -> Optional[AnalyzerSpec]:
+        return self._specs.get(name)
+
+    def all(self) -> List[AnalyzerSpec]:
+        return sorted(self._specs.values(), key=lambda spec: spec.priority)
+
+    def select(self, mime: Optional[str], file_name: Optional[str], head: bytes,
+               embedded: Sequence[str] = ()) -> List[AnalyzerSpec]:
+        """
+        返回匹配的预分析（按优先级排序），没有匹配时返回兜底的预分析
+
+        embedded 为文件中嵌入的其他格式的 MIME 类型（拼接/多格式文件），匹配这些类型的预分析也会执行。
+        """
+        matched = [spec for spec in self.all() if not spec.fallback and (
+            spec.matches(mime, file_name, head) or any(spec.matches(item, None, b"") for item in embedded))]
+        return matched or [spec for spec in self.all() if spec.fallback]
+
+
+analyzer_registry = AnalyzerRegistry()
+analyzer_registry.register(AnalyzerSpec(
+    "archive", lambda path, file_name: extract_archive(path, file_name or "archive"), format_archive_manifest,
+    mime_types=("application/zip", "application/x-tar", "application/gzip", "application/x-bzip2",
+                "application/x-xz", "application/x-7z-compressed"),
+    match=lambda head: archive_type(head) is not None, priority=10
+))
+analyzer_registry.register(AnalyzerSpec(
+    "binary", lambda path, file_name: triage_binary(path), format_binary_summary,
+    mime_types=tuple(BINARY_MIME_TYPES), extensions=(".exe", ".dll", ".elf", ".so"),
+    match=is_binary, cost="light", priority=20
+))
+analyzer_registry.register(AnalyzerSpec(
+    "pcap", lambda path, file_name, time_budget=None: summarize_pcap(path, time_budget=time_budget), format_pcap_summary,
+    mime_types=("application/vnd.tcpdump.pcap", "application/x-pcapng"), extensions=(".pcap", ".pcapng", ".cap"),
+    match=is_capture, priority=30, budget_kwarg="time_budget", time_budget=config.PCAP_TIME_BUDGET
+))
+analyzer_registry.register(AnalyzerSpec(
+    "stego", lambda path, file_name: scan_image(path), format_stego_summary,
+    mime_types=("image/",), match=lambda head: image_format(head) is not None, priority=40
+))
+analyzer_registry.register(AnalyzerSpec(
+    "strings", lambda path, file_name: scan_strings(path), format_strings_summary,
+    cost="light", priority=90, fallback=True
+))
+
+
+def _execute(name: str, path: str, file_name: Optional[str], kwargs: Dict[str, Any],
+             in_process: bool) -> Tuple[Dict[str, Any], float, float]:
+    """执行一个预分析（在线程池或进程池中），返回 (报告, 耗时毫秒, CPU时间毫秒)"""
+    clock = time.process_time if in_process else time.thread_time
+    started, cpu_started = time.perf_counter(), clock()
+    spec = analyzer_registry.get(name)
+    report = spec.run(path, file_name, **kwargs)
+    return report, round((time.perf_counter() - started) * 1000, 1), round((clock() - cpu_started) * 1000, 1)
+
+
+def merge_context(sections: List[str], max_chars: int) -> str:
+    """
+    合并各预分析的摘要，总长度不超过 max_chars
+
+    较短的摘要完整保留，剩余长度在较长的摘要之间平均分配（超出部分截断）。
+    """
+    sections = [section for section in sections if section]
+    if not sections:
+        return ""
+    budget = max_chars - 2 * (len(sections) - 1)
+    allowance: Dict[int, int] = {}
+    remaining = list(range(len(sections)))
+    while remaining:
+        share = max(budget // len(remaining), 0)
+        short = [i for i in remaining if len(sections[i]) <= share]
+        if not short:
+            for i in remaining:
+                allowance[i] = share
+            break
+        for i in short:
+            allowance[i] = len(sections[i])
+            budget -= len(sections[i])
+            remaining.remove(i)
+    parts = []
+    for i, section in enumerate(sections):
+        limit = allowance[i]
+        parts.append(section if len(section) <= limit else section[:max(limit - 4, 0)] + "\n...")
+    return "\n\n".join(parts)
+
+
+class AnalysisPipeline:
+    """按注册表并发执行上传文件的预分析"""
+
+    def __init__(self, registry: AnalyzerRegistry, workers: int, start_method: str):
+        self.registry = registry
+        self.workers = workers
+        self.start_method = start_method
+        self.logger = get_logger("analysis_pipeline")
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        # 超出时间预算后在后台继续执行的任务（保留引用，避免被回收）
+        self._background: Set[asyncio.Task] = set()
+        self.stats: Dict[str, Dict[str, Any]] = {}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context(self.start_method)
+                )
+            return self._pool
+
+    def _reset_pool(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _record(self, stage: Dict[str, Any]):
+        stats = self.stats.setdefault(stage["analyzer"], {
+            "runs": 0, "cached": 0, "errors": 0, "background": 0, "total_ms": 0.0, "max_ms": 0.0, "cpu_ms": 0.0
+        })
+        stats["runs"] += 1
+        if stage["status"] == "cached":
+            stats["cached"] += 1
+        elif stage["status"] == "error":
+            stats["errors"] += 1
+        elapsed = stage.get("elapsed_ms") or 0.0
+        stats["total_ms"] = round(stats["total_ms"] + elapsed, 1)
+        stats["max_ms"] = max(stats["max_ms"], elapsed)
+        stats["cpu_ms"] = round(stats["cpu_ms"] + (stage.get("cpu_ms") or 0.0), 1)
+        stats["avg_ms"] = round(stats["total_ms"] / stats["runs"], 1)
+
+    async def _run_stage(self, spec: AnalyzerSpec, stored_file: Dict[str, Any],
+                         kwargs: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        stage: Dict[str, Any] = {"analyzer": spec.name, "cost": spec.cost}
+        sha256 = stored_file["sha256"]
+        try:
+            report = await asyncio.to_thread(get_cached_report, spec.name, sha256)
+            if report is not None:
+                stage.update(status="cached", elapsed_ms=0.0, cpu_ms=0.0)
+                return stage, report
+            loop = asyncio.get_running_loop()
+            in_process = spec.cost == "heavy"
+            executor = self._get_pool() if in_process else None
+            report, elapsed_ms, cpu_ms = await loop.run_in_executor(
+                executor, _execute, spec.name, stored_file["path"], stored_file.get("file_name"), kwargs, in_process
+            )
+            await asyncio.to_thread(save_cached_report, spec.name, sha256, report)
+            stage.update(status="done", elapsed_ms=elapsed_ms, cpu_ms=cpu_ms)
+            return stage, report
+        except BrokenProcessPool as e:
+            # 工作进程异常退出（如内存不足被终止），重建进程池供后续请求使用
+            self._reset_pool()
+            stage.update(status="error", error=f"工作进程异常退出: {e}")
+        except Exception as e:
+            stage.update(status="error", error=str(e))
+        self.logger.warning(f"预分析 {spec.name} 失败: {stage['error']}")
+        return stage, None
+
+    async def _finish_in_background(self, task: asyncio.Task):
+        stage, _ = await task
+        stage["background"] = True
+        self._record(stage)
+        self.stats[stage["analyzer"]]["background"] += 1
+        self.logger.info(f"预分析 {stage['analyzer']} 在后台完成: {stage['status']}, {stage.get('elapsed_ms')}ms")
+
+    async def run(self, stored_file: Dict[str, Any], mime: Optional[str] = None,
+                  time_budget: Optional[float] = None, max_chars: Optional[int] = None,
+                  file_type: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        执行上传文件的预分析
+
+        Args:
+            stored_file: upload_store.save 的返回值
+            mime: 检测到的 MIME 类型（默认使用 file_type 中的类型）
+            time_budget: 本次请求等待预分析的最长时间（秒）
+            max_chars: 合并后的上下文最大长度
+            file_type: detect_file 的识别结果，未提供时在这里识别
+
+        Returns:
+            {"context": 合并的摘要文本, "analyzers": 执行的预分析, "stages": 各阶段状态和耗时, "elapsed_ms"}
+        """
+        started = time.perf_counter()
+        time_budget = time_budget or config.ANALYSIS_TIME_BUDGET
+        max_chars = max_chars or config.ANALYSIS_CONTEXT_MAX_CHARS
+        file_name = stored_file.get("file_name")
+        head = await asyncio.to_thread(upload_store.read_head, stored_file["path"], 512) if stored_file["size"] else b""
+        if file_type is None and stored_file["size"]:
+            file_type = await asyncio.to_thread(detect_file, stored_file["path"], file_name)
+        file_type = file_type or {}
+        mime = mime or file_type.get("mime")
+        embedded = [item for item in file_type.get("embedded", []) if item.get("mime")]
+        specs = self.registry.select(mime, file_name, head, [item["mime"] for item in embedded])
+
+        tasks: Dict[asyncio.Task, AnalyzerSpec] = {}
+        for spec in specs:
+            kwargs = {spec.budget_kwarg: spec.time_budget} if spec.budget_kwarg else {}
+            tasks[asyncio.create_task(self._run_stage(spec, stored_file, kwargs))] = spec
+        done, pending = await asyncio.wait(tasks, timeout=time_budget) if tasks else (set(), set())
+
+        stages, sections = [], []
+        for task, spec in tasks.items():
+            if task in pending:
+                background = asyncio.create_task(self._finish_in_background(task))
+                self._background.add(background)
+                background.add_done_callback(self._background.discard)
+                stages.append({"analyzer": spec.name, "cost": spec.cost, "status": "running",
+                               "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)})
+                sections.append(f"[{spec.name}] 预分析仍在进行中，结果将在之后的请求中提供")
+                continue
+            stage, report = task.result()
+            self._record(stage)
+            stages.append(stage)
+            if report is not None:
+                try:
+                    sections.append(spec.format(report))
+                except Exception as e:
+                    self.logger.warning(f"格式化预分析 {spec.name} 的结果失败: {e}")
+
+        header = f"[上传文件] 文件名: {file_name}, 类型: {mime or '未知'}, 大小: {stored_file['size']} 字节"
+        if file_type.get("extension_mismatch"):
+            header += f"\n扩展名与内容不符: 扩展名为 {file_type['extension']}, 内容为 {file_type['label']}"
+        if embedded:
+            header += "\n嵌入的其他格式: " + ", ".join(f"{item['type']}@{item['offset']}" for item in embedded)
+        if file_type.get("trailing_data"):
+            header += "\n文件结束标记之后还有附加数据"
+        return {
+            "context": merge_context([header] + sections, max_chars),
+            "analyzers": [spec.name for spec in specs],
+            "stages": stages,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+
+    def describe(self) -> Dict[str, Any]:
+        """注册的预分析及累计的阶段耗时统计"""
+        return {
+            "analyzers": [spec.to_dict() for spec in self.registry.all()],
+            "stats": self.stats,
+            "background_tasks": len(self._background),
+            "workers": self.workers
+        }
+
+    def shutdown(self):
+        self._reset_pool()
+
+# 全局实例
+analysis_pipeline = AnalysisPipeline(analyzer_registry, config.ANALYZER_WORKERS, config.ANALYZER_START_METHOD)
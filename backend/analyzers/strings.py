@@ -0,0 +1,66 @@
+"""
+通用文件扫描
+
+没有专门预分析的文件（文本、未知格式的数据）统一提取字符串、查找flag、计算熵，并给出文本内容预览。
+"""
+import time
+from typing import Dict, Any
+from upload_store import upload_store
+from .common import extract_strings, iter_flags, shannon_entropy, scan_signatures
+
+# 熵和嵌入文件只检查文件开头的这部分内容
+SCAN_LIMIT = 64 * 1024 * 1024
+
+
+def looks_like_text(head: bytes) -> bool:
+    """文件开头不含空字节且能按 UTF-8 解码（允许末尾截断的多字节字符）时视为文本"""
+    if not head or b"\x00" in head:
+        return False
+    for trim in range(4):
+        try:
+            text = head[:len(head) - trim].decode("utf-8")
+        except UnicodeDecodeError:
+            continue
+        control = sum(1 for ch in text if ord(ch) < 32 and ch not in "\t\r\n\f")
+        return control <= len(text) * 0.02
+    return False
+
+
+def scan_strings(path: str, min_length: int = 6, max_strings: int = 40) -> Dict[str, Any]:
+    started = time.perf_counter()
+    report: Dict[str, Any] = {"file_size": 0, "flags": [], "embedded_files": []}
+    with upload_store.open_mmap(path) as buf:
+        if buf is not None:
+            head = bytes(buf[:512])
+            report.update({
+                "file_size": len(buf),
+                "entropy": shannon_entropy(buf[:SCAN_LIMIT]),
+                "text": looks_like_text(head),
+                "flags": sorted({value for value, _ in iter_flags(buf)})[:20],
+                "embedded_files": [item for item in scan_signatures(buf, 1, min(len(buf), SCAN_LIMIT))]
+            })
+            if report["text"]:
+                report["preview"] = head.decode("utf-8", errors="ignore")
+            else:
+                report["strings"] = extract_strings(buf[:SCAN_LIMIT], min_length, max_strings,
+                                                    interesting=lambda s: "flag" in s.lower() or "ctf" in s.lower())
+    report["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return report
+
+
+def format_strings_summary(report: Dict[str, Any], max_chars: int = 2000) -> str:
+    """将扫描结果格式化为提示词中的文本块"""
+    kind = "文本" if report.get("text") else "二进制数据"
+    lines = [f"[文件扫描] {kind}, {report['file_size']} 字节, 熵 {report.get('entropy')}"]
+    if report.get("flags"):
+        lines.append("疑似flag: " + ", ".join(report["flags"]))
+    if report.get("embedded_files"):
+        lines.append("嵌入文件: " + ", ".join(f"{item['type']}@{item['offset']}" for item in report["embedded_files"][:10]))
+    if report.get("preview"):
+        lines.append(f"内容预览: {report['preview'][:400]!r}")
+    strings = (report.get("strings") or {}).get("strings")
+    if strings:
+        lines.append("字符串:")
+        lines += [f"  {item['value'][:120]!r}" for item in strings[:20]]
+    text = "\n".join(lines)
+    return text if len(text) <= max_chars else text[:max_chars] + "\n..."
@@ -47,7 +47,8 @@ class AutoSolver:
                 "type": question_type or (parameters.get("question_type") if parameters else "unknown"),
                 "file": file_info.get("file") if file_info and "file" in file_info else (parameters.get("file") if parameters and "file" in parameters else None),
                 "file_type": file_info.get("file_type") if file_info and "file_type" in file_info else (parameters.get("file_type") if parameters and "file_type" in parameters else None),
-                "file_name": file_info.get("file_name") if file_info and "file_name" in file_info else (parameters.get("file_name") if parameters and "file_name" in parameters else None)
+                "file_name": file_info.get("file_name") if file_info and "file_name" in file_info else (parameters.get("file_name") if parameters and "file_name" in parameters else None),
+                "file_summary": file_info.get("file_summary") if file_info else None
             }
         # 创建解题记录
         auto_solve_data = {
@@ -71,8 +72,11 @@ class AutoSolver:
                         f"【文件信息】：\n"
                         f"- 文件类型：{question.get('file_type', '未知')}\n"
                         f"- 文件名：{question.get('file_name', '未知')}\n"
+                        f"- 文件路径：{question.get('file')}\n"
                         f"- 文件内容已上传，可通过读取本地文件或变量获取内容。\n"
                     )
+                    if question.get("file_summary"):
+                        file_info_section += f"【文件预分析】：\n{question['file_summary']}\n\n"
                 else:
                     file_info_section = ""
                 prompt = (
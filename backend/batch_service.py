@@ -0,0 +1,379 @@
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Any, List, Optional, AsyncIterator, Set
+from ai_providers import AIErrorResponse
+from ai_service import AIService, is_error_response
+from classifier import question_classifier
+from config import config
+from data_service import data_service
+from logger import get_logger
+
+# 已完成（续跑时不再重新分析）的题目状态
+FINISHED_STATUSES = ("done", "cached", "duplicate")
+STREAM_FORMATS = ("ndjson", "sse")
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+
+class _RateLimiter:
+    """按每分钟请求数均匀间隔放行（所有批次共享同一提供者的限速）"""
+
+    def __init__(self, per_minute: int):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+
+    async def wait(self):
+        now = time.monotonic()
+        scheduled = max(now, self._next)
+        self._next = scheduled + self.interval
+        if scheduled > now:
+            await asyncio.sleep(scheduled - now)
+
+
+class _ProviderSlots:
+    """各提供者的并发槽位，题目等待任一可用（未失败过的）提供者空出槽位"""
+
+    def __init__(self):
+        self.free: Dict[str, int] = {}
+        self._condition = asyncio.Condition()
+
+    def ensure(self, provider: str, limit: int):
+        self.free.setdefault(provider, limit)
+
+    async def acquire(self, providers: List[str], excluded: List[str]) -> str:
+        async with self._condition:
+            while True:
+                candidates = [p for p in providers if p not in excluded and self.free.get(p, 0) > 0]
+                if candidates:
+                    provider = max(candidates, key=lambda p: self.free[p])
+                    self.free[provider] -= 1
+                    return provider
+                await self._condition.wait()
+
+    async def release(self, provider: str):
+        async with self._condition:
+            self.free[provider] += 1
+            self._condition.notify_all()
+
+
+class _BatchRun:
+    """运行中的批次：后台任务和订阅结果的队列"""
+
+    def __init__(self, record: Dict[str, Any]):
+        self.record = record
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers: List[asyncio.Queue] = []
+        self.last_saved = 0.0
+
+
+class BatchAnalysisService:
+    """批量题目分析
+
+    一次提交多道题目，所有题目并发调度到请求指定的提供者上：每个提供者有独立的并发上限和每分钟请求数
+    限制，题目在任一提供者空出槽位时立即开始，某个提供者调用失败时换下一个提供者重试。提交时先按
+    (描述, 类型) 去重，再查询各提供者的分析缓存，命中的题目直接返回，不占用提供者的配额。
+
+    批次在后台任务中执行，与客户端连接无关；结果按完成顺序推送给订阅的流（NDJSON 或 SSE），并持久化
+    到数据目录下的批次记录。连接断开后可以重新订阅，服务重启后未完成的题目可以续跑。
+    """
+
+    def __init__(self):
+        self.logger = get_logger("batch_service")
+        self.batches_dir = data_service.data_root / "batches"
+        self._services: Dict[str, AIService] = {}
+        self._limiters: Dict[str, _RateLimiter] = {}
+        self._slots = _ProviderSlots()
+        self._runs: Dict[str, _BatchRun] = {}
+
+    # 提供者
+    def _service(self, provider: str) -> AIService:
+        service = self._services.get(provider)
+        if service is None:
+            service = self._services[provider] = AIService(provider)
+            self._limiters[provider] = _RateLimiter(config.BATCH_PROVIDER_RPM)
+            self._slots.ensure(provider, max(1, config.BATCH_PROVIDER_CONCURRENCY))
+        return service
+
+    # 批次记录
+    def _path(self, batch_id: str):
+        return self.batches_dir / f"{batch_id}.json"
+
+    def _persist(self, run: _BatchRun, force: bool = False):
+        """写入批次记录（运行中最多每秒写一次）"""
+        now = time.monotonic()
+        if not force and now - run.last_saved < 1.0:
+            return
+        run.last_saved = now
+        run.record["updated_at"] = datetime.now().isoformat()
+        self.batches_dir.mkdir(parents=True, exist_ok=True)
+        data_service._write_json_file(self._path(run.record["id"]), run.record)
+
+    def get_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        run = self._runs.get(batch_id)
+        if run is not None:
+            return run.record
+        if not batch_id.replace("-", "").isalnum():
+            return None
+        return data_service._read_json_file(self._path(batch_id))
+
+    def list_batches(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """最近的批次（不含题目明细）"""
+        if not self.batches_dir.exists():
+            return []
+        paths = sorted(self.batches_dir.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)[:limit]
+        batches = []
+        for path in paths:
+            record = self.get_batch(path.stem)
+            if record:
+                batches.append({key: value for key, value in record.items() if key != "items"})
+        return batches
+
+    # 创建和执行
+    def create_batch(self, items: List[Dict[str, Any]], providers: List[str], use_context: bool = True,
+                     user_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        创建批次记录：补全题目类型、批次内去重、查询缓存
+
+        Raises:
+            ValueError: 题目为空或超过上限、提供者不可用
+        """
+        if not items:
+            raise ValueError("题目列表不能为空")
+        if len(items) > config.BATCH_MAX_ITEMS:
+            raise ValueError(f"一个批次最多 {config.BATCH_MAX_ITEMS} 道题目")
+        providers = list(dict.fromkeys(p.lower() for p in providers if p))
+        if not providers:
+            raise ValueError("至少需要一个AI提供者")
+        for provider in providers:
+            try:
+                self._service(provider)
+            except Exception as e:
+                raise ValueError(f"AI提供者 {provider} 不可用: {e}")
+
+        records, first_index = [], {}
+        for index, item in enumerate(items):
+            description = (item.get("description") or "").strip()
+            if not description:
+                raise ValueError(f"第 {index + 1} 道题目的描述为空")
+            question_type = item.get("question_type")
+            entry = {"index": index, "id": item.get("id") or str(uuid.uuid4()), "name": item.get("name"),
+                     "description": description, "question_type": question_type, "status": "pending"}
+            if not question_type or question_type == "auto":
+                classification = question_classifier.classify(description)
+                entry.update(question_type=classification["type"], classified=True,
+                             classification_confidence=classification["confidence"])
+            key = (description, entry["question_type"])
+            if key in first_index:
+                entry.update(status="duplicate", duplicate_of=first_index[key])
+            else:
+                first_index[key] = index
+                for provider in providers:
+                    cached = self._services[provider].get_cached_response(description, entry["question_type"])
+                    if cached and not is_error_response(cached):
+                        entry.update(status="cached", provider=provider, response=cached)
+                        break
+            records.append(entry)
+        for entry in records:
+            if entry["status"] == "duplicate":
+                self._copy_result(entry, records[entry["duplicate_of"]])
+
+        now = datetime.now().isoformat()
+        record = {
+            "id": str(uuid.uuid4()),
+            "status": "pending",
+            "providers": providers,
+            "use_context": use_context,
+            "user_id": user_id,
+            "created_at": now,
+            "updated_at": now,
+            "items": records
+        }
+        run = self._runs[record["id"]] = _BatchRun(record)
+        self._persist(run, force=True)
+        return record
+
+    def start(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """在后台执行批次中未完成的题目（已在运行时直接返回），批次不存在时返回 None"""
+        run = self._runs.get(batch_id)
+        if run is None:
+            record = self.get_batch(batch_id)
+            if record is None:
+                return None
+            run = self._runs[batch_id] = _BatchRun(record)
+        if run.task is None or run.task.done():
+            for item in run.record["items"]:
+                if item["status"] not in FINISHED_STATUSES:
+                    item["status"] = "pending"
+            run.task = asyncio.create_task(self._run(run), name=f"batch:{batch_id}")
+        return run.record
+
+    @staticmethod
+    def _copy_result(duplicate: Dict[str, Any], original: Dict[str, Any]):
+        if original["status"] in ("done", "cached"):
+            duplicate.update(provider=original.get("provider"), response=original.get("response"))
+
+    async def _run(self, run: _BatchRun):
+        record = run.record
+        record["status"] = "running"
+        record["started_at"] = datetime.now().isoformat()
+        started = time.perf_counter()
+        self._persist(run, force=True)
+        pending = [item for item in record["items"] if item["status"] == "pending"]
+        self.logger.info(f"批次 {record['id']} 开始，待分析 {len(pending)} 道题目，提供者: {', '.join(record['providers'])}")
+        try:
+            await asyncio.gather(*(self._process(run, item) for item in pending))
+            counts = self._counts(record)
+            record["status"] = "completed" if not counts.get("error") else "partial"
+        except asyncio.CancelledError:
+            record["status"] = "interrupted"
+            raise
+        finally:
+            record["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            self._persist(run, force=True)
+            self._publish(run, {"event": "summary", **self._summary(record)})
+            for queue in run.subscribers:
+                queue.put_nowait(None)
+            self._runs.pop(record["id"], None)
+            self.logger.info(f"批次 {record['id']} 结束: {record['status']}, 耗时 {record['elapsed_ms']}ms")
+
+    async def _process(self, run: _BatchRun, item: Dict[str, Any]):
+        record = run.record
+        tried: List[str] = []
+        errors = []
+        started = time.perf_counter()
+        while len(tried) < len(record["providers"]):
+            provider = await self._slots.acquire(record["providers"], tried)
+            tried.append(provider)
+            item.update(status="running", provider=provider, attempts=len(tried))
+            try:
+                await self._limiters[provider].wait()
+                response = await self._services[provider].analyze_challenge(
+                    item["description"], item["question_type"], user_id=record.get("user_id"),
+                    use_context=record.get("use_context", True)
+                )
+            except Exception as e:
+                response = AIErrorResponse(f"AI分析遇到问题: {e}")
+            finally:
+                await self._slots.release(provider)
+            if not is_error_response(response):
+                item.update(status="done", response=response, error=None,
+                            elapsed_ms=round((time.perf_counter() - started) * 1000, 1))
+                self._save_history(record, item)
+                break
+            errors.append(f"{provider}: {response[:300]}")
+        else:
+            item.update(status="error", error="; ".join(errors),
+                        elapsed_ms=round((time.perf_counter() - started) * 1000, 1))
+
+        self._publish(run, self._result_event(item))
+        for duplicate in record["items"]:
+            if duplicate.get("duplicate_of") == item["index"]:
+                self._copy_result(duplicate, item)
+                if item["status"] == "error":
+                    duplicate["error"] = item["error"]
+                self._publish(run, self._result_event(duplicate))
+        self._persist(run)
+
+    @staticmethod
+    def _save_history(record: Dict[str, Any], item: Dict[str, Any]):
+        data_service.save_analysis_history(None, {
+            "description": item["description"],
+            "type": item["question_type"],
+            "question_type": item["question_type"],
+            "ai_response": item["response"],
+            "ai_provider": item["provider"],
+            "batch_id": record["id"],
+            "batch_item_id": item["id"],
+            "type_classified": item.get("classified", False)
+        })
+
+    # 结果推送
+    @staticmethod
+    def _result_event(item: Dict[str, Any]) -> Dict[str, Any]:
+        return {"event": "result", **{key: value for key, value in item.items() if key != "description"}}
+
+    @staticmethod
+    def _counts(record: Dict[str, Any]) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for item in record["items"]:
+            counts[item["status"]] = counts.get(item["status"], 0) + 1
+        return counts
+
+    def _summary(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "batch_id": record["id"],
+            "status": record["status"],
+            "total": len(record["items"]),
+            "counts": self._counts(record),
+            "elapsed_ms": record.get("elapsed_ms")
+        }
+
+    @staticmethod
+    def _settled(record: Dict[str, Any], item: Dict[str, Any]) -> bool:
+        """题目已有最终结果（批次内重复的题目以原题为准）"""
+        if item["status"] == "duplicate":
+            item = record["items"][item["duplicate_of"]]
+        return item["status"] in ("done", "cached", "error")
+
+    @staticmethod
+    def _publish(run: _BatchRun, event: Dict[str, Any]):
+        for queue in run.subscribers:
+            queue.put_nowait(event)
+
+    async def events(self, batch_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        订阅批次结果：先返回已完成的题目，再按完成顺序返回后续结果，最后返回汇总
+
+        不运行批次本身，客户端断开不影响批次执行。
+        """
+        run = self._runs.get(batch_id)
+        record = run.record if run else self.get_batch(batch_id)
+        if record is None:
+            return
+        queue: Optional[asyncio.Queue] = None
+        if run is not None and run.task is not None and not run.task.done():
+            queue = asyncio.Queue()
+            run.subscribers.append(queue)
+        try:
+            yield {"event": "batch", **self._summary(record), "providers": record["providers"]}
+            sent: Set[int] = set()
+            for item in record["items"]:
+                if self._settled(record, item):
+                    sent.add(item["index"])
+                    yield self._result_event(item)
+            if queue is None:
+                yield {"event": "summary", **self._summary(record)}
+                return
+            while True:
+                event = await queue.get()
+                if event is None:
+                    return
+                if event["event"] == "result":
+                    if event["index"] in sent:
+                        continue
+                    sent.add(event["index"])
+                yield event
+        finally:
+            if queue is not None and run is not None and queue in run.subscribers:
+                run.subscribers.remove(queue)
+
+    async def stream(self, batch_id: str, format: str = "ndjson") -> AsyncIterator[bytes]:
+        """按 NDJSON 或 SSE 格式编码 events 的输出"""
+        async for event in self.events(batch_id):
+            payload = json.dumps(event, ensure_ascii=False)
+            if format == "sse":
+                yield f"event: {event['event']}\ndata: {payload}\n\n".encode("utf-8")
+            else:
+                yield (payload + "\n").encode("utf-8")
+
+    async def shutdown(self):
+        """停止运行中的批次并保存记录，未完成的题目可在重启后续跑"""
+        runs = [run for run in self._runs.values() if run.task is not None and not run.task.done()]
+        for run in runs:
+            run.task.cancel()
+        await asyncio.gather(*(run.task for run in runs), return_exceptions=True)
+
+# 全局实例
+batch_service = BatchAnalysisService()
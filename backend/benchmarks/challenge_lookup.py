@@ -0,0 +1,98 @@
+"""
+题目按ID查找的性能基准
+
+在临时目录中生成指定数量的题目文件，分别测量：
+- 按ID查找（DataService.get_challenge，文件名编码ID）
+- 旧实现：遍历所有类型目录并逐个解析JSON文件（仅在数量不超过 --scan-limit 时测量）
+
+用法（在 backend 目录下运行）:
+    python benchmarks/challenge_lookup.py --sizes 1000 10000 100000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+CHALLENGE_TYPES = ["web", "pwn", "reverse", "crypto", "misc"]
+
+
+def generate_challenges(challenges_dir: Path, count: int) -> list:
+    """生成题目文件，返回全部题目ID"""
+    ids = []
+    for index in range(count):
+        challenge_id = str(uuid.uuid4())
+        challenge_type = CHALLENGE_TYPES[index % len(CHALLENGE_TYPES)]
+        record = {
+            "id": challenge_id,
+            "description": f"benchmark challenge {index}",
+            "type": challenge_type,
+            "ai_response": "x" * 512,
+            "file_name": None,
+            "timestamp": "2024-01-01T00:00:00"
+        }
+        with open(challenges_dir / challenge_type / f"challenge_{challenge_id}.json", "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        ids.append(challenge_id)
+    return ids
+
+
+def scan_lookup(challenges_dir: Path, challenge_id: str):
+    """旧实现：遍历并解析所有题目文件"""
+    for challenge_type in CHALLENGE_TYPES:
+        for file_path in (challenges_dir / challenge_type).glob("*.json"):
+            with open(file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("id") == challenge_id:
+                return data
+    return None
+
+
+def measure(func, ids: list, repeat: int) -> dict:
+    samples = []
+    for challenge_id in random.sample(ids, min(repeat, len(ids))):
+        start = time.perf_counter()
+        result = func(challenge_id)
+        samples.append((time.perf_counter() - start) * 1e6)
+        assert result is not None and result["id"] == challenge_id
+    samples.sort()
+    return {
+        "mean_us": round(statistics.mean(samples), 1),
+        "p50_us": round(samples[len(samples) // 2], 1),
+        "p99_us": round(samples[min(int(len(samples) * 0.99), len(samples) - 1)], 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="题目按ID查找的性能基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=200, help="每个规模的查找次数")
+    parser.add_argument("--scan-limit", type=int, default=10000, help="旧实现只在不超过该数量时测量")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # DataService 使用相对路径 ../data，在临时目录的子目录中运行
+        run_dir = Path(workdir) / "run"
+        run_dir.mkdir()
+        os.chdir(run_dir)
+        sys.path.insert(0, str(BACKEND_DIR))
+        from data_service import data_service
+
+        total_ids = []
+        for size in sorted(args.sizes):
+            total_ids += generate_challenges(data_service.challenges_dir, size - len(total_ids))
+            result = {"size": size, "lookup": measure(data_service.get_challenge, total_ids, args.repeat)}
+            if size <= args.scan_limit:
+                result["scan"] = measure(lambda cid: scan_lookup(data_service.challenges_dir, cid),
+                                         total_ids, max(args.repeat // 20, 5))
+            print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
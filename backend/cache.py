@@ -19,8 +19,8 @@ class MemoryCache:
         """检查缓存项是否过期"""
         return time.time() - item["timestamp"] > self.ttl
     
-    def _cleanup_expired(self):
-        """清理过期的缓存项"""
+    def _cleanup_expired(self) -> int:
+        """清理过期的缓存项，返回清理数量"""
         current_time = time.time()
         expired_keys = [
             key for key, item in self.cache.items()
@@ -32,6 +32,11 @@ class MemoryCache:
         
         if expired_keys:
             self.logger.info(f"清理了 {len(expired_keys)} 个过期缓存项")
+        return len(expired_keys)
+    
+    def cleanup_expired(self) -> int:
+        """主动清理过期缓存项（供定时维护任务调用）"""
+        return self._cleanup_expired()
     
     def get(self, key: str) -> Optional[Any]:
         """获取缓存值"""
@@ -0,0 +1,420 @@
+import os
+import threading
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+from config import config
+from data_service import data_service
+from logger import get_logger
+from search_index import tokenize
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+QUESTION_TYPES = ("web", "pwn", "reverse", "crypto", "misc")
+
+# 关键词及权重。英文关键词要求两侧是单词边界（"key" 不匹配 "monkey"），以 * 结尾的只要求左侧边界
+# （"decrypt*" 匹配 "decrypted"）；中文关键词不检查边界。区分度低的词权重较小。
+KEYWORDS: Dict[str, Dict[str, float]] = {
+    "web": {
+        "web": 2, "website": 2, "sql": 2, "sqli": 3, "sql injection": 2, "xss": 3, "csrf": 3, "ssrf": 3,
+        "ssti": 3, "xxe": 3, "lfi": 3, "rfi": 3, "upload": 1, "file upload": 2, "cookie*": 1.5, "session": 1,
+        "jwt": 2.5, "php": 2, "javascript": 1, "http": 1, "https": 1, "url": 1, "server": 0.5, "apache": 1.5,
+        "nginx": 1.5, "login": 1.5, "inject*": 1.5, "bypass": 0.5, "filter": 0.5, "waf": 2.5, "flask": 2,
+        "django": 2, "unserialize": 2.5, "deserializ*": 1.5, "rce": 1.5, "admin": 1, "cors": 2, "csp": 2,
+        "graphql": 2.5, "prototype pollution": 3, "node.js": 1.5, "express": 1, "spring": 1.5, "struts": 2.5,
+        "注入": 2.5, "网站": 2, "网页": 2, "登录": 1.5, "上传": 1, "反序列化": 1.5, "跨站": 3,
+        "命令执行": 1.5, "文件包含": 3, "模板注入": 3, "越权": 2.5
+    },
+    "pwn": {
+        "pwn": 3, "buffer": 1, "overflow*": 2, "buffer overflow": 1, "rop": 3, "ret2*": 3, "shellcode": 3,
+        "stack": 1, "heap": 1.5, "format string": 3, "canary": 2.5, "aslr": 2, "pie": 1.5, "nx": 1.5,
+        "got": 0.5, "plt": 2, "libc": 2.5, "gdb": 1.5, "pwntools": 3, "exploit*": 1, "binary": 0.5, "elf": 1,
+        "x86": 0.5, "x64": 0.5, "arm": 0.5, "use after free": 3, "uaf": 3, "tcache": 3, "fastbin": 3,
+        "unsorted bin": 3, "double free": 3, "off by one": 2.5, "one_gadget": 3, "syscall": 1.5, "srop": 3,
+        "栈溢出": 3, "溢出": 2, "格式化字符串": 3, "漏洞利用": 1.5, "堆溢出": 3
+    },
+    "reverse": {
+        "reverse": 2, "revers*": 1.5, "ida": 2.5, "ghidra": 3, "ollydbg": 3, "x64dbg": 3, "disasm": 2,
+        "disassembl*": 2.5, "decompil*": 2.5, "unpack*": 1.5, "upx": 3, "vmprotect": 3, "themida": 3,
+        "algorithm": 1, "keygen": 3, "crack": 1.5, "crackme": 3, "serial": 1.5, "license": 1.5,
+        "obfuscat*": 2, "anti-debug": 3, "binary": 0.5, "elf": 0.5, "apk": 2, "android": 1.5, "dex": 2,
+        "jadx": 3, "frida": 2.5, "z3": 2, "angr": 3, "pyc": 2.5, "dnspy": 3, "wasm": 2, "vm": 1,
+        "逆向": 3, "反编译": 3, "反汇编": 3, "脱壳": 3, "加壳": 2.5, "混淆": 2, "注册码": 3
+    },
+    "crypto": {
+        "crypto": 3, "cryptograph*": 3, "rsa": 3, "aes": 2.5, "des": 1.5, "md5": 1.5, "sha1": 1.5,
+        "sha256": 1.5, "sha512": 1.5, "hash": 1, "encrypt*": 2, "decrypt*": 2, "cipher*": 2.5, "key": 0.5,
+        "prime*": 2, "modulus": 2.5, "modular": 2, "gcd": 2, "lcm": 1.5, "factori*": 2, "discrete log*": 3,
+        "logarithm": 1.5, "elliptic": 3, "curve": 1, "signature": 1, "certificate": 1, "lattice": 3,
+        "lll": 3, "coppersmith": 3, "xor": 1.5, "padding oracle": 3, "vigenere": 3, "caesar": 3, "ecc": 2,
+        "ecdsa": 3, "nonce": 1.5, "plaintext": 2, "密码学": 3, "加密": 2, "解密": 2, "密文": 2.5, "明文": 2,
+        "素数": 2, "公钥": 2, "私钥": 2, "椭圆曲线": 3, "凯撒": 3, "维吉尼亚": 3, "异或": 1.5
+    },
+    "misc": {
+        "misc": 3, "steganograph*": 3, "stego": 3, "forensic*": 3, "pcap*": 3, "wireshark": 3, "memory": 1,
+        "dump": 1, "volatility": 3, "binwalk": 3, "strings": 0.5, "hexdump": 1, "base64": 1, "morse": 3,
+        "qr": 2, "qrcode": 3, "barcode": 2.5, "image": 1, "audio": 2, "video": 1, "zip": 1.5, "archive": 1,
+        "password": 1, "lsb": 2.5, "exif": 2.5, "traffic": 2, "packet*": 2, "usb": 2, "png": 1, "jpg": 1,
+        "wav": 2, "spectrogram": 3, "osint": 3, "brainfuck": 3, "zsteg": 3, "steghide": 3, "foremost": 3,
+        "隐写": 3, "取证": 3, "流量": 2.5, "压缩包": 2, "图片": 1.5, "音频": 2, "内存": 1, "二维码": 3,
+        "摩斯": 3, "伪加密": 3, "爆破": 1, "密码": 1
+    }
+}
+
+# 文件类型（识别出的类型名或扩展名）对应的题目类型
+FILE_QUESTION_TYPES = {
+    "php": "web", "html": "web", "htm": "web", "js": "web", "jsp": "web", "asp": "web",
+    "exe": "pwn", "elf": "pwn", "pe": "pwn", "bin": "pwn", "so": "pwn",
+    "pcap": "misc", "pcapng": "misc", "cap": "misc",
+    "jpg": "misc", "jpeg": "misc", "png": "misc", "gif": "misc", "wav": "misc", "mp3": "misc"
+}
+# 按内容识别的文件类型达到该置信度时优先于扩展名
+FILE_TYPE_MIN_CONFIDENCE = 0.5
+# 附件类型提示的权重
+FILE_HINT_WEIGHT = 3.0
+# 关键词置信度的平滑项：证据越少置信度越低
+KEYWORD_PRIOR = 1.0
+
+_WORD_CHARS = frozenset("abcdefghijklmnopqrstuvwxyz0123456789_")
+
+
+class KeywordAutomaton:
+    """多关键词匹配的 Aho-Corasick 自动机
+
+    构建时把失败链接展开为完整的状态转移表（状态 -> {字符: 下一状态}），匹配时每个字符只做一次字典查找，
+    不在任何关键词中的字符直接回到初始状态。文本只扫描一遍，与关键词数量无关。
+    """
+
+    def __init__(self, keywords: Dict[str, Dict[str, float]]):
+        # 每个输出为 (关键词, 长度, 题目类型, 权重, 是否检查右边界, 是否检查左边界)
+        self._delta: List[Dict[str, int]] = [{}]
+        self._outputs: List[List[tuple]] = [[]]
+        for question_type, entries in keywords.items():
+            for keyword, weight in entries.items():
+                prefix = keyword.endswith("*")
+                word = keyword.rstrip("*").lower()
+                ascii_word = word.isascii()
+                self._insert(word, (word, len(word), question_type, float(weight),
+                                    ascii_word and not prefix, ascii_word))
+        self._build()
+
+    def _insert(self, word: str, output: tuple):
+        state = 0
+        for ch in word:
+            next_state = self._delta[state].get(ch)
+            if next_state is None:
+                next_state = len(self._delta)
+                self._delta.append({})
+                self._outputs.append([])
+                self._delta[state][ch] = next_state
+            state = next_state
+        self._outputs[state].append(output)
+
+    def _build(self):
+        # 广度优先计算失败链接，并把失败状态的转移和输出合并到当前状态
+        fail = [0] * len(self._delta)
+        queue = list(self._delta[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, next_state in list(self._delta[state].items()):
+                queue.append(next_state)
+                target = fail[state]
+                while target and ch not in self._delta[target]:
+                    target = fail[target]
+                fallback = self._delta[target].get(ch, 0)
+                fail[next_state] = fallback if fallback != next_state else 0
+                self._outputs[next_state] = self._outputs[next_state] + self._outputs[fail[next_state]]
+        # 广度优先的顺序保证失败状态的转移表已经完整
+        for state in queue:
+            for ch, next_state in self._delta[fail[state]].items():
+                self._delta[state].setdefault(ch, next_state)
+
+    def search(self, text: str) -> List[Tuple[str, str, float, int]]:
+        """返回 (关键词, 题目类型, 权重, 起始位置)，文本需已转为小写"""
+        delta, outputs = self._delta, self._outputs
+        found = []
+        state = 0
+        for position, ch in enumerate(text):
+            state = delta[state].get(ch, 0)
+            if not state or not outputs[state]:
+                continue
+            for word, length, question_type, weight, right, left in outputs[state]:
+                start = position - length + 1
+                if left and start > 0 and text[start - 1] in _WORD_CHARS:
+                    continue
+                if right and position + 1 < len(text) and text[position + 1] in _WORD_CHARS:
+                    continue
+                found.append((word, question_type, weight, start))
+        return found
+
+
+class HashedNgramModel:
+    """哈希 n-gram 特征的多分类逻辑回归
+
+    特征为检索分词（英文单词、CJK 二元组）的一元和相邻二元组合，用 crc32 哈希到固定数量的桶
+    （哈希值跨进程稳定，模型可以保存后重新加载）。预测只需对命中桶的权重行求和再做 softmax。
+    """
+
+    def __init__(self, hash_bits: int = 18, classes: Tuple[str, ...] = QUESTION_TYPES):
+        self.hash_bits = hash_bits
+        self.classes = tuple(classes)
+        self.weights = np.zeros((1 << hash_bits, len(self.classes)), dtype=np.float32)
+        self.bias = np.zeros(len(self.classes), dtype=np.float32)
+        self.trained_at: Optional[str] = None
+        self.samples = 0
+
+    def features(self, text: str) -> List[int]:
+        tokens = tokenize(text)
+        mask = (1 << self.hash_bits) - 1
+        grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        return sorted({zlib.crc32(gram.encode("utf-8")) & mask for gram in grams})
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        indices = self.features(text)
+        logits = self.bias + (self.weights[indices].sum(axis=0) if indices else 0)
+        probs = np.exp(logits - logits.max())
+        probs /= probs.sum()
+        return {label: float(p) for label, p in zip(self.classes, probs)}
+
+    def fit(self, texts: List[str], labels: List[str], epochs: int = 100, learning_rate: float = 0.5,
+            l2: float = 1e-4) -> float:
+        """全批量 Adagrad 训练，返回训练集准确率"""
+        rows = [self.features(text) for text in texts]
+        lengths = np.array([len(row) for row in rows], dtype=np.int64)
+        keep = lengths > 0
+        rows = [row for row, ok in zip(rows, keep) if ok]
+        targets = np.array([self.classes.index(label) for label, ok in zip(labels, keep) if ok], dtype=np.int64)
+        lengths = lengths[keep]
+        indices = np.fromiter((i for row in rows for i in row), dtype=np.int64, count=int(lengths.sum()))
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        row_of_index = np.repeat(np.arange(len(rows)), lengths)
+        onehot = np.eye(len(self.classes), dtype=np.float32)[targets]
+
+        self.weights[:] = 0
+        self.bias[:] = 0
+        count = len(rows)
+        # Adagrad：只在少数题目中出现的特征梯度小，按累计梯度缩放步长后也能学到
+        weight_history = np.full_like(self.weights, 1e-8)
+        bias_history = np.full_like(self.bias, 1e-8)
+        for _ in range(epochs):
+            logits = np.add.reduceat(self.weights[indices], offsets, axis=0) + self.bias
+            logits -= logits.max(axis=1, keepdims=True)
+            probs = np.exp(logits)
+            probs /= probs.sum(axis=1, keepdims=True)
+            error = (probs - onehot) / count
+            gradient = l2 * self.weights
+            np.add.at(gradient, indices, error[row_of_index])
+            weight_history += gradient ** 2
+            self.weights -= learning_rate * gradient / np.sqrt(weight_history)
+            bias_gradient = error.sum(axis=0)
+            bias_history += bias_gradient ** 2
+            self.bias -= learning_rate * bias_gradient / np.sqrt(bias_history)
+
+        logits = np.add.reduceat(self.weights[indices], offsets, axis=0) + self.bias
+        self.samples = count
+        self.trained_at = datetime.now().isoformat()
+        return float((logits.argmax(axis=1) == targets).mean())
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix(".tmp.npz")
+        np.savez_compressed(temp_path, weights=self.weights, bias=self.bias, hash_bits=self.hash_bits,
+                            classes=np.array(self.classes), trained_at=np.array(self.trained_at or ""),
+                            samples=self.samples)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "HashedNgramModel":
+        with np.load(path) as data:
+            model = cls(int(data["hash_bits"]), tuple(str(label) for label in data["classes"]))
+            model.weights = data["weights"]
+            model.bias = data["bias"]
+            model.trained_at = str(data["trained_at"]) or None
+            model.samples = int(data["samples"])
+        return model
+
+
+class QuestionClassifier:
+    """题目类型分类器
+
+    关键词自动机给出加权得分（每个关键词只计一次），附件的文件类型作为额外证据。安装 numpy 且
+    已有足够的题目记录时，用历史题目训练的哈希 n-gram 逻辑回归与关键词得分按 CLASSIFIER_MODEL_WEIGHT
+    加权融合。模型保存在数据目录下，由定时维护任务在新题目积累到一定数量后重新训练。
+    """
+
+    def __init__(self, model_path: Optional[Path] = None):
+        self.logger = get_logger("classifier")
+        self.automaton = KeywordAutomaton(KEYWORDS)
+        self.model_path = Path(model_path or data_service.data_root / "index" / "question_classifier.npz")
+        self.model: Optional[HashedNgramModel] = None
+        self.model_accuracy: Optional[float] = None
+        self._lock = threading.Lock()
+        self._model_loaded = False
+        self._new_samples = 0
+
+        data_service.subscribe("challenge_saved", self._on_challenge_saved)
+
+    def _on_challenge_saved(self, _challenge: Dict[str, Any]):
+        self._new_samples += 1
+
+    @property
+    def model_enabled(self) -> bool:
+        return NUMPY_AVAILABLE and config.CLASSIFIER_MODEL_ENABLED
+
+    def _ensure_model(self) -> Optional[HashedNgramModel]:
+        if self._model_loaded or not self.model_enabled:
+            return self.model
+        with self._lock:
+            if not self._model_loaded:
+                if self.model_path.exists():
+                    try:
+                        self.model = HashedNgramModel.load(self.model_path)
+                    except Exception as e:
+                        self.logger.warning(f"加载题目分类模型失败: {e}")
+                self._model_loaded = True
+        return self.model
+
+    # 分类
+    @staticmethod
+    def _file_hint(file_name: Optional[str], file_type: Optional[Dict[str, Any]]) -> Optional[str]:
+        if file_type and file_type.get("confidence", 0) >= FILE_TYPE_MIN_CONFIDENCE \
+                and file_type.get("label") in FILE_QUESTION_TYPES:
+            return FILE_QUESTION_TYPES[file_type["label"]]
+        if file_name:
+            extension = os.path.splitext(file_name.lower())[1].lstrip(".")
+            return FILE_QUESTION_TYPES.get(extension)
+        return None
+
+    def classify(self, description: str, file_name: Optional[str] = None,
+                 file_type: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        判断题目类型
+
+        Args:
+            description: 题目描述
+            file_name: 附件文件名（按扩展名提示）
+            file_type: analyzers.detect_file 的识别结果（按文件内容提示，优先于扩展名）
+
+        Returns:
+            {"type", "confidence", "scores": 各类型的概率, "source", "matches": 命中的关键词}
+        """
+        started = time.perf_counter()
+        text = (description or "").lower()
+        scores = dict.fromkeys(QUESTION_TYPES, 0.0)
+        matches = []
+        seen = set()
+        for word, question_type, weight, start in self.automaton.search(text):
+            if (word, question_type) in seen:
+                continue
+            seen.add((word, question_type))
+            scores[question_type] += weight
+            matches.append({"keyword": word, "type": question_type, "weight": weight, "offset": start})
+        hint = self._file_hint(file_name, file_type)
+        if hint:
+            scores[hint] += FILE_HINT_WEIGHT
+
+        total = sum(scores.values())
+        probabilities = {label: score / (total + KEYWORD_PRIOR) for label, score in scores.items()}
+        source = "keywords" if total else None
+
+        model = self._ensure_model()
+        if model is not None and text.strip():
+            predicted = model.predict_proba(text)
+            if total:
+                weight = config.CLASSIFIER_MODEL_WEIGHT
+                probabilities = {label: (1 - weight) * probabilities[label] + weight * predicted.get(label, 0.0)
+                                 for label in QUESTION_TYPES}
+                source = "combined"
+            else:
+                probabilities = {label: predicted.get(label, 0.0) for label in QUESTION_TYPES}
+                source = "model"
+
+        best = max(probabilities, key=probabilities.get)
+        return {
+            "type": best if source else "unknown",
+            "confidence": round(probabilities[best], 4) if source else 0.0,
+            "scores": {label: round(value, 4) for label, value in probabilities.items()},
+            "source": source,
+            "file_hint": hint,
+            "matches": matches,
+            "elapsed_us": round((time.perf_counter() - started) * 1e6, 1)
+        }
+
+    def classify_batch(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量分类，每项包含 description，可选 file_name 和 file_type"""
+        return [self.classify(item.get("description") or "", item.get("file_name"), item.get("file_type"))
+                for item in items]
+
+    # 模型训练
+    def _training_samples(self) -> Tuple[List[str], List[str]]:
+        texts, labels, seen = [], [], set()
+
+        def add(description: Optional[str], label: Optional[str]):
+            description = (description or "").strip()
+            if label in QUESTION_TYPES and description and description not in seen:
+                seen.add(description)
+                texts.append(description)
+                labels.append(label)
+
+        for question_type in QUESTION_TYPES:
+            for file_path in (data_service.challenges_dir / question_type).glob("*.json"):
+                challenge = data_service._read_json_file(file_path)
+                if challenge:
+                    add(challenge.get("description"), challenge.get("type") or question_type)
+        for file_path in data_service.history_dir.glob("*.json"):
+            record = data_service._read_json_file(file_path)
+            analysis_data = (record or {}).get("analysis_data", {}) or {}
+            # 类型由分类器自动判断的记录不作为样本，避免模型学习自己的预测
+            if analysis_data.get("type_classified"):
+                continue
+            add(analysis_data.get("description"), analysis_data.get("type") or analysis_data.get("question_type"))
+        return texts, labels
+
+    def train(self) -> Dict[str, Any]:
+        """用已保存的题目和分析历史训练模型，样本不足时跳过"""
+        if not self.model_enabled:
+            return {"trained": False, "reason": "模型未启用或未安装 numpy"}
+        start_time = time.time()
+        texts, labels = self._training_samples()
+        if len(texts) < config.CLASSIFIER_MIN_SAMPLES or len(set(labels)) < 2:
+            return {"trained": False, "reason": "样本不足", "samples": len(texts)}
+        self._new_samples = 0
+        model = HashedNgramModel(config.CLASSIFIER_HASH_BITS)
+        accuracy = model.fit(texts, labels)
+        model.save(self.model_path)
+        with self._lock:
+            self.model = model
+            self.model_accuracy = accuracy
+            self._model_loaded = True
+        duration = round(time.time() - start_time, 2)
+        self.logger.info(f"题目分类模型训练完成，样本 {len(texts)} 个，训练集准确率 {accuracy:.3f}，耗时 {duration} 秒")
+        return {"trained": True, "samples": len(texts), "accuracy": round(accuracy, 4), "duration": duration}
+
+    def maybe_retrain(self) -> Dict[str, Any]:
+        """没有模型或新增题目达到 CLASSIFIER_RETRAIN_MIN_NEW 时重新训练（定时维护任务调用）"""
+        if self._ensure_model() is not None and self._new_samples < config.CLASSIFIER_RETRAIN_MIN_NEW:
+            return {"trained": False, "reason": "新增样本不足", "new_samples": self._new_samples}
+        return self.train()
+
+    def stats(self) -> Dict[str, Any]:
+        model = self._ensure_model()
+        return {
+            "keywords": sum(len(entries) for entries in KEYWORDS.values()),
+            "model_enabled": self.model_enabled,
+            "model_trained_at": model.trained_at if model else None,
+            "model_samples": model.samples if model else 0,
+            "model_accuracy": self.model_accuracy,
+            "new_samples": self._new_samples
+        }
+
+# 全局实例
+question_classifier = QuestionClassifier()
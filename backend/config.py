@@ -113,6 +113,15 @@ class Config:
     AZURE_OPENAI_API_VERSION: str = os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview")
     AZURE_OPENAI_MODEL: str = os.getenv("AZURE_OPENAI_MODEL", "gpt-4")
     
+    # =============================================================================
+    # Token计量配置
+    # =============================================================================
+    TOKEN_PRICES: Optional[str] = os.getenv("TOKEN_PRICES")
+    TOKEN_DAILY_BUDGET: float = float(os.getenv("TOKEN_DAILY_BUDGET", "0"))
+    PROMPT_TOKEN_BUDGET: int = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+    PROMPT_MESSAGE_MAX_TOKENS: int = int(os.getenv("PROMPT_MESSAGE_MAX_TOKENS", "1500"))
+    PROMPT_SUMMARY_MAX_TOKENS: int = int(os.getenv("PROMPT_SUMMARY_MAX_TOKENS", "300"))
+    
     # =============================================================================
     # 安全配置
     # =============================================================================
@@ -143,12 +152,43 @@ class Config:
     REQUEST_TIMEOUT: int = int(os.getenv("REQUEST_TIMEOUT", "60"))
     MAX_FILE_SIZE: int = int(os.getenv("MAX_FILE_SIZE", "10485760"))  # 10MB
     UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "uploads")
+    UPLOAD_RETENTION_DAYS: int = int(os.getenv("UPLOAD_RETENTION_DAYS", "7"))
     ALLOWED_FILE_TYPES: List[str] = os.getenv(
         "ALLOWED_FILE_TYPES", 
         "image/*,text/*,application/json,application/xml"
     ).split(",")
     UPLOAD_CONCURRENCY: int = int(os.getenv("UPLOAD_CONCURRENCY", "5"))
+    UPLOAD_CHUNK_SIZE: int = int(os.getenv("UPLOAD_CHUNK_SIZE", "1048576"))  # 1MB
+    PCAP_TIME_BUDGET: float = float(os.getenv("PCAP_TIME_BUDGET", "20"))
+    STEGO_MAX_PIXELS: int = int(os.getenv("STEGO_MAX_PIXELS", "50000000"))
+    ARCHIVE_MAX_DEPTH: int = int(os.getenv("ARCHIVE_MAX_DEPTH", "6"))
+    ARCHIVE_MAX_TOTAL_SIZE: int = int(os.getenv("ARCHIVE_MAX_TOTAL_SIZE", "536870912"))  # 512MB
+    ARCHIVE_MAX_RATIO: float = float(os.getenv("ARCHIVE_MAX_RATIO", "250"))
+    ARCHIVE_MAX_MEMBERS: int = int(os.getenv("ARCHIVE_MAX_MEMBERS", "2000"))
+    ARCHIVE_WORKERS: int = int(os.getenv("ARCHIVE_WORKERS", "4"))
+    ANALYSIS_TIME_BUDGET: float = float(os.getenv("ANALYSIS_TIME_BUDGET", "15"))
+    ANALYSIS_CONTEXT_MAX_CHARS: int = int(os.getenv("ANALYSIS_CONTEXT_MAX_CHARS", "8000"))
+    ANALYZER_WORKERS: int = int(os.getenv("ANALYZER_WORKERS", "2"))
+    ANALYZER_START_METHOD: str = os.getenv("ANALYZER_START_METHOD", "spawn")
+    ANALYZER_CACHE_TTL: int = int(os.getenv("ANALYZER_CACHE_TTL", "604800"))  # 7天
+    CLASSIFIER_MODEL_ENABLED: bool = os.getenv("CLASSIFIER_MODEL_ENABLED", "true").lower() == "true"
+    CLASSIFIER_MODEL_WEIGHT: float = float(os.getenv("CLASSIFIER_MODEL_WEIGHT", "0.5"))
+    CLASSIFIER_HASH_BITS: int = int(os.getenv("CLASSIFIER_HASH_BITS", "18"))
+    CLASSIFIER_MIN_SAMPLES: int = int(os.getenv("CLASSIFIER_MIN_SAMPLES", "30"))
+    CLASSIFIER_RETRAIN_MIN_NEW: int = int(os.getenv("CLASSIFIER_RETRAIN_MIN_NEW", "20"))
+    CLASSIFIER_RETRAIN_INTERVAL: int = int(os.getenv("CLASSIFIER_RETRAIN_INTERVAL", "3600"))
+    CLASSIFY_BATCH_LIMIT: int = int(os.getenv("CLASSIFY_BATCH_LIMIT", "1000"))
+    BATCH_MAX_ITEMS: int = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+    BATCH_PROVIDER_CONCURRENCY: int = int(os.getenv("BATCH_PROVIDER_CONCURRENCY", "8"))
+    BATCH_PROVIDER_RPM: int = int(os.getenv("BATCH_PROVIDER_RPM", "60"))
+    OFFLINE_BATCH_MODE: str = os.getenv("OFFLINE_BATCH_MODE", "auto")  # auto/native/local
+    OFFLINE_BATCH_POLL_INTERVAL: int = int(os.getenv("OFFLINE_BATCH_POLL_INTERVAL", "60"))
+    OFFLINE_BATCH_CONCURRENCY: int = int(os.getenv("OFFLINE_BATCH_CONCURRENCY", "4"))
+    OFFLINE_BATCH_MAX_ITEMS: int = int(os.getenv("OFFLINE_BATCH_MAX_ITEMS", "50000"))
     MEMORY_CACHE_SIZE: int = int(os.getenv("MEMORY_CACHE_SIZE", "100"))
+    JSON_INDENT: int = int(os.getenv("JSON_INDENT", "0"))  # 0为紧凑格式
+    JSON_FSYNC: bool = os.getenv("JSON_FSYNC", "false").lower() == "true"
+    JSON_READ_CACHE_SIZE: int = int(os.getenv("JSON_READ_CACHE_SIZE", "256"))
     
     # =============================================================================
     # 缓存配置
@@ -194,6 +234,20 @@ class Config:
     BACKUP_COMPRESSION: str = os.getenv("BACKUP_COMPRESSION", "zip")
     BACKUP_ENCRYPTION_KEY: Optional[str] = os.getenv("BACKUP_ENCRYPTION_KEY")
     
+    # =============================================================================
+    # 定时维护配置
+    # =============================================================================
+    ENABLE_MAINTENANCE: bool = os.getenv("ENABLE_MAINTENANCE", "true").lower() == "true"
+    MAINTENANCE_JITTER: float = float(os.getenv("MAINTENANCE_JITTER", "0.1"))
+    MAINTENANCE_JOB_TIMEOUT: int = int(os.getenv("MAINTENANCE_JOB_TIMEOUT", "300"))
+    
+    # =============================================================================
+    # 批量导入配置
+    # =============================================================================
+    IMPORT_MAX_FILE_SIZE: int = int(os.getenv("IMPORT_MAX_FILE_SIZE", "209715200"))  # 200MB
+    IMPORT_BATCH_SIZE: int = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+    IMPORT_MAX_ERRORS: int = int(os.getenv("IMPORT_MAX_ERRORS", "100"))
+    
     # =============================================================================
     # 第三方服务配置
     # =============================================================================
@@ -0,0 +1,194 @@
+import threading
+from collections import deque, OrderedDict
+from typing import Dict, Any, List, Optional
+from data_service import data_service
+from retrieval_index import similarity_index
+from logger import get_logger
+
+
+class ContextProvider:
+    """分析上下文提供者
+
+    在内存中维护上下文所需的聚合数据（用户偏好、按类型分组的最近分析历史、按分类分组的工具、
+    最近的自动解题记录），通过订阅 DataService 的写入事件增量更新，避免每次分析都重新读取文件。
+    """
+
+    def __init__(self, history_per_type: int = 3, recent_auto_solves: int = 10, initial_history_scan: int = 50):
+        self.logger = get_logger("context_provider")
+        self.history_per_type = history_per_type
+        self.recent_auto_solves = recent_auto_solves
+        self.initial_history_scan = initial_history_scan
+        self._lock = threading.RLock()
+        self._loaded = False
+
+        self.user_preferences: Dict[str, Any] = {}
+        self.history_by_type: Dict[str, deque] = {}
+        self.history_summary_by_type: Dict[str, str] = {}
+        self.tools_by_category: Dict[str, List[Dict[str, Any]]] = {}
+        self.auto_solves: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.success_patterns: List[str] = []
+
+        data_service.subscribe("history_saved", self._on_history_saved)
+        data_service.subscribe("config_saved", self._on_config_saved)
+        data_service.subscribe("tools_saved", self._on_tools_saved)
+        data_service.subscribe("auto_solve_saved", self._on_auto_solve_saved)
+        data_service.subscribe("auto_solve_deleted", self._on_auto_solve_deleted)
+
+    # 初始加载
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self._set_user_preferences(data_service.get_user_config())
+            # 历史按时间从新到旧返回，倒序追加以保持每个类型内的时间顺序
+            for record in reversed(data_service.get_analysis_history(limit=self.initial_history_scan)):
+                self._add_history(record)
+            self._set_tools(data_service.get_tools())
+            for solve in reversed(data_service.get_auto_solves(limit=self.recent_auto_solves)):
+                self._add_auto_solve(solve)
+            self._loaded = True
+            self.logger.info("上下文聚合数据加载完成")
+
+    def reload(self):
+        """从磁盘重新构建全部聚合数据"""
+        with self._lock:
+            self.history_by_type.clear()
+            self.history_summary_by_type.clear()
+            self.tools_by_category.clear()
+            self.auto_solves.clear()
+            self.success_patterns = []
+            self._loaded = False
+        self._ensure_loaded()
+
+    # 增量维护
+    @staticmethod
+    def _record_type(record: Dict[str, Any]) -> str:
+        analysis_data = record.get("analysis_data", {}) or {}
+        return analysis_data.get("type") or analysis_data.get("question_type") or "unknown"
+
+    def _set_user_preferences(self, user_config: Dict[str, Any]):
+        user_config = user_config or {}
+        self.user_preferences = {
+            "ai_provider": user_config.get("ai_provider", "deepseek"),
+            "language": user_config.get("ai_settings", {}).get("language", "zh"),
+            "analysis_style": user_config.get("analysis_settings", {}).get("style", "detailed")
+        }
+
+    def _add_history(self, record: Dict[str, Any]):
+        question_type = self._record_type(record)
+        records = self.history_by_type.setdefault(question_type, deque(maxlen=self.history_per_type))
+        records.append(record)
+        # 摘要按从新到旧的顺序生成
+        self.history_summary_by_type[question_type] = self._summarize_history(list(reversed(records)))
+
+    def _set_tools(self, tools: List[Dict[str, Any]]):
+        tools_by_category: Dict[str, List[Dict[str, Any]]] = {}
+        for tool in tools or []:
+            tools_by_category.setdefault(tool.get("category"), []).append(tool)
+        self.tools_by_category = tools_by_category
+
+    def _add_auto_solve(self, solve: Dict[str, Any]):
+        solve_id = solve.get("id")
+        if solve_id in self.auto_solves:
+            self.auto_solves.move_to_end(solve_id)
+        self.auto_solves[solve_id] = solve
+        while len(self.auto_solves) > self.recent_auto_solves:
+            self.auto_solves.popitem(last=False)
+        self._refresh_success_patterns()
+
+    def _refresh_success_patterns(self):
+        successful = [s for s in reversed(self.auto_solves.values()) if s.get("status") == "completed"]
+        self.success_patterns = self._extract_success_patterns(successful)
+
+    def _on_history_saved(self, record: Dict[str, Any]):
+        if not self._loaded:
+            return
+        with self._lock:
+            self._add_history(record)
+
+    def _on_config_saved(self, payload: Dict[str, Any]):
+        if not self._loaded or payload.get("name") != "user_config":
+            return
+        with self._lock:
+            self._set_user_preferences(payload.get("data"))
+
+    def _on_tools_saved(self, tools: List[Dict[str, Any]]):
+        if not self._loaded:
+            return
+        with self._lock:
+            self._set_tools(tools)
+
+    def _on_auto_solve_saved(self, solve: Dict[str, Any]):
+        if not self._loaded:
+            return
+        with self._lock:
+            self._add_auto_solve(dict(solve))
+
+    def _on_auto_solve_deleted(self, solve_id: str):
+        if not self._loaded:
+            return
+        with self._lock:
+            if self.auto_solves.pop(solve_id, None) is not None:
+                self._refresh_success_patterns()
+
+    # 摘要
+    @staticmethod
+    def _summarize_history(history: List[Dict[str, Any]]) -> str:
+        """总结历史分析记录"""
+        if not history:
+            return ""
+
+        summary_parts = []
+        for record in history:
+            analysis_data = record.get("analysis_data", {})
+            summary_parts.append(f"题目类型: {analysis_data.get('type') or analysis_data.get('question_type', 'unknown')}")
+            if analysis_data.get('ai_response'):
+                # 提取AI响应的关键信息
+                response = analysis_data['ai_response']
+                if '## 分析思路' in response:
+                    summary_parts.append("包含详细分析思路")
+                if '## 解题步骤' in response:
+                    summary_parts.append("包含具体解题步骤")
+                if 'flag{' in response.lower():
+                    summary_parts.append("包含flag信息")
+
+        return " | ".join(summary_parts[:5])  # 限制长度
+
+    @staticmethod
+    def _extract_success_patterns(successful_solves: List[Dict[str, Any]]) -> List[str]:
+        """提取成功解题模式"""
+        patterns = []
+        for solve in successful_solves:
+            method = solve.get("solve_method", "")
+            if method:
+                patterns.append(f"成功使用 {method} 方法解题")
+
+            if solve.get("flag"):
+                patterns.append("成功获取flag")
+
+        return patterns[:3]  # 限制数量
+
+    # 查询
+    def get_context(self, question_type: str, user_id: Optional[str] = None,
+                    description: Optional[str] = None) -> Dict[str, Any]:
+        """获取分析上下文（仅读取内存中的聚合数据）
+
+        提供题目描述时，相似题目来自相似题目检索索引；否则为同类型的最近分析记录。
+        """
+        self._ensure_loaded()
+        similar = similarity_index.search(description, question_type) if description else []
+        with self._lock:
+            if not similar:
+                similar = list(reversed(self.history_by_type.get(question_type, ())))
+            return {
+                "user_preferences": dict(self.user_preferences),
+                "history_summary": self.history_summary_by_type.get(question_type, ""),
+                "similar_challenges": similar,
+                "tool_usage": list(self.tools_by_category.get(question_type, []))[:5],
+                "success_patterns": list(self.success_patterns)
+            }
+
+# 全局实例
+context_provider = ContextProvider()
@@ -40,12 +40,8 @@ class ConversationService:
         return conversation_id
     
     def add_message(self, conversation_id: str, role: str, content: str, metadata: Dict[str, Any] = None) -> bool:
-        """添加消息到对话"""
+        """添加消息到对话（追加写消息日志，元数据和更新时间由存储层同步）"""
         try:
-            conversation = data_service.get_conversation(conversation_id)
-            if not conversation:
-                return False
-            
             message = {
                 "id": str(uuid.uuid4()),
                 "role": role,  # "user" 或 "assistant"
@@ -54,24 +50,8 @@ class ConversationService:
                 "metadata": metadata or {}
             }
             
-            conversation["messages"].append(message)
-            conversation["updated_at"] = datetime.now().isoformat()
-            
-            # 更新元数据
-            if metadata:
-                if "question_type" in metadata:
-                    conversation["metadata"]["question_type"] = metadata["question_type"]
-                if "challenge_id" in metadata:
-                    conversation["metadata"]["challenge_id"] = metadata["challenge_id"]
-                if "ai_provider" in metadata:
-                    conversation["metadata"]["ai_provider"] = metadata["ai_provider"]
-            
-            # 限制消息数量
-            if len(conversation["messages"]) > self.max_history_messages:
-                conversation["messages"] = conversation["messages"][-self.max_history_messages:]
-            
-            # 保存更新
-            data_service.save_conversation(conversation)
+            if not data_service.append_conversation_message(conversation_id, message):
+                return False
             
             self.logger.info(f"添加消息到对话 {conversation_id}: {role}")
             return True
@@ -102,19 +82,12 @@ class ConversationService:
     def update_conversation_context(self, conversation_id: str, context_updates: Dict[str, Any]) -> bool:
         """更新对话上下文"""
         try:
-            conversation = data_service.get_conversation(conversation_id)
-            if not conversation:
+            if not data_service.update_conversation(conversation_id, {
+                "context": context_updates,
+                "updated_at": datetime.now().isoformat()
+            }):
                 return False
             
-            # 更新上下文
-            current_context = conversation.get("context", {})
-            current_context.update(context_updates)
-            conversation["context"] = current_context
-            conversation["updated_at"] = datetime.now().isoformat()
-            
-            # 保存更新
-            data_service.save_conversation(conversation)
-            
             self.logger.info(f"更新对话上下文: {conversation_id}")
             return True
             
@@ -0,0 +1,417 @@
+import bisect
+import heapq
+import json
+import os
+import threading
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Callable
+from logger import get_logger
+
+# 消息元数据中会同步到对话元数据的字段
+METADATA_FIELDS = ("question_type", "challenge_id", "ai_provider")
+
+
+class ConversationIndex:
+    """对话二级索引：user_id -> 按 updated_at 排序的对话ID，以及按 updated_at 排序的最小堆
+
+    用户对话列表为有序列表的区间读取；过期清理从最小堆顶部弹出，过时的堆元素惰性丢弃。
+    索引只保存在内存中，可随时从磁盘上的对话文件重建。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, tuple] = {}  # conversation_id -> (user_id, updated_at)
+        self._by_user: Dict[Optional[str], List[tuple]] = {}  # user_id -> [(updated_at, conversation_id)]
+        self._heap: List[tuple] = []  # [(updated_at, conversation_id)]
+        self.built = False
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+            self._heap.clear()
+            self.built = False
+
+    def _remove_locked(self, conversation_id: str):
+        previous = self._entries.pop(conversation_id, None)
+        if previous is None:
+            return
+        user_id, updated_at = previous
+        items = self._by_user.get(user_id)
+        if items:
+            position = bisect.bisect_left(items, (updated_at, conversation_id))
+            if position < len(items) and items[position] == (updated_at, conversation_id):
+                items.pop(position)
+            if not items:
+                del self._by_user[user_id]
+
+    def update(self, conversation_id: str, user_id: Optional[str], updated_at: str):
+        """新增或更新对话的索引项"""
+        with self._lock:
+            if self._entries.get(conversation_id) == (user_id, updated_at):
+                return
+            self._remove_locked(conversation_id)
+            self._entries[conversation_id] = (user_id, updated_at)
+            bisect.insort(self._by_user.setdefault(user_id, []), (updated_at, conversation_id))
+            heapq.heappush(self._heap, (updated_at, conversation_id))
+            # 过时元素过多时重建堆
+            if len(self._heap) > 2 * len(self._entries) + 64:
+                self._heap = [(entry[1], cid) for cid, entry in self._entries.items()]
+                heapq.heapify(self._heap)
+
+    def remove(self, conversation_id: str):
+        with self._lock:
+            self._remove_locked(conversation_id)
+
+    def list_user(self, user_id: Optional[str], limit: int = 10) -> List[str]:
+        """按 updated_at 倒序返回用户最近的对话ID"""
+        with self._lock:
+            items = self._by_user.get(user_id, [])
+            return [conversation_id for _, conversation_id in reversed(items[-limit:])] if limit > 0 else []
+
+    def expired(self, cutoff: str) -> List[str]:
+        """返回 updated_at 早于 cutoff 的对话ID（按时间从旧到新）"""
+        with self._lock:
+            valid = []
+            while self._heap and self._heap[0][0] < cutoff:
+                item = heapq.heappop(self._heap)
+                entry = self._entries.get(item[1])
+                # 已删除或已更新的对话在堆中留下的旧元素直接丢弃
+                if entry is not None and entry[1] == item[0]:
+                    valid.append(item)
+            # 仍有效的元素放回堆中，由调用方删除后再惰性丢弃
+            for item in valid:
+                heapq.heappush(self._heap, item)
+        return [conversation_id for _, conversation_id in valid]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "conversations": len(self._entries),
+                "users": len(self._by_user),
+                "heap_size": len(self._heap)
+            }
+
+
+class ConversationStore:
+    """对话存储：对话头信息 + 追加写消息日志
+
+    每个对话由两个文件组成：
+    - ``{id}.json``：对话头（用户、上下文、元数据、时间戳），采用写回缓存，延迟落盘；
+    - ``{id}.messages.jsonl``：追加写的消息日志，每条消息一行，追加为O(1)。
+
+    对话头可以完全由消息日志推导出 updated_at 和元数据，因此写回缓存中尚未落盘的头信息在崩溃后不会丢失消息。
+    热点对话保存在LRU内存缓存中，同一对话的写入通过对话级锁串行化，避免并发消息丢失。
+    """
+
+    def __init__(self, root: Path, read_json: Callable[[Path], Optional[Dict[str, Any]]],
+                 write_json: Callable[[Path, Dict[str, Any]], bool],
+                 max_messages: int = 10, cache_size: int = 256, compact_threshold: int = 100):
+        self.logger = get_logger("conversation_store")
+        self.root = root
+        self._read_json = read_json
+        self._write_json = write_json
+        self.max_messages = max_messages
+        self.cache_size = cache_size
+        self.compact_threshold = compact_threshold
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._locks: Dict[str, threading.Lock] = {}
+        self._global_lock = threading.Lock()
+        self.index = ConversationIndex()
+        self._index_lock = threading.Lock()
+
+    # 路径与锁
+    def header_path(self, conversation_id: str) -> Path:
+        return self.root / f"{conversation_id}.json"
+
+    def log_path(self, conversation_id: str) -> Path:
+        return self.root / f"{conversation_id}.messages.jsonl"
+
+    def _lock_for(self, conversation_id: str) -> threading.Lock:
+        with self._global_lock:
+            lock = self._locks.get(conversation_id)
+            if lock is None:
+                lock = self._locks[conversation_id] = threading.Lock()
+            return lock
+
+    # 缓存
+    def _cache_put(self, conversation_id: str, entry: Dict[str, Any]):
+        evicted = []
+        with self._global_lock:
+            self._cache[conversation_id] = entry
+            self._cache.move_to_end(conversation_id)
+            while len(self._cache) > self.cache_size:
+                evicted.append(self._cache.popitem(last=False))
+        for evicted_id, evicted_entry in evicted:
+            if evicted_entry["dirty"]:
+                self._flush_entry(evicted_id, evicted_entry)
+
+    def _cache_get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        with self._global_lock:
+            entry = self._cache.get(conversation_id)
+            if entry is not None:
+                self._cache.move_to_end(conversation_id)
+            return entry
+
+    # 读取
+    def _read_log(self, conversation_id: str) -> List[Dict[str, Any]]:
+        messages = []
+        path = self.log_path(conversation_id)
+        if not path.exists():
+            return messages
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    messages.append(json.loads(line))
+                except ValueError:
+                    # 崩溃时可能留下不完整的末行，跳过即可
+                    self.logger.warning(f"跳过损坏的消息日志行: {conversation_id}")
+        return messages
+
+    def _repair_log_tail(self, conversation_id: str):
+        """崩溃时追加可能只写入了半行，截断到最后一个换行符，保证后续追加从新行开始"""
+        path = self.log_path(conversation_id)
+        try:
+            with open(path, "r+b") as f:
+                end = f.seek(0, os.SEEK_END)
+                if end == 0:
+                    return
+                f.seek(end - 1)
+                if f.read(1) == b"\n":
+                    return
+                position = end
+                while position > 0:
+                    start = max(position - 65536, 0)
+                    f.seek(start)
+                    newline = f.read(position - start).rfind(b"\n")
+                    if newline >= 0:
+                        position = start + newline + 1
+                        break
+                    position = start
+                f.truncate(position)
+        except FileNotFoundError:
+            return
+        self.logger.warning(f"截断消息日志末尾不完整的行: {conversation_id}")
+
+    def _write_log(self, conversation_id: str, messages: List[Dict[str, Any]]):
+        path = self.log_path(conversation_id)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for message in messages:
+                f.write(json.dumps(message, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _apply_message(header: Dict[str, Any], message: Dict[str, Any]):
+        """根据消息更新对话头的 updated_at 和元数据"""
+        timestamp = message.get("timestamp")
+        if timestamp and timestamp > header.get("updated_at", ""):
+            header["updated_at"] = timestamp
+        metadata = message.get("metadata") or {}
+        header_metadata = header.setdefault("metadata", {})
+        for field in METADATA_FIELDS:
+            if field in metadata:
+                header_metadata[field] = metadata[field]
+
+    def _load(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._cache_get(conversation_id)
+        if entry is not None:
+            return entry
+
+        header = self._read_json(self.header_path(conversation_id))
+        if not header:
+            return None
+
+        self._repair_log_tail(conversation_id)
+        messages = self._read_log(conversation_id)
+        dirty = False
+        legacy_messages = header.pop("messages", None)
+        if legacy_messages:
+            # 兼容旧格式：消息内嵌在对话文件中，迁移到消息日志
+            messages = legacy_messages + messages
+            self._write_log(conversation_id, messages[-self.max_messages:])
+            dirty = True
+        for message in messages:
+            self._apply_message(header, message)
+
+        entry = {
+            "header": header,
+            "messages": deque(messages, maxlen=self.max_messages),
+            "log_lines": min(len(messages), self.max_messages) if legacy_messages else len(messages),
+            "dirty": dirty
+        }
+        self._cache_put(conversation_id, entry)
+        self._index_entry(conversation_id, header)
+        return entry
+
+    @staticmethod
+    def _snapshot(entry: Dict[str, Any]) -> Dict[str, Any]:
+        conversation = json.loads(json.dumps(entry["header"]))
+        conversation["messages"] = [dict(m) for m in entry["messages"]]
+        return conversation
+
+    # 写回
+    def _flush_entry(self, conversation_id: str, entry: Dict[str, Any]) -> bool:
+        if self._write_json(self.header_path(conversation_id), entry["header"]):
+            entry["dirty"] = False
+            return True
+        return False
+
+    def flush(self, conversation_id: str = None) -> int:
+        """将写回缓存中的对话头落盘，返回落盘数量"""
+        with self._global_lock:
+            if conversation_id is not None:
+                items = [(conversation_id, self._cache[conversation_id])] if conversation_id in self._cache else []
+            else:
+                items = list(self._cache.items())
+        flushed = 0
+        for cid, entry in items:
+            if not entry["dirty"]:
+                continue
+            with self._lock_for(cid):
+                if entry["dirty"] and self._flush_entry(cid, entry):
+                    flushed += 1
+        return flushed
+
+    # 索引
+    def _last_log_timestamp(self, conversation_id: str) -> str:
+        """读取消息日志末行的时间戳（只读取文件末尾）"""
+        path = self.log_path(conversation_id)
+        try:
+            with open(path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                f.seek(max(size - 65536, 0))
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return ""
+        for line in reversed(lines):
+            try:
+                return json.loads(line.decode("utf-8")).get("timestamp", "")
+            except ValueError:
+                continue
+        return ""
+
+    def rebuild_index(self) -> int:
+        """从磁盘上的对话文件重建索引，返回索引的对话数量"""
+        with self._index_lock:
+            self.index.clear()
+            count = 0
+            if self.root.exists():
+                for path in self.root.glob("*.json"):
+                    header = self._read_json(path)
+                    if not header or "id" not in header:
+                        continue
+                    conversation_id = header["id"]
+                    entry = self._cache_get(conversation_id)
+                    if entry is not None:
+                        header = entry["header"]
+                    updated_at = max(header.get("updated_at", ""), self._last_log_timestamp(conversation_id))
+                    self.index.update(conversation_id, header.get("user_id"), updated_at)
+                    count += 1
+            self.index.built = True
+            self.logger.info(f"对话索引重建完成，共 {count} 个对话")
+            return count
+
+    def _ensure_index(self):
+        if not self.index.built:
+            self.rebuild_index()
+
+    def _index_entry(self, conversation_id: str, header: Dict[str, Any]):
+        if self.index.built:
+            self.index.update(conversation_id, header.get("user_id"), header.get("updated_at", ""))
+
+    def list_user_conversation_ids(self, user_id: Optional[str], limit: int = 10) -> List[str]:
+        """按 updated_at 倒序获取用户的对话ID"""
+        self._ensure_index()
+        return self.index.list_user(user_id, limit)
+
+    def expired_conversation_ids(self, cutoff: str) -> List[str]:
+        """获取 updated_at 早于 cutoff 的对话ID"""
+        self._ensure_index()
+        return self.index.expired(cutoff)
+
+    # 公共接口
+    def save(self, conversation_data: Dict[str, Any]) -> bool:
+        """整体保存对话（创建或覆盖）"""
+        conversation_id = conversation_data["id"]
+        header = {k: v for k, v in conversation_data.items() if k != "messages"}
+        messages = list(conversation_data.get("messages", []))[-self.max_messages:]
+        with self._lock_for(conversation_id):
+            self._write_log(conversation_id, messages)
+            if not self._write_json(self.header_path(conversation_id), header):
+                return False
+            self._cache_put(conversation_id, {
+                "header": header,
+                "messages": deque(messages, maxlen=self.max_messages),
+                "log_lines": len(messages),
+                "dirty": False
+            })
+            self._index_entry(conversation_id, header)
+        return True
+
+    def get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """获取对话（包含最近的消息）"""
+        with self._lock_for(conversation_id):
+            entry = self._load(conversation_id)
+            return self._snapshot(entry) if entry else None
+
+    def append_message(self, conversation_id: str, message: Dict[str, Any]) -> bool:
+        """追加一条消息到对话日志"""
+        with self._lock_for(conversation_id):
+            entry = self._load(conversation_id)
+            if entry is None:
+                return False
+            # 无缓冲的追加模式下整行只调用一次 write，不会与其他写入交错或拆成多段
+            line = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+            with open(self.log_path(conversation_id), "ab", buffering=0) as f:
+                f.write(line)
+            entry["messages"].append(message)
+            entry["log_lines"] += 1
+            self._apply_message(entry["header"], message)
+            entry["dirty"] = True
+            self._index_entry(conversation_id, entry["header"])
+            # 日志过长时压缩为最近的消息
+            if entry["log_lines"] > self.compact_threshold:
+                self._write_log(conversation_id, list(entry["messages"]))
+                entry["log_lines"] = len(entry["messages"])
+        return True
+
+    def update_header(self, conversation_id: str, updates: Dict[str, Any]) -> bool:
+        """更新对话头字段（写回缓存，延迟落盘）"""
+        with self._lock_for(conversation_id):
+            entry = self._load(conversation_id)
+            if entry is None:
+                return False
+            for key, value in updates.items():
+                if key == "context":
+                    entry["header"].setdefault("context", {}).update(value)
+                else:
+                    entry["header"][key] = value
+            entry["dirty"] = True
+            self._index_entry(conversation_id, entry["header"])
+            # 上下文无法从消息日志推导，立即落盘
+            if "context" in updates:
+                self._flush_entry(conversation_id, entry)
+        return True
+
+    def delete(self, conversation_id: str) -> bool:
+        """删除对话及其消息日志"""
+        with self._lock_for(conversation_id):
+            with self._global_lock:
+                self._cache.pop(conversation_id, None)
+            header_path = self.header_path(conversation_id)
+            existed = header_path.exists()
+            for path in (header_path, self.log_path(conversation_id)):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+        with self._global_lock:
+            self._locks.pop(conversation_id, None)
+        self.index.remove(conversation_id)
+        return existed
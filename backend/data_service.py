@@ -1,10 +1,40 @@
 import json
 import os
+import threading
 import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable
 from pathlib import Path
 import shutil
+from conversation_store import ConversationStore
+from registry import ConfigRegistry
+from config import config
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+
+def dumps_json(data: Any, indent: int = 0) -> bytes:
+    """序列化为UTF-8编码的JSON（安装了 orjson 时使用 orjson）"""
+    if ORJSON_AVAILABLE:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(data, option=option)
+    if indent:
+        return json.dumps(data, ensure_ascii=False, indent=indent).encode("utf-8")
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads_json(raw: bytes) -> Any:
+    """解析UTF-8编码的JSON"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(raw)
+    return json.loads(raw)
 
 class DataService:
     """数据服务类，负责管理data文件夹中的数据读写"""
@@ -17,9 +47,56 @@ class DataService:
         self.configs_dir = self.data_root / "configs"
         self.cache_dir = self.data_root / "cache"
         self.exports_dir = self.data_root / "exports"
+        self.conversations_dir = self.data_root / "conversations"
+        
+        # 写入事件订阅者（事件名 -> 回调列表），用于增量维护内存中的聚合数据
+        self._listeners: Dict[str, List[Callable[[Any], None]]] = {}
+        
+        # 不符合 challenge_{id}.json 命名的旧题目文件：id -> 路径，按目录修改时间判断是否需要重建
+        self._legacy_challenge_paths: Dict[str, Path] = {}
+        self._legacy_challenge_mtimes: Optional[Dict[str, int]] = None
+        
+        # 只读解析结果缓存：路径 -> ((inode, mtime_ns, size), 解析结果)，按LRU淘汰
+        self._json_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._json_cache_lock = threading.Lock()
+        # 批量写入时延迟到批次结束再同步的目录
+        self._batch_state = threading.local()
         
         # 确保目录存在
         self._ensure_directories()
+        
+        # 对话存储（追加写消息日志 + 写回缓存）
+        self.conversation_store = ConversationStore(
+            self.conversations_dir,
+            read_json=self._read_json_file,
+            write_json=self._write_json_file
+        )
+        
+        # 工具和解题模板注册表（内存索引 + 加锁写回）
+        self.tool_registry = ConfigRegistry(
+            self.configs_dir / "tools.json", "tools",
+            read_json=self._read_json_file,
+            write_json=self._write_json_file,
+            on_change=lambda tools: self._emit("tools_saved", tools)
+        )
+        self.template_registry = ConfigRegistry(
+            self.configs_dir / "solve_templates.json", "templates",
+            read_json=self._read_json_file,
+            write_json=self._write_json_file,
+            on_change=lambda templates: self._emit("templates_saved", templates)
+        )
+    
+    def subscribe(self, event: str, callback: Callable[[Any], None]):
+        """订阅数据写入事件"""
+        self._listeners.setdefault(event, []).append(callback)
+    
+    def _emit(self, event: str, payload: Any):
+        """通知订阅者，订阅者异常不影响写入流程"""
+        for callback in self._listeners.get(event, []):
+            try:
+                callback(payload)
+            except Exception as e:
+                print(f"处理数据事件失败 {event}: {e}")
     
     def _ensure_directories(self):
         """确保所有必要的目录存在"""
@@ -29,7 +106,8 @@ class DataService:
             self.history_dir,
             self.configs_dir,
             self.cache_dir,
-            self.exports_dir
+            self.exports_dir,
+            self.conversations_dir
         ]
         
         # 创建题目类型子目录
@@ -48,26 +126,105 @@ class DataService:
         """获取当前时间戳"""
         return datetime.now().isoformat()
     
-    def _read_json_file(self, file_path: Path) -> Optional[Dict[str, Any]]:
-        """读取JSON文件"""
+    def _read_json_file(self, file_path: Path, cached: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        读取JSON文件
+        
+        Args:
+            file_path: 文件路径
+            cached: 使用解析结果缓存（按 inode、修改时间和大小判断是否失效）。
+                返回的对象在多次调用间共享，调用方不能修改
+        """
         try:
-            if file_path.exists():
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+            if not cached:
+                with open(file_path, 'rb') as f:
+                    return loads_json(f.read())
+            
+            key = str(file_path)
+            stat = os.stat(file_path)
+            signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            with self._json_cache_lock:
+                entry = self._json_cache.get(key)
+                if entry is not None and entry[0] == signature:
+                    self._json_cache.move_to_end(key)
+                    return entry[1]
+            with open(file_path, 'rb') as f:
+                data = loads_json(f.read())
+            if config.JSON_READ_CACHE_SIZE > 0:
+                with self._json_cache_lock:
+                    self._json_cache[key] = (signature, data)
+                    self._json_cache.move_to_end(key)
+                    while len(self._json_cache) > config.JSON_READ_CACHE_SIZE:
+                        self._json_cache.popitem(last=False)
+            return data
+        except FileNotFoundError:
+            pass
         except Exception as e:
             print(f"读取文件失败 {file_path}: {e}")
         return None
     
     def _write_json_file(self, file_path: Path, data: Dict[str, Any]) -> bool:
-        """写入JSON文件"""
+        """
+        原子写入JSON文件
+        
+        先写入同目录下的临时文件，再重命名覆盖目标文件，读取方不会看到写了一半的文件，
+        写入中途崩溃也不会破坏原文件。JSON_FSYNC 开启时在重命名前同步文件内容，
+        并在重命名后同步目录（批量写入时目录在批次结束后统一同步）。
+        """
+        temp_path = file_path.with_name(f".{file_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            payload = dumps_json(data, config.JSON_INDENT)
+            with open(temp_path, 'wb') as f:
+                f.write(payload)
+                if config.JSON_FSYNC:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(temp_path, file_path)
+            with self._json_cache_lock:
+                self._json_cache.pop(str(file_path), None)
+            if config.JSON_FSYNC:
+                pending_dirs = getattr(self._batch_state, "dirs", None)
+                if pending_dirs is not None:
+                    pending_dirs.add(file_path.parent)
+                else:
+                    self._fsync_directory(file_path.parent)
             return True
         except Exception as e:
             print(f"写入文件失败 {file_path}: {e}")
+            try:
+                temp_path.unlink()
+            except OSError:
+                pass
             return False
     
+    @staticmethod
+    def _fsync_directory(directory: Path):
+        """同步目录项，确保重命名在断电后仍然生效（不支持目录fsync的平台上忽略）"""
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+    
+    @contextmanager
+    def batch_writes(self):
+        """批量写入：批次内每个文件仍然原子写入，目录同步合并到批次结束时执行一次"""
+        if getattr(self._batch_state, "dirs", None) is not None:
+            yield
+            return
+        self._batch_state.dirs = set()
+        try:
+            yield
+        finally:
+            pending_dirs, self._batch_state.dirs = self._batch_state.dirs, None
+            for directory in pending_dirs:
+                self._fsync_directory(directory)
+    
     # 题目相关操作
     def save_challenge(self, description: str, question_type: str, ai_response: str, 
                       file_name: Optional[str] = None) -> Dict[str, Any]:
@@ -87,19 +244,78 @@ class DataService:
         # 保存到对应类型的目录
         file_path = self.challenges_dir / question_type / f"challenge_{challenge_id}.json"
         if self._write_json_file(file_path, challenge_data):
+            self._emit("challenge_saved", challenge_data)
             return challenge_data
         else:
             raise Exception("保存题目失败")
     
+    def _legacy_challenge_index(self) -> Dict[str, Path]:
+        """旧题目文件的 id -> 路径索引，目录有变化时重新扫描（只解析不符合命名规则的文件）"""
+        mtimes = {}
+        for challenge_type in ["web", "pwn", "reverse", "crypto", "misc"]:
+            try:
+                mtimes[challenge_type] = (self.challenges_dir / challenge_type).stat().st_mtime_ns
+            except FileNotFoundError:
+                mtimes[challenge_type] = 0
+        
+        if mtimes != self._legacy_challenge_mtimes:
+            legacy_paths = {}
+            for challenge_type in mtimes:
+                type_dir = self.challenges_dir / challenge_type
+                if not type_dir.exists():
+                    continue
+                for file_path in type_dir.glob("*.json"):
+                    if file_path.name.startswith("challenge_"):
+                        continue
+                    data = self._read_json_file(file_path)
+                    if data and data.get("id"):
+                        legacy_paths[data["id"]] = file_path
+            self._legacy_challenge_paths = legacy_paths
+            self._legacy_challenge_mtimes = mtimes
+        return self._legacy_challenge_paths
+    
+    def _challenge_path(self, challenge_id: str) -> Optional[Path]:
+        """根据ID定位题目文件：题目ID编码在文件名中，最多检查每个类型目录一次"""
+        if not challenge_id or Path(challenge_id).name != challenge_id:
+            return None
+        for challenge_type in ["web", "pwn", "reverse", "crypto", "misc"]:
+            file_path = self.challenges_dir / challenge_type / f"challenge_{challenge_id}.json"
+            if file_path.exists():
+                return file_path
+        
+        file_path = self._legacy_challenge_index().get(challenge_id)
+        if file_path is not None and file_path.exists():
+            return file_path
+        return None
+    
+    def save_challenges_bulk(self, challenges: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量保存题目记录（保留记录中已有的ID和时间戳），返回保存成功的记录"""
+        saved = []
+        with self.batch_writes():
+            for challenge in challenges:
+                challenge_data = {
+                    "id": challenge.get("id") or self._generate_id(),
+                    "description": challenge["description"],
+                    "type": challenge["type"],
+                    "ai_response": challenge.get("ai_response", ""),
+                    "file_name": challenge.get("file_name"),
+                    "timestamp": challenge.get("timestamp") or self._get_timestamp()
+                }
+                file_path = self.challenges_dir / challenge_data["type"] / f"challenge_{challenge_data['id']}.json"
+                if self._write_json_file(file_path, challenge_data):
+                    saved.append(challenge_data)
+        for challenge_data in saved:
+            self._emit("challenge_saved", challenge_data)
+        return saved
+    
     def get_challenge(self, challenge_id: str) -> Optional[Dict[str, Any]]:
         """根据ID获取题目"""
-        # 在所有类型目录中查找
-        for challenge_type in ["web", "pwn", "reverse", "crypto", "misc"]:
-            type_dir = self.challenges_dir / challenge_type
-            for file_path in type_dir.glob("*.json"):
-                data = self._read_json_file(file_path)
-                if data and data.get("id") == challenge_id:
-                    return data
+        file_path = self._challenge_path(challenge_id)
+        if file_path is None:
+            return None
+        data = self._read_json_file(file_path, cached=True)
+        if data and data.get("id") == challenge_id:
+            return data
         return None
     
     def get_challenges(self, challenge_type: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
@@ -136,18 +352,17 @@ class DataService:
     
     def delete_challenge(self, challenge_id: str) -> bool:
         """删除题目"""
-        for challenge_type in ["web", "pwn", "reverse", "crypto", "misc"]:
-            type_dir = self.challenges_dir / challenge_type
-            for file_path in type_dir.glob("*.json"):
-                data = self._read_json_file(file_path)
-                if data and data.get("id") == challenge_id:
-                    try:
-                        file_path.unlink()
-                        return True
-                    except Exception as e:
-                        print(f"删除文件失败 {file_path}: {e}")
-                        return False
-        return False
+        file_path = self._challenge_path(challenge_id)
+        if file_path is None:
+            return False
+        data = self._read_json_file(file_path) or {"id": challenge_id}
+        try:
+            file_path.unlink()
+            self._emit("challenge_deleted", data)
+            return True
+        except Exception as e:
+            print(f"删除文件失败 {file_path}: {e}")
+            return False
     
     # 分析历史相关操作
     def save_analysis_history(self, challenge_id: str, analysis_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -164,6 +379,7 @@ class DataService:
         
         file_path = self.history_dir / f"history_{history_id}.json"
         if self._write_json_file(file_path, history_data):
+            self._emit("history_saved", history_data)
             return history_data
         else:
             raise Exception("保存分析历史失败")
@@ -185,13 +401,24 @@ class DataService:
     def save_config(self, config_name: str, config_data: Dict[str, Any]) -> bool:
         """保存配置"""
         file_path = self.configs_dir / f"{config_name}.json"
-        return self._write_json_file(file_path, config_data)
+        if self._write_json_file(file_path, config_data):
+            self._emit("config_saved", {"name": config_name, "data": config_data})
+            return True
+        return False
     
     def get_config(self, config_name: str) -> Optional[Dict[str, Any]]:
         """获取配置"""
         file_path = self.configs_dir / f"{config_name}.json"
         return self._read_json_file(file_path)
     
+    def get_user_config(self) -> Dict[str, Any]:
+        """获取用户配置"""
+        return self.get_config("user_config") or {}
+    
+    def save_user_config(self, config_data: Dict[str, Any]) -> bool:
+        """保存用户配置"""
+        return self.save_config("user_config", config_data)
+    
     def get_all_configs(self) -> Dict[str, Any]:
         """获取所有配置"""
         configs = {}
@@ -214,14 +441,17 @@ class DataService:
         # 使用key的hash作为文件名
         safe_key = "".join(c for c in key if c.isalnum() or c in ('-', '_')).rstrip()
         file_path = self.cache_dir / f"cache_{safe_key}.json"
-        return self._write_json_file(file_path, cache_data)
+        if self._write_json_file(file_path, cache_data):
+            self._emit("cache_saved", file_path.name)
+            return True
+        return False
     
     def get_cache(self, key: str) -> Optional[Any]:
         """获取缓存"""
         safe_key = "".join(c for c in key if c.isalnum() or c in ('-', '_')).rstrip()
         file_path = self.cache_dir / f"cache_{safe_key}.json"
         
-        cache_data = self._read_json_file(file_path)
+        cache_data = self._read_json_file(file_path, cached=True)
         if cache_data:
             timestamp = cache_data.get("timestamp", 0)
             ttl = cache_data.get("ttl", 3600)
@@ -233,6 +463,7 @@ class DataService:
                 # 删除过期缓存
                 try:
                     file_path.unlink()
+                    self._emit("cache_deleted", file_path.name)
                 except:
                     pass
         
@@ -253,79 +484,60 @@ class DataService:
                     try:
                         file_path.unlink()
                         cleared_count += 1
+                        self._emit("cache_deleted", file_path.name)
                     except:
                         pass
         
         return cleared_count
     
-    # 导出相关操作
-    def export_data(self, data_type: str, data: List[Dict[str, Any]], format: str = "json") -> str:
-        """导出数据"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"export_{data_type}_{timestamp}.{format}"
-        file_path = self.exports_dir / filename
-        
-        if format == "json":
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        elif format == "csv":
-            if data:
-                import csv
-                with open(file_path, 'w', encoding='utf-8', newline='') as f:
-                    writer = csv.DictWriter(f, fieldnames=data[0].keys())
-                    writer.writeheader()
-                    writer.writerows(data)
-        
-        return str(file_path)
-    
     # 工具相关操作
     def save_tools(self, tools: List[Dict[str, Any]]) -> bool:
-        """保存工具列表"""
-        file_path = self.configs_dir / "tools.json"
-        return self._write_json_file(file_path, {"tools": tools})
+        """保存工具列表（整体替换）"""
+        try:
+            return self.tool_registry.replace_all(tools)
+        except Exception as e:
+            print(f"保存工具列表失败: {e}")
+            return False
     
     def get_tools(self, category: str = None) -> List[Dict[str, Any]]:
         """获取工具列表"""
-        file_path = self.configs_dir / "tools.json"
-        data = self._read_json_file(file_path)
-        
-        if not data or "tools" not in data:
-            return []
-        
-        tools = data["tools"]
-        if category:
-            tools = [tool for tool in tools if tool.get("category") == category]
-        
-        return tools
+        return self.tool_registry.all(category=category)
     
     def get_tool_by_name(self, name: str) -> Optional[Dict[str, Any]]:
         """根据名称获取工具"""
-        tools = self.get_tools()
-        for tool in tools:
-            if tool.get("name") == name:
-                return tool
-        return None
+        return self.tool_registry.get_by_name(name)
     
-    def add_tool(self, tool: Dict[str, Any]) -> bool:
-        """添加工具"""
-        tools = self.get_tools()
-        tools.append(tool)
-        return self.save_tools(tools)
+    def get_tool_by_id(self, tool_id: int) -> Optional[Dict[str, Any]]:
+        """根据ID获取工具"""
+        return self.tool_registry.get_by_id(tool_id)
+    
+    def add_tool(self, tool: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """添加工具（自动分配ID），返回添加的工具；同名工具已存在或保存失败时返回 None"""
+        try:
+            return self.tool_registry.add(tool)
+        except Exception as e:
+            print(f"添加工具失败: {e}")
+            return None
     
     def update_tool(self, name: str, updated_tool: Dict[str, Any]) -> bool:
         """更新工具"""
-        tools = self.get_tools()
-        for i, tool in enumerate(tools):
-            if tool.get("name") == name:
-                tools[i] = updated_tool
-                return self.save_tools(tools)
-        return False
+        try:
+            return self.tool_registry.replace(name, updated_tool)
+        except Exception as e:
+            print(f"更新工具失败: {e}")
+            return False
+    
+    def merge_tools(self, tools: List[Dict[str, Any]], overwrite: bool = False) -> Dict[str, int]:
+        """批量合并工具（只写一次 tools.json）"""
+        return self.tool_registry.merge(tools, overwrite)
     
     def delete_tool(self, name: str) -> bool:
         """删除工具"""
-        tools = self.get_tools()
-        tools = [tool for tool in tools if tool.get("name") != name]
-        return self.save_tools(tools)
+        try:
+            return self.tool_registry.remove(name)
+        except Exception as e:
+            print(f"删除工具失败: {e}")
+            return False
     
     # 自动解题相关操作
     def save_auto_solve(self, auto_solve_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -353,6 +565,7 @@ class DataService:
         
         file_path = auto_solve_dir / f"auto_solve_{auto_solve_id}.json"
         if self._write_json_file(file_path, auto_solve_record):
+            self._emit("auto_solve_saved", auto_solve_record)
             return auto_solve_record
         else:
             raise Exception("保存自动解题记录失败")
@@ -396,7 +609,10 @@ class DataService:
         if updates.get("status") in ["completed", "failed"] and not current_data.get("completed_at"):
             current_data["completed_at"] = self._get_timestamp()
         
-        return self._write_json_file(file_path, current_data)
+        if self._write_json_file(file_path, current_data):
+            self._emit("auto_solve_saved", current_data)
+            return True
+        return False
     
     def delete_auto_solve(self, auto_solve_id: str) -> bool:
         """删除自动解题记录"""
@@ -406,6 +622,7 @@ class DataService:
         try:
             if file_path.exists():
                 file_path.unlink()
+                self._emit("auto_solve_deleted", auto_solve_id)
                 return True
         except Exception as e:
             print(f"删除自动解题记录失败 {file_path}: {e}")
@@ -414,80 +631,70 @@ class DataService:
     
     # 模板相关操作
     def save_templates(self, templates: List[Dict[str, Any]]) -> bool:
-        """保存模板列表"""
-        file_path = self.configs_dir / "solve_templates.json"
-        return self._write_json_file(file_path, {"templates": templates})
+        """保存模板列表（整体替换）"""
+        try:
+            return self.template_registry.replace_all(templates)
+        except Exception as e:
+            print(f"保存模板列表失败: {e}")
+            return False
     
-    def get_templates(self, category: str = None) -> List[Dict[str, Any]]:
-        """获取模板列表"""
-        file_path = self.configs_dir / "solve_templates.json"
-        data = self._read_json_file(file_path)
-        
-        if not data or "templates" not in data:
-            return []
-        
-        templates = data["templates"]
-        if category:
-            templates = [template for template in templates if template.get("category") == category]
-        
-        # 只返回启用的模板
-        templates = [template for template in templates if template.get("is_active", True)]
-        
-        return templates
+    def get_templates(self, category: str = None, include_inactive: bool = False) -> List[Dict[str, Any]]:
+        """获取模板列表（默认只返回启用的模板）"""
+        if include_inactive:
+            return self.template_registry.all(category=category)
+        return self.template_registry.all(category=category, predicate=lambda t: t.get("is_active", True))
+    
+    def merge_templates(self, templates: List[Dict[str, Any]], overwrite: bool = False) -> Dict[str, int]:
+        """批量合并解题模板（只写一次 solve_templates.json）"""
+        return self.template_registry.merge(templates, overwrite)
     
     def get_template_by_name(self, name: str) -> Optional[Dict[str, Any]]:
-        """根据名称获取模板"""
-        templates = self.get_templates()
-        for template in templates:
-            if template.get("name") == name:
-                return template
-        return None
+        """根据名称获取模板（包括已禁用的模板）"""
+        return self.template_registry.get_by_name(name)
     
     def add_template(self, template: Dict[str, Any]) -> bool:
-        """添加模板"""
-        templates = self.get_templates()
-        # 生成新的ID
-        max_id = max([t.get('id', 0) for t in templates]) if templates else 0
-        template['id'] = max_id + 1
-        templates.append(template)
-        return self.save_templates(templates)
+        """添加模板（自动分配ID）"""
+        try:
+            return self.template_registry.add(template) is not None
+        except Exception as e:
+            print(f"添加模板失败: {e}")
+            return False
     
     def update_template(self, name: str, updated_template: Dict[str, Any]) -> bool:
         """更新模板"""
-        templates = self.get_templates()
-        for i, template in enumerate(templates):
-            if template.get("name") == name:
-                templates[i] = updated_template
-                return self.save_templates(templates)
-        return False
+        try:
+            return self.template_registry.replace(name, updated_template)
+        except Exception as e:
+            print(f"更新模板失败: {e}")
+            return False
     
     def delete_template(self, name: str) -> bool:
         """删除模板"""
-        templates = self.get_templates()
-        templates = [template for template in templates if template.get("name") != name]
-        return self.save_templates(templates)
+        try:
+            return self.template_registry.remove(name)
+        except Exception as e:
+            print(f"删除模板失败: {e}")
+            return False
     
     def enable_template(self, name: str) -> bool:
         """启用模板"""
-        templates = self.get_templates()
-        for i, template in enumerate(templates):
-            if template.get("name") == name:
-                templates[i]["is_active"] = True
-                return self.save_templates(templates)
-        return False
+        try:
+            return self.template_registry.update_fields(name, is_active=True)
+        except Exception as e:
+            print(f"启用模板失败: {e}")
+            return False
     
     def disable_template(self, name: str) -> bool:
         """禁用模板"""
-        templates = self.get_templates()
-        for i, template in enumerate(templates):
-            if template.get("name") == name:
-                templates[i]["is_active"] = False
-                return self.save_templates(templates)
-        return False
+        try:
+            return self.template_registry.update_fields(name, is_active=False)
+        except Exception as e:
+            print(f"禁用模板失败: {e}")
+            return False
     
     # 统计相关操作
     def get_stats(self) -> Dict[str, Any]:
-        """获取统计数据"""
+        """扫描磁盘获取统计数据（较慢，接口使用 stats_service 中维护的计数）"""
         stats = {
             "total_challenges": 0,
             "challenges_by_type": {},
@@ -519,36 +726,22 @@ class DataService:
         return stats
 
     def save_template(self, template_data: Dict[str, Any]) -> bool:
-        """保存解题模板"""
+        """保存解题模板（有ID时按ID更新，否则添加）"""
         try:
-            templates = self.get_templates()
             template_id = template_data.get("id")
-            
-            if template_id:
-                # 更新现有模板
-                for i, template in enumerate(templates):
-                    if template.get("id") == template_id:
-                        templates[i] = template_data
-                        break
-            else:
-                # 添加新模板
-                template_data["id"] = str(uuid.uuid4())
-                template_data["created_at"] = datetime.now().isoformat()
-                templates.append(template_data)
-            
-            self._write_json_file(self.configs_dir / "solve_templates.json", {"templates": templates})
-            return True
+            if template_id is not None:
+                return self.template_registry.replace_by_id(template_id, template_data)
+            template_data = dict(template_data)
+            template_data.setdefault("created_at", datetime.now().isoformat())
+            return self.template_registry.add(template_data) is not None
         except Exception as e:
             print(f"保存模板失败: {e}")
             return False
 
-    def delete_template(self, template_id: str) -> bool:
-        """删除解题模板"""
+    def delete_template_by_id(self, template_id: Any) -> bool:
+        """按ID删除解题模板"""
         try:
-            templates = self.get_templates()
-            templates = [t for t in templates if t.get("id") != template_id]
-            self._write_json_file(self.configs_dir / "solve_templates.json", {"templates": templates})
-            return True
+            return self.template_registry.remove_by_id(template_id)
         except Exception as e:
             print(f"删除模板失败: {e}")
             return False
@@ -557,14 +750,7 @@ class DataService:
     def save_conversation(self, conversation_data: Dict[str, Any]) -> bool:
         """保存对话数据"""
         try:
-            conversations_dir = self.data_root / "conversations"
-            conversations_dir.mkdir(exist_ok=True)
-            
-            conversation_id = conversation_data["id"]
-            conversation_file = conversations_dir / f"{conversation_id}.json"
-            
-            self._write_json_file(conversation_file, conversation_data)
-            return True
+            return self.conversation_store.save(conversation_data)
         except Exception as e:
             print(f"保存对话失败: {e}")
             return False
@@ -572,34 +758,40 @@ class DataService:
     def get_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
         """获取对话数据"""
         try:
-            conversations_dir = self.data_root / "conversations"
-            conversation_file = conversations_dir / f"{conversation_id}.json"
-            
-            if conversation_file.exists():
-                return self._read_json_file(conversation_file)
-            return None
+            return self.conversation_store.get(conversation_id)
         except Exception as e:
             print(f"获取对话失败: {e}")
             return None
 
+    def append_conversation_message(self, conversation_id: str, message: Dict[str, Any]) -> bool:
+        """追加消息到对话（追加写日志，不重写整个对话）"""
+        try:
+            return self.conversation_store.append_message(conversation_id, message)
+        except Exception as e:
+            print(f"追加对话消息失败: {e}")
+            return False
+
+    def update_conversation(self, conversation_id: str, updates: Dict[str, Any]) -> bool:
+        """更新对话头信息（上下文、时间戳等）"""
+        try:
+            return self.conversation_store.update_header(conversation_id, updates)
+        except Exception as e:
+            print(f"更新对话失败: {e}")
+            return False
+
+    def flush_conversations(self) -> int:
+        """将写回缓存中的对话头落盘"""
+        return self.conversation_store.flush()
+
     def get_user_conversations(self, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """获取用户的对话列表"""
+        """获取用户的对话列表（按索引读取，只加载返回的对话）"""
         try:
-            conversations_dir = self.data_root / "conversations"
-            if not conversations_dir.exists():
-                return []
-            
             conversations = []
-            for filename in os.listdir(conversations_dir):
-                if filename.endswith('.json'):
-                    conversation_file = conversations_dir / filename
-                    conversation = self._read_json_file(conversation_file)
-                    if conversation and conversation.get("user_id") == user_id:
-                        conversations.append(conversation)
-            
-            # 按更新时间排序
-            conversations.sort(key=lambda x: x.get("updated_at", ""), reverse=True)
-            return conversations[:limit]
+            for conversation_id in self.conversation_store.list_user_conversation_ids(user_id, limit):
+                conversation = self.conversation_store.get(conversation_id)
+                if conversation:
+                    conversations.append(conversation)
+            return conversations
         except Exception as e:
             print(f"获取用户对话列表失败: {e}")
             return []
@@ -607,37 +799,20 @@ class DataService:
     def delete_conversation(self, conversation_id: str) -> bool:
         """删除对话"""
         try:
-            conversations_dir = self.data_root / "conversations"
-            conversation_file = conversations_dir / f"{conversation_id}.json"
-            
-            if conversation_file.exists():
-                conversation_file.unlink()
-                return True
-            return False
+            return self.conversation_store.delete(conversation_id)
         except Exception as e:
             print(f"删除对话失败: {e}")
             return False
 
     def cleanup_expired_conversations(self, hours: int = 24) -> int:
-        """清理过期的对话"""
+        """清理过期的对话（从按更新时间排序的索引中取出过期项）"""
         try:
-            conversations_dir = self.data_root / "conversations"
-            if not conversations_dir.exists():
-                return 0
-            
-            cutoff_time = datetime.now() - timedelta(hours=hours)
+            cutoff_time = (datetime.now() - timedelta(hours=hours)).isoformat()
             deleted_count = 0
             
-            for filename in os.listdir(conversations_dir):
-                if filename.endswith('.json'):
-                    conversation_file = conversations_dir / filename
-                    conversation = self._read_json_file(conversation_file)
-                    
-                    if conversation:
-                        updated_at = datetime.fromisoformat(conversation.get("updated_at", "1970-01-01T00:00:00"))
-                        if updated_at < cutoff_time:
-                            conversation_file.unlink()
-                            deleted_count += 1
+            for conversation_id in self.conversation_store.expired_conversation_ids(cutoff_time):
+                if self.conversation_store.delete(conversation_id):
+                    deleted_count += 1
             
             return deleted_count
         except Exception as e:
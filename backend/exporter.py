@@ -0,0 +1,260 @@
+import csv
+import io
+import json
+import os
+import threading
+import uuid
+import zipfile
+import zlib
+from datetime import datetime
+from typing import Dict, Any, Iterator, List, Optional, Callable
+from data_service import data_service
+from record_index import challenge_index, history_index, auto_solve_index
+from logger import get_logger
+
+EXPORT_DATA_TYPES = ["challenges", "history", "auto_solves", "configs"]
+EXPORT_FORMATS = ["json", "jsonl", "csv"]
+MEDIA_TYPES = {
+    "json": "application/json",
+    "jsonl": "application/x-ndjson",
+    "csv": "text/csv",
+    "zip": "application/zip"
+}
+
+_INDEXES = {
+    "challenges": challenge_index,
+    "history": history_index,
+    "auto_solves": auto_solve_index
+}
+
+
+def iter_records(data_type: str) -> Iterator[Dict[str, Any]]:
+    """逐条读取记录（按时间从新到旧），不在内存中保留整个数据集"""
+    if data_type == "configs":
+        for file_path in sorted(data_service.configs_dir.glob("*.json")):
+            config_data = data_service._read_json_file(file_path)
+            if config_data is not None:
+                yield {"name": file_path.stem, "data": config_data}
+        return
+    index = _INDEXES.get(data_type)
+    if index is None:
+        raise ValueError(f"不支持的数据类型: {data_type}")
+    for file_path in index.paths():
+        record = data_service._read_json_file(file_path)
+        if record:
+            yield record
+
+
+def count_records(data_type: str) -> int:
+    if data_type == "configs":
+        return len(list(data_service.configs_dir.glob("*.json")))
+    return _INDEXES[data_type].count()
+
+
+def flatten_record(record: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    """展开嵌套字典（键以 . 连接），列表序列化为JSON字符串，用于CSV导出"""
+    flat = {}
+    for key, value in record.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_record(value, f"{name}."))
+        elif isinstance(value, list):
+            flat[name] = json.dumps(value, ensure_ascii=False)
+        else:
+            flat[name] = value
+    return flat
+
+
+def _csv_header(data_type: str) -> List[str]:
+    """第一遍遍历收集所有记录展开后的字段（按首次出现顺序），只保存字段名"""
+    header: Dict[str, None] = {}
+    for record in iter_records(data_type):
+        for key in flatten_record(record):
+            header.setdefault(key, None)
+    return list(header)
+
+
+def iter_export_chunks(data_type: str, format: str = "jsonl",
+                       on_record: Optional[Callable[[], None]] = None) -> Iterator[bytes]:
+    """
+    按指定格式逐条生成导出内容
+
+    Args:
+        data_type: 数据类型
+        format: json、jsonl 或 csv
+        on_record: 每写出一条记录后的回调，用于进度统计
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {format}")
+
+    if format == "csv":
+        header = _csv_header(data_type)
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=header, extrasaction="ignore")
+        writer.writeheader()
+        # 以UTF-8 BOM开头，便于表格软件识别中文
+        yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+        for record in iter_records(data_type):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(flatten_record(record))
+            yield buffer.getvalue().encode("utf-8")
+            if on_record:
+                on_record()
+        return
+
+    if format == "json":
+        yield b"["
+    first = True
+    for record in iter_records(data_type):
+        line = json.dumps(record, ensure_ascii=False)
+        if format == "json":
+            yield (line if first else "," + line).encode("utf-8")
+        else:
+            yield (line + "\n").encode("utf-8")
+        first = False
+        if on_record:
+            on_record()
+    if format == "json":
+        yield b"]"
+
+
+def gzip_chunks(chunks: Iterator[bytes], level: int = 6) -> Iterator[bytes]:
+    """流式gzip压缩"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_filename(data_type: str, format: str, compress: bool = False) -> str:
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"export_{data_type}_{timestamp}.{format}" + (".gz" if compress else "")
+
+
+class ExportJobManager:
+    """导出任务管理
+
+    导出文件先写入临时文件，完成后重命名，导出目录中不会出现写了一半的文件。
+    全量归档（所有数据类型打包为zip）和大数据量导出作为后台任务运行，可查询进度。
+    """
+
+    def __init__(self, max_jobs: int = 50):
+        self.logger = get_logger("exporter")
+        self.max_jobs = max_jobs
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def export_to_file(self, data_type: str, format: str = "json", compress: bool = False,
+                       job: Optional[Dict[str, Any]] = None, keep_empty: bool = True) -> Dict[str, Any]:
+        """导出到导出目录，返回文件名和记录数（keep_empty 为 False 时没有记录则不生成文件，filename 为 None）"""
+        if data_type == "all":
+            return self._export_archive(job)
+
+        filename = export_filename(data_type, format, compress)
+        file_path = data_service.exports_dir / filename
+        temp_path = file_path.with_name(f".{filename}.tmp")
+        counter = {"records": 0}
+
+        def on_record():
+            counter["records"] += 1
+            if job is not None:
+                job["processed"] += 1
+
+        chunks = iter_export_chunks(data_type, format, on_record)
+        if compress:
+            chunks = gzip_chunks(chunks)
+        try:
+            with open(temp_path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            if not counter["records"] and not keep_empty:
+                return {"filename": None, "file_path": None, "data_count": 0, "size": 0}
+            os.replace(temp_path, file_path)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+        return {"filename": filename, "file_path": str(file_path), "data_count": counter["records"],
+                "size": file_path.stat().st_size}
+
+    def _export_archive(self, job: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """将所有数据类型导出为JSONL并打包为zip"""
+        filename = export_filename("all", "zip")
+        file_path = data_service.exports_dir / filename
+        temp_path = file_path.with_name(f".{filename}.tmp")
+        total_records = 0
+        try:
+            with zipfile.ZipFile(temp_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                for data_type in EXPORT_DATA_TYPES:
+                    with archive.open(f"{data_type}.jsonl", "w", force_zip64=True) as member:
+                        for record in iter_records(data_type):
+                            member.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+                            total_records += 1
+                            if job is not None:
+                                job["processed"] += 1
+            os.replace(temp_path, file_path)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+        return {"filename": filename, "file_path": str(file_path), "data_count": total_records,
+                "size": file_path.stat().st_size}
+
+    # 后台任务
+    def create_job(self, data_type: str, format: str = "jsonl", compress: bool = False) -> Dict[str, Any]:
+        if data_type != "all" and data_type not in EXPORT_DATA_TYPES:
+            raise ValueError(f"不支持的数据类型: {data_type}")
+        if data_type != "all" and format not in EXPORT_FORMATS:
+            raise ValueError(f"不支持的导出格式: {format}")
+        types = EXPORT_DATA_TYPES if data_type == "all" else [data_type]
+        job = {
+            "id": str(uuid.uuid4()),
+            "data_type": data_type,
+            "format": "zip" if data_type == "all" else format,
+            "compress": compress,
+            "status": "pending",
+            "processed": 0,
+            "total": sum(count_records(t) for t in types),
+            "result": None,
+            "error": None,
+            "created_at": datetime.now().isoformat(),
+            "finished_at": None
+        }
+        with self._lock:
+            self.jobs[job["id"]] = job
+            # 只保留最近的任务记录
+            while len(self.jobs) > self.max_jobs:
+                oldest = next(iter(self.jobs))
+                if self.jobs[oldest]["status"] in ("pending", "running"):
+                    break
+                del self.jobs[oldest]
+        return job
+
+    def run_job(self, job_id: str):
+        """执行导出任务（在后台线程中调用）"""
+        job = self.jobs[job_id]
+        job["status"] = "running"
+        try:
+            job["result"] = self.export_to_file(job["data_type"], job["format"], job["compress"], job)
+            job["status"] = "completed"
+            self.logger.info(f"导出任务完成: {job['result']['filename']}，共 {job['processed']} 条记录")
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            self.logger.error(f"导出任务失败 {job_id}: {e}")
+        finally:
+            job["finished_at"] = datetime.now().isoformat()
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        progress = job["processed"] / job["total"] if job["total"] else (1.0 if job["status"] == "completed" else 0.0)
+        return {**job, "progress": round(min(progress, 1.0), 4)}
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        return [self.get_job(job_id) for job_id in reversed(list(self.jobs))]
+
+# 全局实例
+export_manager = ExportJobManager()
@@ -0,0 +1,421 @@
+import io
+import json
+import time
+import zipfile
+from pathlib import PurePosixPath
+from typing import Dict, Any, Iterator, List, Optional, Tuple, BinaryIO
+from data_service import data_service
+from record_index import challenge_index, challenge_content_hash, CHALLENGE_TYPES
+from config import config
+from logger import get_logger
+from upload_store import UploadTooLargeError
+from analyzers.archive import ArchiveLimitError, ByteQuota, LimitedReader, RATIO_SLACK
+
+IMPORT_DATA_TYPES = ["challenges", "tools", "templates"]
+CONFLICT_POLICIES = ["skip", "update"]
+
+# 归档中各数据类型对应的成员文件名（不含扩展名）
+_MEMBER_STEMS = {
+    "challenges": {"challenges"},
+    "tools": {"tools"},
+    "templates": {"templates", "solve_templates"}
+}
+# 流式解析JSON数组时每次读取的字符数
+_JSON_CHUNK_CHARS = 64 * 1024
+# JSON 文档中包裹记录列表的键
+_LIST_KEYS = {
+    "challenges": "challenges",
+    "tools": "tools",
+    "templates": "templates"
+}
+
+
+def _validate_challenge(record: Dict[str, Any]) -> Dict[str, Any]:
+    description = record.get("description")
+    if not isinstance(description, str) or not description.strip():
+        raise ValueError("缺少题目描述 description")
+    challenge_type = record.get("type")
+    if challenge_type not in CHALLENGE_TYPES:
+        raise ValueError(f"无效的题目类型: {challenge_type}")
+    challenge_id = record.get("id")
+    if challenge_id is not None and (not isinstance(challenge_id, str) or "/" in challenge_id
+                                     or "\\" in challenge_id or challenge_id in ("", ".", "..")):
+        raise ValueError(f"无效的题目ID: {challenge_id}")
+    return {
+        "id": challenge_id,
+        "description": description,
+        "type": challenge_type,
+        "ai_response": record.get("ai_response") or "",
+        "file_name": record.get("file_name"),
+        "timestamp": record.get("timestamp") if isinstance(record.get("timestamp"), str) else None
+    }
+
+
+def _validate_tool(record: Dict[str, Any]) -> Dict[str, Any]:
+    name = record.get("name")
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError("缺少工具名称 name")
+    if not record.get("category"):
+        raise ValueError("缺少工具分类 category")
+    tags = record.get("tags") or []
+    if not isinstance(tags, list):
+        raise ValueError("tags 必须是列表")
+    return {
+        "name": name.strip(),
+        "description": record.get("description", ""),
+        "command": record.get("command", ""),
+        "category": record["category"],
+        "difficulty": record.get("difficulty", "beginner"),
+        "url": record.get("url", ""),
+        "tags": tags
+    }
+
+
+def _validate_template(record: Dict[str, Any]) -> Dict[str, Any]:
+    name = record.get("name")
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError("缺少模板名称 name")
+    parameters = record.get("parameters") or {}
+    if not isinstance(parameters, dict):
+        raise ValueError("parameters 必须是对象")
+    return {
+        "name": name.strip(),
+        "category": record.get("category", ""),
+        "description": record.get("description", ""),
+        "template_code": record.get("template_code", ""),
+        "parameters": parameters,
+        "is_active": bool(record.get("is_active", True)),
+        "created_at": record.get("created_at") or data_service._get_timestamp()
+    }
+
+
+_VALIDATORS = {
+    "challenges": _validate_challenge,
+    "tools": _validate_tool,
+    "templates": _validate_template
+}
+
+
+class _SizeLimitedStream(io.RawIOBase):
+    """读取或定位超过大小限制时抛出 UploadTooLargeError 的只读流包装"""
+
+    def __init__(self, stream: BinaryIO, limit: int):
+        self._stream = stream
+        self.limit = limit
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        if self._stream.tell() > self.limit:
+            raise UploadTooLargeError(self.limit)
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        position = self._stream.seek(offset, whence)
+        if position > self.limit:
+            raise UploadTooLargeError(self.limit)
+        return position
+
+    def tell(self) -> int:
+        return self._stream.tell()
+
+
+class _MemberStream(io.RawIOBase):
+    """把按配额计数的 LimitedReader 包装成可供 BufferedReader/TextIOWrapper 使用的原始流"""
+
+    def __init__(self, reader: LimitedReader):
+        self._reader = reader
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._reader.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class ImportReport:
+    """导入结果统计，错误只保留前 max_errors 条"""
+
+    def __init__(self, data_type: str, max_errors: int):
+        self.data_type = data_type
+        self.max_errors = max_errors
+        self.total = 0
+        self.imported = 0
+        self.updated = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.errors: List[Dict[str, Any]] = []
+        self.started = time.perf_counter()
+
+    def error(self, source: str, line: Optional[int], message: str):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"source": source, "line": line, "error": message})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "data_type": self.data_type,
+            "total": self.total,
+            "imported": self.imported,
+            "updated": self.updated,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+            "took_ms": round((time.perf_counter() - self.started) * 1000, 1)
+        }
+
+
+def _iter_jsonl(stream: BinaryIO, source: str) -> Iterator[Tuple[str, int, Any]]:
+    """逐行解析JSONL，解析失败的行以异常对象返回，不中断后续行"""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", errors="strict", newline=None)
+    line_number = 0
+    try:
+        for line in text:
+            line_number += 1
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield source, line_number, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield source, line_number, ValueError(f"JSON解析失败: {e.msg}")
+    except UnicodeDecodeError:
+        yield source, line_number + 1, ValueError("文件不是有效的UTF-8编码")
+    finally:
+        text.detach()
+
+
+def _iter_json_array(text: io.TextIOBase, buffer: str, source: str) -> Iterator[Tuple[str, int, Any]]:
+    """逐条解析顶层JSON数组，buffer 为已读入且去掉开头 "[" 的文本，内存中只保留当前记录附近的数据"""
+    decoder = json.JSONDecoder()
+    offset, position, eof = 0, 0, False
+    while True:
+        while offset < len(buffer) and buffer[offset] in " \t\r\n,":
+            offset += 1
+        if offset == len(buffer):
+            if eof:
+                yield source, position + 1, ValueError("JSON解析失败: 数组不完整")
+                return
+            chunk = text.read(_JSON_CHUNK_CHARS)
+            buffer, offset, eof = chunk, 0, not chunk
+            continue
+        if buffer[offset] == "]":
+            return
+        try:
+            record, end = decoder.raw_decode(buffer, offset)
+            # 值恰好停在缓冲区末尾时可能被截断（如数字），读入更多数据后重新解析
+            complete = end < len(buffer) or eof
+        except json.JSONDecodeError as e:
+            if eof:
+                yield source, position + 1, ValueError(f"JSON解析失败: {e.msg}")
+                return
+            complete = False
+        if not complete:
+            chunk = text.read(_JSON_CHUNK_CHARS)
+            buffer, offset, eof = buffer[offset:] + chunk, 0, not chunk
+            continue
+        position += 1
+        yield source, position, record
+        offset = end
+
+
+def _iter_json_document(stream: BinaryIO, source: str, data_type: str) -> Iterator[Tuple[str, int, Any]]:
+    """解析单个JSON文档：记录列表、{"<类型>": [...]} 或单条记录
+
+    顶层为数组（导出格式）时逐条流式解析，其余形式整体解析。
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", errors="strict", newline=None)
+    try:
+        head, chunk = "", " "
+        while not head and chunk:
+            chunk = text.read(_JSON_CHUNK_CHARS)
+            head = chunk.lstrip()
+        if head.startswith("["):
+            yield from _iter_json_array(text, head[1:], source)
+            return
+        document = json.loads(head + text.read())
+    except json.JSONDecodeError as e:
+        yield source, None, ValueError(f"JSON解析失败: {e}")
+        return
+    except UnicodeDecodeError:
+        yield source, None, ValueError("文件不是有效的UTF-8编码")
+        return
+    finally:
+        text.detach()
+    if isinstance(document, dict) and isinstance(document.get(_LIST_KEYS[data_type]), list):
+        document = document[_LIST_KEYS[data_type]]
+    if not isinstance(document, list):
+        document = [document]
+    for position, record in enumerate(document, 1):
+        yield source, position, record
+
+
+def _iter_archive(stream: BinaryIO, data_type: str) -> Iterator[Tuple[str, int, Any]]:
+    """遍历zip归档中的JSON/JSONL成员（成员逐个解压读取，不解压到磁盘）
+
+    归档中存在与数据类型同名的成员（如全量导出的 challenges.jsonl）时只导入这些成员，
+    否则导入所有 .json/.jsonl 成员。成员读取沿用上传压缩包解包的防压缩炸弹限制：
+    单个成员超过压缩比时跳过该成员，所有成员解出的总字节数超过限制时停止读取归档。
+    """
+    try:
+        archive = zipfile.ZipFile(stream)
+    except zipfile.BadZipFile:
+        yield "archive", None, ValueError("无效的zip归档")
+        return
+    with archive:
+        members = [info for info in archive.infolist()
+                   if not info.is_dir() and PurePosixPath(info.filename).suffix.lower() in (".json", ".jsonl")
+                   and not PurePosixPath(info.filename).name.startswith(".")]
+        named = [info for info in members if PurePosixPath(info.filename).stem in _MEMBER_STEMS[data_type]]
+        members = named or members
+        if len(members) > config.ARCHIVE_MAX_MEMBERS:
+            yield "archive", None, ValueError(f"归档成员超过 {config.ARCHIVE_MAX_MEMBERS} 个，只导入前 {config.ARCHIVE_MAX_MEMBERS} 个")
+            members = members[:config.ARCHIVE_MAX_MEMBERS]
+        total = ByteQuota(config.ARCHIVE_MAX_TOTAL_SIZE, "解出的总大小超过限制")
+        for info in members:
+            ratio = ByteQuota(max(info.compress_size, 1) * config.ARCHIVE_MAX_RATIO + RATIO_SLACK,
+                              "压缩比超过限制", fatal=False)
+            try:
+                with archive.open(info) as member:
+                    limited = io.BufferedReader(_MemberStream(LimitedReader(member, [ratio, total])))
+                    if info.filename.lower().endswith(".jsonl"):
+                        yield from _iter_jsonl(limited, info.filename)
+                    else:
+                        yield from _iter_json_document(limited, info.filename, data_type)
+            except ArchiveLimitError as e:
+                yield info.filename, None, ValueError(f"{e}，已停止读取该成员")
+                if e.fatal:
+                    return
+
+
+def iter_source_records(stream: BinaryIO, filename: str, data_type: str) -> Iterator[Tuple[str, int, Any]]:
+    """按文件类型逐条产出 (来源, 行号, 记录或解析错误)"""
+    head = stream.read(4)
+    stream.seek(0)
+    lower_name = (filename or "").lower()
+    if head == b"PK\x03\x04" or lower_name.endswith(".zip"):
+        yield from _iter_archive(stream, data_type)
+    elif lower_name.endswith(".json"):
+        yield from _iter_json_document(stream, filename, data_type)
+    else:
+        yield from _iter_jsonl(stream, filename or "upload")
+
+
+class Importer:
+    """批量导入题目、工具和解题模板
+
+    导入文件逐行解析和校验，单条记录出错只记入报告不中断导入。
+    题目按内容哈希（类型 + 描述）和ID去重，按批写入；工具和模板按名称去重，
+    全部记录校验完成后一次性合并写入配置文件。
+    """
+
+    def __init__(self):
+        self.logger = get_logger("importer")
+
+    @staticmethod
+    def _existing_challenges() -> Tuple[set, set]:
+        """已有题目的ID集合和内容哈希集合（来自题目索引，不读取题目文件）"""
+        return challenge_index.field_values("id"), challenge_index.field_values("content_hash")
+
+    def import_stream(self, stream: BinaryIO, filename: str, data_type: str,
+                      on_conflict: str = "skip", max_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        从上传文件导入记录
+
+        Args:
+            stream: 可seek的二进制文件对象
+            filename: 原始文件名（用于判断 .zip/.json/.jsonl）
+            data_type: challenges、tools 或 templates
+            on_conflict: 同名工具/模板的处理方式，skip 跳过或 update 覆盖；题目重复时总是跳过
+            max_size: 文件大小限制，默认为 IMPORT_MAX_FILE_SIZE
+
+        Returns:
+            导入报告
+
+        Raises:
+            UploadTooLargeError: 文件超过大小限制（在写入任何记录之前检查）
+        """
+        if data_type not in IMPORT_DATA_TYPES:
+            raise ValueError(f"不支持的数据类型: {data_type}")
+        if on_conflict not in CONFLICT_POLICIES:
+            raise ValueError(f"不支持的冲突处理方式: {on_conflict}")
+        limited = _SizeLimitedStream(stream, config.IMPORT_MAX_FILE_SIZE if max_size is None else max_size)
+        # 先定位到末尾检查大小，超过限制时不导入任何记录
+        limited.seek(0, io.SEEK_END)
+        limited.seek(0)
+        stream = io.BufferedReader(limited)
+
+        report = ImportReport(data_type, config.IMPORT_MAX_ERRORS)
+        validate = _VALIDATORS[data_type]
+        if data_type == "challenges":
+            existing_ids, existing_hashes = self._existing_challenges()
+            batch: List[Dict[str, Any]] = []
+        else:
+            pending: Dict[str, Dict[str, Any]] = {}
+
+        for source, line, record in iter_source_records(stream, filename, data_type):
+            report.total += 1
+            if isinstance(record, Exception):
+                report.error(source, line, str(record))
+                continue
+            if not isinstance(record, dict):
+                report.error(source, line, "记录必须是JSON对象")
+                continue
+            try:
+                record = validate(record)
+            except ValueError as e:
+                report.error(source, line, str(e))
+                continue
+
+            if data_type == "challenges":
+                content_hash = challenge_content_hash(record["type"], record["description"])
+                if content_hash in existing_hashes or (record["id"] and record["id"] in existing_ids):
+                    report.duplicates += 1
+                    continue
+                existing_hashes.add(content_hash)
+                if record["id"]:
+                    existing_ids.add(record["id"])
+                batch.append(record)
+                if len(batch) >= config.IMPORT_BATCH_SIZE:
+                    self._flush_challenges(batch, report)
+                    batch = []
+            else:
+                # 同一文件中的同名记录以后出现的为准
+                if record["name"] in pending:
+                    report.duplicates += 1
+                pending[record["name"]] = record
+
+        if data_type == "challenges":
+            self._flush_challenges(batch, report)
+        elif pending:
+            merge = data_service.merge_tools if data_type == "tools" else data_service.merge_templates
+            result = merge(list(pending.values()), overwrite=on_conflict == "update")
+            report.imported += result["added"]
+            report.updated += result["updated"]
+            report.duplicates += result["duplicates"]
+
+        result = report.to_dict()
+        self.logger.info(f"导入{data_type}完成: 共 {report.total} 条, 新增 {report.imported}, 更新 {report.updated}, "
+                         f"重复 {report.duplicates}, 失败 {report.failed}, 耗时 {result['took_ms']}ms")
+        return result
+
+    @staticmethod
+    def _flush_challenges(batch: List[Dict[str, Any]], report: ImportReport):
+        if not batch:
+            return
+        saved = data_service.save_challenges_bulk(batch)
+        report.imported += len(saved)
+        for _ in range(len(batch) - len(saved)):
+            report.error("write", None, "写入题目文件失败")
+
+# 全局实例
+importer = Importer()
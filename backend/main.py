@@ -1,7 +1,7 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Body, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Body, BackgroundTasks, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import PlainTextResponse, FileResponse
+from fastapi.responses import PlainTextResponse, FileResponse, StreamingResponse
 from sqlalchemy.orm import Session
 import os
 from dotenv import load_dotenv
@@ -10,20 +10,33 @@ from datetime import datetime
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import asyncio
-import mimetypes
-import magic
+import functools
+from pathlib import Path
+from contextlib import asynccontextmanager
 
 from database import SessionLocal, engine, Base
 from models import Question, Tool, AutoSolve, SolveTemplate
-from schemas import QuestionCreate, QuestionResponse, ToolResponse, AnalysisRequest, AutoSolveRequest, AutoSolveResponse, SolveTemplateCreate, SolveTemplateResponse, CodeExecutionRequest, CodeExecutionResponse, ConversationCreateRequest, MessageRequest
+from schemas import QuestionCreate, QuestionResponse, ToolResponse, AnalysisRequest, AutoSolveRequest, AutoSolveResponse, SolveTemplateCreate, SolveTemplateResponse, CodeExecutionRequest, CodeExecutionResponse, ConversationCreateRequest, MessageRequest, ClassifyRequest, BatchAnalyzeRequest, OfflineBatchRequest
 from ai_service import AIService, extract_structured_content
 from auto_solver import AutoSolver
-from utils import detect_question_type, get_recommended_tools
+from utils import get_recommended_tools
+from classifier import question_classifier
+from batch_service import batch_service, STREAM_FORMATS, STREAM_MEDIA_TYPES
+from offline_batch import offline_batch_manager
 from config import config
 from logger import get_logger
 from cache import ai_response_cache
 from data_service import data_service
 from conversation_service import conversation_service
+from maintenance import maintenance_scheduler
+from stats_service import stats_service
+from record_index import challenge_index, history_index, auto_solve_index
+from search_index import search_index
+from retrieval_index import similarity_index
+from exporter import export_manager, iter_export_chunks, gzip_chunks, export_filename, EXPORT_DATA_TYPES, EXPORT_FORMATS, MEDIA_TYPES
+from importer import importer, IMPORT_DATA_TYPES, CONFLICT_POLICIES
+from upload_store import upload_store, UploadTooLargeError
+from analyzers import analysis_pipeline, detect_file
 
 # 加载环境变量
 load_dotenv()
@@ -49,11 +62,35 @@ os.makedirs(os.path.dirname(config.LOG_FILE), exist_ok=True)
 if config.ENABLE_AUTO_BACKUP:
     os.makedirs(config.BACKUP_DIR, exist_ok=True)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：加载统计数据，启动和停止后台定时维护任务"""
+    await asyncio.to_thread(stats_service.load)
+    # 检索索引首次构建可能较慢，在后台执行（相似题目索引构建完成前分析不附加相似题解）
+    search_build = asyncio.create_task(asyncio.to_thread(search_index.ensure_built))
+    similarity_build = asyncio.create_task(asyncio.to_thread(similarity_index.ensure_built))
+    if config.ENABLE_MAINTENANCE:
+        await maintenance_scheduler.start()
+    offline_batch_manager.resume_pending()
+    try:
+        yield
+    finally:
+        await asyncio.gather(search_build, similarity_build, return_exceptions=True)
+        await batch_service.shutdown()
+        await offline_batch_manager.shutdown()
+        analysis_pipeline.shutdown()
+        if config.ENABLE_MAINTENANCE:
+            await maintenance_scheduler.stop()
+        else:
+            data_service.flush_conversations()
+            stats_service.persist()
+
 app = FastAPI(
     title="CTF智能分析平台",
     description="支持多AI提供者的CTF题目智能分析平台，包括DeepSeek、硅基流动、本地模型和OpenAI兼容API",
     version="2.1.0",
-    debug=config.DEBUG
+    debug=config.DEBUG,
+    lifespan=lifespan
 )
 
 # CORS配置
@@ -64,6 +101,7 @@ if config.ENABLE_CORS:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor"],
     )
     logger.info(f"CORS已启用，允许的源: {config.ALLOWED_ORIGINS}")
 
@@ -146,7 +184,7 @@ async def health_check():
 @app.post("/api/analyze")
 async def analyze_challenge(
     description: str = Form(...),
-    question_type: str = Form(...),
+    question_type: Optional[str] = Form(None),
     ai_provider: Optional[str] = Form(None),
     user_id: Optional[str] = Form(None),
     conversation_id: Optional[str] = Form(None),
@@ -154,15 +192,8 @@ async def analyze_challenge(
     file: Optional[UploadFile] = File(None),
     file_type: Optional[str] = Form(None)
 ):
-    """分析CTF题目，支持多模态文件上传"""
+    """分析CTF题目，支持多模态文件上传（question_type 为空或 auto 时自动判断题目类型）"""
     try:
-        # 验证文件大小
-        if file and file.size > config.MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=413, 
-                detail=f"文件大小超过限制 ({config.MAX_FILE_SIZE} 字节)"
-            )
-        
         # 验证文件类型
         if file:
             allowed_types = config.ALLOWED_FILE_TYPES
@@ -175,30 +206,26 @@ async def analyze_challenge(
                     detail=f"不支持的文件类型: {file.content_type}"
                 )
         
-        # 文件类型自动识别
+        # 上传文件流式写入内容寻址存储（边写边校验大小），之后只传递文件路径
         detected_type = None
-        file_content = None
+        stored_file = None
+        file_detection = None
         if file:
-            file_content = await file.read()
-            detected_type = file_type or file.content_type or mimetypes.guess_type(file.filename)[0]
-            if not detected_type and file_content:
-                try:
-                    detected_type = magic.from_buffer(file_content, mime=True)
-                except Exception:
-                    detected_type = None
-
-        # 多模态分析分发
-        multimodal_context = {}
-        if detected_type:
-            if detected_type.startswith("image/"):
-                # 图片分析（如OCR/隐写）
-                multimodal_context["image"] = file_content
-            elif detected_type in ["application/vnd.tcpdump.pcap", "application/octet-stream"] and file.filename.endswith(".pcap"):
-                multimodal_context["pcap"] = file_content
-            elif detected_type in ["application/x-executable", "application/x-dosexec", "application/octet-stream"]:
-                multimodal_context["binary"] = file_content
-            else:
-                multimodal_context["file"] = file_content
+            stored_file = await upload_store.save(file)
+            # 只读取文件开头和结尾几KB，按签名表、libmagic和扩展名识别类型（客户端声明的类型只作为兜底）
+            if stored_file["size"]:
+                file_detection = detect_file(stored_file["path"], file.filename, file.content_type)
+            detected_type = file_type or (file_detection or {}).get("mime") or file.content_type
+
+        classification = None
+        if not question_type or question_type == "auto":
+            classification = question_classifier.classify(description, file.filename if file else None, file_detection)
+            question_type = classification["type"]
+
+        # 上传文件预分析（按注册表匹配预分析并在时间预算内并发执行）
+        file_analysis = None
+        if stored_file:
+            file_analysis = await analysis_pipeline.run(stored_file, detected_type, file_type=file_detection)
 
         # 创建或获取对话会话
         conv_id = conversation_id
@@ -214,21 +241,16 @@ async def analyze_challenge(
             metadata={"question_type": question_type, "ai_provider": ai_provider, "file_type": detected_type}
         )
 
-        # 构建多轮对话提示词（可拼接文件摘要/特征）
-        enhanced_prompt = description
-        if multimodal_context:
-            enhanced_prompt += f"\n\n[文件类型: {detected_type}, 文件名: {file.filename}]"
-            # TODO: 可插入自动摘要/特征提取
-
         # 调用AI分析
         if ai_provider and ai_provider != ai_service.provider_type:
             ai_service.switch_provider(ai_provider)
         response = await ai_service.analyze_challenge(
-            enhanced_prompt,
+            description,
             question_type,
             user_id=user_id,
             use_context=use_context,
-            conversation_id=conv_id
+            conversation_id=conv_id,
+            file_context=file_analysis["context"] if file_analysis else None
         )
         conversation_service.add_message(
             conversation_id=conv_id,
@@ -238,15 +260,18 @@ async def analyze_challenge(
         )
         analysis_data = {
             "description": description,
+            "type": question_type,
             "question_type": question_type,
             "ai_response": response,
             "ai_provider": ai_service.provider_type,
             "conversation_id": conv_id,
             "use_context": use_context,
             "file_type": detected_type,
-            "file_name": file.filename if file else None
+            "file_name": file.filename if file else None,
+            "file_sha256": stored_file["sha256"] if stored_file else None,
+            "type_classified": classification is not None
         }
-        data_service.save_analysis_history(analysis_data)
+        data_service.save_analysis_history(None, analysis_data)
         structured = extract_structured_content(response)
         return {
             "success": True,
@@ -254,44 +279,147 @@ async def analyze_challenge(
             "structured": structured,
             "conversation_id": conv_id,
             "ai_provider": ai_service.provider_type,
-            "file_type": detected_type
+            "question_type": question_type,
+            "classification": classification,
+            "file_type": detected_type,
+            "file_detection": file_detection,
+            "file_analysis": {
+                "analyzers": file_analysis["analyzers"],
+                "stages": file_analysis["stages"],
+                "elapsed_ms": file_analysis["elapsed_ms"]
+            } if file_analysis else None
         }
     except HTTPException:
         raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         logger.error(f"分析题目失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"分析题目失败: {str(e)}")
 
+def _batch_stream(batch_id: str, format: str) -> StreamingResponse:
+    if format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的格式: {format}")
+    return StreamingResponse(
+        batch_service.stream(batch_id, format),
+        media_type=STREAM_MEDIA_TYPES[format],
+        headers={"Cache-Control": "no-cache", "X-Batch-Id": batch_id}
+    )
+
+@app.post("/api/analyze/batch")
+async def analyze_batch(request: BatchAnalyzeRequest, format: str = "ndjson"):
+    """批量分析题目，按完成顺序流式返回结果（format 为 ndjson 或 sse）"""
+    try:
+        record = await asyncio.to_thread(
+            batch_service.create_batch, [item.dict() for item in request.items],
+            request.providers or [ai_service.provider_type], request.use_context, request.user_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    batch_service.start(record["id"])
+    return _batch_stream(record["id"], format)
+
+@app.get("/api/analyze/batch")
+async def list_batches(limit: int = 20):
+    """获取最近的批量分析记录"""
+    return {"batches": await asyncio.to_thread(batch_service.list_batches, limit)}
+
+@app.get("/api/analyze/batch/{batch_id}")
+async def get_batch(batch_id: str):
+    """获取批量分析记录及各题目的结果"""
+    record = batch_service.get_batch(batch_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="批次不存在")
+    return record
+
+@app.get("/api/analyze/batch/{batch_id}/stream")
+async def stream_batch(batch_id: str, format: str = "ndjson"):
+    """重新订阅批次结果：先返回已完成的题目，运行中的批次继续推送后续结果"""
+    if batch_service.get_batch(batch_id) is None:
+        raise HTTPException(status_code=404, detail="批次不存在")
+    return _batch_stream(batch_id, format)
+
+@app.post("/api/analyze/batch/{batch_id}/resume")
+async def resume_batch(batch_id: str, format: str = "ndjson"):
+    """续跑批次中未完成或失败的题目（批次仍在运行时直接订阅）"""
+    if batch_service.start(batch_id) is None:
+        raise HTTPException(status_code=404, detail="批次不存在")
+    return _batch_stream(batch_id, format)
+
+@app.post("/api/offline-batches")
+async def create_offline_batch(request: OfflineBatchRequest):
+    """创建离线批量分析任务（提供者有批量接口时提交批次，否则本地逐条调用），结果导入分析缓存和历史"""
+    try:
+        job = await asyncio.to_thread(
+            offline_batch_manager.create_job, request.provider,
+            [item.dict() for item in request.items] if request.items else None,
+            request.source, request.question_type, request.limit, request.mode, request.skip_cached
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return offline_batch_manager.start(job["id"])
+
+@app.get("/api/offline-batches")
+async def list_offline_batches(limit: int = 20):
+    """获取最近的离线批量任务"""
+    return {"jobs": await asyncio.to_thread(offline_batch_manager.list_jobs, limit)}
+
+@app.get("/api/offline-batches/{job_id}")
+async def get_offline_batch(job_id: str):
+    """获取离线批量任务的状态和进度"""
+    job = offline_batch_manager.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+@app.post("/api/offline-batches/{job_id}/resume")
+async def resume_offline_batch(job_id: str):
+    """续跑中断或失败的离线批量任务"""
+    job = offline_batch_manager.start(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+@app.post("/api/offline-batches/{job_id}/cancel")
+async def cancel_offline_batch(job_id: str):
+    """取消离线批量任务（已提交的远端批次一并取消）"""
+    job = await offline_batch_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
 @app.post("/api/auto-solve", response_model=AutoSolveResponse)
 async def auto_solve_challenge(
     description: str = Form(...),
-    question_type: str = Form(...),
+    question_type: Optional[str] = Form(None),
     template_id: Optional[str] = Form(None),
     custom_code: Optional[str] = Form(None),
     file: Optional[UploadFile] = File(None),
     file_type: Optional[str] = Form(None)
 ):
-    """自动解题，支持多模态文件上传"""
+    """自动解题，支持多模态文件上传（question_type 为空或 auto 时自动判断题目类型）"""
     try:
-        logger.info(f"收到自动解题请求，题目类型: {question_type}")
-        
-        # 验证文件大小
-        if file and file.size > config.MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=413, 
-                detail=f"文件大小超过限制 ({config.MAX_FILE_SIZE} 字节)"
-            )
-        
-        # 处理文件上传
+        # 处理文件上传（流式写入存储，解题器拿到的是文件路径）
         file_info = {}
+        file_detection = {}
         if file:
-            file_content = await file.read()
+            stored_file = await upload_store.save(file)
+            file_detection = detect_file(stored_file["path"], file.filename, file.content_type) if stored_file["size"] else {}
             file_info = {
-                "file": file_content,
-                "file_type": file_type or file.content_type,
-                "file_name": file.filename
+                "file": stored_file["path"],
+                "file_type": file_type or file_detection.get("mime") or file.content_type,
+                "file_name": file.filename,
+                "file_sha256": stored_file["sha256"],
+                "file_size": stored_file["size"]
             }
+            file_analysis = await analysis_pipeline.run(stored_file, file_info["file_type"], file_type=file_detection or None)
+            file_info["file_summary"] = file_analysis["context"]
         
+        if not question_type or question_type == "auto":
+            question_type = question_classifier.classify(description, file.filename if file else None,
+                                                         file_detection or None)["type"]
+        logger.info(f"收到自动解题请求，题目类型: {question_type}")
+
         # 创建自动解题器
         auto_solver = AutoSolver(ai_service=ai_service)
         
@@ -318,6 +446,8 @@ async def auto_solve_challenge(
         
     except HTTPException:
         raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         logger.error(f"自动解题失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"自动解题失败: {str(e)}")
@@ -348,12 +478,42 @@ async def get_auto_solve_result(solve_id: str):
         logger.error(f"获取解题结果失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"获取解题结果失败: {str(e)}")
 
+async def _query_index(index, response: Response, fields: Optional[str], default_fields: List[str],
+                       limit: int, cursor: Optional[str], **kwargs) -> List[Dict[str, Any]]:
+    """
+    分页查询记录索引，下一页游标通过 X-Next-Cursor 响应头返回
+
+    default_fields 只包含索引中的摘要字段，直接在内存中返回；调用方通过 fields 请求摘要以外的字段时
+    需要读取当前页的记录文件，放到线程中执行，不阻塞事件循环。
+    """
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else default_fields
+    query = functools.partial(index.query, field_list, limit=max(1, min(limit, 500)), cursor=cursor, **kwargs)
+    try:
+        if set(field_list) <= set(default_fields):
+            items, next_cursor = query()
+        else:
+            items, next_cursor = await asyncio.to_thread(query)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
+
 @app.get("/api/auto-solves")
-async def get_auto_solves(question_id: str = None, limit: int = 50):
-    """获取自动解题记录列表"""
+async def get_auto_solves(response: Response, question_id: str = None, status: Optional[str] = None,
+                          limit: int = 50, cursor: Optional[str] = None, fields: Optional[str] = None,
+                          date_from: Optional[str] = None, date_to: Optional[str] = None):
+    """获取自动解题记录列表（游标分页，fields 为逗号分隔的返回字段）"""
     try:
-        auto_solves = data_service.get_auto_solves(question_id=question_id, limit=limit)
-        return auto_solves
+        # generated_code、execution_result、error_message 不在摘要中，需要时通过 fields 指定
+        return await _query_index(
+            auto_solve_index, response, fields,
+            ["id", "question_id", "status", "solve_method", "flag", "execution_time", "created_at", "completed_at"],
+            limit, cursor, filters={"question_id": question_id, "status": status},
+            date_from=date_from, date_to=date_to
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"获取自动解题记录失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"获取自动解题记录失败: {str(e)}")
@@ -520,20 +680,17 @@ async def disable_solve_template(
         raise HTTPException(status_code=500, detail=f"禁用解题模板失败: {str(e)}")
 
 @app.get("/api/challenges")
-async def get_challenges(challenge_type: str = None, limit: int = 50):
-    """获取题目列表"""
+async def get_challenges(response: Response, challenge_type: str = None, limit: int = 50,
+                         cursor: Optional[str] = None, fields: Optional[str] = None,
+                         date_from: Optional[str] = None, date_to: Optional[str] = None):
+    """获取题目列表（游标分页，fields 为逗号分隔的返回字段）"""
     try:
-        challenges = data_service.get_challenges(challenge_type=challenge_type, limit=limit)
-        
-        return [
-            {
-                "id": challenge["id"],
-                "description": challenge["description"][:100] + "..." if len(challenge["description"]) > 100 else challenge["description"],
-                "type": challenge["type"],
-                "timestamp": challenge["timestamp"]
-            }
-            for challenge in challenges
-        ]
+        return await _query_index(
+            challenge_index, response, fields, ["id", "description", "type", "timestamp"],
+            limit, cursor, filters={"type": challenge_type}, date_from=date_from, date_to=date_to
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"获取题目列表失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"获取题目列表失败: {str(e)}")
@@ -552,29 +709,44 @@ async def get_challenge_detail(challenge_id: str):
         raise HTTPException(status_code=500, detail=f"获取题目详情失败: {str(e)}")
 
 @app.get("/api/history")
-async def get_history():
-    """获取分析历史"""
+async def get_history(response: Response, question_type: Optional[str] = None, limit: int = 50,
+                      cursor: Optional[str] = None, fields: Optional[str] = None,
+                      date_from: Optional[str] = None, date_to: Optional[str] = None):
+    """获取分析历史（游标分页，fields 为逗号分隔的返回字段）"""
     try:
-        history = data_service.get_analysis_history(limit=50)
-        return [
-            {
-                "id": h["id"],
-                "challenge_id": h["challenge_id"],
-                "description": h["analysis_data"]["description"][:100] + "..." if len(h["analysis_data"]["description"]) > 100 else h["analysis_data"]["description"],
-                "type": h["analysis_data"]["type"],
-                "timestamp": h["timestamp"]
-            }
-            for h in history
-        ]
+        return await _query_index(
+            history_index, response, fields, ["id", "challenge_id", "description", "type", "timestamp"],
+            limit, cursor, filters={"type": question_type}, date_from=date_from, date_to=date_to
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"获取历史记录失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"获取历史记录失败: {str(e)}")
 
+@app.get("/api/search")
+async def search(q: str, question_type: Optional[str] = None, kind: Optional[str] = None,
+                 date_from: Optional[str] = None, date_to: Optional[str] = None,
+                 limit: int = 20, offset: int = 0, highlight: bool = True):
+    """全文检索题目和分析历史（按相关度排序，kind 为 challenge 或 history）"""
+    if kind and kind not in ("challenge", "history"):
+        raise HTTPException(status_code=400, detail="kind 只支持 challenge 或 history")
+    if not search_index.available:
+        raise HTTPException(status_code=503, detail="全文检索不可用")
+    try:
+        return await asyncio.to_thread(
+            search_index.search, q, question_type, kind, date_from, date_to,
+            max(1, min(limit, 100)), max(offset, 0), highlight
+        )
+    except Exception as e:
+        logger.error(f"全文检索失败: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"全文检索失败: {str(e)}")
+
 @app.get("/api/stats")
 async def get_stats():
     """获取统计信息"""
     try:
-        stats = data_service.get_stats()
+        stats = stats_service.get_stats()
         
         return {
             "total_questions": stats["total_challenges"],
@@ -585,6 +757,17 @@ async def get_stats():
         logger.error(f"获取统计信息失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"获取统计信息失败: {str(e)}")
 
+@app.get("/api/stats/series")
+async def get_stats_series(granularity: str = "hour", metric: str = "challenges",
+                           question_type: Optional[str] = None, limit: int = 24):
+    """获取按小时/按天统计的新增题目或分析数量"""
+    if granularity not in ("hour", "day"):
+        raise HTTPException(status_code=400, detail="granularity 只支持 hour 或 day")
+    if metric not in ("challenges", "analyses"):
+        raise HTTPException(status_code=400, detail="metric 只支持 challenges 或 analyses")
+    limit = max(1, min(limit, 24 * 7 if granularity == "hour" else 90))
+    return stats_service.get_series(granularity, metric, question_type, limit)
+
 @app.get("/api/ai-providers")
 async def get_ai_providers():
     """获取可用的AI提供者"""
@@ -639,6 +822,58 @@ async def get_ai_provider_status():
         logger.error(f"获取AI提供者状态失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"获取AI提供者状态失败: {str(e)}")
 
+@app.get("/api/metrics/tokens")
+async def get_token_metrics():
+    """获取token用量与预估费用统计"""
+    try:
+        return ai_service.get_token_metrics()
+    except Exception as e:
+        logger.error(f"获取token统计失败: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"获取token统计失败: {str(e)}")
+
+@app.get("/api/maintenance/status")
+async def get_maintenance_status():
+    """获取定时维护任务的运行状态"""
+    return maintenance_scheduler.get_status()
+
+@app.get("/api/analyzers")
+async def get_analyzers():
+    """获取注册的上传文件预分析及各阶段的累计耗时统计"""
+    return analysis_pipeline.describe()
+
+@app.post("/api/classify")
+async def classify_question(request: ClassifyRequest):
+    """判断题目类型（items 不为空时批量判断）"""
+    if request.items:
+        if len(request.items) > config.CLASSIFY_BATCH_LIMIT:
+            raise HTTPException(status_code=400, detail=f"批量判断最多 {config.CLASSIFY_BATCH_LIMIT} 条")
+        items = [item.dict() for item in request.items]
+        return {"results": await asyncio.to_thread(question_classifier.classify_batch, items)}
+    if not request.description:
+        raise HTTPException(status_code=400, detail="description 和 items 不能都为空")
+    return question_classifier.classify(request.description, request.file_name, request.file_type)
+
+@app.get("/api/classify/model")
+async def get_classifier_model():
+    """获取题目分类器的关键词数量和本地模型状态"""
+    return question_classifier.stats()
+
+@app.post("/api/classify/train")
+async def train_classifier():
+    """用已保存的题目和分析历史重新训练题目分类模型"""
+    try:
+        return await asyncio.to_thread(question_classifier.train)
+    except Exception as e:
+        logger.error(f"训练题目分类模型失败: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"训练题目分类模型失败: {str(e)}")
+
+@app.post("/api/maintenance/{job_name}/run")
+async def run_maintenance_job(job_name: str):
+    """立即运行一次指定的维护任务"""
+    if job_name not in maintenance_scheduler.jobs:
+        raise HTTPException(status_code=404, detail=f"维护任务不存在: {job_name}")
+    return await maintenance_scheduler.run_job(job_name)
+
 @app.post("/api/conversations")
 async def create_conversation(request: ConversationCreateRequest):
     """创建新的对话会话"""
@@ -753,16 +988,12 @@ async def add_tool(tool: dict = Body(...)):
         if existing_tool:
             raise HTTPException(status_code=400, detail="工具已存在")
         
-        # 生成新的ID
-        tools = data_service.get_tools()
-        max_id = max([t.get('id', 0) for t in tools]) if tools else 0
-        tool['id'] = max_id + 1
-        
-        success = data_service.add_tool(tool)
-        if not success:
+        # 注册表在锁内分配ID并写入
+        created_tool = data_service.add_tool(tool)
+        if not created_tool:
             raise HTTPException(status_code=500, detail="添加工具失败")
         
-        return {"success": True, "tool": tool}
+        return {"success": True, "tool": created_tool}
     except Exception as e:
         logger.error(f"添加工具失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"添加工具失败: {str(e)}")
@@ -817,42 +1048,95 @@ async def save_user_config(config: dict = Body(...)):
         logger.error(f"保存用户配置失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"保存用户配置失败: {str(e)}")
 
+def _validate_export(data_type: str, format: str):
+    if data_type not in EXPORT_DATA_TYPES:
+        raise HTTPException(status_code=400, detail=f"不支持的数据类型: {data_type}")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的导出格式: {format}")
+
 @app.post("/api/export/{data_type}")
-async def export_data(data_type: str, format: str = "json"):
-    """导出数据"""
-    try:
-        if data_type == "history":
-            data = data_service.get_analysis_history(limit=1000)
-        elif data_type == "challenges":
-            data = data_service.get_challenges(limit=1000)
-        elif data_type == "configs":
-            data = [data_service.get_all_configs()]
-        else:
-            raise HTTPException(status_code=400, detail=f"不支持的数据类型: {data_type}")
-        
-        if not data:
+async def export_data(data_type: str, background_tasks: BackgroundTasks, format: str = "json", compress: bool = False):
+    """导出数据到导出目录（data_type 为 all 时创建全量归档后台任务）"""
+    if data_type == "all":
+        job = export_manager.create_job("all")
+        background_tasks.add_task(export_manager.run_job, job["id"])
+        return {"success": True, "job": export_manager.get_job(job["id"])}
+    _validate_export(data_type, format)
+    try:
+        result = await asyncio.to_thread(export_manager.export_to_file, data_type, format, compress, keep_empty=False)
+        if not result["data_count"]:
             raise HTTPException(status_code=404, detail=f"没有找到{data_type}数据")
-        
-        file_path = data_service.export_data(data_type, data, format)
-        filename = file_path.split("/")[-1]
-        
-        return {
-            "success": True,
-            "filename": filename,
-            "file_path": file_path,
-            "data_count": len(data),
-            "format": format
-        }
+        return {"success": True, "format": format, **result}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"导出{data_type}失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
 
+@app.get("/api/export/{data_type}/stream")
+async def stream_export(data_type: str, format: str = "jsonl", compress: bool = False):
+    """直接流式下载导出内容（不生成临时文件）"""
+    _validate_export(data_type, format)
+    chunks = iter_export_chunks(data_type, format)
+    if compress:
+        chunks = gzip_chunks(chunks)
+    filename = export_filename(data_type, format, compress)
+    return StreamingResponse(
+        chunks,
+        media_type="application/gzip" if compress else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.post("/api/export-jobs")
+async def create_export_job(background_tasks: BackgroundTasks, data_type: str = Body(...),
+                            format: str = Body("jsonl"), compress: bool = Body(False)):
+    """创建后台导出任务（data_type 为 all 时打包所有数据）"""
+    try:
+        job = export_manager.create_job(data_type, format, compress)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    background_tasks.add_task(export_manager.run_job, job["id"])
+    return export_manager.get_job(job["id"])
+
+@app.get("/api/export-jobs")
+async def list_export_jobs():
+    """获取导出任务列表"""
+    return export_manager.list_jobs()
+
+@app.get("/api/export-jobs/{job_id}")
+async def get_export_job(job_id: str):
+    """获取导出任务进度"""
+    job = export_manager.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="导出任务不存在")
+    return job
+
+@app.post("/api/import/{data_type}")
+async def import_data(data_type: str, file: UploadFile = File(...), on_conflict: str = Form("skip")):
+    """批量导入题目、工具或解题模板（JSONL、JSON 或 zip 归档），返回逐条错误报告"""
+    if data_type not in IMPORT_DATA_TYPES:
+        raise HTTPException(status_code=400, detail=f"不支持的数据类型，可选: {', '.join(IMPORT_DATA_TYPES)}")
+    if on_conflict not in CONFLICT_POLICIES:
+        raise HTTPException(status_code=400, detail=f"不支持的冲突处理方式，可选: {', '.join(CONFLICT_POLICIES)}")
+    if file.size is not None and file.size > config.IMPORT_MAX_FILE_SIZE:
+        raise HTTPException(status_code=413, detail=f"文件大小超过限制 ({config.IMPORT_MAX_FILE_SIZE} 字节)")
+    try:
+        report = await asyncio.to_thread(importer.import_stream, file.file, file.filename, data_type, on_conflict)
+        return {"success": True, **report}
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        logger.error(f"导入{data_type}失败: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"导入失败: {str(e)}")
+    finally:
+        await file.close()
+
 @app.get("/api/exports")
 async def list_exports():
     """获取可下载的导出文件列表"""
     try:
         exports = []
-        for file_path in sorted(data_service.exports_dir.glob("export_*.json"), key=lambda x: x.stat().st_mtime, reverse=True):
+        for file_path in sorted(data_service.exports_dir.glob("export_*"), key=lambda x: x.stat().st_mtime, reverse=True):
             exports.append({
                 "filename": file_path.name,
                 "size": file_path.stat().st_size,
@@ -868,7 +1152,7 @@ async def download_export(filename: str):
     """下载指定导出文件"""
     try:
         file_path = data_service.exports_dir / filename
-        if not file_path.exists():
+        if Path(filename).name != filename or not filename.startswith("export_") or not file_path.exists():
             raise HTTPException(status_code=404, detail="文件不存在")
         
         return FileResponse(
@@ -876,6 +1160,8 @@ async def download_export(filename: str):
             filename=filename,
             media_type="application/octet-stream"
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"下载导出文件失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"下载失败: {str(e)}")
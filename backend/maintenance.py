@@ -0,0 +1,355 @@
+import asyncio
+import json
+import os
+import random
+import shutil
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Any, Callable, List, Optional
+from config import config
+from logger import get_logger
+from cache import memory_cache
+from data_service import data_service
+from conversation_service import conversation_service
+from token_meter import token_meter
+from stats_service import stats_service
+from classifier import question_classifier
+from upload_store import upload_store
+
+
+def _parse_cron_field(field: str, minimum: int, maximum: int) -> set:
+    """解析cron单个字段，支持 *、*/n、a-b、a,b 组合"""
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+        if part in ("*", ""):
+            start, end = minimum, maximum
+        elif "-" in part:
+            start, end = (int(x) for x in part.split("-", 1))
+        else:
+            start = end = int(part)
+        values.update(range(max(start, minimum), min(end, maximum) + 1, step))
+    return values
+
+
+def next_cron_time(expression: str, now: datetime) -> datetime:
+    """计算cron表达式（分 时 日 月 周）在 now 之后的下一次触发时间
+
+    与标准cron一致：日和周两个字段都有限制（不以 * 开头）时，任一字段匹配即触发，
+    例如 "0 2 1 * 1" 在每月1日和每周一的 2:00 都会运行。
+    """
+    fields = expression.split()
+    if len(fields) != 5:
+        raise ValueError(f"无效的cron表达式: {expression}")
+    minutes = _parse_cron_field(fields[0], 0, 59)
+    hours = _parse_cron_field(fields[1], 0, 23)
+    days = _parse_cron_field(fields[2], 1, 31)
+    months = _parse_cron_field(fields[3], 1, 12)
+    weekdays = {d % 7 for d in _parse_cron_field(fields[4], 0, 7)}  # 0和7都表示周日
+    either_day = not fields[2].startswith("*") and not fields[4].startswith("*")
+
+    def day_matches(day: datetime) -> bool:
+        day_match, weekday_match = day.day in days, (day.isoweekday() % 7) in weekdays
+        return (day_match or weekday_match) if either_day else (day_match and weekday_match)
+
+    candidate = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    day = candidate.replace(hour=0, minute=0)
+    # 逐日查找匹配的日期，再在当天内查找匹配的时分
+    for _ in range(366 * 5):
+        if day.month in months and day_matches(day):
+            for hour in sorted(hours):
+                for minute in sorted(minutes):
+                    run_at = day.replace(hour=hour, minute=minute)
+                    if run_at >= candidate:
+                        return run_at
+        day += timedelta(days=1)
+    raise ValueError(f"cron表达式没有可触发的时间: {expression}")
+
+
+def _directory_size(path: Path) -> Dict[str, int]:
+    """统计目录的文件数量和总大小"""
+    files = 0
+    size = 0
+    stack = [str(path)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        files += 1
+                        size += entry.stat(follow_symlinks=False).st_size
+        except FileNotFoundError:
+            continue
+    return {"files": files, "bytes": size}
+
+
+def _prune_files(directory: Path, pattern: str, max_age_days: int) -> int:
+    """删除目录下超过保留天数的文件，返回删除数量"""
+    if max_age_days <= 0 or not directory.exists():
+        return 0
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    for file_path in directory.glob(pattern):
+        try:
+            if file_path.is_file() and file_path.stat().st_mtime < cutoff:
+                file_path.unlink()
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+class MaintenanceJob:
+    """定时维护任务及其运行状态"""
+
+    def __init__(self, name: str, func: Callable[[], Any], interval: Optional[int] = None,
+                 schedule: Optional[str] = None, timeout: Optional[int] = None, jitter: Optional[float] = None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.schedule = schedule
+        self.timeout = timeout or config.MAINTENANCE_JOB_TIMEOUT
+        self.jitter = config.MAINTENANCE_JITTER if jitter is None else jitter
+        self.next_run: Optional[datetime] = None
+        self.running = False
+        self.thread_future: Optional[asyncio.Future] = None
+        self.run_count = 0
+        self.failure_count = 0
+        self.last_run: Optional[str] = None
+        self.last_duration: Optional[float] = None
+        self.last_result: Any = None
+        self.last_error: Optional[str] = None
+
+    def delay_until_next(self) -> float:
+        """计算距下一次运行的秒数（间隔任务带随机抖动）"""
+        now = datetime.now()
+        if self.schedule:
+            self.next_run = next_cron_time(self.schedule, now)
+            delay = (self.next_run - now).total_seconds()
+        else:
+            delay = self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+            self.next_run = now + timedelta(seconds=delay)
+        return max(delay, 0.0)
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "interval": self.interval,
+            "schedule": self.schedule,
+            "timeout": self.timeout,
+            "running": self.running,
+            "next_run": self.next_run.isoformat() if self.next_run else None,
+            "run_count": self.run_count,
+            "failure_count": self.failure_count,
+            "last_run": self.last_run,
+            "last_duration": self.last_duration,
+            "last_result": self.last_result,
+            "last_error": self.last_error
+        }
+
+
+class MaintenanceScheduler:
+    """后台定时维护调度器
+
+    在应用生命周期内为每个任务启动一个 asyncio 循环，任务函数在线程池中执行，
+    单次运行受超时限制，失败不会影响其他任务和下一次运行。
+    """
+
+    def __init__(self):
+        self.logger = get_logger("maintenance")
+        self.jobs: Dict[str, MaintenanceJob] = {}
+        self._tasks: List[asyncio.Task] = []
+        self.metrics_dir = data_service.data_root / "metrics"
+        self.backup_dir = Path(config.BACKUP_DIR)
+
+    def register(self, name: str, func: Callable[[], Any], **kwargs) -> MaintenanceJob:
+        """注册维护任务（interval 为秒数，schedule 为cron表达式，二选一）"""
+        job = MaintenanceJob(name, func, **kwargs)
+        self.jobs[name] = job
+        return job
+
+    def register_default_jobs(self):
+        """注册内置维护任务"""
+        self.register("cache_sweep", self.sweep_cache, interval=config.CACHE_CLEANUP_INTERVAL)
+        self.register("conversation_expiry", conversation_service.cleanup_expired_conversations,
+                      interval=max(config.CACHE_CLEANUP_INTERVAL, 600))
+        self.register("conversation_flush", data_service.flush_conversations, interval=60)
+        self.register("export_pruning", self.prune_exports, interval=3600)
+        self.register("upload_gc", self.prune_uploads, interval=3600)
+        self.register("stats_persist", stats_service.persist, interval=60)
+        if config.CLASSIFIER_MODEL_ENABLED:
+            self.register("classifier_retrain", question_classifier.maybe_retrain,
+                          interval=config.CLASSIFIER_RETRAIN_INTERVAL)
+        if config.ENABLE_AUTO_BACKUP:
+            self.register("backup", self.run_backup, schedule=config.BACKUP_SCHEDULE,
+                          timeout=max(config.MAINTENANCE_JOB_TIMEOUT, 1800))
+        if config.ENABLE_MONITORING:
+            self.register("metrics_rollup", self.rollup_metrics, interval=config.METRICS_COLLECTION_INTERVAL)
+        if config.ENABLE_HEALTH_CHECK:
+            self.register("health_check", self.check_health, interval=config.HEALTH_CHECK_INTERVAL)
+
+    # 调度
+    async def start(self):
+        if self._tasks:
+            return
+        if not self.jobs:
+            self.register_default_jobs()
+        for job in self.jobs.values():
+            self._tasks.append(asyncio.create_task(self._job_loop(job), name=f"maintenance:{job.name}"))
+        self.logger.info(f"定时维护已启动，共 {len(self.jobs)} 个任务: {', '.join(self.jobs)}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # 关闭前写回缓存中的对话元数据和统计数据
+        try:
+            data_service.flush_conversations()
+            stats_service.persist()
+        except Exception as e:
+            self.logger.error(f"关闭时写回数据失败: {e}")
+        self.logger.info("定时维护已停止")
+
+    async def _job_loop(self, job: MaintenanceJob):
+        while True:
+            try:
+                await asyncio.sleep(job.delay_until_next())
+            except ValueError as e:
+                self.logger.error(f"维护任务 {job.name} 调度配置无效，已停止: {e}")
+                return
+            await self.run_job(job.name)
+
+    async def run_job(self, name: str) -> Dict[str, Any]:
+        """立即运行一次指定任务，返回运行状态"""
+        job = self.jobs.get(name)
+        if job is None:
+            raise KeyError(name)
+        if job.running:
+            return job.get_status()
+
+        job.running = True
+        start_time = time.time()
+        job.last_run = datetime.now().isoformat()
+        # 线程无法强制终止：超时或调度停止后只停止等待，线程结束前 running 保持为 True，避免同一任务并行运行
+        future = asyncio.ensure_future(asyncio.to_thread(job.func))
+        job.thread_future = future
+        future.add_done_callback(lambda done: self._on_thread_done(job, done, start_time))
+        try:
+            job.last_result = await asyncio.wait_for(asyncio.shield(future), timeout=job.timeout)
+            job.last_error = None
+        except asyncio.TimeoutError:
+            job.failure_count += 1
+            job.last_error = f"运行超时({job.timeout}秒)"
+            self.logger.warning(f"维护任务 {job.name} 运行超时，等待线程结束前不会再次运行")
+        except Exception as e:
+            job.failure_count += 1
+            job.last_error = str(e)
+            self.logger.error(f"维护任务 {job.name} 运行失败: {e}")
+        finally:
+            if future.done():
+                job.running = False
+            job.run_count += 1
+            job.last_duration = round(time.time() - start_time, 3)
+        return job.get_status()
+
+    def _on_thread_done(self, job: MaintenanceJob, future: asyncio.Future, start_time: float):
+        if job.thread_future is future:
+            job.thread_future = None
+            job.running = False
+            if job.last_error and job.last_error.startswith("运行超时"):
+                self.logger.info(f"维护任务 {job.name} 超时后运行结束，共耗时 {time.time() - start_time:.1f} 秒")
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "running": bool(self._tasks),
+            "jobs": {name: job.get_status() for name, job in self.jobs.items()}
+        }
+
+    # 任务
+    def sweep_cache(self) -> Dict[str, int]:
+        """清理内存缓存和文件缓存中的过期项"""
+        return {
+            "memory": memory_cache.cleanup_expired(),
+            "files": data_service.clear_expired_cache()
+        }
+
+    def prune_exports(self) -> int:
+        """删除超过保留天数的导出文件"""
+        removed = _prune_files(data_service.exports_dir, "export_*", config.EXPORT_RETENTION_DAYS)
+        if removed:
+            self.logger.info(f"清理了 {removed} 个过期导出文件")
+        return removed
+
+    def prune_uploads(self) -> Dict[str, int]:
+        """删除超过保留天数没有再被上传的文件和中断遗留的临时文件"""
+        return upload_store.prune(config.UPLOAD_RETENTION_DAYS)
+
+    def run_backup(self) -> Dict[str, Any]:
+        """备份数据目录（不含缓存和导出文件），并清理过期备份"""
+        data_service.flush_conversations()
+        self.backup_dir.mkdir(parents=True, exist_ok=True)
+        archive_format = "gztar" if config.BACKUP_COMPRESSION in ("tar.gz", "gztar") else "zip"
+        base_name = self.backup_dir / f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+        data_root = data_service.data_root.resolve()
+        excluded = {data_service.cache_dir.name, data_service.exports_dir.name}
+        def ignore(directory, names):
+            return [n for n in names if n in excluded] if Path(directory) == data_root else []
+
+        # 先复制到临时目录再打包，避免打包过程中文件被并发修改
+        staging = Path(f"{base_name}.staging")
+        try:
+            shutil.copytree(data_root, staging, ignore=ignore)
+            archive_path = shutil.make_archive(str(base_name), archive_format, root_dir=staging)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        removed = _prune_files(self.backup_dir, "backup_*", config.BACKUP_RETENTION_DAYS)
+        self.logger.info(f"数据备份完成: {archive_path}")
+        return {"archive": archive_path, "bytes": os.path.getsize(archive_path), "pruned": removed}
+
+    def disk_usage(self) -> Dict[str, Dict[str, int]]:
+        """统计数据目录下各子目录的文件数量和大小"""
+        usage = {}
+        if data_service.data_root.exists():
+            for entry in data_service.data_root.iterdir():
+                if entry.is_dir():
+                    usage[entry.name] = _directory_size(entry)
+        return usage
+
+    def rollup_metrics(self) -> Dict[str, Any]:
+        """汇总当前指标并追加到按天分文件的指标日志，清理超过保留天数的指标文件"""
+        snapshot = {
+            "timestamp": datetime.now().isoformat(),
+            "tokens": token_meter.get_stats(),
+            "memory_cache": memory_cache.get_stats(),
+            "disk_usage": self.disk_usage()
+        }
+        self.metrics_dir.mkdir(parents=True, exist_ok=True)
+        metrics_file = self.metrics_dir / f"metrics_{datetime.now().strftime('%Y%m%d')}.jsonl"
+        with open(metrics_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(snapshot, ensure_ascii=False, default=str) + "\n")
+        pruned = _prune_files(self.metrics_dir, "metrics_*.jsonl", config.MONITORING_RETENTION_DAYS)
+        return {"file": metrics_file.name, "pruned": pruned}
+
+    def check_health(self) -> Dict[str, Any]:
+        """检查数据目录和上传目录是否可写，以及磁盘剩余空间"""
+        total, used, free = shutil.disk_usage(data_service.data_root)
+        status = {
+            "data_writable": os.access(data_service.data_root, os.W_OK),
+            "upload_writable": os.access(config.UPLOAD_DIR, os.W_OK) if os.path.exists(config.UPLOAD_DIR) else False,
+            "disk_free_bytes": free,
+            "disk_used_percent": round(used / total * 100, 1) if total else 0
+        }
+        if not status["data_writable"] or status["disk_used_percent"] > 90:
+            self.logger.warning(f"健康检查异常: {status}")
+        return status
+
+# 全局实例
+maintenance_scheduler = MaintenanceScheduler()
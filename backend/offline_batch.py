@@ -0,0 +1,398 @@
+import asyncio
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Iterator
+from ai_service import AIService
+from ai_providers.batch import (
+    BatchAPIUnsupported, NativeBatchClient, LocalBatchDriver, TERMINAL_BATCH_STATUSES,
+    api_base, build_request_line, parse_result_line
+)
+from classifier import question_classifier
+from config import config
+from data_service import data_service
+from logger import get_logger
+
+OFFLINE_BATCH_MODES = ("auto", "native", "local")
+OFFLINE_BATCH_SOURCES = ("challenges",)
+# 任务不再变化的状态
+FINISHED_JOB_STATUSES = ("completed", "failed", "cancelled")
+
+
+class OfflineBatchManager:
+    """离线批量分析
+
+    用于非交互的大批量分析（如换用新模型重新分析已保存的题目）。创建任务时把每道题目按在线分析相同的
+    方式组装成请求行写入 input.jsonl；提供者有批量接口时上传并提交批次后定期轮询，没有时（auto 模式下
+    提交返回404等）改由本地按并发上限逐条调用。结果写入 output.jsonl 后逐行导入分析缓存和分析历史。
+
+    每个任务一个目录（data/offline_batches/<任务ID>/），任务状态、远端批次ID、本地已完成的结果行和导入
+    进度都落盘，服务重启后未完成的任务从中断处继续：已提交的批次继续轮询，本地调用跳过已有结果的行，
+    导入从上次的行号继续。
+    """
+
+    def __init__(self, transport=None):
+        """transport 为传给 httpx 的传输层，调试时可传入 httpx.ASGITransport(app=mock_server.create_app())"""
+        self.logger = get_logger("offline_batch")
+        self.jobs_dir = data_service.data_root / "offline_batches"
+        self.transport = transport
+        self._services: Dict[str, AIService] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def _service(self, provider: str) -> AIService:
+        if provider not in self._services:
+            self._services[provider] = AIService(provider)
+        return self._services[provider]
+
+    # 任务记录
+    def _job_dir(self, job_id: str) -> Path:
+        return self.jobs_dir / job_id
+
+    def _save(self, job: Dict[str, Any]):
+        job["updated_at"] = datetime.now().isoformat()
+        data_service._write_json_file(self._job_dir(job["id"]) / "job.json", job)
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if not job_id.replace("-", "").isalnum():
+            return None
+        job = data_service._read_json_file(self._job_dir(job_id) / "job.json")
+        if job is not None:
+            job["active"] = job_id in self._tasks
+        return job
+
+    def list_jobs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        if not self.jobs_dir.exists():
+            return []
+        paths = sorted(self.jobs_dir.glob("*/job.json"), key=lambda p: p.stat().st_mtime, reverse=True)[:limit]
+        return [job for job in (self.get_job(path.parent.name) for path in paths) if job]
+
+    @staticmethod
+    def _read_jsonl(path: Path) -> Iterator[Dict[str, Any]]:
+        if not path.exists():
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    @staticmethod
+    def _write_jsonl(path: Path, rows) -> int:
+        count = 0
+        temp_path = path.with_suffix(".tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                count += 1
+        os.replace(temp_path, path)
+        return count
+
+    # 创建
+    def create_job(self, provider: Optional[str] = None, items: Optional[List[Dict[str, Any]]] = None,
+                   source: Optional[str] = None, question_type: Optional[str] = None, limit: Optional[int] = None,
+                   mode: Optional[str] = None, skip_cached: bool = False) -> Dict[str, Any]:
+        """
+        创建离线批量任务并写入请求文件
+
+        Args:
+            provider: AI提供者类型，默认使用 AI_SERVICE
+            items: 题目列表（description, question_type, id）
+            source: 不传 items 时从已保存的数据中取题目，目前支持 challenges
+            question_type: source 为 challenges 时只取该类型的题目
+            limit: 最多取多少道题目
+            mode: auto（有批量接口时使用，否则本地调用）、native 或 local
+            skip_cached: 跳过分析缓存中已有结果的题目
+
+        Raises:
+            ValueError: 参数无效、提供者不是OpenAI兼容接口或没有题目
+        """
+        provider = (provider or config.AI_SERVICE).lower()
+        mode = mode or config.OFFLINE_BATCH_MODE
+        if mode not in OFFLINE_BATCH_MODES:
+            raise ValueError(f"不支持的批量模式: {mode}，可选: {', '.join(OFFLINE_BATCH_MODES)}")
+        limit = min(limit or config.OFFLINE_BATCH_MAX_ITEMS, config.OFFLINE_BATCH_MAX_ITEMS)
+        service = self._service(provider)
+        # 非OpenAI兼容的提供者（本地模型）在这里抛出 ValueError
+        api_base(service.provider)
+
+        if items is None:
+            if source not in OFFLINE_BATCH_SOURCES:
+                raise ValueError(f"需要提供 items 或 source（可选: {', '.join(OFFLINE_BATCH_SOURCES)}）")
+            items = [{"description": challenge.get("description"), "question_type": challenge.get("type"),
+                      "challenge_id": challenge.get("id")}
+                     for challenge in data_service.get_challenges(question_type, limit)]
+
+        job_id = str(uuid.uuid4())
+        job_dir = self._job_dir(job_id)
+        job_dir.mkdir(parents=True, exist_ok=True)
+        records, seen, skipped = [], set(), 0
+        for item in items:
+            description = (item.get("description") or "").strip()
+            if not description:
+                continue
+            item_type = item.get("question_type")
+            classified = not item_type or item_type == "auto"
+            if classified:
+                item_type = question_classifier.classify(description)["type"]
+            if (description, item_type) in seen or (skip_cached and service.get_cached_response(description, item_type)):
+                skipped += 1
+                continue
+            seen.add((description, item_type))
+            records.append({"custom_id": f"item-{len(records)}", "description": description,
+                            "question_type": item_type, "classified": classified, "item_id": item.get("id"),
+                            "challenge_id": item.get("challenge_id")})
+            if len(records) >= limit:
+                break
+        if not records:
+            job_dir.rmdir()
+            raise ValueError("没有需要分析的题目")
+
+        try:
+            self._write_jsonl(job_dir / "items.jsonl", records)
+            # 离线分析不附加用户上下文，提示词与 use_context=False 的在线分析一致
+            self._write_jsonl(job_dir / "input.jsonl", (
+                build_request_line(service.provider, record["custom_id"],
+                                   service.build_prompt(record["description"], record["question_type"], use_context=False),
+                                   record["question_type"])
+                for record in records
+            ))
+        except Exception:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+        now = datetime.now().isoformat()
+        job = {
+            "id": job_id,
+            "provider": provider,
+            "model": getattr(service.provider, "model", None),
+            "mode": mode,
+            "driver": "local" if mode == "local" else None,
+            "status": "pending",
+            "total": len(records),
+            "skipped": skipped,
+            "remote_batch_id": None,
+            "remote_status": None,
+            "request_counts": None,
+            "completed": 0,
+            "ingest_offset": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "errors": [],
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "finished_at": None
+        }
+        self._save(job)
+        self.logger.info(f"离线批量任务 {job_id} 已创建: {provider}, {len(records)} 道题目, 模式 {mode}")
+        return job
+
+    # 执行
+    def start(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """在后台执行或续跑任务（已在运行时直接返回），任务不存在时返回 None"""
+        job = self.get_job(job_id)
+        if job is None:
+            return None
+        if job_id not in self._tasks and job["status"] not in ("completed", "cancelled"):
+            task = asyncio.create_task(self._run(job_id), name=f"offline_batch:{job_id}")
+            self._tasks[job_id] = task
+            task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+            job["active"] = True
+        return job
+
+    def resume_pending(self) -> int:
+        """启动时续跑所有未结束的任务，返回续跑的任务数"""
+        resumed = 0
+        for job in self.list_jobs(limit=1000):
+            if job["status"] not in FINISHED_JOB_STATUSES and self.start(job["id"]):
+                resumed += 1
+        if resumed:
+            self.logger.info(f"续跑 {resumed} 个未完成的离线批量任务")
+        return resumed
+
+    async def _run(self, job_id: str):
+        job = self.get_job(job_id)
+        job.pop("active", None)
+        job["error"] = None
+        service = self._service(job["provider"])
+        try:
+            # 导入中断的任务直接继续导入
+            if job["status"] != "ingesting":
+                if job["driver"] != "local":
+                    try:
+                        await self._run_native(job, service)
+                    except BatchAPIUnsupported as e:
+                        if job["mode"] == "native":
+                            raise
+                        self.logger.info(f"{job['provider']} 没有批量接口（{e}），任务 {job_id} 改为本地调用")
+                        job["driver"] = "local"
+                if job["driver"] == "local":
+                    await self._run_local(job, service)
+            job["status"] = "ingesting"
+            self._save(job)
+            await self._run_ingest(job, service)
+            job.update(status="completed", finished_at=datetime.now().isoformat())
+            self.logger.info(f"离线批量任务 {job_id} 完成: 成功 {job['succeeded']}, 失败 {job['failed']}")
+        except asyncio.CancelledError:
+            # 服务停止：保留当前状态，重启后续跑
+            raise
+        except Exception as e:
+            job.update(status="failed", error=str(e), finished_at=datetime.now().isoformat())
+            self.logger.error(f"离线批量任务 {job_id} 失败: {e}", exc_info=True)
+        finally:
+            self._save(job)
+
+    async def _run_native(self, job: Dict[str, Any], service: AIService):
+        client = NativeBatchClient(service.provider, transport=self.transport)
+        job_dir = self._job_dir(job["id"])
+        if not job["remote_batch_id"]:
+            content = await asyncio.to_thread((job_dir / "input.jsonl").read_bytes)
+            batch = await client.submit(content, metadata={"job_id": job["id"]})
+            job.update(driver="native", status="submitted", remote_batch_id=batch["id"], remote_status=batch.get("status"))
+            self._save(job)
+        while True:
+            batch = await client.retrieve(job["remote_batch_id"])
+            job.update(remote_status=batch.get("status"), request_counts=batch.get("request_counts"))
+            if batch.get("status") in TERMINAL_BATCH_STATUSES:
+                break
+            job["status"] = "running" if batch.get("status") == "in_progress" else "submitted"
+            self._save(job)
+            await asyncio.sleep(config.OFFLINE_BATCH_POLL_INTERVAL)
+
+        # 过期或取消的批次也可能有部分结果
+        outputs = [await client.download(batch[key]) for key in ("output_file_id", "error_file_id") if batch.get(key)]
+        if batch["status"] != "completed" and not outputs:
+            raise RuntimeError(f"批次 {job['remote_batch_id']} 状态为 {batch['status']}，没有结果")
+        rows = (json.loads(line) for text in outputs for line in text.splitlines() if line.strip())
+        job["completed"] = await asyncio.to_thread(self._write_jsonl, job_dir / "output.jsonl", rows)
+
+    async def _run_local(self, job: Dict[str, Any], service: AIService):
+        job_dir = self._job_dir(job["id"])
+        output_path = job_dir / "output.jsonl"
+        done = self._completed_ids(output_path)
+        job.update(status="running", completed=len(done))
+        self._save(job)
+        last_saved = time.monotonic()
+
+        def on_result(row: Dict[str, Any]):
+            nonlocal last_saved
+            output.write(json.dumps(row, ensure_ascii=False) + "\n")
+            output.flush()
+            job["completed"] += 1
+            if time.monotonic() - last_saved >= 1.0:
+                last_saved = time.monotonic()
+                self._save(job)
+
+        pending = (line for line in self._read_jsonl(job_dir / "input.jsonl") if line["custom_id"] not in done)
+        driver = LocalBatchDriver(service.provider, concurrency=config.OFFLINE_BATCH_CONCURRENCY,
+                                  transport=self.transport)
+        with open(output_path, "a", encoding="utf-8") as output:
+            await driver.run(pending, on_result)
+
+    @staticmethod
+    def _completed_ids(output_path: Path) -> set:
+        """本地调用已写入的结果行（去掉中断时写了一半的最后一行）"""
+        if not output_path.exists():
+            return set()
+        raw = output_path.read_bytes()
+        if raw and not raw.endswith(b"\n"):
+            raw = raw[:raw.rfind(b"\n") + 1]
+            with open(output_path, "wb") as f:
+                f.write(raw)
+        return {json.loads(line)["custom_id"] for line in raw.decode("utf-8").splitlines() if line.strip()}
+
+    async def _run_ingest(self, job: Dict[str, Any], service: AIService):
+        """在线程中导入结果；任务被取消时通知线程停止并等它退出，之后线程不再写任务记录"""
+        stop = threading.Event()
+        ingest = asyncio.ensure_future(asyncio.to_thread(self._ingest, job, service, stop))
+        try:
+            await asyncio.shield(ingest)
+        except asyncio.CancelledError:
+            stop.set()
+            await asyncio.gather(ingest, return_exceptions=True)
+            raise
+
+    def _ingest(self, job: Dict[str, Any], service: AIService, stop: threading.Event):
+        """
+        把结果导入分析缓存和分析历史，从上次中断的行继续
+
+        每导入一行立即保存导入进度，中断后续跑不会重复写入分析历史和token用量；stop 被设置时在下一行之前退出。
+        """
+        job_dir = self._job_dir(job["id"])
+        items = {item["custom_id"]: item for item in self._read_jsonl(job_dir / "items.jsonl")}
+        prompts = {}
+        provider = service.provider
+        with data_service.batch_writes():
+            for offset, row in enumerate(self._read_jsonl(job_dir / "output.jsonl")):
+                if offset < job["ingest_offset"]:
+                    continue
+                if stop.is_set():
+                    return
+                result = parse_result_line(row)
+                item = items.get(result["custom_id"])
+                if item is not None:
+                    if result["error"] or not result["content"]:
+                        job["failed"] += 1
+                        if len(job["errors"]) < 20:
+                            job["errors"].append({"custom_id": result["custom_id"], "error": result["error"]})
+                    else:
+                        if result["usage"] is None and not prompts:
+                            prompts = {line["custom_id"]: "\n".join(m["content"] for m in line["body"]["messages"])
+                                       for line in self._read_jsonl(job_dir / "input.jsonl")}
+                        provider._record_usage(result["model"] or job["model"], prompts.get(result["custom_id"], ""),
+                                               result["content"], usage=result["usage"],
+                                               question_type=item["question_type"])
+                        data_service.save_cache(service.cache_key(item["description"], item["question_type"]),
+                                                result["content"], ttl=config.CACHE_TTL)
+                        data_service.save_analysis_history(item.get("challenge_id"), {
+                            "description": item["description"],
+                            "type": item["question_type"],
+                            "question_type": item["question_type"],
+                            "ai_response": result["content"],
+                            "ai_provider": job["provider"],
+                            "model": result["model"] or job["model"],
+                            "offline_batch_id": job["id"],
+                            "type_classified": item.get("classified", False)
+                        })
+                        job["succeeded"] += 1
+                job["ingest_offset"] = offset + 1
+                self._save(job)
+        # 没有返回结果的请求（如批次过期）计为失败
+        job["failed"] = max(job["failed"], job["total"] - job["succeeded"])
+
+    # 控制
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """取消任务：停止本地调用或轮询，已提交的远端批次一并取消"""
+        job = self.get_job(job_id)
+        if job is None:
+            return None
+        if job["status"] in FINISHED_JOB_STATUSES:
+            return job
+        task = self._tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            job = self.get_job(job_id)
+        if job["remote_batch_id"] and job["remote_status"] not in TERMINAL_BATCH_STATUSES:
+            try:
+                client = NativeBatchClient(self._service(job["provider"]).provider, transport=self.transport)
+                job["remote_status"] = (await client.cancel(job["remote_batch_id"])).get("status")
+            except Exception as e:
+                self.logger.warning(f"取消远端批次 {job['remote_batch_id']} 失败: {e}")
+        job.pop("active", None)
+        job.update(status="cancelled", finished_at=datetime.now().isoformat())
+        self._save(job)
+        return job
+
+    async def shutdown(self):
+        """停止后台任务，状态已落盘，重启后续跑"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+# 全局实例
+offline_batch_manager = OfflineBatchManager()
@@ -0,0 +1,178 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Tuple
+from config import config
+from logger import get_logger
+from token_meter import estimate_tokens
+
+_HEADING_RE = re.compile(r'^#{1,4}\s*(.+)$', re.MULTILINE)
+_FLAG_RE = re.compile(r'flag\{[^}]{0,80}\}', re.IGNORECASE)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """按token预算截断文本（保留开头部分）"""
+    if max_tokens <= 0:
+        return ""
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    # 按比例估算截断位置，再逐步收缩直到满足预算
+    cut = max(int(len(text) * max_tokens / tokens), 1)
+    truncated = text[:cut]
+    while cut > 1 and estimate_tokens(truncated) > max_tokens:
+        cut = int(cut * 0.9)
+        truncated = text[:cut]
+    return truncated.rstrip() + "…"
+
+
+class PromptAssembler:
+    """按token预算组装提示词
+
+    各部分按优先级依次填充：当前问题（必选） > 上下文信息 > 最近的对话历史（从新到旧） > 更早对话的压缩摘要。
+    超出预算时从最早的对话消息开始裁剪，被裁剪的消息合并为一段缓存的压缩摘要。
+    """
+
+    def __init__(self, budget: int = None, message_max_tokens: int = None, summary_max_tokens: int = None,
+                 summary_cache_size: int = 256):
+        self.logger = get_logger("prompt_builder")
+        self.budget = budget or config.PROMPT_TOKEN_BUDGET
+        self.message_max_tokens = message_max_tokens or config.PROMPT_MESSAGE_MAX_TOKENS
+        self.summary_max_tokens = summary_max_tokens or config.PROMPT_SUMMARY_MAX_TOKENS
+        self.summary_cache_size = summary_cache_size
+        self._summary_cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _role_label(message: Dict[str, Any]) -> str:
+        return "用户" if message.get("role") == "user" else "AI助手"
+
+    def _summary_key(self, conversation_id: str, messages: List[Dict[str, Any]]) -> str:
+        ids = "|".join(str(m.get("id") or hash(m.get("content", ""))) for m in messages)
+        return hashlib.sha1(f"{conversation_id}|{ids}".encode("utf-8")).hexdigest()
+
+    def _summarize_message(self, message: Dict[str, Any]) -> str:
+        """提取单条消息的要点：标题、flag和首行内容"""
+        content = message.get("content", "") or ""
+        parts = []
+        headings = _HEADING_RE.findall(content)
+        if headings:
+            parts.append("、".join(h.strip() for h in headings[:4]))
+        flags = _FLAG_RE.findall(content)
+        if flags:
+            parts.append(f"flag: {flags[0]}")
+        if not parts:
+            first_line = next((line.strip() for line in content.splitlines() if line.strip()), "")
+            parts.append(truncate_to_tokens(first_line, 60))
+        return f"{self._role_label(message)}: {'；'.join(parts)}"
+
+    def summarize_messages(self, messages: List[Dict[str, Any]], conversation_id: str = None) -> str:
+        """将较早的对话轮次压缩为摘要（按消息ID缓存）"""
+        if not messages:
+            return ""
+        key = self._summary_key(conversation_id or "", messages)
+        with self._lock:
+            if key in self._summary_cache:
+                self._summary_cache.move_to_end(key)
+                return self._summary_cache[key]
+
+        summary = "\n".join(self._summarize_message(m) for m in messages)
+        summary = truncate_to_tokens(summary, self.summary_max_tokens)
+
+        with self._lock:
+            self._summary_cache[key] = summary
+            if len(self._summary_cache) > self.summary_cache_size:
+                self._summary_cache.popitem(last=False)
+        return summary
+
+    def assemble(self, description: str, question_type: str, base_prompt: str,
+                 context_info: List[str] = None, history_msgs: List[Dict[str, Any]] = None,
+                 conversation_id: str = None, file_context: str = None) -> Tuple[str, Dict[str, Any]]:
+        """
+        组装最终提示词
+
+        Args:
+            description: 题目描述
+            question_type: 题目类型
+            base_prompt: 提供者的提示词模板（包含 {description} 占位符）
+            context_info: 上下文信息条目，按优先级排序
+            history_msgs: 对话历史（从旧到新）
+            conversation_id: 对话ID，用于摘要缓存
+            file_context: 上传文件的预分析摘要（长度已由预分析流水线限制，与当前问题一起作为必选部分）
+
+        Returns:
+            (最终提示词, 组装统计)
+        """
+        context_info = context_info or []
+        history_msgs = history_msgs or []
+
+        def render_question(context_lines: List[str]) -> str:
+            context_section = "\n\n## 上下文信息\n" + "\n".join(f"- {info}" for info in context_lines) if context_lines else ""
+            file_section = f"\n\n## 文件预分析\n{file_context}" if file_context else ""
+            enhanced_prompt = base_prompt.replace("{description}", f"{description}{file_section}{context_section}")
+            return f"## 当前问题\n题目类型: {question_type}\n题目描述: {enhanced_prompt}\n请基于对话历史和上下文信息，提供连贯且深入的分析。"
+
+        # 1. 当前问题为必选部分
+        question_tokens = estimate_tokens(render_question([]))
+        remaining = self.budget - question_tokens
+        if remaining < 0:
+            self.logger.warning(f"当前问题本身已超出提示词预算: {question_tokens} > {self.budget}")
+
+        # 2. 上下文信息按条目顺序填充
+        kept_context = []
+        for info in context_info:
+            cost = estimate_tokens(info) + 2
+            if cost > remaining:
+                break
+            kept_context.append(info)
+            remaining -= cost
+
+        # 3. 对话历史从最新的消息开始保留，单条消息限制长度，预留摘要空间
+        summary_reserve = min(self.summary_max_tokens, max(remaining // 4, 0))
+        history_budget = remaining - summary_reserve
+        kept_history: List[str] = []
+        cut_index = len(history_msgs)
+        for index in range(len(history_msgs) - 1, -1, -1):
+            message = history_msgs[index]
+            content = truncate_to_tokens(message.get("content", "") or "", self.message_max_tokens)
+            line = f"{self._role_label(message)}: {content}"
+            cost = estimate_tokens(line) + 1
+            if cost > history_budget:
+                break
+            kept_history.insert(0, line)
+            history_budget -= cost
+            cut_index = index
+        remaining = history_budget + summary_reserve
+
+        # 4. 被裁剪的较早消息压缩为摘要
+        summary = ""
+        dropped = history_msgs[:cut_index]
+        if dropped and remaining > 0:
+            summary = truncate_to_tokens(self.summarize_messages(dropped, conversation_id), remaining)
+
+        history_parts = []
+        if summary:
+            history_parts.append(f"## 早期对话摘要\n{summary}\n")
+        if kept_history:
+            history_parts.append("## 对话历史\n" + "\n".join(kept_history) + "\n")
+        final_prompt = "".join(history_parts) + "\n" + render_question(kept_context)
+
+        stats = {
+            "prompt_tokens": estimate_tokens(final_prompt),
+            "budget": self.budget,
+            "history_total": len(history_msgs),
+            "history_kept": len(kept_history),
+            "history_summarized": len(dropped),
+            "context_kept": len(kept_context),
+            "context_total": len(context_info)
+        }
+        self.logger.info(
+            f"提示词组装完成: {stats['prompt_tokens']}/{self.budget} tokens, "
+            f"历史 {stats['history_kept']}/{stats['history_total']} 条(摘要 {stats['history_summarized']} 条), "
+            f"上下文 {stats['context_kept']}/{stats['context_total']} 项"
+        )
+        return final_prompt, stats
+
+# 全局实例
+prompt_assembler = PromptAssembler()
@@ -0,0 +1,280 @@
+import base64
+import bisect
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple, Callable, Iterable
+from data_service import data_service
+from logger import get_logger
+
+CHALLENGE_TYPES = ["web", "pwn", "reverse", "crypto", "misc"]
+
+
+def _preview(text: Optional[str], length: int = 100) -> str:
+    text = text or ""
+    return text[:length] + "..." if len(text) > length else text
+
+
+def challenge_content_hash(challenge_type: str, description: str) -> str:
+    """题目内容哈希：题目类型 + 规范化空白后的描述"""
+    normalized = " ".join((description or "").split())
+    return hashlib.sha256(f"{challenge_type}\n{normalized}".encode("utf-8")).hexdigest()
+
+
+def encode_cursor(timestamp: str, record_id: str) -> str:
+    """将排序键编码为游标"""
+    return base64.urlsafe_b64encode(f"{timestamp}|{record_id}".encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """解析游标，格式错误时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        timestamp, record_id = raw.rsplit("|", 1)
+        return timestamp, record_id
+    except Exception:
+        raise ValueError(f"无效的游标: {cursor}")
+
+
+class RecordIndex:
+    """记录列表索引
+
+    在内存中按 (timestamp, id) 有序保存每条记录的摘要字段和文件路径，另为可筛选字段维护二级有序列表。
+    列表接口使用键集游标分页：只在索引上定位和筛选，返回摘要字段时不读取记录文件，
+    只有请求了摘要之外的字段时才读取当前页记录的文件。索引首次使用时扫描一次记录文件，之后由写入事件增量维护。
+    """
+
+    def __init__(self, name: str, list_files: Callable[[], Iterable[Path]],
+                 summarize: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 file_path: Callable[[Dict[str, Any]], Path],
+                 filter_fields: Tuple[str, ...] = (), nested_field: Optional[str] = None):
+        self.name = name
+        self.logger = get_logger("record_index")
+        self._list_files = list_files
+        self._summarize = summarize
+        self._file_path = file_path
+        self.filter_fields = filter_fields
+        # 摘要之外的字段在记录中的查找位置（如分析历史的 analysis_data）
+        self.nested_field = nested_field
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._keys: List[Tuple[str, str]] = []
+        self._summaries: Dict[str, Dict[str, Any]] = {}
+        self._by_field: Dict[str, Dict[Any, List[Tuple[str, str]]]] = {field: {} for field in filter_fields}
+
+    # 维护
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            for path in self._list_files():
+                record = data_service._read_json_file(path)
+                if record and record.get("id"):
+                    self._put_locked(record, path)
+            self._loaded = True
+            self.logger.info(f"{self.name} 索引构建完成，共 {len(self._keys)} 条记录")
+
+    def _remove_locked(self, record_id: str):
+        summary = self._summaries.pop(record_id, None)
+        if summary is None:
+            return
+        key = (summary.get("timestamp") or "", record_id)
+        self._discard(self._keys, key)
+        for field in self.filter_fields:
+            keys = self._by_field[field].get(summary.get(field))
+            if keys is not None:
+                self._discard(keys, key)
+
+    @staticmethod
+    def _discard(keys: List[Tuple[str, str]], key: Tuple[str, str]):
+        position = bisect.bisect_left(keys, key)
+        if position < len(keys) and keys[position] == key:
+            keys.pop(position)
+
+    def _put_locked(self, record: Dict[str, Any], path: Optional[Path] = None):
+        record_id = record["id"]
+        self._remove_locked(record_id)
+        summary = self._summarize(record)
+        summary["_path"] = str(path or self._file_path(record))
+        self._summaries[record_id] = summary
+        key = (summary.get("timestamp") or "", record_id)
+        bisect.insort(self._keys, key)
+        for field in self.filter_fields:
+            bisect.insort(self._by_field[field].setdefault(summary.get(field), []), key)
+
+    def put(self, record: Dict[str, Any]):
+        if not self._loaded or not record.get("id"):
+            return
+        with self._lock:
+            self._put_locked(record)
+
+    def remove(self, record_id: str):
+        if not self._loaded:
+            return
+        with self._lock:
+            self._remove_locked(record_id)
+
+    # 查询
+    def _project(self, summary: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+        missing = [f for f in fields if f not in summary]
+        record = None
+        if missing:
+            record = data_service._read_json_file(Path(summary["_path"]), cached=True) or {}
+        result = {}
+        for field in fields:
+            if field in summary:
+                result[field] = summary[field]
+            elif field in record:
+                result[field] = record[field]
+            elif self.nested_field:
+                result[field] = (record.get(self.nested_field) or {}).get(field)
+            else:
+                result[field] = None
+        return result
+
+    def query(self, fields: List[str], limit: int = 50, cursor: Optional[str] = None,
+              filters: Optional[Dict[str, Any]] = None, date_from: Optional[str] = None,
+              date_to: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        按时间从新到旧分页查询
+
+        Args:
+            fields: 返回的字段
+            limit: 每页数量
+            cursor: 上一页返回的游标
+            filters: 字段筛选（仅支持 filter_fields 中的字段）
+            date_from: 起始时间（包含，ISO格式或日期前缀）
+            date_to: 结束时间（包含，ISO格式或日期前缀）
+
+        Returns:
+            (当前页记录, 下一页游标；没有更多记录时为 None)
+        """
+        self._ensure_loaded()
+        filters = {k: v for k, v in (filters or {}).items() if v is not None}
+        for field in filters:
+            if field not in self.filter_fields:
+                raise ValueError(f"不支持按 {field} 筛选")
+
+        with self._lock:
+            # 使用第一个筛选字段的二级索引，其余筛选条件逐条检查
+            if filters:
+                first_field = next(iter(filters))
+                keys = self._by_field[first_field].get(filters[first_field], [])
+            else:
+                keys = self._keys
+
+            # 游标之前（更新）的记录已经返回过，从游标位置向更早的记录遍历
+            upper = len(keys)
+            if cursor:
+                upper = bisect.bisect_left(keys, decode_cursor(cursor))
+            if date_to:
+                # 日期前缀上界：ISO时间中的字符都小于 "~"，同一前缀的记录都会被包含
+                upper = min(upper, bisect.bisect_right(keys, (date_to + "~",)))
+            lower = bisect.bisect_left(keys, (date_from,)) if date_from else 0
+
+            page: List[Dict[str, Any]] = []
+            last_key = None
+            index = upper - 1
+            while index >= lower and len(page) < limit:
+                key = keys[index]
+                summary = self._summaries[key[1]]
+                if all(summary.get(field) == value for field, value in filters.items()):
+                    page.append(summary)
+                    last_key = key
+                index -= 1
+            has_more = index >= lower and last_key is not None and len(page) == limit
+
+        items = [self._project(summary, fields) for summary in page]
+        next_cursor = encode_cursor(*last_key) if has_more else None
+        return items, next_cursor
+
+    def count(self) -> int:
+        self._ensure_loaded()
+        return len(self._keys)
+
+    def field_values(self, field: str) -> set:
+        """全部记录某个摘要字段的取值集合（快照）"""
+        self._ensure_loaded()
+        with self._lock:
+            return {summary.get(field) for summary in self._summaries.values()}
+
+    def paths(self) -> List[Path]:
+        """按时间从新到旧返回全部记录文件路径（快照）"""
+        self._ensure_loaded()
+        with self._lock:
+            return [Path(self._summaries[record_id]["_path"]) for _, record_id in reversed(self._keys)]
+
+
+def _challenge_files() -> Iterable[Path]:
+    for challenge_type in CHALLENGE_TYPES:
+        yield from (data_service.challenges_dir / challenge_type).glob("*.json")
+
+
+def _summarize_challenge(challenge: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": challenge["id"],
+        "description": _preview(challenge.get("description")),
+        "type": challenge.get("type"),
+        "file_name": challenge.get("file_name"),
+        "timestamp": challenge.get("timestamp"),
+        # 导入时按内容去重
+        "content_hash": challenge_content_hash(challenge.get("type"), challenge.get("description"))
+    }
+
+
+def _summarize_history(record: Dict[str, Any]) -> Dict[str, Any]:
+    analysis_data = record.get("analysis_data", {}) or {}
+    return {
+        "id": record["id"],
+        "challenge_id": record.get("challenge_id"),
+        "description": _preview(analysis_data.get("description")),
+        "type": analysis_data.get("type") or analysis_data.get("question_type"),
+        "timestamp": record.get("timestamp")
+    }
+
+
+def _summarize_auto_solve(solve: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": solve["id"],
+        "question_id": solve.get("question_id"),
+        "status": solve.get("status"),
+        "solve_method": solve.get("solve_method"),
+        "flag": solve.get("flag"),
+        "execution_time": solve.get("execution_time", 0),
+        "created_at": solve.get("created_at"),
+        "completed_at": solve.get("completed_at"),
+        # 自动解题记录以创建时间排序
+        "timestamp": solve.get("created_at")
+    }
+
+
+challenge_index = RecordIndex(
+    "challenges",
+    list_files=_challenge_files,
+    summarize=_summarize_challenge,
+    file_path=lambda c: data_service.challenges_dir / (c.get("type") or "misc") / f"challenge_{c['id']}.json",
+    filter_fields=("type",)
+)
+history_index = RecordIndex(
+    "history",
+    list_files=lambda: data_service.history_dir.glob("*.json"),
+    summarize=_summarize_history,
+    file_path=lambda h: data_service.history_dir / f"history_{h['id']}.json",
+    filter_fields=("type",),
+    nested_field="analysis_data"
+)
+auto_solve_index = RecordIndex(
+    "auto_solves",
+    list_files=lambda: (data_service.data_root / "auto_solve").glob("auto_solve_*.json"),
+    summarize=_summarize_auto_solve,
+    file_path=lambda s: data_service.data_root / "auto_solve" / f"auto_solve_{s['id']}.json",
+    filter_fields=("status", "question_id")
+)
+
+data_service.subscribe("challenge_saved", challenge_index.put)
+data_service.subscribe("challenge_deleted", lambda c: challenge_index.remove(c.get("id")))
+data_service.subscribe("history_saved", history_index.put)
+data_service.subscribe("auto_solve_saved", auto_solve_index.put)
+data_service.subscribe("auto_solve_deleted", auto_solve_index.remove)
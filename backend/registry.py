@@ -0,0 +1,228 @@
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Callable, Tuple
+from logger import get_logger
+
+
+class ConfigRegistry:
+    """配置列表注册表（工具、解题模板）
+
+    列表文件格式为 {list_key: [记录, ...]}。记录在内存中按名称、ID和分类建立索引，查询为 O(1)；
+    所有修改在锁内完成并同步原子写回文件（写入成功后才替换内存中的数据）。
+    每次访问时检查文件的 inode、修改时间和大小，文件被外部修改时自动重新加载。
+    返回给调用方的记录均为浅拷贝，修改返回值不会影响注册表。
+    """
+
+    def __init__(self, file_path: Path, list_key: str,
+                 read_json: Callable[[Path], Optional[Dict[str, Any]]],
+                 write_json: Callable[[Path, Dict[str, Any]], bool],
+                 on_change: Optional[Callable[[List[Dict[str, Any]]], None]] = None):
+        self.file_path = file_path
+        self.list_key = list_key
+        self.logger = get_logger("registry")
+        self._read_json = read_json
+        self._write_json = write_json
+        # 数据变化（包括外部修改后重新加载）时的回调，参数为全部记录
+        self._on_change = on_change
+        self._lock = threading.RLock()
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._loaded = False
+        self._items: List[Dict[str, Any]] = []
+        self._by_name: Dict[str, Dict[str, Any]] = {}
+        self._by_id: Dict[Any, Dict[str, Any]] = {}
+        self._by_category: Dict[Any, List[Dict[str, Any]]] = {}
+        self._max_id = 0
+
+    # 加载与索引
+    def _file_signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self.file_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _reindex(self, items: List[Dict[str, Any]]):
+        self._items = items
+        self._by_name = {}
+        self._by_id = {}
+        self._by_category = {}
+        for item in items:
+            self._by_name.setdefault(item.get("name"), item)
+            if item.get("id") is not None:
+                self._by_id.setdefault(item["id"], item)
+            self._by_category.setdefault(item.get("category"), []).append(item)
+        int_ids = [item["id"] for item in items if isinstance(item.get("id"), int)]
+        self._max_id = max(int_ids) if int_ids else 0
+
+    def _refresh(self) -> bool:
+        """首次访问或文件被外部修改时重新加载，返回是否重新加载"""
+        signature = self._file_signature()
+        if self._loaded and signature == self._signature:
+            return False
+        with self._lock:
+            signature = self._file_signature()
+            if self._loaded and signature == self._signature:
+                return False
+            data = self._read_json(self.file_path) if signature is not None else None
+            items = data.get(self.list_key, []) if isinstance(data, dict) else []
+            self._reindex([item for item in items if isinstance(item, dict)])
+            if self._loaded:
+                self.logger.info(f"{self.file_path.name} 已被外部修改，重新加载 {len(self._items)} 条记录")
+            reloaded = self._loaded
+            self._signature = signature
+            self._loaded = True
+        if reloaded:
+            self._notify()
+        return reloaded
+
+    def _commit(self, items: List[Dict[str, Any]]) -> bool:
+        """写回文件，成功后替换内存中的数据（调用方持有锁）"""
+        if not self._write_json(self.file_path, {self.list_key: items}):
+            return False
+        self._reindex(items)
+        self._signature = self._file_signature()
+        return True
+
+    def _notify(self):
+        if self._on_change:
+            self._on_change(self.all())
+
+    # 查询
+    def all(self, category: Optional[str] = None,
+            predicate: Optional[Callable[[Dict[str, Any]], bool]] = None) -> List[Dict[str, Any]]:
+        """按文件中的顺序返回记录，可按分类和条件筛选"""
+        self._refresh()
+        with self._lock:
+            items = self._items if category is None else self._by_category.get(category, [])
+            return [dict(item) for item in items if predicate is None or predicate(item)]
+
+    def get_by_name(self, name: str) -> Optional[Dict[str, Any]]:
+        self._refresh()
+        with self._lock:
+            item = self._by_name.get(name)
+            return dict(item) if item is not None else None
+
+    def get_by_id(self, item_id: Any) -> Optional[Dict[str, Any]]:
+        self._refresh()
+        with self._lock:
+            item = self._by_id.get(item_id)
+            return dict(item) if item is not None else None
+
+    def count(self) -> int:
+        self._refresh()
+        return len(self._items)
+
+    # 修改
+    def _mutate(self, change: Callable[[List[Dict[str, Any]]], Any]) -> Any:
+        """
+        在锁内基于当前记录列表的副本执行修改并写回
+
+        change 返回 None 或 False 时表示没有修改，不写文件；写入失败时抛出异常，内存数据保持不变。
+        """
+        self._refresh()
+        with self._lock:
+            items = list(self._items)
+            result = change(items)
+            if result is None or result is False:
+                return result
+            if not self._commit(items):
+                raise IOError(f"写入 {self.file_path.name} 失败")
+        self._notify()
+        return result
+
+    def add(self, item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """添加记录并分配递增ID，同名记录已存在时返回 None"""
+        def change(items):
+            if item.get("name") in self._by_name:
+                return None
+            record = dict(item, id=self._max_id + 1)
+            items.append(record)
+            return record
+        record = self._mutate(change)
+        return dict(record) if record else None
+
+    def replace(self, name: str, item: Dict[str, Any]) -> bool:
+        """替换同名记录（未指定ID时保留原ID），改名与其他记录冲突时返回 False"""
+        def change(items):
+            current = self._by_name.get(name)
+            if current is None:
+                return False
+            new_name = item.get("name", name)
+            if new_name != name and new_name in self._by_name:
+                return False
+            record = dict(item)
+            record.setdefault("name", name)
+            record.setdefault("id", current.get("id"))
+            items[items.index(current)] = record
+            return True
+        return bool(self._mutate(change))
+
+    def replace_by_id(self, item_id: Any, item: Dict[str, Any]) -> bool:
+        """按ID替换记录"""
+        def change(items):
+            current = self._by_id.get(item_id)
+            if current is None:
+                return False
+            items[items.index(current)] = dict(item, id=item_id)
+            return True
+        return bool(self._mutate(change))
+
+    def update_fields(self, name: str, **fields) -> bool:
+        """修改同名记录的部分字段"""
+        def change(items):
+            current = self._by_name.get(name)
+            if current is None:
+                return False
+            items[items.index(current)] = {**current, **fields}
+            return True
+        return bool(self._mutate(change))
+
+    def remove(self, name: str) -> bool:
+        def change(items):
+            current = self._by_name.get(name)
+            if current is None:
+                return False
+            items.remove(current)
+            return True
+        return bool(self._mutate(change))
+
+    def remove_by_id(self, item_id: Any) -> bool:
+        def change(items):
+            current = self._by_id.get(item_id)
+            if current is None:
+                return False
+            items.remove(current)
+            return True
+        return bool(self._mutate(change))
+
+    def merge(self, incoming: List[Dict[str, Any]], overwrite: bool = False) -> Dict[str, int]:
+        """按名称批量合并：新记录分配递增ID，同名记录按 overwrite 覆盖（保留原ID）或跳过，只写一次文件"""
+        result = {"added": 0, "updated": 0, "duplicates": 0}
+
+        def change(items):
+            positions = {item.get("name"): i for i, item in enumerate(items)}
+            next_id = self._max_id + 1
+            for item in incoming:
+                position = positions.get(item["name"])
+                if position is None:
+                    positions[item["name"]] = len(items)
+                    items.append(dict(item, id=next_id))
+                    next_id += 1
+                    result["added"] += 1
+                elif overwrite:
+                    items[position] = dict(item, id=items[position].get("id"))
+                    result["updated"] += 1
+                else:
+                    result["duplicates"] += 1
+            return bool(result["added"] or result["updated"])
+
+        self._mutate(change)
+        return result
+
+    def replace_all(self, items: List[Dict[str, Any]]) -> bool:
+        """整体替换记录列表"""
+        def change(current):
+            current[:] = [dict(item) for item in items]
+            return True
+        return bool(self._mutate(change))
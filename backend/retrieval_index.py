@@ -0,0 +1,297 @@
+import heapq
+import math
+import re
+import threading
+import time
+from array import array
+from typing import Dict, Any, List, Optional, Set
+from data_service import data_service
+from logger import get_logger
+from search_index import tokenize
+
+_HEADING_RE = re.compile(r'^#{1,4}\s*(.+)$', re.MULTILINE)
+_FLAG_RE = re.compile(r'flag\{', re.IGNORECASE)
+
+
+class SimilarityIndex:
+    """相似题目检索索引（内存 BM25）
+
+    对历史分析和题目记录的描述及回复中的标题建立倒排索引（词 -> 紧凑数组形式的文档号和词频），
+    按题目描述检索最相似的历史题解，返回题解要点而不是完整回复，用于在较少的提示词token内提供参考。
+    查询词按 idf 从高到低处理，超过时间预算时停止；出现在大部分文档中的词区分度低、倒排表长，直接跳过。
+    已有成功自动解题记录的题目得分加权。
+
+    索引在启动时由 ensure_built 在后台线程中构建，构建完成前检索直接返回空列表；构建期间的写入事件先排队，
+    构建完成后再应用。删除和更新的文档在倒排表中留下过时条目，过时文档超过一定比例时压缩倒排表。
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, description_weight: int = 2,
+                 max_query_terms: int = 24, max_df_ratio: float = 0.3, success_boost: float = 1.25,
+                 compact_ratio: float = 0.2):
+        self.logger = get_logger("retrieval_index")
+        self.k1 = k1
+        self.b = b
+        self.description_weight = description_weight
+        self.max_query_terms = max_query_terms
+        self.max_df_ratio = max_df_ratio
+        self.success_boost = success_boost
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._building = False
+        self._pending_lock = threading.Lock()
+        self._pending: List[tuple] = []  # 构建期间收到的写入事件
+
+        self._docs: List[Optional[Dict[str, Any]]] = []  # 文档号 -> 文档元数据，删除后置为 None
+        self._doc_lengths = array("I")
+        self._total_length = 0
+        self._live_docs = 0
+        self._stale_docs = 0  # 已删除但仍在倒排表中的文档数
+        self._doc_ids: Dict[str, int] = {}  # "kind:record_id" -> 文档号
+        self._postings: Dict[str, tuple] = {}  # 词 -> (文档号数组, 词频数组)
+        self._solved_challenges: Set[str] = set()
+
+        data_service.subscribe("history_saved", lambda h: self._apply(self._add_history, h))
+        data_service.subscribe("challenge_saved", lambda c: self._apply(self._add_challenge, c))
+        data_service.subscribe("challenge_deleted", lambda c: self._apply(self._remove_document, f"challenge:{c.get('id')}"))
+        data_service.subscribe("auto_solve_saved", self._on_auto_solve_saved)
+
+    # 构建
+    def ensure_built(self) -> bool:
+        """从记录文件全量构建索引（耗时较长，在后台线程中调用），返回是否执行了构建"""
+        with self._pending_lock:
+            if self._loaded or self._building:
+                return False
+            self._building = True
+        with self._lock:
+            start_time = time.time()
+            for challenge_type in ["web", "pwn", "reverse", "crypto", "misc"]:
+                for file_path in (data_service.challenges_dir / challenge_type).glob("*.json"):
+                    challenge = data_service._read_json_file(file_path)
+                    if challenge and challenge.get("id"):
+                        self._add_challenge(challenge)
+            for file_path in data_service.history_dir.glob("*.json"):
+                record = data_service._read_json_file(file_path)
+                if record and record.get("id"):
+                    self._add_history(record)
+            for solve in data_service.get_auto_solves(limit=10 ** 9):
+                self._mark_solved(solve)
+            # 应用构建期间的写入事件（重复添加的文档会替换已有文档）
+            with self._pending_lock:
+                for func, arg in self._pending:
+                    func(arg)
+                self._pending = []
+                self._loaded = True
+                self._building = False
+            self.logger.info(f"相似题目索引构建完成，共 {self._live_docs} 个文档，耗时 {time.time() - start_time:.2f} 秒")
+        return True
+
+    @staticmethod
+    def _digest(description: str, response: str) -> str:
+        """题解要点：描述开头、回复中的标题和是否包含flag"""
+        description = " ".join(description.split())
+        parts = [description[:80] + ("..." if len(description) > 80 else "")]
+        headings = [h.strip() for h in _HEADING_RE.findall(response or "")][:5]
+        if headings:
+            parts.append("要点: " + "、".join(headings))
+        if _FLAG_RE.search(response or ""):
+            parts.append("已获取flag")
+        return "；".join(parts)
+
+    def _add_document(self, kind: str, record_id: str, challenge_id: Optional[str], question_type: Optional[str],
+                      timestamp: Optional[str], description: str, response: str):
+        key = f"{kind}:{record_id}"
+        if key in self._doc_ids:
+            self._remove_document(key)
+
+        terms: Dict[str, int] = {}
+        for token in tokenize(description):
+            terms[token] = terms.get(token, 0) + self.description_weight
+        for token in tokenize("\n".join(_HEADING_RE.findall(response or ""))):
+            terms[token] = terms.get(token, 0) + 1
+        if not terms:
+            return
+
+        doc_number = len(self._docs)
+        self._docs.append({
+            "kind": kind,
+            "id": record_id,
+            "challenge_id": challenge_id,
+            "type": question_type,
+            "timestamp": timestamp,
+            "digest": self._digest(description, response)
+        })
+        length = sum(terms.values())
+        self._doc_lengths.append(length)
+        self._total_length += length
+        self._live_docs += 1
+        self._doc_ids[key] = doc_number
+        for term, frequency in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("I"), array("H"))
+            postings[0].append(doc_number)
+            postings[1].append(min(frequency, 65535))
+
+    def _remove_document(self, key: str):
+        doc_number = self._doc_ids.pop(key, None)
+        if doc_number is None or self._docs[doc_number] is None:
+            return
+        # 倒排表中暂时保留过时的文档号，查询时跳过，累计到一定比例后压缩
+        self._docs[doc_number] = None
+        self._total_length -= self._doc_lengths[doc_number]
+        self._live_docs -= 1
+        self._stale_docs += 1
+        if self._stale_docs >= 64 and self._stale_docs > len(self._docs) * self.compact_ratio:
+            self._compact()
+
+    def _compact(self):
+        """去掉倒排表中的过时条目并重新编号文档"""
+        start_time = time.perf_counter()
+        renumber = array("i", [-1]) * len(self._docs)
+        docs, lengths = [], array("I")
+        for old_number, doc in enumerate(self._docs):
+            if doc is not None:
+                renumber[old_number] = len(docs)
+                docs.append(doc)
+                lengths.append(self._doc_lengths[old_number])
+        postings = {}
+        for term, (doc_numbers, frequencies) in self._postings.items():
+            new_numbers, new_frequencies = array("I"), array("H")
+            for doc_number, frequency in zip(doc_numbers, frequencies):
+                new_number = renumber[doc_number]
+                if new_number >= 0:
+                    new_numbers.append(new_number)
+                    new_frequencies.append(frequency)
+            if new_numbers:
+                postings[term] = (new_numbers, new_frequencies)
+        self._docs, self._doc_lengths, self._postings = docs, lengths, postings
+        self._doc_ids = {key: renumber[number] for key, number in self._doc_ids.items()}
+        removed, self._stale_docs = self._stale_docs, 0
+        self.logger.info(f"相似题目索引压缩完成，移除 {removed} 个过时文档，"
+                         f"耗时 {(time.perf_counter() - start_time) * 1000:.1f}ms")
+
+    def _add_challenge(self, challenge: Dict[str, Any]):
+        self._add_document("challenge", challenge["id"], challenge["id"], challenge.get("type"),
+                           challenge.get("timestamp"), challenge.get("description") or "",
+                           challenge.get("ai_response") or "")
+
+    def _add_history(self, record: Dict[str, Any]):
+        analysis_data = record.get("analysis_data", {}) or {}
+        self._add_document("history", record["id"], record.get("challenge_id"),
+                           analysis_data.get("type") or analysis_data.get("question_type"), record.get("timestamp"),
+                           analysis_data.get("description") or "", analysis_data.get("ai_response") or "")
+
+    # 增量维护
+    def _apply(self, func, arg):
+        """应用写入事件：未构建时忽略，构建中排队，构建完成后直接更新"""
+        with self._pending_lock:
+            if not self._loaded:
+                if self._building:
+                    self._pending.append((func, arg))
+                return
+        with self._lock:
+            func(arg)
+
+    def _mark_solved(self, solve: Dict[str, Any]):
+        if solve.get("status") == "completed" and solve.get("question_id"):
+            self._solved_challenges.add(solve["question_id"])
+
+    def _on_auto_solve_saved(self, solve: Dict[str, Any]):
+        self._apply(self._mark_solved, solve)
+
+    # 查询
+    def search(self, description: str, question_type: Optional[str] = None, top_k: int = 3,
+               budget_ms: float = 20.0, type_boost: float = 1.2,
+               exclude_ids: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+        """
+        检索与题目描述最相似的历史题解
+
+        Args:
+            description: 当前题目描述
+            question_type: 当前题目类型，同类型文档得分加权
+            top_k: 返回数量
+            budget_ms: 时间预算（毫秒），超出后使用已累计的得分
+            type_boost: 同类型文档的得分倍数
+            exclude_ids: 需要排除的记录ID
+
+        Returns:
+            相似题解列表（按得分从高到低），索引尚未构建完成时为空
+        """
+        if not self._loaded:
+            return []
+        start_time = time.perf_counter()
+        query_terms = set(tokenize(description))
+        exclude_ids = exclude_ids or set()
+
+        with self._lock:
+            if not query_terms or not self._live_docs:
+                return []
+            total_docs = len(self._docs)
+            average_length = self._total_length / self._live_docs
+
+            weighted_terms = []
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                document_frequency = len(postings[0])
+                if total_docs >= 100 and document_frequency > total_docs * self.max_df_ratio:
+                    continue
+                idf = math.log(1 + (total_docs - document_frequency + 0.5) / (document_frequency + 0.5))
+                weighted_terms.append((idf, term))
+            weighted_terms.sort(reverse=True)
+
+            scores: Dict[int, float] = {}
+            processed = 0
+            for idf, term in weighted_terms[:self.max_query_terms]:
+                if processed and (time.perf_counter() - start_time) * 1000 > budget_ms:
+                    break
+                doc_numbers, frequencies = self._postings[term]
+                for doc_number, frequency in zip(doc_numbers, frequencies):
+                    length_norm = 1 - self.b + self.b * self._doc_lengths[doc_number] / average_length
+                    scores[doc_number] = scores.get(doc_number, 0.0) + idf * frequency * (self.k1 + 1) / (
+                        frequency + self.k1 * length_norm)
+                processed += 1
+
+            candidates = []
+            for doc_number, score in scores.items():
+                doc = self._docs[doc_number]
+                if doc is None or doc["id"] in exclude_ids:
+                    continue
+                if question_type and doc["type"] == question_type:
+                    score *= type_boost
+                if doc["challenge_id"] in self._solved_challenges:
+                    score *= self.success_boost
+                candidates.append((score, doc_number))
+
+            results = []
+            seen = set()
+            for score, doc_number in heapq.nlargest(top_k * 3, candidates):
+                doc = self._docs[doc_number]
+                # 同一题目的题目记录和分析历史只保留一条
+                group = doc["challenge_id"] or doc["id"]
+                if group in seen:
+                    continue
+                seen.add(group)
+                results.append({**doc, "score": round(score, 4), "solved": doc["challenge_id"] in self._solved_challenges})
+                if len(results) >= top_k:
+                    break
+
+        elapsed = (time.perf_counter() - start_time) * 1000
+        if processed < min(len(weighted_terms), self.max_query_terms):
+            self.logger.info(f"相似题目检索超出时间预算，仅使用 {processed}/{len(weighted_terms)} 个查询词 ({elapsed:.1f}ms)")
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "ready": self._loaded,
+                "documents": self._live_docs,
+                "stale_documents": self._stale_docs,
+                "terms": len(self._postings),
+                "solved_challenges": len(self._solved_challenges)
+            }
+
+# 全局实例
+similarity_index = SimilarityIndex()
@@ -148,4 +148,39 @@ class AnalysisResponse(BaseModel):
     response: str
     structured: Optional[Dict[str, Any]] = None
     conversation_id: Optional[str] = None
-    ai_provider: Optional[str] = None 
\ No newline at end of file
+    ai_provider: Optional[str] = None 
+
+class ClassifyItem(BaseModel):
+    description: str
+    file_name: Optional[str] = None
+    file_type: Optional[Dict[str, Any]] = None  # 文件类型识别结果（detect_file 的返回值）
+
+class ClassifyRequest(BaseModel):
+    """题目类型判断请求，items 不为空时批量判断"""
+    description: Optional[str] = None
+    file_name: Optional[str] = None
+    file_type: Optional[Dict[str, Any]] = None
+    items: Optional[List[ClassifyItem]] = None
+
+class BatchAnalyzeItem(BaseModel):
+    description: str
+    question_type: Optional[str] = None
+    id: Optional[str] = None
+    name: Optional[str] = None
+
+class BatchAnalyzeRequest(BaseModel):
+    """批量分析请求，providers 为空时使用默认提供者"""
+    items: List[BatchAnalyzeItem]
+    providers: Optional[List[str]] = None
+    use_context: bool = True
+    user_id: Optional[str] = None
+
+class OfflineBatchRequest(BaseModel):
+    """离线批量分析请求，items 为空时从 source 指定的已保存数据中取题目"""
+    provider: Optional[str] = None
+    items: Optional[List[BatchAnalyzeItem]] = None
+    source: Optional[str] = None
+    question_type: Optional[str] = None
+    limit: Optional[int] = None
+    mode: Optional[str] = None
+    skip_cached: bool = False
@@ -0,0 +1,318 @@
+import html
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+from data_service import data_service
+from logger import get_logger
+
+# CJK 连续字符按二元组切分，其余按字母数字单词切分
+_TOKEN_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[A-Za-z0-9_]+')
+_CJK_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+_CODE_BLOCK_RE = re.compile(r"```[a-zA-Z0-9]*\n(.*?)```", re.DOTALL)
+
+SCHEMA_VERSION = "1"
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """将文本切分为检索词：CJK 二元组 + 小写的英文/数字单词"""
+    tokens = []
+    for match in _TOKEN_RE.finditer(text or ""):
+        run = match.group()
+        if _CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+
+def extract_code(text: Optional[str]) -> str:
+    """提取 Markdown 代码块内容"""
+    return "\n".join(_CODE_BLOCK_RE.findall(text or ""))
+
+
+class SearchIndex:
+    """基于 SQLite FTS5 的全文检索索引
+
+    索引题目描述、AI 回复、回复中的代码块和提到的工具名。文本预先切分为 CJK 二元组和英文单词后写入 FTS5 表，
+    查询使用相同的切分规则并按 bm25 排序；原文不重复存储，高亮片段从当前页记录的文件中生成。
+    索引随 DataService 的写入事件增量更新，首次启动时从记录文件全量构建。
+    """
+
+    # bm25 列权重：描述、回复、代码、工具
+    COLUMN_WEIGHTS = (3.0, 1.0, 0.8, 2.0)
+
+    def __init__(self, db_path: Optional[Path] = None):
+        self.logger = get_logger("search_index")
+        self.db_path = Path(db_path or data_service.data_root / "index" / "search.db")
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._tool_names: Optional[List[str]] = None
+        self.available = True
+
+        data_service.subscribe("challenge_saved", lambda c: self._safe_update(self.index_challenge, c))
+        data_service.subscribe("challenge_deleted", lambda c: self._safe_update(self.remove, "challenge", c.get("id")))
+        data_service.subscribe("history_saved", lambda h: self._safe_update(self.index_history, h))
+        data_service.subscribe("tools_saved", lambda _: setattr(self, "_tool_names", None))
+
+    # 连接
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            return self._conn
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+                CREATE TABLE IF NOT EXISTS docs (
+                    rowid INTEGER PRIMARY KEY,
+                    doc_id TEXT UNIQUE NOT NULL,
+                    kind TEXT NOT NULL,
+                    record_id TEXT NOT NULL,
+                    challenge_id TEXT,
+                    type TEXT,
+                    timestamp TEXT,
+                    title TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_docs_type_time ON docs(type, timestamp);
+                CREATE INDEX IF NOT EXISTS idx_docs_time ON docs(timestamp);
+                CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+                    description, response, code, tools,
+                    tokenize = "unicode61 remove_diacritics 0 tokenchars '_'"
+                );
+            """)
+        except sqlite3.OperationalError as e:
+            conn.close()
+            self.available = False
+            raise RuntimeError(f"SQLite 不支持 FTS5，全文检索不可用: {e}")
+        self._conn = conn
+        return conn
+
+    def _safe_update(self, func, *args):
+        if not self.available:
+            return
+        try:
+            func(*args)
+        except Exception as e:
+            self.logger.error(f"更新检索索引失败: {e}")
+
+    def _get_tool_names(self) -> List[str]:
+        if self._tool_names is None:
+            self._tool_names = [t.get("name") for t in data_service.get_tools() if t.get("name")]
+        return self._tool_names
+
+    def _mentioned_tools(self, text: str) -> str:
+        lowered = (text or "").lower()
+        return " ".join(name for name in self._get_tool_names() if name.lower() in lowered)
+
+    # 写入
+    def _upsert(self, conn: sqlite3.Connection, kind: str, record_id: str, challenge_id: Optional[str],
+                question_type: Optional[str], timestamp: Optional[str], description: str, response: str):
+        doc_id = f"{kind}:{record_id}"
+        title = description[:200]
+        row = conn.execute("SELECT rowid FROM docs WHERE doc_id = ?", (doc_id,)).fetchone()
+        if row:
+            rowid = row[0]
+            conn.execute("UPDATE docs SET challenge_id = ?, type = ?, timestamp = ?, title = ? WHERE rowid = ?",
+                         (challenge_id, question_type, timestamp, title, rowid))
+            conn.execute("DELETE FROM docs_fts WHERE rowid = ?", (rowid,))
+        else:
+            rowid = conn.execute(
+                "INSERT INTO docs (doc_id, kind, record_id, challenge_id, type, timestamp, title) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (doc_id, kind, record_id, challenge_id, question_type, timestamp, title)
+            ).lastrowid
+        conn.execute(
+            "INSERT INTO docs_fts (rowid, description, response, code, tools) VALUES (?, ?, ?, ?, ?)",
+            (rowid, " ".join(tokenize(description)), " ".join(tokenize(response)),
+             " ".join(tokenize(extract_code(response))), " ".join(tokenize(self._mentioned_tools(response))))
+        )
+
+    def _challenge_args(self, challenge: Dict[str, Any]) -> tuple:
+        return ("challenge", challenge["id"], challenge["id"], challenge.get("type"), challenge.get("timestamp"),
+                challenge.get("description") or "", challenge.get("ai_response") or "")
+
+    def _history_args(self, record: Dict[str, Any]) -> tuple:
+        analysis_data = record.get("analysis_data", {}) or {}
+        return ("history", record["id"], record.get("challenge_id"),
+                analysis_data.get("type") or analysis_data.get("question_type"), record.get("timestamp"),
+                analysis_data.get("description") or "", analysis_data.get("ai_response") or "")
+
+    def index_challenge(self, challenge: Dict[str, Any]):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                self._upsert(conn, *self._challenge_args(challenge))
+
+    def index_history(self, record: Dict[str, Any]):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                self._upsert(conn, *self._history_args(record))
+
+    def remove(self, kind: str, record_id: str):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                row = conn.execute("SELECT rowid FROM docs WHERE doc_id = ?", (f"{kind}:{record_id}",)).fetchone()
+                if row:
+                    conn.execute("DELETE FROM docs_fts WHERE rowid = ?", (row[0],))
+                    conn.execute("DELETE FROM docs WHERE rowid = ?", (row[0],))
+
+    def rebuild(self) -> int:
+        """从记录文件全量重建索引，返回索引的文档数量"""
+        start_time = time.time()
+        count = 0
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM docs_fts")
+                conn.execute("DELETE FROM docs")
+                for challenge_type in ["web", "pwn", "reverse", "crypto", "misc"]:
+                    for file_path in (data_service.challenges_dir / challenge_type).glob("*.json"):
+                        challenge = data_service._read_json_file(file_path)
+                        if challenge and challenge.get("id"):
+                            self._upsert(conn, *self._challenge_args(challenge))
+                            count += 1
+                for file_path in data_service.history_dir.glob("*.json"):
+                    record = data_service._read_json_file(file_path)
+                    if record and record.get("id"):
+                        self._upsert(conn, *self._history_args(record))
+                        count += 1
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)", (SCHEMA_VERSION,))
+            conn.execute("INSERT INTO docs_fts (docs_fts) VALUES ('optimize')")
+        self.logger.info(f"检索索引重建完成，共 {count} 个文档，耗时 {time.time() - start_time:.2f} 秒")
+        return count
+
+    def ensure_built(self) -> bool:
+        """索引不存在或版本不一致时全量构建，返回是否执行了构建"""
+        try:
+            with self._lock:
+                row = self._connect().execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        except RuntimeError as e:
+            self.logger.warning(str(e))
+            return False
+        if row and row[0] == SCHEMA_VERSION:
+            return False
+        self.rebuild()
+        return True
+
+    # 查询
+    @staticmethod
+    def _build_match(tokens: List[str]) -> str:
+        terms = []
+        for token in dict.fromkeys(tokens):
+            # 单个CJK字符在文档中只以二元组出现，使用前缀匹配
+            if len(token) == 1 and _CJK_RE.match(token):
+                terms.append(f'"{token}"*')
+            else:
+                terms.append(f'"{token}"')
+        return " ".join(terms)
+
+    @staticmethod
+    def _highlight(text: str, pattern: re.Pattern, width: int = 80) -> str:
+        """生成包含命中词的片段，命中词用 <mark> 标记"""
+        match = pattern.search(text)
+        if not match:
+            return ""
+        start = max(match.start() - width // 2, 0)
+        end = min(match.end() + width, len(text))
+        snippet = text[start:end]
+        parts = []
+        position = 0
+        for m in pattern.finditer(snippet):
+            parts.append(html.escape(snippet[position:m.start()]))
+            parts.append(f"<mark>{html.escape(m.group())}</mark>")
+            position = m.end()
+        parts.append(html.escape(snippet[position:]))
+        return ("…" if start > 0 else "") + "".join(parts) + ("…" if end < len(text) else "")
+
+    def _load_texts(self, kind: str, record_id: str) -> Tuple[str, str]:
+        if kind == "challenge":
+            record = data_service.get_challenge(record_id) or {}
+            return record.get("description") or "", record.get("ai_response") or ""
+        record = data_service._read_json_file(data_service.history_dir / f"history_{record_id}.json", cached=True) or {}
+        analysis_data = record.get("analysis_data", {}) or {}
+        return analysis_data.get("description") or "", analysis_data.get("ai_response") or ""
+
+    def search(self, query: str, question_type: Optional[str] = None, kind: Optional[str] = None,
+               date_from: Optional[str] = None, date_to: Optional[str] = None,
+               limit: int = 20, offset: int = 0, highlight: bool = True) -> Dict[str, Any]:
+        """
+        全文检索
+
+        Args:
+            query: 查询文本
+            question_type: 按题目类型筛选
+            kind: challenge 或 history
+            date_from: 起始时间（包含，ISO格式或日期前缀）
+            date_to: 结束时间（包含，ISO格式或日期前缀）
+            limit: 返回数量
+            offset: 跳过数量
+            highlight: 是否生成高亮片段
+
+        Returns:
+            检索结果（按相关度排序）和耗时
+        """
+        start_time = time.perf_counter()
+        tokens = tokenize(query)
+        if not tokens:
+            return {"query": query, "results": [], "took_ms": 0.0}
+
+        match = self._build_match(tokens)
+        filters = []
+        filter_params: List[Any] = []
+        if question_type:
+            filters.append("AND d.type = ?")
+            filter_params.append(question_type)
+        if kind:
+            filters.append("AND d.kind = ?")
+            filter_params.append(kind)
+        if date_from:
+            filters.append("AND d.timestamp >= ?")
+            filter_params.append(date_from)
+        if date_to:
+            # 日期前缀上界：ISO时间中的字符都小于 "~"
+            filters.append("AND d.timestamp <= ?")
+            filter_params.append(date_to + "~")
+
+        # 对全部命中文档按 bm25 排序，FTS5 只需为前 limit + offset 条维护有序结果
+        sql = ("SELECT d.kind, d.record_id, d.challenge_id, d.type, d.timestamp, d.title, "
+               "bm25(docs_fts, ?, ?, ?, ?) AS score FROM docs_fts JOIN docs d ON d.rowid = docs_fts.rowid "
+               "WHERE docs_fts MATCH ? " + " ".join(filters) +
+               " ORDER BY score LIMIT ? OFFSET ?")
+        params = [*self.COLUMN_WEIGHTS, match, *filter_params, limit, offset]
+        with self._lock:
+            rows = self._connect().execute(sql, params).fetchall()
+
+        pattern = re.compile("|".join(re.escape(t) for t in sorted(set(tokens), key=len, reverse=True)), re.IGNORECASE)
+        results = []
+        for kind_, record_id, challenge_id, type_, timestamp, title, score in rows:
+            item = {
+                "kind": kind_,
+                "id": record_id,
+                "challenge_id": challenge_id,
+                "type": type_,
+                "timestamp": timestamp,
+                "title": title,
+                "score": round(-score, 4)
+            }
+            if highlight:
+                description, response = self._load_texts(kind_, record_id)
+                item["highlight"] = self._highlight(response, pattern) or self._highlight(description, pattern)
+            results.append(item)
+
+        return {"query": query, "results": results, "took_ms": round((time.perf_counter() - start_time) * 1000, 2)}
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+# 全局实例
+search_index = SearchIndex()
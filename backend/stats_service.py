@@ -0,0 +1,279 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Set
+from data_service import data_service
+from logger import get_logger
+
+CHALLENGE_TYPES = ["web", "pwn", "reverse", "crypto", "misc"]
+
+
+def _scan_names(directory, prefix: str = "", suffix: str = ".json") -> Set[str]:
+    """列出目录下匹配前后缀的文件名（只读目录项，不读取文件内容）"""
+    try:
+        with os.scandir(directory) as entries:
+            return {e.name for e in entries if e.name.startswith(prefix) and e.name.endswith(suffix) and e.is_file()}
+    except FileNotFoundError:
+        return set()
+
+
+class StatsService:
+    """统计数据服务
+
+    统计计数保存在内存中，通过订阅 DataService 的写入和删除事件增量更新，读取为 O(1)。
+    计数定期持久化到 data/stats/stats.json，启动时与磁盘上的实际文件数量校准。
+    同时按小时和按天记录新增题目与分析的时间序列（按题目类型分组），供仪表盘使用。
+    """
+
+    def __init__(self, hourly_retention_hours: int = 168, daily_retention_days: int = 90):
+        self.logger = get_logger("stats_service")
+        self.hourly_retention_hours = hourly_retention_hours
+        self.daily_retention_days = daily_retention_days
+        self.stats_file = data_service.data_root / "stats" / "stats.json"
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._dirty = False
+
+        self.challenges_by_type: Dict[str, int] = {}
+        # 题目类型 -> 已有题目文件名，用于区分新增和覆盖保存
+        self._challenge_files: Dict[str, Set[str]] = {}
+        self.total_history = 0
+        self._auto_solve_ids: Set[str] = set()
+        self._cache_files: Set[str] = set()
+        self._config_files: Set[str] = set()
+        # 时间序列：桶 -> 指标名 -> 题目类型 -> 数量
+        self.hourly: Dict[str, Dict[str, Dict[str, int]]] = {}
+        self.daily: Dict[str, Dict[str, Dict[str, int]]] = {}
+
+        data_service.subscribe("challenge_saved", self._on_challenge_saved)
+        data_service.subscribe("challenge_deleted", self._on_challenge_deleted)
+        data_service.subscribe("history_saved", self._on_history_saved)
+        data_service.subscribe("auto_solve_saved", self._on_auto_solve_saved)
+        data_service.subscribe("auto_solve_deleted", self._on_auto_solve_deleted)
+        data_service.subscribe("cache_saved", self._on_cache_saved)
+        data_service.subscribe("cache_deleted", self._on_cache_deleted)
+        data_service.subscribe("config_saved", lambda payload: self._on_config_saved(f"{payload.get('name')}.json"))
+        data_service.subscribe("tools_saved", lambda _: self._on_config_saved("tools.json"))
+        data_service.subscribe("templates_saved", lambda _: self._on_config_saved("solve_templates.json"))
+
+    # 加载与校准
+    def load(self):
+        """读取持久化的统计数据，并与磁盘上的文件数量校准"""
+        with self._lock:
+            persisted = data_service._read_json_file(self.stats_file) or {}
+
+            challenge_files = {
+                challenge_type: _scan_names(data_service.challenges_dir / challenge_type)
+                for challenge_type in CHALLENGE_TYPES
+            }
+            challenges_by_type = {challenge_type: len(names) for challenge_type, names in challenge_files.items()}
+            total_history = len(_scan_names(data_service.history_dir))
+            auto_solve_files = _scan_names(data_service.data_root / "auto_solve", prefix="auto_solve_")
+
+            counters = persisted.get("counters")
+            if counters and (counters.get("challenges_by_type") != challenges_by_type
+                             or counters.get("total_history") != total_history):
+                self.logger.info(f"统计计数与磁盘不一致，已按磁盘校准: {counters} -> {challenges_by_type}, {total_history}")
+
+            self.challenges_by_type = challenges_by_type
+            self._challenge_files = challenge_files
+            self.total_history = total_history
+            self._auto_solve_ids = {name[len("auto_solve_"):-len(".json")] for name in auto_solve_files}
+            self._cache_files = _scan_names(data_service.cache_dir, prefix="cache_")
+            self._config_files = _scan_names(data_service.configs_dir)
+
+            if "hourly" in persisted or "daily" in persisted:
+                self.hourly = persisted.get("hourly", {})
+                self.daily = persisted.get("daily", {})
+            else:
+                self._rebuild_series()
+            self._prune_series()
+            self._loaded = True
+            self._dirty = True
+            self.logger.info(f"统计数据加载完成: 题目 {sum(challenges_by_type.values())} 个, 分析历史 {total_history} 条")
+
+    def _rebuild_series(self):
+        """首次启动时根据已有记录的时间戳重建时间序列（需要读取记录文件，只执行一次）"""
+        self.hourly = {}
+        self.daily = {}
+        for challenge_type in CHALLENGE_TYPES:
+            for name in _scan_names(data_service.challenges_dir / challenge_type):
+                record = data_service._read_json_file(data_service.challenges_dir / challenge_type / name)
+                if record:
+                    self._add_to_series("challenges", record.get("type") or challenge_type, record.get("timestamp"))
+        for name in _scan_names(data_service.history_dir):
+            record = data_service._read_json_file(data_service.history_dir / name)
+            if record:
+                self._add_to_series("analyses", self._history_type(record), record.get("timestamp"))
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self.load()
+
+    def persist(self) -> bool:
+        """将统计数据写入磁盘（仅在有变更时写入）"""
+        with self._lock:
+            if not self._loaded or not self._dirty:
+                return False
+            snapshot = {
+                "counters": {
+                    "challenges_by_type": dict(self.challenges_by_type),
+                    "total_history": self.total_history,
+                    "auto_solves": len(self._auto_solve_ids),
+                    "cache_files": len(self._cache_files),
+                    "config_files": len(self._config_files)
+                },
+                "hourly": self.hourly,
+                "daily": self.daily,
+                "updated_at": datetime.now().isoformat()
+            }
+            self.stats_file.parent.mkdir(parents=True, exist_ok=True)
+            if data_service._write_json_file(self.stats_file, snapshot):
+                self._dirty = False
+                return True
+            return False
+
+    # 时间序列
+    @staticmethod
+    def _history_type(record: Dict[str, Any]) -> str:
+        analysis_data = record.get("analysis_data", {}) or {}
+        return analysis_data.get("type") or analysis_data.get("question_type") or "unknown"
+
+    def _add_to_series(self, metric: str, question_type: str, timestamp: Optional[str]):
+        timestamp = timestamp or datetime.now().isoformat()
+        for series, bucket in ((self.hourly, timestamp[:13]), (self.daily, timestamp[:10])):
+            is_new = bucket not in series
+            counts = series.setdefault(bucket, {}).setdefault(metric, {})
+            counts[question_type] = counts.get(question_type, 0) + 1
+            if is_new:
+                self._prune_series()
+
+    def _prune_series(self):
+        now = datetime.now()
+        hourly_cutoff = (now - timedelta(hours=self.hourly_retention_hours)).isoformat()[:13]
+        daily_cutoff = (now - timedelta(days=self.daily_retention_days)).isoformat()[:10]
+        for bucket in [b for b in self.hourly if b < hourly_cutoff]:
+            del self.hourly[bucket]
+        for bucket in [b for b in self.daily if b < daily_cutoff]:
+            del self.daily[bucket]
+
+    # 事件处理
+    def _on_challenge_saved(self, challenge: Dict[str, Any]):
+        if not self._loaded:
+            return
+        with self._lock:
+            challenge_type = challenge.get("type", "unknown")
+            names = self._challenge_files.setdefault(challenge_type, set())
+            name = f"challenge_{challenge.get('id')}.json"
+            # 覆盖已有题目不计入新增
+            if name in names:
+                return
+            names.add(name)
+            self.challenges_by_type[challenge_type] = len(names)
+            self._add_to_series("challenges", challenge_type, challenge.get("timestamp"))
+            self._dirty = True
+
+    def _on_challenge_deleted(self, challenge: Dict[str, Any]):
+        if not self._loaded:
+            return
+        with self._lock:
+            name = f"challenge_{challenge.get('id')}.json"
+            # 题目文件损坏时删除事件中没有类型，按文件名查找
+            challenge_type = challenge.get("type") or next(
+                (t for t, names in self._challenge_files.items() if name in names), "unknown")
+            names = self._challenge_files.setdefault(challenge_type, set())
+            names.discard(name)
+            self.challenges_by_type[challenge_type] = len(names)
+            self._dirty = True
+
+    def _on_history_saved(self, record: Dict[str, Any]):
+        if not self._loaded:
+            return
+        with self._lock:
+            self.total_history += 1
+            self._add_to_series("analyses", self._history_type(record), record.get("timestamp"))
+            self._dirty = True
+
+    def _on_auto_solve_saved(self, solve: Dict[str, Any]):
+        if not self._loaded:
+            return
+        with self._lock:
+            self._auto_solve_ids.add(solve.get("id"))
+            self._dirty = True
+
+    def _on_auto_solve_deleted(self, solve_id: str):
+        if not self._loaded:
+            return
+        with self._lock:
+            self._auto_solve_ids.discard(solve_id)
+            self._dirty = True
+
+    def _on_cache_saved(self, file_name: str):
+        if not self._loaded:
+            return
+        with self._lock:
+            self._cache_files.add(file_name)
+
+    def _on_cache_deleted(self, file_name: str):
+        if not self._loaded:
+            return
+        with self._lock:
+            self._cache_files.discard(file_name)
+
+    def _on_config_saved(self, file_name: str):
+        if not self._loaded:
+            return
+        with self._lock:
+            self._config_files.add(file_name)
+
+    # 查询
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计数据（与 DataService.get_stats 返回结构一致）"""
+        self._ensure_loaded()
+        with self._lock:
+            return {
+                "total_challenges": sum(self.challenges_by_type.values()),
+                "challenges_by_type": dict(self.challenges_by_type),
+                "total_history": self.total_history,
+                "total_auto_solves": len(self._auto_solve_ids),
+                "cache_files": len(self._cache_files),
+                "config_files": len(self._config_files)
+            }
+
+    def get_cache_file_count(self) -> int:
+        self._ensure_loaded()
+        return len(self._cache_files)
+
+    def get_series(self, granularity: str = "hour", metric: str = "challenges",
+                   question_type: Optional[str] = None, limit: int = 24) -> List[Dict[str, Any]]:
+        """
+        获取时间序列（从旧到新，缺失的时间桶补0）
+
+        Args:
+            granularity: hour 或 day
+            metric: challenges 或 analyses
+            question_type: 只返回指定题目类型的数量，为空时返回按类型分组的数量
+            limit: 返回的时间桶数量
+        """
+        self._ensure_loaded()
+        now = datetime.now()
+        if granularity == "day":
+            series, step, key_length = self.daily, timedelta(days=1), 10
+        else:
+            series, step, key_length = self.hourly, timedelta(hours=1), 13
+
+        points = []
+        with self._lock:
+            for offset in range(limit - 1, -1, -1):
+                bucket = (now - step * offset).isoformat()[:key_length]
+                counts = dict(series.get(bucket, {}).get(metric, {}))
+                if question_type:
+                    points.append({"bucket": bucket, "count": counts.get(question_type, 0)})
+                else:
+                    points.append({"bucket": bucket, "count": sum(counts.values()), "by_type": counts})
+        return points
+
+# 全局实例
+stats_service = StatsService()
@@ -0,0 +1,20 @@
+"""
+测试公共配置
+
+后端模块以 backend 为导入根目录，数据目录为相对当前目录的 ../data，日志写入 logs/app.log。
+测试在导入任何后端模块之前切换到临时目录，数据和日志都不会落到仓库里。
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+WORK_DIR = Path(tempfile.mkdtemp(prefix="ctf-backend-tests-")) / "run"
+WORK_DIR.mkdir(parents=True)
+os.chdir(WORK_DIR)
+
+os.environ.setdefault("DEEPSEEK_API_KEY", "test-key")
+os.environ.setdefault("AI_SERVICE", "deepseek")
@@ -0,0 +1,66 @@
+import asyncio
+import uuid
+import pytest
+import ai_service
+from ai_providers import AIErrorResponse, AIProvider
+from ai_providers.local import LocalAIProvider
+from ai_service import AIService, is_error_response
+from data_service import data_service
+
+
+class _BrokenTokenizer:
+    pad_token_id = 0
+    eos_token_id = 0
+
+    def __call__(self, *args, **kwargs):
+        raise RuntimeError("tokenizer exploded")
+
+
+def _failing_local_provider() -> LocalAIProvider:
+    # 跳过加载模型的构造函数，只保留 analyze_challenge 用到的属性
+    provider = LocalAIProvider.__new__(LocalAIProvider)
+    AIProvider.__init__(provider)
+    provider.model_path = "/models/broken"
+    provider.device = "cpu"
+    provider.temperature = 0.7
+    provider.tokenizer = _BrokenTokenizer()
+    provider.get_prompt_template = lambda question_type: "{description}"
+    return provider
+
+
+@pytest.fixture
+def local_service(monkeypatch):
+    provider = _failing_local_provider()
+    monkeypatch.setattr(ai_service.AIProviderFactory, "create_provider", staticmethod(lambda provider_type=None: provider))
+    return AIService("local")
+
+
+def test_failing_local_provider_is_error_and_not_cached(local_service):
+    description = f"broken local model {uuid.uuid4()}"
+    response = asyncio.run(local_service.analyze_challenge(description, "misc", use_context=False))
+
+    assert isinstance(response, AIErrorResponse)
+    assert response.startswith("本地模型分析遇到问题")
+    assert is_error_response(response)
+    assert local_service.get_cached_response(description, "misc") is None
+
+
+def test_error_prefixes_recognised_without_type():
+    # 从缓存、历史读回的文本不再是 AIErrorResponse，按前缀识别
+    for text in ("本地模型分析遇到问题，请检查模型配置或稍后重试。",
+                 "抱歉，本地模型未能生成有效分析结果，请检查模型配置或尝试其他AI提供者。",
+                 "AI分析暂时不可用，请稍后重试。",
+                 "AI分析遇到问题，请检查网络连接或稍后重试。"):
+        assert is_error_response(str(text))
+    assert not is_error_response("这是一道 RSA 题目，先分解 n。")
+    assert is_error_response("")
+
+
+def test_successful_response_is_cached(local_service, monkeypatch):
+    async def analyze(prompt, question_type):
+        return "分析结果"
+
+    monkeypatch.setattr(local_service.provider, "analyze_challenge", analyze)
+    description = f"working local model {uuid.uuid4()}"
+    assert asyncio.run(local_service.analyze_challenge(description, "misc", use_context=False)) == "分析结果"
+    assert data_service.get_cache(local_service.cache_key(description, "misc")) == "分析结果"
@@ -0,0 +1,69 @@
+import zipfile
+import pytest
+from analyzers.archive import extract_archive, format_archive_manifest
+from upload_store import upload_store
+
+
+def _zip(path, members):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return str(path)
+
+
+def test_skipped_bomb_members_do_not_use_the_total_budget(tmp_path):
+    path = _zip(tmp_path / "bomb.zip", {
+        "bomb1.bin": b"\0" * (40 << 20),
+        "bomb2.bin": b"\0" * (40 << 20),
+        "flag.txt": b"flag{legit}" * 100
+    })
+    report = extract_archive(path, "bomb.zip", max_total_size=12 << 20)
+
+    members = {member["path"]: member for member in report["members"]}
+    assert report["stopped"] is None
+    assert members["bomb.zip!/bomb1.bin"]["skipped"] == "压缩比超过限制"
+    assert members["bomb.zip!/bomb2.bin"]["skipped"] == "压缩比超过限制"
+    assert members["bomb.zip!/flag.txt"]["size"] == 1100
+    assert report["total_size"] == 1100
+    assert report["skipped_size"] > 0
+    assert "解出 1100 字节" in format_archive_manifest(report)
+
+
+def test_7z_members_are_streamed_through_the_quotas(tmp_path):
+    py7zr = pytest.importorskip("py7zr")
+    inner = tmp_path / "inner.zip"
+    _zip(inner, {"deep.txt": b"flag{nested}"})
+    path = tmp_path / "challenge.7z"
+    with py7zr.SevenZipFile(path, "w") as archive:
+        archive.writestr(b"flag{seven}\n" * 10, "notes.txt")
+        archive.writestr(b"", "empty.txt")
+        archive.writestr(inner.read_bytes(), "inner.zip")
+    report = extract_archive(str(path), "challenge.7z")
+
+    members = {member["path"]: member for member in report["members"]}
+    assert members["challenge.7z!/notes.txt"]["flags"] == ["flag{seven}"]
+    assert members["challenge.7z!/empty.txt"]["size"] == 0
+    assert members["challenge.7z!/inner.zip!/deep.txt"]["flags"] == ["flag{nested}"]
+    assert report["stopped"] is None
+
+
+def test_7z_bomb_is_stopped_by_real_byte_count(tmp_path):
+    py7zr = pytest.importorskip("py7zr")
+    path = tmp_path / "bomb.7z"
+    with py7zr.SevenZipFile(path, "w") as archive:
+        archive.writestr(b"\0" * (64 << 20), "zero.bin")
+    report = extract_archive(str(path), "bomb.7z", max_total_size=8 << 20, max_ratio=100000)
+
+    assert report["stopped"] == "解出的总大小超过限制"
+    assert report["total_size"] <= (8 << 20) + (1 << 20)
+
+
+def test_extracted_members_are_removed_after_extraction(tmp_path):
+    path = _zip(tmp_path / "members.zip", {f"file{i}.txt": f"flag{{member-{i}}}".encode() for i in range(5)})
+    objects_before = set(upload_store.objects_dir.rglob("*"))
+    report = extract_archive(path, "members.zip")
+
+    assert sorted(flag for member in report["members"] for flag in member["flags"]) == \
+        sorted(f"flag{{member-{i}}}" for i in range(5))
+    assert set(upload_store.objects_dir.rglob("*")) == objects_before
+    assert not list(upload_store.tmp_dir.glob("scratch-*"))
@@ -0,0 +1,24 @@
+import uuid
+from classifier import question_classifier
+from data_service import data_service
+
+
+def test_training_skips_history_typed_by_the_classifier():
+    chosen = f"user labelled {uuid.uuid4()}"
+    predicted = f"classifier labelled {uuid.uuid4()}"
+    data_service.save_analysis_history(None, {"description": chosen, "type": "crypto", "type_classified": False})
+    data_service.save_analysis_history(None, {"description": predicted, "type": "web", "type_classified": True})
+
+    texts, labels = question_classifier._training_samples()
+
+    assert dict(zip(texts, labels))[chosen] == "crypto"
+    assert predicted not in texts
+
+
+def test_classify_batch_uses_file_type():
+    file_type = {"label": "elf", "confidence": 0.9}
+    single = question_classifier.classify("看看这个附件", None, file_type)
+    batch = question_classifier.classify_batch([{"description": "看看这个附件", "file_type": file_type}])
+
+    assert single["file_hint"] == batch[0]["file_hint"] == "pwn"
+    assert batch[0]["type"] == single["type"]
@@ -0,0 +1,27 @@
+import json
+from conversation_store import ConversationStore
+from data_service import data_service
+
+
+def _store(tmp_path):
+    return ConversationStore(tmp_path, read_json=data_service._read_json_file, write_json=data_service._write_json_file)
+
+
+def _message(text, timestamp):
+    return {"role": "user", "content": text, "timestamp": timestamp}
+
+
+def test_append_after_torn_line_starts_on_a_new_line(tmp_path):
+    store = _store(tmp_path)
+    store.save({"id": "c1", "user_id": "u1", "messages": [_message("first", "2026-01-01T00:00:00")]})
+    store.flush()
+    # 模拟追加写到一半时崩溃
+    with open(store.log_path("c1"), "ab") as f:
+        f.write(b'{"role": "user", "content": "tor')
+
+    restarted = _store(tmp_path)
+    assert restarted.append_message("c1", _message("second", "2026-01-01T00:01:00"))
+
+    lines = store.log_path("c1").read_bytes().decode("utf-8").splitlines()
+    assert [json.loads(line)["content"] for line in lines] == ["first", "second"]
+    assert [m["content"] for m in _store(tmp_path).get("c1")["messages"]] == ["first", "second"]
@@ -0,0 +1,57 @@
+import io
+import json
+import uuid
+import zipfile
+from importer import importer, iter_source_records
+
+
+def _zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def _challenges(count):
+    tag = uuid.uuid4().hex
+    return [{"description": f"imported {tag} #{i}", "type": "misc"} for i in range(count)]
+
+
+def test_zip_bomb_member_is_skipped_and_other_members_imported():
+    records = _challenges(3)
+    archive = _zip({
+        "challenges.jsonl": b"\n" * (40 << 20),
+        "challenges.json": json.dumps(records).encode()
+    })
+    sources = list(iter_source_records(archive, "import.zip", "challenges"))
+
+    errors = [(source, str(record)) for source, _, record in sources if isinstance(record, Exception)]
+    assert errors == [("challenges.jsonl", "压缩比超过限制，已停止读取该成员")]
+    assert [record for source, _, record in sources if source == "challenges.json"] == records
+
+
+def test_json_array_is_parsed_record_by_record():
+    records = _challenges(2000)
+    document = json.dumps(records, ensure_ascii=False, indent=2).encode()
+    parsed = list(iter_source_records(io.BytesIO(document), "challenges.json", "challenges"))
+
+    assert [record for _, _, record in parsed] == records
+    assert [line for _, line, _ in parsed] == list(range(1, 2001))
+
+
+def test_truncated_json_array_reports_error_after_complete_records():
+    records = _challenges(2)
+    document = json.dumps(records).encode()[:-10]
+    parsed = list(iter_source_records(io.BytesIO(document), "challenges.json", "challenges"))
+
+    assert [record for _, _, record in parsed[:1]] == records[:1]
+    assert isinstance(parsed[-1][2], ValueError)
+
+
+def test_import_zip_export():
+    records = _challenges(5)
+    report = importer.import_stream(_zip({"challenges.json": json.dumps(records).encode()}), "export.zip", "challenges")
+
+    assert (report["total"], report["imported"], report["failed"]) == (5, 5, 0)
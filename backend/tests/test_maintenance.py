@@ -0,0 +1,16 @@
+from datetime import datetime
+from maintenance import next_cron_time
+
+
+def test_day_of_month_and_weekday_restricted_match_either():
+    # 2026-10-19 是周一
+    now = datetime(2026, 10, 19, 3, 0)
+    assert next_cron_time("0 2 1 * 1", now) == datetime(2026, 10, 26, 2, 0)
+    assert next_cron_time("0 2 1 * 1", datetime(2026, 10, 27, 3, 0)) == datetime(2026, 11, 1, 2, 0)
+
+
+def test_unrestricted_day_field_requires_the_other():
+    now = datetime(2026, 10, 19, 3, 0)
+    assert next_cron_time("0 2 * * 1", now) == datetime(2026, 10, 26, 2, 0)
+    assert next_cron_time("0 2 1 * *", now) == datetime(2026, 11, 1, 2, 0)
+    assert next_cron_time("30 * * * *", now) == datetime(2026, 10, 19, 3, 30)
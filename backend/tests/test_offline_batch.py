@@ -0,0 +1,156 @@
+import asyncio
+import time
+import uuid
+import httpx
+import pytest
+from ai_providers.deepseek import DeepSeekProvider
+from ai_providers.mock_server import create_app
+from config import config
+from data_service import data_service
+from offline_batch import OfflineBatchManager
+
+
+@pytest.fixture(autouse=True)
+def offline_batch_env(monkeypatch):
+    # 仓库中的提示词模板为占位内容，这里只需要请求体里带上题目
+    monkeypatch.setattr(DeepSeekProvider, "get_prompt_template", lambda self, question_type: "{description}")
+    monkeypatch.setattr(config, "OFFLINE_BATCH_POLL_INTERVAL", 0.01)
+
+
+def _manager(**app_options) -> OfflineBatchManager:
+    return OfflineBatchManager(transport=httpx.ASGITransport(app=create_app(**app_options)))
+
+
+def _items(count: int):
+    tag = uuid.uuid4().hex
+    return [{"description": f"offline batch {tag} #{i}", "question_type": "misc"} for i in range(count)]
+
+
+def _history_for(job_id: str):
+    records = (data_service._read_json_file(path) for path in data_service.history_dir.glob("history_*.json"))
+    return [record for record in records
+            if record and record["analysis_data"].get("offline_batch_id") == job_id]
+
+
+async def _run_job(manager: OfflineBatchManager, job_id: str):
+    manager.start(job_id)
+    await manager._tasks[job_id]
+    return manager.get_job(job_id)
+
+
+async def _wait_for(predicate, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "等待超时"
+        await asyncio.sleep(0.01)
+
+
+def _slow_history(monkeypatch, delay: float = 0.05):
+    save = data_service.save_analysis_history
+
+    def slow_save(challenge_id, analysis_data):
+        time.sleep(delay)
+        return save(challenge_id, analysis_data)
+
+    monkeypatch.setattr(data_service, "save_analysis_history", slow_save)
+
+
+def test_native_batch_api():
+    async def scenario():
+        manager = _manager()
+        items = _items(3)
+        job = manager.create_job("deepseek", items=items)
+        job = await _run_job(manager, job["id"])
+
+        assert job["status"] == "completed"
+        assert job["driver"] == "native"
+        assert job["remote_batch_id"] and job["remote_status"] == "completed"
+        assert (job["succeeded"], job["failed"]) == (3, 0)
+        service = manager._service("deepseek")
+        for item in items:
+            assert service.get_cached_response(item["description"], "misc").startswith("[mock:")
+        assert len(_history_for(job["id"])) == 3
+
+    asyncio.run(scenario())
+
+
+def test_local_fallback_without_batch_api():
+    async def scenario():
+        manager = _manager(batch_api=False)
+        job = manager.create_job("deepseek", items=_items(5), mode="auto")
+        job = await _run_job(manager, job["id"])
+
+        assert job["status"] == "completed"
+        assert job["driver"] == "local"
+        assert job["remote_batch_id"] is None
+        assert (job["succeeded"], job["failed"]) == (5, 0)
+        assert len(_history_for(job["id"])) == 5
+
+    asyncio.run(scenario())
+
+
+def test_failed_rows_come_back_as_errors():
+    async def scenario():
+        manager = _manager(fail_rate=0.5, seed=7)
+        job = manager.create_job("deepseek", items=_items(10))
+        job = await _run_job(manager, job["id"])
+
+        assert job["status"] == "completed"
+        assert job["failed"] > 0 and job["succeeded"] > 0
+        assert job["failed"] + job["succeeded"] == 10
+        assert all(error["error"] == "mock server error" for error in job["errors"])
+        assert len(_history_for(job["id"])) == job["succeeded"]
+
+    asyncio.run(scenario())
+
+
+def test_cancel_during_ingest_stops_the_ingest_thread(monkeypatch):
+    _slow_history(monkeypatch)
+
+    async def scenario():
+        manager = _manager()
+        job = manager.create_job("deepseek", items=_items(20))
+        job_id = job["id"]
+        manager.start(job_id)
+        await _wait_for(lambda: (manager.get_job(job_id) or {}).get("ingest_offset", 0) >= 2)
+
+        cancelled = await manager.cancel(job_id)
+        assert cancelled["status"] == "cancelled"
+        # 导入线程若仍在运行，会继续写入历史并把任务记录改回 ingesting
+        await asyncio.sleep(0.3)
+        job = manager.get_job(job_id)
+        assert job["status"] == "cancelled"
+        assert job["ingest_offset"] < 20
+        assert len(_history_for(job_id)) == job["succeeded"]
+        # 重启后不会续跑已取消的任务
+        restarted = OfflineBatchManager()
+        restarted.resume_pending()
+        assert job_id not in restarted._tasks
+        return job_id
+
+    job_id = asyncio.run(scenario())
+    assert data_service._read_json_file(data_service.data_root / "offline_batches" / job_id / "job.json")["status"] == "cancelled"
+
+
+def test_resumed_ingest_does_not_duplicate_history(monkeypatch):
+    _slow_history(monkeypatch)
+
+    async def scenario():
+        manager = _manager()
+        job = manager.create_job("deepseek", items=_items(20))
+        job_id = job["id"]
+        manager.start(job_id)
+        await _wait_for(lambda: (manager.get_job(job_id) or {}).get("ingest_offset", 0) >= 3)
+        # 模拟服务停止：任务保留在 ingesting，重启后续跑
+        await manager.shutdown()
+        interrupted = manager.get_job(job_id)
+        assert interrupted["status"] == "ingesting"
+        assert len(_history_for(job_id)) == interrupted["succeeded"]
+
+        job = await _run_job(_manager(), job_id)
+        assert job["status"] == "completed"
+        assert (job["succeeded"], job["failed"]) == (20, 0)
+        assert len(_history_for(job_id)) == 20
+        assert len({record["analysis_data"]["description"] for record in _history_for(job_id)}) == 20
+
+    asyncio.run(scenario())
@@ -0,0 +1,17 @@
+import uuid
+from data_service import data_service
+from stats_service import StatsService
+
+
+def test_overwriting_a_challenge_does_not_count_it_again():
+    stats = StatsService()
+    stats.load()
+    before = stats.get_stats()["challenges_by_type"]["crypto"]
+    challenge = {"id": uuid.uuid4().hex, "description": "RSA with small e", "type": "crypto"}
+
+    data_service.save_challenges_bulk([challenge])
+    data_service.save_challenges_bulk([dict(challenge, ai_response="updated")])
+    assert stats.get_stats()["challenges_by_type"]["crypto"] == before + 1
+
+    assert data_service.delete_challenge(challenge["id"])
+    assert stats.get_stats()["challenges_by_type"]["crypto"] == before
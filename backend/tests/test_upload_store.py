@@ -0,0 +1,28 @@
+import io
+import os
+import time
+from upload_store import upload_store, STALE_TMP_SECONDS
+
+
+def _age(path, seconds):
+    old = time.time() - seconds
+    os.utime(path, (old, old))
+
+
+def test_prune_removes_objects_not_uploaded_within_retention():
+    stale = upload_store.save_stream(io.BytesIO(b"stale upload"))
+    reused = upload_store.save_stream(io.BytesIO(b"reused upload"))
+    _age(stale["path"], 10 * 86400)
+    _age(reused["path"], 10 * 86400)
+    # 重复上传刷新最后引用时间
+    assert upload_store.save_stream(io.BytesIO(b"reused upload"))["deduplicated"]
+    leftover = upload_store.tmp_dir / "interrupted.part"
+    leftover.write_bytes(b"partial")
+    _age(leftover, STALE_TMP_SECONDS + 60)
+
+    removed = upload_store.prune(7)
+
+    assert removed["objects"] >= 1 and removed["tmp"] >= 1
+    assert not os.path.exists(stale["path"])
+    assert os.path.exists(reused["path"])
+    assert not leftover.exists()
@@ -0,0 +1,244 @@
+import json
+import math
+import re
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Any, Optional
+from logger import get_logger
+from config import config
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    tiktoken = None
+    _ENCODING = None
+
+# CJK字符（中日韩统一表意文字、假名、谚文）
+_CJK_RE = re.compile('[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+# 非CJK部分按“单词/数字/符号”切分
+_PIECE_RE = re.compile(r'[A-Za-z]+|\d+|[^\sA-Za-z\d]')
+
+# 默认价格表（每百万token，USD），可通过 TOKEN_PRICES 环境变量覆盖或追加
+DEFAULT_TOKEN_PRICES = {
+    "deepseek-chat": {"prompt": 0.27, "completion": 1.10, "cached": 0.07},
+    "deepseek-reasoner": {"prompt": 0.55, "completion": 2.19, "cached": 0.14},
+    "gpt-3.5-turbo": {"prompt": 0.50, "completion": 1.50, "cached": 0.25},
+    "gpt-4o-mini": {"prompt": 0.15, "completion": 0.60, "cached": 0.075},
+}
+
+# 当前请求的归属信息（用户、题目类型），由 AIService 在调用提供者前绑定
+_usage_scope: ContextVar[Dict[str, Any]] = ContextVar("token_usage_scope", default={})
+
+
+def estimate_tokens(text: str) -> int:
+    """本地估算文本token数
+
+    优先使用 tiktoken 的 cl100k_base 编码；未安装时按启发式估算：
+    CJK字符约1个token，英文单词约每4个字母1个token，数字和符号各约1个token。
+    """
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        try:
+            return len(_ENCODING.encode(text, disallowed_special=()))
+        except Exception:
+            pass
+
+    cjk_count = len(_CJK_RE.findall(text))
+    rest = _CJK_RE.sub(" ", text)
+    count = cjk_count
+    for piece in _PIECE_RE.findall(rest):
+        if piece.isalpha():
+            count += math.ceil(len(piece) / 4)
+        elif piece.isdigit():
+            count += math.ceil(len(piece) / 3)
+        else:
+            count += 1
+    return count
+
+
+def _empty_counters() -> Dict[str, Any]:
+    return {
+        "requests": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cached_tokens": 0,
+        "total_tokens": 0,
+        "estimated_requests": 0,
+        "estimated_cost": 0.0
+    }
+
+
+class TokenMeter:
+    """Token计量器：按提供者/模型/用户/题目类型累计token用量和预估费用"""
+
+    def __init__(self):
+        self.logger = get_logger("token_meter")
+        self._lock = threading.Lock()
+        self.prices = dict(DEFAULT_TOKEN_PRICES)
+        self.prices.update(self._load_price_overrides())
+        self.by_provider: Dict[str, Dict[str, Any]] = {}
+        self.by_model: Dict[str, Dict[str, Any]] = {}
+        self.by_user: Dict[str, Dict[str, Any]] = {}
+        self.by_question_type: Dict[str, Dict[str, Any]] = {}
+        self.daily_cost: Dict[str, float] = {}
+        self._budget_alerted_day: Optional[str] = None
+
+    def _load_price_overrides(self) -> Dict[str, Dict[str, float]]:
+        """解析 TOKEN_PRICES 环境变量（JSON，模型名 -> {prompt, completion, cached}）"""
+        if not config.TOKEN_PRICES:
+            return {}
+        try:
+            overrides = json.loads(config.TOKEN_PRICES)
+            if isinstance(overrides, dict):
+                return overrides
+        except Exception as e:
+            self.logger.warning(f"TOKEN_PRICES 解析失败，使用默认价格表: {e}")
+        return {}
+
+    @contextmanager
+    def scope(self, user_id: str = None, question_type: str = None):
+        """绑定当前请求的用户和题目类型，供提供者记录用量时归属"""
+        token = _usage_scope.set({"user_id": user_id, "question_type": question_type})
+        try:
+            yield
+        finally:
+            _usage_scope.reset(token)
+
+    def estimate_cost(self, model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+        """按价格表估算费用，未知模型返回0"""
+        price = self.prices.get(model)
+        if not price:
+            return 0.0
+        uncached = max(prompt_tokens - cached_tokens, 0)
+        cost = (
+            uncached * price.get("prompt", 0)
+            + cached_tokens * price.get("cached", price.get("prompt", 0))
+            + completion_tokens * price.get("completion", 0)
+        ) / 1_000_000
+        return round(cost, 8)
+
+    @staticmethod
+    def parse_usage(usage: Optional[Dict[str, Any]]) -> Optional[Dict[str, int]]:
+        """解析OpenAI兼容响应中的 usage 块，兼容 DeepSeek 的缓存命中字段"""
+        if not usage or not isinstance(usage, dict):
+            return None
+        prompt_tokens = int(usage.get("prompt_tokens") or 0)
+        completion_tokens = int(usage.get("completion_tokens") or 0)
+        details = usage.get("prompt_tokens_details") or {}
+        cached_tokens = int(details.get("cached_tokens") or usage.get("prompt_cache_hit_tokens") or 0)
+        if not prompt_tokens and not completion_tokens:
+            return None
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens
+        }
+
+    def record(self, provider: str, model: str, prompt: str, completion: str,
+               usage: Optional[Dict[str, Any]] = None, question_type: str = None,
+               token_counter=None) -> Dict[str, Any]:
+        """
+        记录一次AI调用的用量
+
+        Args:
+            provider: 提供者类型
+            model: 模型名称
+            prompt: 发送的提示词（usage缺失时用于本地估算）
+            completion: 模型输出
+            usage: 响应中的 usage 块
+            question_type: 题目类型，未传入时取当前绑定的请求范围
+            token_counter: 提供者自带的计数函数（如本地模型的tokenizer）
+
+        Returns:
+            本次调用的用量记录
+        """
+        parsed = self.parse_usage(usage)
+        estimated = parsed is None
+        if estimated:
+            counter = token_counter or estimate_tokens
+            parsed = {
+                "prompt_tokens": counter(prompt or ""),
+                "completion_tokens": counter(completion or ""),
+                "cached_tokens": 0
+            }
+
+        scope = _usage_scope.get()
+        user_id = scope.get("user_id") or "anonymous"
+        question_type = question_type or scope.get("question_type") or "unknown"
+        cost = self.estimate_cost(model, parsed["prompt_tokens"], parsed["completion_tokens"], parsed["cached_tokens"])
+        record = {
+            "provider": provider,
+            "model": model,
+            "user_id": user_id,
+            "question_type": question_type,
+            **parsed,
+            "total_tokens": parsed["prompt_tokens"] + parsed["completion_tokens"],
+            "estimated": estimated,
+            "estimated_cost": cost
+        }
+
+        day = datetime.now().strftime("%Y-%m-%d")
+        with self._lock:
+            for bucket, key in (
+                (self.by_provider, provider),
+                (self.by_model, f"{provider}:{model}"),
+                (self.by_user, user_id),
+                (self.by_question_type, question_type)
+            ):
+                counters = bucket.setdefault(key, _empty_counters())
+                counters["requests"] += 1
+                counters["prompt_tokens"] += record["prompt_tokens"]
+                counters["completion_tokens"] += record["completion_tokens"]
+                counters["cached_tokens"] += record["cached_tokens"]
+                counters["total_tokens"] += record["total_tokens"]
+                counters["estimated_requests"] += 1 if estimated else 0
+                counters["estimated_cost"] = round(counters["estimated_cost"] + cost, 8)
+            self.daily_cost[day] = round(self.daily_cost.get(day, 0.0) + cost, 8)
+            daily_total = self.daily_cost[day]
+
+        self._check_budget(day, daily_total)
+        return record
+
+    def _check_budget(self, day: str, daily_total: float):
+        """超出每日预算时告警（每天只告警一次）"""
+        budget = config.TOKEN_DAILY_BUDGET
+        if budget > 0 and daily_total >= budget and self._budget_alerted_day != day:
+            self._budget_alerted_day = day
+            self.logger.warning(f"今日AI调用预估费用 {daily_total:.4f} 已超出预算 {budget:.4f}")
+
+    def get_provider_stats(self, provider: str) -> Dict[str, Any]:
+        """获取单个提供者及其各模型的用量"""
+        with self._lock:
+            return {
+                "total": dict(self.by_provider.get(provider, _empty_counters())),
+                "models": {
+                    key.split(":", 1)[1]: dict(counters)
+                    for key, counters in self.by_model.items()
+                    if key.split(":", 1)[0] == provider
+                }
+            }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取全部用量统计"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        with self._lock:
+            return {
+                "by_provider": {k: dict(v) for k, v in self.by_provider.items()},
+                "by_model": {k: dict(v) for k, v in self.by_model.items()},
+                "by_user": {k: dict(v) for k, v in self.by_user.items()},
+                "by_question_type": {k: dict(v) for k, v in self.by_question_type.items()},
+                "daily_cost": dict(self.daily_cost),
+                "budget": {
+                    "daily_budget": config.TOKEN_DAILY_BUDGET,
+                    "today_cost": self.daily_cost.get(today, 0.0),
+                    "exceeded": config.TOKEN_DAILY_BUDGET > 0 and self.daily_cost.get(today, 0.0) >= config.TOKEN_DAILY_BUDGET
+                },
+                "tokenizer": "tiktoken" if _ENCODING is not None else "heuristic"
+            }
+
+# 全局实例
+token_meter = TokenMeter()
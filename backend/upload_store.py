@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import mmap
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, BinaryIO, Iterator, Optional
+from fastapi import UploadFile
+from config import config
+from logger import get_logger
+
+# 临时文件（写了一半的上传、解包临时目录）超过该时间(秒)视为进程中断时遗留，由清理任务删除
+STALE_TMP_SECONDS = 86400
+
+
+class UploadTooLargeError(Exception):
+    """上传文件超过大小限制"""
+
+    def __init__(self, limit: int):
+        super().__init__(f"文件大小超过限制 ({limit} 字节)")
+        self.limit = limit
+
+
+class UploadStore:
+    """按内容寻址的上传文件存储
+
+    上传内容按块复制到临时文件，复制过程中计算SHA-256并检查大小限制，完成后以哈希为文件名
+    移动到 objects/<前两位>/<哈希>。相同内容的文件只保存一份。每个上传只占用一个块大小的内存，
+    下游通过文件路径（或 open_mmap 映射）读取内容，不在请求处理过程中传递整个文件的字节。
+
+    文件的修改时间记录最后一次被上传（引用）的时间，重复上传时刷新；prune() 删除超过保留天数
+    没有再被上传的文件，由定时维护任务调用。
+    """
+
+    def __init__(self, root: Path, max_size: int, chunk_size: int = 1024 * 1024):
+        self.root = root
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.objects_dir = root / "objects"
+        self.tmp_dir = root / "tmp"
+        self.logger = get_logger("upload_store")
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+
+    def object_path(self, sha256: str) -> Path:
+        return self.objects_dir / sha256[:2] / sha256
+
+    def _store_stream(self, stream: BinaryIO, max_size: Optional[int] = None,
+                      directory: Optional[Path] = None) -> Dict[str, Any]:
+        """复制数据流到存储（同步，在线程中执行），directory 不为空时保存到该目录而不是 objects"""
+        max_size = self.max_size if max_size is None else max_size
+        digest = hashlib.sha256()
+        size = 0
+        temp_path = self.tmp_dir / f"{uuid.uuid4().hex}.part"
+        try:
+            with open(temp_path, "wb") as f:
+                while True:
+                    chunk = stream.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_size:
+                        raise UploadTooLargeError(max_size)
+                    digest.update(chunk)
+                    f.write(chunk)
+            sha256 = digest.hexdigest()
+            target = directory / sha256 if directory is not None else self.object_path(sha256)
+            deduplicated = target.exists()
+            if not deduplicated:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(temp_path, target)
+            elif directory is None:
+                # 刷新最后引用时间，避免仍在使用的文件被清理
+                os.utime(target)
+            return {"sha256": sha256, "path": str(target), "size": size, "deduplicated": deduplicated}
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+
+    async def save(self, upload: UploadFile) -> Dict[str, Any]:
+        """
+        保存上传文件
+
+        Returns:
+            {"sha256", "path", "size", "deduplicated", "file_name", "content_type"}
+
+        Raises:
+            UploadTooLargeError: 文件超过大小限制
+        """
+        if upload.size is not None and upload.size > self.max_size:
+            raise UploadTooLargeError(self.max_size)
+        await upload.seek(0)
+        stored = await asyncio.to_thread(self._store_stream, upload.file)
+        stored["file_name"] = upload.filename
+        stored["content_type"] = upload.content_type
+        if stored["deduplicated"]:
+            self.logger.info(f"上传文件与已有文件相同，复用 {stored['sha256']}")
+        return stored
+
+    def save_stream(self, stream: BinaryIO, max_size: Optional[int] = None,
+                    directory: Optional[Path] = None) -> Dict[str, Any]:
+        """
+        保存服务端产生的数据流（如从压缩包中解出的文件），同步执行
+
+        Args:
+            stream: 可读的二进制流
+            max_size: 大小限制，默认与上传文件相同
+            directory: 保存目录（如 scratch() 创建的临时目录），默认保存到内容寻址存储
+
+        Raises:
+            UploadTooLargeError: 数据超过大小限制
+        """
+        return self._store_stream(stream, max_size, directory)
+
+    @contextmanager
+    def scratch(self) -> Iterator[Path]:
+        """创建临时目录存放只在一次处理中使用的文件（如解包出的文件），退出时整个删除"""
+        directory = self.tmp_dir / f"scratch-{uuid.uuid4().hex}"
+        directory.mkdir(parents=True)
+        try:
+            yield directory
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def exists(self, sha256: str) -> bool:
+        return self.object_path(sha256).exists()
+
+    @staticmethod
+    def read_head(path: str, length: int = 8192) -> bytes:
+        """读取文件开头的字节（用于类型识别）"""
+        with open(path, "rb") as f:
+            return f.read(length)
+
+    @staticmethod
+    @contextmanager
+    def open_mmap(path: str) -> Iterator[Optional[mmap.mmap]]:
+        """只读映射文件内容，空文件返回 None"""
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                yield None
+                return
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                yield mapped
+            finally:
+                mapped.close()
+
+    def prune(self, max_age_days: int) -> Dict[str, int]:
+        """删除超过保留天数没有再被上传的文件，以及中断遗留的临时文件，返回各自的删除数量"""
+        removed = {"objects": 0, "bytes": 0, "tmp": 0}
+        now = time.time()
+        if max_age_days > 0:
+            cutoff = now - max_age_days * 86400
+            for path in self.objects_dir.glob("*/*"):
+                try:
+                    stat = path.stat()
+                    if stat.st_mtime < cutoff:
+                        path.unlink()
+                        removed["objects"] += 1
+                        removed["bytes"] += stat.st_size
+                except OSError:
+                    continue
+        for path in self.tmp_dir.iterdir():
+            try:
+                if path.stat().st_mtime >= now - STALE_TMP_SECONDS:
+                    continue
+                if path.is_dir():
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    path.unlink()
+                removed["tmp"] += 1
+            except OSError:
+                continue
+        if removed["objects"] or removed["tmp"]:
+            self.logger.info(f"清理上传存储: {removed['objects']} 个过期文件 ({removed['bytes']} 字节), "
+                             f"{removed['tmp']} 个遗留临时文件")
+        return removed
+
+    def remove(self, sha256: str) -> bool:
+        try:
+            self.object_path(sha256).unlink()
+            return True
+        except FileNotFoundError:
+            return False
+
+# 全局实例
+upload_store = UploadStore(Path(config.UPLOAD_DIR), config.MAX_FILE_SIZE, config.UPLOAD_CHUNK_SIZE)
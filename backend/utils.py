@@ -1,81 +1,22 @@
 import re
-from typing import List, Optional
+from typing import List, Optional, Dict, Any
 from sqlalchemy.orm import Session
 from models import Tool
 from schemas import ToolResponse
 from data_service import data_service
+from classifier import question_classifier
 
-def detect_question_type(description: str, filename: Optional[str] = None) -> str:
-    """检测CTF题目类型"""
-    description_lower = description.lower()
-    
-    # Web相关关键词
-    web_keywords = [
-        'sql', 'xss', 'csrf', 'lfi', 'rfi', 'ssrf', 'ssti', 'xxe',
-        'upload', 'cookie', 'session', 'jwt', 'php', 'javascript',
-        'http', 'url', 'web', 'server', 'apache', 'nginx', 'login',
-        'injection', 'bypass', 'filter', 'waf'
-    ]
-    
-    # Pwn相关关键词
-    pwn_keywords = [
-        'buffer', 'overflow', 'rop', 'shellcode', 'stack', 'heap',
-        'format', 'string', 'canary', 'aslr', 'pie', 'nx', 'got',
-        'plt', 'libc', 'gdb', 'pwntools', 'exploit', 'binary',
-        'elf', 'x86', 'x64', 'arm'
-    ]
-    
-    # Reverse相关关键词
-    reverse_keywords = [
-        'reverse', 'ida', 'ghidra', 'ollydbg', 'x64dbg', 'disasm',
-        'decompile', 'unpack', 'upx', 'vmprotect', 'themida',
-        'algorithm', 'keygen', 'crack', 'serial', 'license',
-        'obfuscate', 'anti-debug'
-    ]
-    
-    # Crypto相关关键词
-    crypto_keywords = [
-        'rsa', 'aes', 'des', 'md5', 'sha', 'hash', 'encrypt',
-        'decrypt', 'cipher', 'key', 'crypto', 'prime', 'modular',
-        'gcd', 'lcm', 'factorization', 'discrete', 'logarithm',
-        'elliptic', 'curve', 'signature', 'certificate'
-    ]
-    
-    # Misc相关关键词
-    misc_keywords = [
-        'steganography', 'stego', 'forensics', 'pcap', 'wireshark',
-        'memory', 'dump', 'volatility', 'binwalk', 'strings',
-        'hexdump', 'base64', 'morse', 'qr', 'barcode', 'image',
-        'audio', 'video', 'zip', 'archive', 'password'
-    ]
-    
-    # 文件扩展名检测
-    if filename:
-        filename_lower = filename.lower()
-        if any(ext in filename_lower for ext in ['.php', '.html', '.js', '.jsp', '.asp']):
-            return 'web'
-        elif any(ext in filename_lower for ext in ['.exe', '.elf', '.bin', '.so']):
-            return 'pwn'
-        elif any(ext in filename_lower for ext in ['.pcap', '.pcapng', '.cap']):
-            return 'misc'
-        elif any(ext in filename_lower for ext in ['.jpg', '.png', '.gif', '.wav', '.mp3']):
-            return 'misc'
-    
-    # 关键词匹配计分
-    scores = {
-        'web': sum(1 for keyword in web_keywords if keyword in description_lower),
-        'pwn': sum(1 for keyword in pwn_keywords if keyword in description_lower),
-        'reverse': sum(1 for keyword in reverse_keywords if keyword in description_lower),
-        'crypto': sum(1 for keyword in crypto_keywords if keyword in description_lower),
-        'misc': sum(1 for keyword in misc_keywords if keyword in description_lower)
-    }
-    
-    # 返回得分最高的类型
-    max_score = max(scores.values())
-    if max_score > 0:
-        return max(scores, key=scores.get)
-    
-    return 'unknown'
+def detect_question_type(description: str, filename: Optional[str] = None,
+                         file_type: Optional[Dict[str, Any]] = None) -> str:
+    """
+    检测CTF题目类型（得分和置信度见 question_classifier.classify）
+
+    Args:
+        description: 题目描述
+        filename: 附件文件名（按扩展名判断）
+        file_type: analyzers.detect_file 的识别结果（按文件内容判断，优先于扩展名）
+    """
+    return question_classifier.classify(description, filename, file_type)["type"]
 
 def get_recommended_tools(question_type: str, db: Session = None) -> List[ToolResponse]:
     """根据题目类型获取推荐工具"""
@@ -2,9 +2,15 @@ import React, { useEffect, useState } from 'react';
 import { deleteHistoryItem, getHistory } from '../services/api';
 import { QuestionResponse } from '../types';
 
+// 列表需要的字段（查看详情需要 ai_response）
+const HISTORY_FIELDS = 'id,description,type,timestamp,ai_response';
+const PAGE_SIZE = 20;
+
 const History: React.FC = () => {
   const [history, setHistory] = useState<QuestionResponse[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | undefined>();
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState<string | null>(null);
 
   useEffect(() => {
@@ -14,8 +20,9 @@ const History: React.FC = () => {
   const loadHistory = async () => {
     try {
       setLoading(true);
-      const data = await getHistory();
-      setHistory(data);
+      const page = await getHistory(PAGE_SIZE, undefined, HISTORY_FIELDS);
+      setHistory(page.data);
+      setNextCursor(page.nextCursor);
     } catch (err) {
       setError(err instanceof Error ? err.message : '加载历史记录失败');
     } finally {
@@ -23,6 +30,20 @@ const History: React.FC = () => {
     }
   };
 
+  const loadMore = async () => {
+    if (!nextCursor) return;
+    try {
+      setLoadingMore(true);
+      const page = await getHistory(PAGE_SIZE, nextCursor, HISTORY_FIELDS);
+      setHistory(prev => [...prev, ...page.data]);
+      setNextCursor(page.nextCursor);
+    } catch (err) {
+      setError(err instanceof Error ? err.message : '加载历史记录失败');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleDelete = async (id: number) => {
     if (window.confirm('确定要删除这条记录吗？')) {
       try {
@@ -158,6 +179,14 @@ const History: React.FC = () => {
           </div>
         ))
       )}
+
+      {nextCursor && (
+        <div style={{ textAlign: 'center', marginTop: '16px' }}>
+          <button style={viewButtonStyle} onClick={loadMore} disabled={loadingMore}>
+            {loadingMore ? '加载中...' : '加载更多'}
+          </button>
+        </div>
+      )}
     </div>
   );
 };
@@ -1,5 +1,5 @@
 import axios from 'axios';
-import { QuestionResponse, StatsResponse, ToolResponse } from '../types';
+import { CursorPage, QuestionResponse, StatsResponse, ToolResponse } from '../types';
 
 // 从环境变量获取API基础URL，如果没有设置则使用默认值
 const API_BASE_URL = process.env.REACT_APP_API_URL || 
@@ -71,12 +71,16 @@ export const getToolsByType = async (questionType: string): Promise<ToolResponse
   return response.data;
 };
 
-// 获取历史记录
-export const getHistory = async (skip = 0, limit = 20): Promise<QuestionResponse[]> => {
+// 获取历史记录（fields 为逗号分隔的返回字段，默认只返回摘要字段；nextCursor 用于获取下一页）
+export const getHistory = async (
+  limit = 20,
+  cursor?: string,
+  fields?: string
+): Promise<CursorPage<QuestionResponse>> => {
   const response = await api.get('/api/history', {
-    params: { skip, limit }
+    params: { limit, cursor, fields }
   });
-  return response.data;
+  return { data: response.data, nextCursor: response.headers['x-next-cursor'] || undefined };
 };
 
 // 删除历史记录
@@ -17,6 +17,12 @@ export interface QuestionResponse {
   ai_provider?: string;
 }
 
+// 游标分页的列表（nextCursor 来自 X-Next-Cursor 响应头，没有更多记录时为空）
+export interface CursorPage<T> {
+  data: T[];
+  nextCursor?: string;
+}
+
 export interface StatsResponse {
   total_questions: number;
   type_stats: {